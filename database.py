@@ -3,10 +3,15 @@
 # Will: copiar e colar inteiro ✅
 
 import os
+import time
 import logging
+import threading
+from collections import deque
 from datetime import datetime
 from contextlib import closing
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple, Callable
+
+from utilitarios.texto import detectar_sinal_bloqueio
 
 # =======================
 # PyMySQL (com fallback)
@@ -29,27 +34,359 @@ except Exception:
     pymysql = _DummyPymysql()
 
 
+# =======================
+# Pool de conexões (config)
+# =======================
+# Cada processo Gunicorn mantém seu próprio pool (não compartilha sockets entre forks).
+# Tamanho padrão = threads que usam o banco no processo: requisições (GUNICORN_THREADS),
+# processadores da fila de entrada, executor do engine async e as threads de fundo
+# (worker e write-back da fila, jobs de campanha, flush do anti-spam, prober da Z-API,
+# índice da IA). Quem já tem conexão aberta passa o cursor adiante em vez de pegar outra.
+_THREADS_BACKGROUND_DB = 6
+_THREADS_DB = (
+    max(1, int(os.getenv("GUNICORN_THREADS", "1")))
+    + max(1, int(os.getenv("ENTRADA_PROCESSADORES", "2")))
+    + max(2, int(os.getenv("FILA_ASYNC_DB_THREADS", "4")))
+    + _THREADS_BACKGROUND_DB
+)
+DB_POOL_ENABLED = os.getenv("DB_POOL_ENABLED", "1") == "1"
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", str(_THREADS_DB)))
+DB_POOL_TIMEOUT_SEC = float(os.getenv("DB_POOL_TIMEOUT_SEC", "10"))
+DB_POOL_MAX_LIFETIME_SEC = float(os.getenv("DB_POOL_MAX_LIFETIME_SEC", "1800"))
+DB_POOL_PING_AFTER_SEC = float(os.getenv("DB_POOL_PING_AFTER_SEC", "30"))
+
+# Flag do protocolo MySQL: há transação aberta na sessão
+_SERVER_STATUS_IN_TRANS = 1
+
+
 # =======================
 # Conexão MySQL
 # =======================
+def _abrir_conexao_mysql():
+    """Abre uma conexão PyMySQL nova (handshake TCP + auth)."""
+    return pymysql.connect(
+        host=os.getenv("MYSQL_HOST"),
+        user=os.getenv("MYSQL_USER"),
+        password=os.getenv("MYSQL_PASSWORD"),
+        db=os.getenv("MYSQL_DB"),
+        port=int(os.getenv("MYSQL_PORT", 3306)),
+        charset="utf8mb4",
+        cursorclass=pymysql.cursors.DictCursor,  # ✅ sempre dict
+        autocommit=False
+    )
+
+
+class _PooledConnection:
+    """
+    Proxy de uma conexão do pool.
+    Delegação total para a conexão PyMySQL, exceto close(): devolve ao pool.
+    Assim `with closing(get_db_connection())` e `conn.close()` continuam válidos.
+    """
+
+    def __init__(self, pool: "_MySQLPool", raw, created_at: float):
+        self._pool = pool
+        self._raw = raw
+        self._created_at = created_at
+        self._released = False
+        self._locks_nomeados = False  # GET_LOCK nesta sessão: limpa na devolução
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        self._pool._release(self._raw, self._created_at, self._locks_nomeados)
+
+    def __del__(self):
+        # Rede de segurança: rotas que esquecem conn.close() não "vazam" vagas do pool
+        if not getattr(self, "_released", True):
+            try:
+                self._pool._metrics["leaked"] += 1
+                self.close()
+            except Exception:
+                pass
+
+
+class _MySQLPool:
+    """
+    Pool de conexões PyMySQL por processo:
+    - tamanho máximo (espera até DB_POOL_TIMEOUT_SEC quando esgotado)
+    - health-check (ping) no checkout se a conexão ficou ociosa
+    - reciclagem por tempo máximo de vida
+    - fork-safe: descarta conexões herdadas do processo pai
+    """
+
+    def __init__(self, size: int, timeout: float, max_lifetime: float, ping_after: float):
+        self.size = max(1, int(size))
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.ping_after = ping_after
+        self._cond = threading.Condition(threading.RLock())  # RLock: __del__ pode devolver durante GC
+        self._idle = deque()  # (raw, created_at, last_used)
+        self._in_use = 0
+        self._pid = os.getpid()
+        self._metrics = self._zerar_metricas()
+
+    @staticmethod
+    def _zerar_metricas() -> dict:
+        return {
+            "checkouts": 0,
+            "reused": 0,
+            "waits": 0,
+            "wait_time_total_ms": 0.0,
+            "wait_timeouts": 0,
+            "created": 0,
+            "destroyed": 0,
+            "connect_time_total_ms": 0.0,
+            "ping_failures": 0,
+            "recycled": 0,
+            "connect_errors": 0,
+            "leaked": 0,
+        }
+
+    # ------------------------------------------
+    # Fork safety
+    # ------------------------------------------
+    def _reset_after_fork(self):
+        """Chamado no processo filho: não reaproveita sockets do pai."""
+        self._cond = threading.Condition(threading.RLock())
+        self._idle = deque()
+        self._in_use = 0
+        self._pid = os.getpid()
+        self._metrics = self._zerar_metricas()
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            self._reset_after_fork()
+
+    # ------------------------------------------
+    # Ciclo de vida das conexões
+    # ------------------------------------------
+    def _destroy(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._metrics["destroyed"] += 1
+
+    def _create(self):
+        t0 = time.perf_counter()
+        try:
+            raw = _abrir_conexao_mysql()
+        except Exception:
+            with self._cond:
+                self._metrics["connect_errors"] += 1
+            raise
+        elapsed_ms = (time.perf_counter() - t0) * 1000
+        with self._cond:
+            self._metrics["created"] += 1
+            self._metrics["connect_time_total_ms"] += elapsed_ms
+        return raw, time.time()
+
+    def _is_healthy(self, raw, created_at: float, last_used: float) -> bool:
+        now = time.time()
+        if self.max_lifetime > 0 and now - created_at > self.max_lifetime:
+            with self._cond:
+                self._metrics["recycled"] += 1
+            return False
+        if now - last_used >= self.ping_after:
+            try:
+                raw.ping(reconnect=False)
+            except Exception:
+                with self._cond:
+                    self._metrics["ping_failures"] += 1
+                return False
+        return True
+
+    def acquire(self) -> _PooledConnection:
+        self._check_pid()
+        wait_start = None
+
+        with self._cond:
+            self._metrics["checkouts"] += 1
+            while not self._idle and self._in_use >= self.size:
+                if wait_start is None:
+                    wait_start = time.perf_counter()
+                    self._metrics["waits"] += 1
+                remaining = self.timeout - (time.perf_counter() - wait_start)
+                if remaining <= 0:
+                    self._metrics["wait_timeouts"] += 1
+                    self._metrics["wait_time_total_ms"] += (time.perf_counter() - wait_start) * 1000
+                    raise TimeoutError(f"Pool MySQL esgotado ({self.size} conexões em uso)")
+                self._cond.wait(remaining)
+            if wait_start is not None:
+                self._metrics["wait_time_total_ms"] += (time.perf_counter() - wait_start) * 1000
+            item = self._idle.pop() if self._idle else None
+            self._in_use += 1
+
+        try:
+            # Reaproveita conexões ociosas saudáveis (LIFO: a mais "quente" primeiro)
+            while item is not None:
+                raw, created_at, last_used = item
+                if self._is_healthy(raw, created_at, last_used):
+                    with self._cond:
+                        self._metrics["reused"] += 1
+                    return _PooledConnection(self, raw, created_at)
+                self._destroy(raw)
+                with self._cond:
+                    item = self._idle.pop() if self._idle else None
+
+            raw, created_at = self._create()
+            return _PooledConnection(self, raw, created_at)
+
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+    def _release(self, raw, created_at: float, locks_nomeados: bool = False):
+        if self._pid != os.getpid():
+            return  # conexão de outro processo: apenas descarta a referência
+
+        reusable = bool(getattr(raw, "open", False))
+        if reusable:
+            try:
+                # Encerra transação pendente (inclusive snapshot de SELECT) antes de reutilizar
+                if getattr(raw, "server_status", 0) & _SERVER_STATUS_IN_TRANS:
+                    raw.rollback()
+                # Lock nomeado esquecido não pode sobreviver na próxima checagem desta conexão
+                if locks_nomeados:
+                    with raw.cursor() as cur:
+                        cur.execute("DO RELEASE_ALL_LOCKS()")
+            except Exception:
+                reusable = False
+
+        if reusable and self.max_lifetime > 0 and time.time() - created_at > self.max_lifetime:
+            reusable = False
+            with self._cond:
+                self._metrics["recycled"] += 1
+
+        if not reusable:
+            self._destroy(raw)
+
+        with self._cond:
+            self._in_use -= 1
+            if reusable:
+                self._idle.append((raw, created_at, time.time()))
+            self._cond.notify()
+
+    def close_all(self):
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+        for raw, _, _ in idle:
+            self._destroy(raw)
+
+    def stats(self) -> dict:
+        with self._cond:
+            m = dict(self._metrics)
+            idle = len(self._idle)
+            in_use = self._in_use
+
+        reused = m["reused"]
+        avg_connect_ms = m["connect_time_total_ms"] / m["created"] if m["created"] else 0.0
+        return {
+            "pid": self._pid,
+            "size": self.size,
+            "in_use": in_use,
+            "idle": idle,
+            "checkouts": m["checkouts"],
+            "reused": reused,
+            "created": m["created"],
+            "destroyed": m["destroyed"],
+            "recycled": m["recycled"],
+            "ping_failures": m["ping_failures"],
+            "connect_errors": m["connect_errors"],
+            "leaked": m["leaked"],
+            "waits": m["waits"],
+            "wait_timeouts": m["wait_timeouts"],
+            "wait_time_total_ms": round(m["wait_time_total_ms"], 1),
+            "avg_wait_ms": round(m["wait_time_total_ms"] / m["waits"], 1) if m["waits"] else 0.0,
+            "avg_connect_ms": round(avg_connect_ms, 1),
+            # Estimativa: cada reuso evita um handshake TCP+auth
+            "handshake_ms_saved_est": round(reused * avg_connect_ms, 1),
+        }
+
+
+_pool: Optional[_MySQLPool] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> _MySQLPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = _MySQLPool(
+                    size=DB_POOL_SIZE,
+                    timeout=DB_POOL_TIMEOUT_SEC,
+                    max_lifetime=DB_POOL_MAX_LIFETIME_SEC,
+                    ping_after=DB_POOL_PING_AFTER_SEC,
+                )
+    return _pool
+
+
+def obter_lock_nomeado(conn, nome: str, timeout: float) -> bool:
+    """
+    GET_LOCK na sessão de `conn` (True se conseguiu). Quem chama faz o RELEASE_LOCK;
+    se esquecer (ou falhar no caminho), o pool solta os locks ao receber a conexão de volta.
+    """
+    if isinstance(conn, _PooledConnection):
+        conn._locks_nomeados = True
+    cur = conn.cursor()
+    cur.execute("SELECT GET_LOCK(%s, %s) AS ok", (nome, timeout))
+    return bool((cur.fetchone() or {}).get("ok"))
+
+
+def _reset_pool_no_filho():
+    global _pool_lock
+    _pool_lock = threading.Lock()
+    if _pool is not None:
+        _pool._reset_after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_pool_no_filho)
+
+
 def get_db_connection():
+    """
+    Retorna uma conexão MySQL (DictCursor, autocommit=False) ou None em caso de erro.
+    Com DB_POOL_ENABLED=1 a conexão vem do pool do processo e close() a devolve.
+    """
     try:
-        conn = pymysql.connect(
-            host=os.getenv("MYSQL_HOST"),
-            user=os.getenv("MYSQL_USER"),
-            password=os.getenv("MYSQL_PASSWORD"),
-            db=os.getenv("MYSQL_DB"),
-            port=int(os.getenv("MYSQL_PORT", 3306)),
-            charset="utf8mb4",
-            cursorclass=pymysql.cursors.DictCursor,  # ✅ sempre dict
-            autocommit=False
-        )
-        return conn
+        if DB_POOL_ENABLED and HAVE_PYMYSQL:
+            return _get_pool().acquire()
+        return _abrir_conexao_mysql()
     except Exception as e:
         logging.error(f"❌ Erro ao conectar no MySQL: {e}")
         return None
 
 
+def obter_metricas_pool() -> dict:
+    """Métricas do pool de conexões deste processo (para /api/monitor-status)."""
+    if not (DB_POOL_ENABLED and HAVE_PYMYSQL):
+        return {"enabled": False}
+    return {"enabled": True, **_get_pool().stats()}
+
+
+def fechar_pool() -> None:
+    """Fecha as conexões ociosas do pool (shutdown/testes)."""
+    if _pool is not None:
+        _pool.close_all()
+
+
 # =======================
 # Helpers internos
 # =======================
@@ -88,6 +425,21 @@ def _telefone_db(telefone: str) -> str:
     return tel
 
 
+def chave_consentimento(telefone: str) -> str:
+    """
+    Chave de consent_state para um telefone em qualquer formato (visitantes.telefone,
+    fila_envios.numero com 55, máscara, sem o 9): passa pelo número de envio
+    (55 + DDD + 9 + número) e volta para o padrão do banco (_telefone_db).
+    Única normalização usada por quem grava e por quem consulta a tabela.
+    """
+    d = _digits(telefone)
+    if len(d) == 11:
+        d = "55" + d
+    elif len(d) == 10:
+        d = "55" + d[:2] + "9" + d[2:]
+    return _telefone_db(d)
+
+
 def _get_or_create_visitante_id_by_tel(cursor, telefone_db: str, nome_padrao: str = "Visitante") -> Optional[int]:
     """
     Resolve visitante_id pelo telefone.
@@ -110,6 +462,35 @@ def _get_or_create_visitante_id_by_tel(cursor, telefone_db: str, nome_padrao: st
     return int(cursor.lastrowid or 0) or None
 
 
+def _registrar_consentimento(cursor, telefone_db: str, mensagens: List[Tuple[str, str]]) -> None:
+    """
+    Mantém consent_state (1 linha por telefone) na mesma transação que grava as conversas,
+    para a checagem de consentimento da fila ser uma leitura por chave primária.
+
+    Args:
+        mensagens: (mensagem, tipo) das conversas gravadas
+    """
+    recebida = any(tipo == "recebida" for _, tipo in mensagens)
+    bloqueio = any(
+        tipo == "bloqueado" or (tipo == "recebida" and detectar_sinal_bloqueio(mensagem))
+        for mensagem, tipo in mensagens
+    )
+    chave = chave_consentimento(telefone_db)
+    if not chave or not (recebida or bloqueio):
+        return
+    try:
+        cursor.execute("""
+            INSERT INTO consent_state (telefone, last_inbound_at, last_block_signal_at)
+            VALUES (%s, IF(%s, NOW(), NULL), IF(%s, NOW(), NULL))
+            ON DUPLICATE KEY UPDATE
+                last_inbound_at = COALESCE(VALUES(last_inbound_at), last_inbound_at),
+                last_block_signal_at = COALESCE(VALUES(last_block_signal_at), last_block_signal_at)
+        """, (chave, recebida, bloqueio))
+    except Exception as e:
+        # Não perde a conversa por causa do índice (ex.: migração ainda não rodada)
+        logging.error(f"❌ Erro ao atualizar consent_state para tel={chave}: {e}")
+
+
 # =======================
 # Visitantes / Membros
 # =======================
@@ -389,6 +770,301 @@ def buscar_fase_id(descricao_fase):
         return None
 
 
+# =======================
+# Contexto do visitante (1 leitura + 1 gravação por mensagem)
+# =======================
+_FASES_CACHE: Dict[str, int] = {}
+
+
+def _obter_fase_id_cache(cursor, descricao: str) -> Optional[int]:
+    """Resolve fases.id pela descrição com cache em memória (tabela quase estática)."""
+    if descricao in _FASES_CACHE:
+        return _FASES_CACHE[descricao]
+    cursor.execute("SELECT id FROM fases WHERE descricao = %s LIMIT 1", (descricao,))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    _FASES_CACHE[descricao] = int(row["id"])
+    return _FASES_CACHE[descricao]
+
+
+class VisitorContext:
+    """
+    Dados do visitante carregados UMA vez por mensagem recebida.
+    Os handlers leem daqui e registram as escritas (conversas, fase, estatísticas, envios);
+    salvar_contexto_visitante() grava tudo numa única transação no final.
+    """
+
+    def __init__(self, telefone: str, visitante_id: Optional[int] = None, nome: Optional[str] = None,
+                 fase: Optional[str] = None, fase_id: Optional[int] = None, status_id: Optional[int] = None):
+        self.telefone = telefone
+        self.visitante_id = visitante_id
+        self.nome = nome or "Visitante"
+        self.fase = fase or "INICIO"
+        self.fase_id = fase_id
+        self.status_id = status_id
+
+        self.conversas_pendentes: list = []
+        self.estatisticas_pendentes: list = []
+        self.envios_pendentes: list = []
+        self.nova_fase: Optional[tuple] = None  # (descricao, origem)
+
+    @property
+    def cadastrado(self) -> bool:
+        return self.visitante_id is not None
+
+    @property
+    def primeiro_nome(self) -> str:
+        partes = (self.nome or "").split()
+        return partes[0] if partes else "Visitante"
+
+    def registrar_conversa(self, mensagem: str, tipo: str = "recebida", sid=None, origem: str = "integra+"):
+        self.conversas_pendentes.append((mensagem, tipo, sid, origem))
+
+    def definir_fase(self, fase_nome: str, origem: str = "integra+"):
+        """Última fase definida vence (mesmo resultado final de chamadas seguidas a atualizar_status)."""
+        self.nova_fase = (fase_nome, origem)
+
+    def registrar_estatistica(self, estado_atual: str, proximo_estado: str, origem: str = "integra+"):
+        self.estatisticas_pendentes.append((estado_atual, proximo_estado, origem))
+
+    def enfileirar(self, numero: str, mensagem: str, meta: Optional[Dict[str, Any]] = None):
+        """Envio adiado: entra na fila na mesma transação que grava a conversa recebida."""
+        self.envios_pendentes.append((numero, mensagem, meta))
+
+
+def carregar_contexto_visitante(telefone: str) -> VisitorContext:
+    """
+    Carrega id, nome, telefone e fase atual do visitante numa única query.
+    Em caso de erro/sem cadastro, retorna contexto padrão (fase INICIO), como obter_estado_atual_do_banco.
+    """
+    telefone_db = _telefone_db(telefone)
+    try:
+        with closing(get_db_connection()) as conn:
+            if not conn:
+                return VisitorContext(telefone_db)
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT v.id, v.nome, s.id AS status_id, s.fase_id, f.descricao AS fase
+                FROM visitantes v
+                LEFT JOIN status s ON v.id = s.visitante_id
+                LEFT JOIN fases f ON s.fase_id = f.id
+                WHERE v.telefone = %s
+                LIMIT 1
+            ''', (telefone_db,))
+            row = cursor.fetchone()
+            if not row:
+                return VisitorContext(telefone_db)
+            return VisitorContext(
+                telefone_db,
+                visitante_id=int(row["id"]),
+                nome=row.get("nome"),
+                fase=row.get("fase"),
+                fase_id=row.get("fase_id"),
+                status_id=row.get("status_id"),
+            )
+    except Exception as e:
+        logging.error(f"Erro ao carregar contexto do visitante {telefone_db}: {e}")
+        return VisitorContext(telefone_db)
+
+
+def salvar_contexto_visitante(contexto: VisitorContext, gravar_envios: Optional[Callable] = None) -> bool:
+    """
+    Grava numa única transação tudo que os handlers registraram no contexto:
+    visitante (se novo), conversas, fase (status), estatísticas e, com `gravar_envios`
+    (ex.: fila_mensagens.adicionar_lote_na_fila), os envios pendentes.
+    A conversa recebida (message_sid) commita junto com os envios: é o marcador de
+    mensagem processada, então um retry do webhook não repete nenhum efeito.
+    """
+    envios = contexto.envios_pendentes if gravar_envios else []
+    if not (contexto.conversas_pendentes or contexto.nova_fase or contexto.estatisticas_pendentes or envios):
+        return True
+
+    try:
+        with closing(get_db_connection()) as conn:
+            if not conn:
+                return False
+            cursor = conn.cursor()
+
+            vid = contexto.visitante_id
+            if not vid:
+                vid = _get_or_create_visitante_id_by_tel(cursor, contexto.telefone, nome_padrao="Visitante")
+            if not vid:
+                logging.error(f"❌ salvar_contexto_visitante: não foi possível resolver visitante_id para tel={contexto.telefone}")
+                conn.rollback()
+                return False
+            contexto.visitante_id = vid
+
+            # 1) Conversas (INSERT multi-linha)
+            if contexto.conversas_pendentes:
+                valores = ", ".join(["(%s, %s, %s, %s, %s, NOW())"] * len(contexto.conversas_pendentes))
+                params = []
+                for mensagem, tipo, sid, origem in contexto.conversas_pendentes:
+                    params.extend((vid, mensagem, tipo, sid, origem))
+                cursor.execute(f"""
+                    INSERT INTO conversas (visitante_id, mensagem, tipo, message_sid, origem, created_at)
+                    VALUES {valores}
+                """, tuple(params))
+                _registrar_consentimento(
+                    cursor, contexto.telefone,
+                    [(mensagem, tipo) for mensagem, tipo, _, _ in contexto.conversas_pendentes],
+                )
+
+            # 2) Fase atual (status)
+            if contexto.nova_fase:
+                fase_nome, origem_fase = contexto.nova_fase
+                fase_id = _obter_fase_id_cache(cursor, fase_nome)
+                if not fase_id:
+                    logging.error(f"❌ Fase '{fase_nome}' não encontrada na tabela 'fases'.")
+                else:
+                    data_atualizacao = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                    if contexto.status_id:
+                        cursor.execute("""
+                            UPDATE status
+                            SET fase_id = %s, data_atualizacao = %s, origem = %s
+                            WHERE visitante_id = %s
+                        """, (fase_id, data_atualizacao, origem_fase, vid))
+                        logging.info(
+                            f"🔄 {contexto.nome} ({contexto.telefone}) mudou de fase_id={contexto.fase_id} → {fase_id} ({fase_nome})"
+                        )
+                    else:
+                        cursor.execute("""
+                            INSERT INTO status (visitante_id, fase_id, data_atualizacao, origem)
+                            VALUES (%s, %s, %s, %s)
+                        """, (vid, fase_id, data_atualizacao, origem_fase))
+                        contexto.status_id = cursor.lastrowid
+                        logging.info(f"🆕 Status criado para {contexto.nome} ({contexto.telefone}) → fase '{fase_nome}'")
+                    contexto.fase, contexto.fase_id = fase_nome, fase_id
+
+            # 3) Estatísticas
+            if contexto.estatisticas_pendentes:
+                valores = ", ".join(["(%s, %s, %s, %s, %s)"] * len(contexto.estatisticas_pendentes))
+                params = []
+                agora = datetime.now()
+                for estado_atual, proximo_estado, origem in contexto.estatisticas_pendentes:
+                    params.extend((contexto.telefone, estado_atual, proximo_estado, origem, agora))
+                cursor.execute(f"""
+                    INSERT INTO estatisticas (numero, estado_atual, proximo_estado, origem, data_hora)
+                    VALUES {valores}
+                """, tuple(params))
+
+            # 4) Envios (fila_envios) no mesmo commit
+            if envios:
+                gravar_envios(cursor, [(numero, mensagem, None, meta or {}) for numero, mensagem, meta in envios])
+
+            conn.commit()
+
+        logging.info(
+            f"💾 Contexto salvo: tel={contexto.telefone} | conversas={len(contexto.conversas_pendentes)} | "
+            f"fase={contexto.nova_fase[0] if contexto.nova_fase else '-'} | estatisticas={len(contexto.estatisticas_pendentes)} | "
+            f"envios={len(envios)}"
+        )
+        contexto.conversas_pendentes.clear()
+        contexto.estatisticas_pendentes.clear()
+        if envios:
+            contexto.envios_pendentes.clear()
+        contexto.nova_fase = None
+        return True
+
+    except Exception as e:
+        logging.exception(f"❌ Erro ao salvar contexto do visitante {contexto.telefone}: {e}")
+        return False
+
+
+def aplicar_pos_envio_em_lote(
+    cursor,
+    conversas: List[Tuple[str, str, str]],
+    fases: List[Tuple[str, str, str]],
+    eventos: List[Tuple[int, str, str]],
+) -> None:
+    """
+    Efeitos no CRM de um lote de envios confirmados, na transação de quem chama
+    (write-back da fila_envios). Equivale a salvar_conversa + atualizar_status +
+    atualizar_status_envio_evento item a item, com poucas queries multi-linha.
+
+    Args:
+        conversas: (telefone, mensagem, origem) das mensagens enviadas
+        fases: (telefone, fase, origem) — ex.: boas-vindas manuais → INICIO
+        eventos: (visitante_id, evento_nome, status) de eventos_envios
+    """
+    telefones = {_telefone_db(t) for t, _, _ in conversas} | {_telefone_db(t) for t, _, _ in fases}
+    telefones.discard("")
+    vids: Dict[str, int] = {}
+    if telefones:
+        placeholders = ",".join(["%s"] * len(telefones))
+        cursor.execute(f"SELECT id, telefone FROM visitantes WHERE telefone IN ({placeholders})", tuple(telefones))
+        for row in cursor.fetchall() or []:
+            vids.setdefault(row["telefone"], int(row["id"]))
+
+    # 1) Conversas enviadas (cria visitante mínimo se não existir, como salvar_conversa)
+    linhas = []
+    for telefone, mensagem, origem in conversas:
+        tel = _telefone_db(telefone)
+        if tel and tel not in vids:
+            vid = _get_or_create_visitante_id_by_tel(cursor, tel, nome_padrao="Visitante")
+            if vid:
+                vids[tel] = vid
+        if tel in vids:
+            linhas.append((vids[tel], mensagem, "enviada", None, origem))
+        else:
+            logging.error(f"❌ Pós-envio em lote: não foi possível resolver visitante_id para tel={telefone}")
+    if linhas:
+        valores = ", ".join(["(%s, %s, %s, %s, %s, NOW())"] * len(linhas))
+        cursor.execute(f"""
+            INSERT INTO conversas (visitante_id, mensagem, tipo, message_sid, origem, created_at)
+            VALUES {valores}
+        """, tuple(v for linha in linhas for v in linha))
+
+    # 2) Fase (status): só visitantes existentes, como atualizar_status
+    por_fase: Dict[Tuple[int, str], List[int]] = {}
+    for telefone, fase_nome, origem in fases:
+        tel = _telefone_db(telefone)
+        if tel not in vids:
+            logging.error(f"❌ Visitante com telefone '{tel}' não encontrado no banco.")
+            continue
+        fase_id = _obter_fase_id_cache(cursor, fase_nome)
+        if not fase_id:
+            logging.error(f"❌ Fase '{fase_nome}' não encontrada na tabela 'fases'.")
+            continue
+        por_fase.setdefault((fase_id, origem), []).append(vids[tel])
+    if por_fase:
+        data_atualizacao = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        todos = sorted({vid for ids in por_fase.values() for vid in ids})
+        placeholders = ",".join(["%s"] * len(todos))
+        cursor.execute(f"SELECT DISTINCT visitante_id FROM status WHERE visitante_id IN ({placeholders})", tuple(todos))
+        com_status = {int(r["visitante_id"]) for r in cursor.fetchall() or []}
+        novos = []
+        for (fase_id, origem), ids in por_fase.items():
+            existentes = [vid for vid in ids if vid in com_status]
+            if existentes:
+                placeholders = ",".join(["%s"] * len(existentes))
+                cursor.execute(f"""
+                    UPDATE status
+                    SET fase_id = %s, data_atualizacao = %s, origem = %s
+                    WHERE visitante_id IN ({placeholders})
+                """, (fase_id, data_atualizacao, origem, *existentes))
+            novos.extend((vid, fase_id, data_atualizacao, origem) for vid in ids if vid not in com_status)
+        if novos:
+            valores = ", ".join(["(%s, %s, %s, %s)"] * len(novos))
+            cursor.execute(f"""
+                INSERT INTO status (visitante_id, fase_id, data_atualizacao, origem)
+                VALUES {valores}
+            """, tuple(v for linha in novos for v in linha))
+        logging.info(f"🔄 Pós-envio em lote: fase atualizada para {sum(len(i) for i in por_fase.values())} visitante(s)")
+
+    # 3) eventos_envios (campanhas): um UPDATE por status
+    por_status: Dict[str, List[Tuple[int, str]]] = {}
+    for visitante_id, evento_nome, status in eventos:
+        por_status.setdefault(status, []).append((int(visitante_id), str(evento_nome)))
+    for status, pares in por_status.items():
+        placeholders = ",".join(["(%s, %s)"] * len(pares))
+        cursor.execute(f"""
+            UPDATE eventos_envios
+            SET status = %s, data_envio = NOW()
+            WHERE (visitante_id, evento_nome) IN ({placeholders})
+        """, (status, *(v for par in pares for v in par)))
+
+
 def obter_estado_atual_do_banco(telefone):
     try:
         telefone = _telefone_db(telefone)
@@ -471,6 +1147,7 @@ def salvar_conversa(numero: str, mensagem: str, tipo="recebida", sid=None, orige
                 INSERT INTO conversas (visitante_id, mensagem, tipo, message_sid, origem, created_at)
                 VALUES (%s, %s, %s, %s, %s, NOW())
             """, (vid, mensagem, tipo, sid, origem))
+            _registrar_consentimento(cursor, telefone_db, [(mensagem, tipo)])
 
             conn.commit()
             logging.info(f"💬 Conversa salva: tel={telefone_db}, tipo={tipo}, origem={origem}")
@@ -1067,6 +1744,17 @@ def obter_dados_genero():
 # =======================
 # Treinamento IA
 # =======================
+def registrar_mudanca_ia(cursor, fonte: str, pergunta: str) -> None:
+    """
+    Change-feed da base da IA: cada processo compara MAX(id) com a versão do seu
+    índice em memória e aplica só as perguntas alteradas. Chamar na mesma transação do upsert.
+
+    Args:
+        fonte: 'kb' (knowledge_base) ou 'train' (training_pairs)
+    """
+    cursor.execute("INSERT INTO ia_changelog (fonte, question) VALUES (%s, %s)", (fonte, pergunta))
+
+
 def salvar_par_treinamento(pergunta: str, resposta: str, categoria: str = "geral", fonte: str = "manual"):
     try:
         with closing(get_db_connection()) as conn:
@@ -1078,6 +1766,7 @@ def salvar_par_treinamento(pergunta: str, resposta: str, categoria: str = "geral
                 VALUES (%s, %s, %s, %s, NOW(), NOW())
                 ON DUPLICATE KEY UPDATE answer = VALUES(answer), updated_at = NOW()
             """, (pergunta, resposta, categoria, fonte))
+            registrar_mudanca_ia(cursor, "train", pergunta)
             conn.commit()
             return True
     except Exception as e:
@@ -1212,6 +1901,104 @@ def atualizar_status_envio_evento(visitante_id, evento_nome, novo_status):
         return False
 
 
+def visitantes_com_envio_evento(cursor, evento_nome: str, visitante_ids: List[int]) -> set:
+    """
+    Dos visitantes informados, quais já têm envio desse evento que conta como disparado
+    (qualquer status exceto 'falha' / 'bloqueado_consentimento'). Uma query por bloco de ids.
+    """
+    existentes = set()
+    ids = sorted({int(v) for v in visitante_ids if v})
+    for i in range(0, len(ids), 1000):
+        bloco = ids[i:i + 1000]
+        placeholders = ",".join(["%s"] * len(bloco))
+        cursor.execute(f"""
+            SELECT DISTINCT visitante_id
+            FROM eventos_envios
+            WHERE evento_nome = %s
+              AND status NOT IN ('falha', 'bloqueado_consentimento')
+              AND visitante_id IN ({placeholders})
+        """, (evento_nome, *bloco))
+        existentes.update(int(r["visitante_id"]) for r in cursor.fetchall() or [])
+    return existentes
+
+
+def registrar_envios_evento_em_lote(cursor, evento_nome: str, mensagem: str, status_por_visitante: Dict[int, str],
+                                    origem: str = "integra+") -> None:
+    """
+    Equivalente em lote de salvar_envio_evento + atualizar_status_envio_evento, na transação de quem chama:
+    - fase EVENTO_ENVIADO para todos (UPDATE ... IN + INSERT ... SELECT para quem não tem status)
+    - eventos_envios: linhas anteriores do mesmo evento (falha/bloqueio) são reaproveitadas,
+      os demais ganham uma linha nova (INSERT multi-linha) já com o status final
+    """
+    if not status_por_visitante:
+        return
+    ids = sorted(status_por_visitante)
+
+    fase_id = _obter_fase_id_cache(cursor, "EVENTO_ENVIADO")
+    if not fase_id:
+        cursor.execute("INSERT INTO fases (descricao) VALUES (%s)", ("EVENTO_ENVIADO",))
+        fase_id = int(cursor.lastrowid)
+        _FASES_CACHE["EVENTO_ENVIADO"] = fase_id
+
+    com_envio = set()
+    for i in range(0, len(ids), 500):
+        bloco = ids[i:i + 500]
+        placeholders = ",".join(["%s"] * len(bloco))
+
+        # 1) Fase EVENTO_ENVIADO
+        cursor.execute(f"""
+            UPDATE status
+            SET fase_id = %s, data_atualizacao = NOW(), origem = %s
+            WHERE visitante_id IN ({placeholders})
+        """, (fase_id, origem, *bloco))
+        cursor.execute(f"""
+            INSERT INTO status (visitante_id, fase_id, data_atualizacao, origem)
+            SELECT v.id, %s, NOW(), %s
+            FROM visitantes v
+            LEFT JOIN status s ON s.visitante_id = v.id
+            WHERE v.id IN ({placeholders}) AND s.id IS NULL
+        """, (fase_id, origem, *bloco))
+
+        # 2) Linhas anteriores do evento (só sobram falha/bloqueio: o resto foi deduplicado)
+        cursor.execute(f"""
+            SELECT DISTINCT visitante_id FROM eventos_envios
+            WHERE evento_nome = %s AND visitante_id IN ({placeholders})
+        """, (evento_nome, *bloco))
+        com_envio.update(int(r["visitante_id"]) for r in cursor.fetchall() or [])
+
+    por_status: Dict[str, List[int]] = {}
+    for vid in ids:
+        if vid in com_envio:
+            por_status.setdefault(status_por_visitante[vid], []).append(vid)
+    for status, vids in por_status.items():
+        for i in range(0, len(vids), 500):
+            bloco = vids[i:i + 500]
+            placeholders = ",".join(["%s"] * len(bloco))
+            cursor.execute(f"""
+                UPDATE eventos_envios
+                SET mensagem = %s, imagem_url = NULL, status = %s, origem = %s, data_envio = NOW()
+                WHERE evento_nome = %s AND visitante_id IN ({placeholders})
+            """, (mensagem, status, origem, evento_nome, *bloco))
+
+    novos = [vid for vid in ids if vid not in com_envio]
+    for i in range(0, len(novos), 500):
+        bloco = novos[i:i + 500]
+        valores = ", ".join(["(%s, %s, %s, NULL, %s, %s, NOW())"] * len(bloco))
+        params = []
+        for vid in bloco:
+            params.extend((vid, evento_nome, mensagem, status_por_visitante[vid], origem))
+        cursor.execute(f"""
+            INSERT INTO eventos_envios
+                (visitante_id, evento_nome, mensagem, imagem_url, status, origem, data_envio)
+            VALUES {valores}
+        """, tuple(params))
+
+    logging.info(
+        f"📢 Evento '{evento_nome}' registrado em lote: {len(ids)} visitante(s) "
+        f"({len(novos)} novo(s), {len(ids) - len(novos)} reaproveitado(s))"
+    )
+
+
 def listar_envios_eventos(limit=100, origem: str = None):
     """Lista os últimos envios de eventos/campanhas, opcionalmente filtrando por origem."""
     try:
@@ -1242,6 +2029,35 @@ def listar_envios_eventos(limit=100, origem: str = None):
         return []
 
 
+def _filtro_visitantes_evento(data_inicio=None, data_fim=None, idade_min=None, idade_max=None, genero=None):
+    """Cláusula WHERE (e parâmetros) da audiência de um evento/campanha."""
+    where = "WHERE 1=1"
+    params = []
+
+    if data_inicio:
+        where += " AND data_cadastro >= %s"
+        params.append(data_inicio)
+
+    if data_fim:
+        where += " AND data_cadastro <= %s"
+        params.append(data_fim)
+
+    if genero:
+        where += " AND genero = %s"
+        params.append(genero)
+
+    if idade_min is not None or idade_max is not None:
+        where += " AND data_nascimento IS NOT NULL"
+        if idade_min is not None:
+            where += " AND TIMESTAMPDIFF(YEAR, data_nascimento, CURDATE()) >= %s"
+            params.append(int(idade_min))
+        if idade_max is not None:
+            where += " AND TIMESTAMPDIFF(YEAR, data_nascimento, CURDATE()) <= %s"
+            params.append(int(idade_max))
+
+    return where, params
+
+
 def filtrar_visitantes_para_evento(data_inicio=None, data_fim=None, idade_min=None, idade_max=None, genero=None):
     """
     Retorna visitantes filtrados por data de cadastro, idade e gênero.
@@ -1251,40 +2067,48 @@ def filtrar_visitantes_para_evento(data_inicio=None, data_fim=None, idade_min=No
             if not conn:
                 return []
             cursor = conn.cursor()
-            query = """
+            where, params = _filtro_visitantes_evento(data_inicio, data_fim, idade_min, idade_max, genero)
+            cursor.execute(f"""
                 SELECT id, nome, telefone, genero, data_nascimento, data_cadastro
                 FROM visitantes
-                WHERE 1=1
-            """
-            params = []
+                {where}
+            """, tuple(params))
+            return cursor.fetchall() or []
 
-            if data_inicio:
-                query += " AND data_cadastro >= %s"
-                params.append(data_inicio)
+    except Exception as e:
+        logging.error(f"❌ Erro ao filtrar visitantes para evento: {e}")
+        return []
 
-            if data_fim:
-                query += " AND data_cadastro <= %s"
-                params.append(data_fim)
 
-            if genero:
-                query += " AND genero = %s"
-                params.append(genero)
+def contar_visitantes_para_evento(cursor, **filtros) -> int:
+    """Tamanho da audiência (mesmos filtros de filtrar_visitantes_para_evento)."""
+    where, params = _filtro_visitantes_evento(**filtros)
+    cursor.execute(f"SELECT COUNT(*) AS total FROM visitantes {where}", tuple(params))
+    return int((cursor.fetchone() or {}).get("total") or 0)
 
-            if idade_min is not None or idade_max is not None:
-                query += " AND data_nascimento IS NOT NULL"
-                if idade_min is not None:
-                    query += " AND TIMESTAMPDIFF(YEAR, data_nascimento, CURDATE()) >= %s"
-                    params.append(int(idade_min))
-                if idade_max is not None:
-                    query += " AND TIMESTAMPDIFF(YEAR, data_nascimento, CURDATE()) <= %s"
-                    params.append(int(idade_max))
 
-            cursor.execute(query, tuple(params))
-            return cursor.fetchall() or []
+def listar_telefones_audiencia_evento(cursor, **filtros) -> Tuple[int, List[str]]:
+    """
+    Audiência de um evento/campanha para a prévia: (total de visitantes, telefones preenchidos).
+    O consentimento fica com fila_mensagens.avaliar_consentimento_em_lote, o mesmo filtro do disparo.
+    """
+    where, params = _filtro_visitantes_evento(**filtros)
+    cursor.execute(f"SELECT telefone FROM visitantes {where}", tuple(params))
+    linhas = cursor.fetchall() or []
+    return len(linhas), [row["telefone"] for row in linhas if row.get("telefone")]
 
-    except Exception as e:
-        logging.error(f"❌ Erro ao filtrar visitantes para evento: {e}")
-        return []
+
+def listar_visitantes_para_evento_apos(cursor, apos_id: int, limite: int, **filtros) -> List[Dict[str, Any]]:
+    """Próximo bloco da audiência em ordem de id (paginação por checkpoint, sem OFFSET)."""
+    where, params = _filtro_visitantes_evento(**filtros)
+    cursor.execute(f"""
+        SELECT id, nome, telefone
+        FROM visitantes
+        {where} AND id > %s
+        ORDER BY id
+        LIMIT %s
+    """, (*params, int(apos_id), int(limite)))
+    return cursor.fetchall() or []
 
 
 def limpar_envios_eventos():
@@ -1316,6 +2140,7 @@ def obter_resumo_campanhas(limit=100):
                     COUNT(*) AS total,
                     SUM(CASE WHEN status = 'pendente' THEN 1 ELSE 0 END) AS pendentes,
                     SUM(CASE WHEN status = 'falha' THEN 1 ELSE 0 END) AS falhas,
+                    SUM(CASE WHEN status = 'bloqueado_consentimento' THEN 1 ELSE 0 END) AS bloqueados_consentimento,
                     SUM(CASE WHEN status IN ('enviado', 'reprocessado') THEN 1 ELSE 0 END) AS enviados,
                     MAX(data_envio) AS ultima_data
                 FROM eventos_envios
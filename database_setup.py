@@ -1,8 +1,25 @@
 # database_setup.py (adaptado para MySQL)
 import os
+import sys
 import pymysql
 from contextlib import closing
 
+from utilitarios.texto import PALAVRAS_BLOQUEIO
+from database import chave_consentimento
+
+
+def _conectar():
+    return pymysql.connect(
+        host=os.getenv('MYSQL_HOST', 'localhost'),
+        port=int(os.getenv('MYSQL_PORT', '3306')),
+        user=os.getenv('MYSQL_USER', 'root'),
+        password=os.getenv('MYSQL_PASSWORD', ''),
+        db=os.getenv('MYSQL_DB', ''),
+        charset='utf8mb4',
+        cursorclass=pymysql.cursors.DictCursor
+    )
+
+
 def criar_tabelas():
     """Cria as tabelas necessárias para o CRM no MySQL do HostGator."""
     queries = [
@@ -96,9 +113,163 @@ def criar_tabelas():
             data_hora TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (visitante_id) REFERENCES visitantes(id) ON DELETE CASCADE
         )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS fila_envios (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            numero VARCHAR(20) NOT NULL,
+            mensagem TEXT NOT NULL,
+            imagem_url VARCHAR(500),
+            status VARCHAR(20) NOT NULL DEFAULT 'pendente',
+            tentativas INT NOT NULL DEFAULT 0,
+            status_code INT,
+            last_error VARCHAR(500),
+            meta_json TEXT,
+            scheduled_for DATETIME NULL,
+            prioridade TINYINT NOT NULL DEFAULT 2,
+            claimed_by VARCHAR(64) NULL,
+            claimed_at DATETIME NULL,
+            lease_expires_at DATETIME NULL,
+            instance_id VARCHAR(64) NULL,
+            enviado_em DATETIME NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            KEY idx_fila_envios_claim (status, scheduled_for, created_at),
+            KEY idx_fila_envios_raia (status, prioridade, created_at),
+            KEY idx_fila_envios_instancia (status, instance_id, prioridade, created_at),
+            KEY idx_fila_envios_lease (status, lease_expires_at),
+            KEY idx_fila_envios_claimed_at (claimed_at),
+            KEY idx_fila_envios_enviado_em (status, enviado_em)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS fila_entrada (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            message_sid VARCHAR(128) NULL,
+            telefone VARCHAR(20) NOT NULL,
+            payload_json MEDIUMTEXT NOT NULL,
+            origem VARCHAR(50),
+            status VARCHAR(20) NOT NULL DEFAULT 'pendente',
+            tentativas INT NOT NULL DEFAULT 0,
+            last_error TEXT,
+            locked_by VARCHAR(64),
+            locked_at DATETIME,
+            created_at DATETIME(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+            processed_at DATETIME(3) NULL,
+            UNIQUE KEY uq_fila_entrada_sid (message_sid),
+            KEY idx_fila_entrada_status_tel (status, telefone, id),
+            KEY idx_fila_entrada_tel_status (telefone, status)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS fila_rate_limit (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            instance_id VARCHAR(64) NOT NULL,
+            date DATE NOT NULL,
+            total_sent INT NOT NULL DEFAULT 0,
+            total_failed INT NOT NULL DEFAULT 0,
+            messages_in_current_batch INT NOT NULL DEFAULT 0,
+            last_batch_pause_at DATETIME NULL,
+            current_error_rate DECIMAL(5,3) NOT NULL DEFAULT 0.000,
+            slowdown_active BOOLEAN NOT NULL DEFAULT FALSE,
+            tokens_reservados INT NOT NULL DEFAULT 0,
+            tokens_heartbeat_at DATETIME NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            UNIQUE KEY uq_fila_rate_limit_dia (instance_id, date)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS fila_rate_limit_reservas (
+            instance_id VARCHAR(64) NOT NULL,
+            date DATE NOT NULL,
+            holder VARCHAR(64) NOT NULL,
+            tokens INT NOT NULL DEFAULT 0,
+            heartbeat_at DATETIME NOT NULL,
+            PRIMARY KEY (instance_id, date, holder)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS fila_rate_limit_janela (
+            instance_id VARCHAR(64) NOT NULL,
+            minuto DATETIME NOT NULL,
+            sent INT NOT NULL DEFAULT 0,
+            failed INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (instance_id, minuto)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS zapi_status_cache (
+            instance_id VARCHAR(64) PRIMARY KEY,
+            online TINYINT(1) NOT NULL DEFAULT 0,
+            mensagem VARCHAR(255),
+            resposta_json TEXT,
+            checked_at DATETIME NULL,
+            refreshing_by VARCHAR(64) NULL,
+            refreshing_until DATETIME NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS consent_state (
+            telefone VARCHAR(20) PRIMARY KEY,
+            last_inbound_at DATETIME NULL,
+            last_block_signal_at DATETIME NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS campaign_jobs (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            kind VARCHAR(20) NOT NULL,
+            evento_nome VARCHAR(255) NULL,
+            mensagem TEXT NULL,
+            filtros_json TEXT,
+            status VARCHAR(20) NOT NULL DEFAULT 'pendente',
+            audience_size INT NOT NULL DEFAULT 0,
+            processed INT NOT NULL DEFAULT 0,
+            enqueued INT NOT NULL DEFAULT 0,
+            skipped INT NOT NULL DEFAULT 0,
+            failed INT NOT NULL DEFAULT 0,
+            details_json TEXT,
+            checkpoint_id BIGINT NOT NULL DEFAULT 0,
+            last_fila_id BIGINT NULL,
+            claimed_by VARCHAR(64) NULL,
+            lease_expires_at DATETIME NULL,
+            last_error VARCHAR(500),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at DATETIME NULL,
+            finished_at DATETIME NULL,
+            KEY idx_campaign_jobs_status (status, lease_expires_at)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS ia_changelog (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            fonte VARCHAR(10) NOT NULL,
+            question TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
         '''
     ]
 
+    # Migrações idempotentes para bancos já existentes (MySQL não tem ADD COLUMN IF NOT EXISTS)
+    colunas_extras = [
+        ("fila_envios", "claimed_by", "VARCHAR(64) NULL"),
+        ("fila_envios", "lease_expires_at", "DATETIME NULL"),
+        ("fila_envios", "prioridade", "TINYINT NOT NULL DEFAULT 2"),
+        ("fila_envios", "claimed_at", "DATETIME NULL"),
+        ("fila_envios", "instance_id", "VARCHAR(64) NULL"),
+        ("fila_envios", "enviado_em", "DATETIME NULL"),
+        ("fila_rate_limit", "tokens_reservados", "INT NOT NULL DEFAULT 0"),
+        ("fila_rate_limit", "tokens_heartbeat_at", "DATETIME NULL"),
+    ]
+    indices_extras = [
+        ("fila_envios", "idx_fila_envios_claim", "(status, scheduled_for, created_at)"),
+        ("fila_envios", "idx_fila_envios_lease", "(status, lease_expires_at)"),
+        ("fila_envios", "idx_fila_envios_raia", "(status, prioridade, created_at)"),
+        ("fila_envios", "idx_fila_envios_claimed_at", "(claimed_at)"),
+        ("fila_envios", "idx_fila_envios_instancia", "(status, instance_id, prioridade, created_at)"),
+        ("fila_envios", "idx_fila_envios_enviado_em", "(status, enviado_em)"),
+    ]
+
     fases_iniciais = [
         "INICIO",
         "MENU",
@@ -113,20 +284,46 @@ def criar_tabelas():
     ]
 
     try:
-        conn = pymysql.connect(
-            host=os.getenv('MYSQL_HOST', 'localhost'),
-            port=int(os.getenv('MYSQL_PORT', '3306')),
-            user=os.getenv('MYSQL_USER', 'root'),
-            password=os.getenv('MYSQL_PASSWORD', ''),
-            db=os.getenv('MYSQL_DB', ''),
-            charset='utf8mb4',
-            cursorclass=pymysql.cursors.DictCursor
-        )
+        conn = _conectar()
         with closing(conn.cursor()) as cursor:
+            cursor.execute("""
+                SELECT COUNT(*) AS count FROM information_schema.TABLES
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'consent_state'
+            """)
+            consent_state_novo = cursor.fetchone()['count'] == 0
+
             # Criar tabelas
             for query in queries:
                 cursor.execute(query)
 
+            for tabela, coluna, definicao in colunas_extras:
+                cursor.execute("""
+                    SELECT COUNT(*) AS count FROM information_schema.COLUMNS
+                    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+                """, (tabela, coluna))
+                if cursor.fetchone()['count'] == 0:
+                    cursor.execute(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {definicao}")
+                    print(f"Coluna {tabela}.{coluna} criada.")
+                    if (tabela, coluna) == ("fila_envios", "prioridade"):
+                        # Backfill das raias para itens ainda pendentes
+                        cursor.execute("""
+                            UPDATE fila_envios
+                            SET prioridade = CASE
+                                WHEN JSON_EXTRACT(meta_json, '$.is_reply') = true THEN 0
+                                WHEN JSON_UNQUOTE(JSON_EXTRACT(meta_json, '$.tipo')) = 'manual' THEN 1
+                                ELSE 2 END
+                            WHERE status IN ('pendente', 'processando')
+                        """)
+
+            for tabela, indice, colunas in indices_extras:
+                cursor.execute("""
+                    SELECT COUNT(*) AS count FROM information_schema.STATISTICS
+                    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+                """, (tabela, indice))
+                if cursor.fetchone()['count'] == 0:
+                    cursor.execute(f"CREATE INDEX {indice} ON {tabela} {colunas}")
+                    print(f"Índice {indice} criado em {tabela}.")
+
             # Inserir fases iniciais se não existirem
             cursor.execute('SELECT COUNT(*) as count FROM fases')
             count = cursor.fetchone()['count']
@@ -135,6 +332,14 @@ def criar_tabelas():
                     cursor.execute('INSERT INTO fases (descricao) VALUES (%s)', (fase,))
                 print("Fases inseridas com sucesso!")
 
+            # Linhas gravadas com o telefone cru (máscara, +55, sem o 9) antes da chave normalizada
+            cursor.execute("SELECT COUNT(*) AS count FROM consent_state WHERE telefone NOT REGEXP '^[0-9]{11}$'")
+            consent_state_legado = cursor.fetchone()['count'] > 0
+
+            if consent_state_novo or consent_state_legado:
+                # Tabela nova (ou com chaves antigas): monta o índice de consentimento a partir do histórico
+                _backfill_consent_state(cursor)
+
             conn.commit()
         conn.close()
         print("Tabelas e fases criadas/validadas com sucesso no MySQL!")
@@ -142,5 +347,76 @@ def criar_tabelas():
         print(f"Erro ao criar tabelas: {e}")
 
 
+def _backfill_consent_state(cursor):
+    """
+    Reconstrói consent_state (última recebida / último sinal de bloqueio por telefone) a partir de conversas.
+    Cada telefone vira a chave de database.chave_consentimento (a mesma da consulta da fila);
+    formatos diferentes do mesmo número são somados e o sinal de bloqueio mais recente prevalece.
+    Linhas antigas gravadas com o telefone cru são migradas para a chave normalizada.
+    """
+    sinais = " OR ".join(["c.mensagem LIKE %s"] * len(PALAVRAS_BLOQUEIO))
+    cursor.execute(f"""
+        SELECT
+            v.telefone,
+            MAX(CASE WHEN c.tipo = 'recebida' THEN c.created_at END) AS last_inbound_at,
+            MAX(CASE WHEN c.tipo = 'bloqueado' OR (c.tipo = 'recebida' AND ({sinais})) THEN c.created_at END) AS last_block_signal_at
+        FROM conversas c
+        INNER JOIN visitantes v ON c.visitante_id = v.id
+        WHERE c.tipo IN ('recebida', 'bloqueado')
+        GROUP BY v.telefone
+    """, tuple(f"%{p}%" for p in PALAVRAS_BLOQUEIO))
+    linhas = list(cursor.fetchall() or [])
+
+    cursor.execute("SELECT telefone, last_inbound_at, last_block_signal_at FROM consent_state")
+    legadas = [row for row in cursor.fetchall() or [] if row['telefone'] != chave_consentimento(row['telefone'])]
+    linhas.extend(legadas)
+
+    por_chave = _consolidar_consentimento(linhas)
+    valores = [(chave, recebida, bloqueio) for chave, (recebida, bloqueio) in por_chave.items()]
+    for i in range(0, len(valores), 1000):
+        cursor.executemany("""
+            INSERT INTO consent_state (telefone, last_inbound_at, last_block_signal_at)
+            VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                last_inbound_at = GREATEST(COALESCE(consent_state.last_inbound_at, VALUES(last_inbound_at)),
+                                           COALESCE(VALUES(last_inbound_at), consent_state.last_inbound_at)),
+                last_block_signal_at = GREATEST(COALESCE(consent_state.last_block_signal_at, VALUES(last_block_signal_at)),
+                                                COALESCE(VALUES(last_block_signal_at), consent_state.last_block_signal_at))
+        """, valores[i:i + 1000])
+    if legadas:
+        cursor.executemany("DELETE FROM consent_state WHERE telefone = %s", [(row['telefone'],) for row in legadas])
+    print(f"consent_state reconstruída a partir de conversas ({len(valores)} telefone(s), {len(legadas)} linha(s) legada(s) migrada(s)).")
+
+
+def _consolidar_consentimento(linhas):
+    """{chave: (última recebida, último bloqueio)} somando as linhas que caem na mesma chave."""
+    def _maior(a, b):
+        return b if a is None else a if b is None else max(a, b)
+
+    por_chave = {}
+    for row in linhas:
+        chave = chave_consentimento(row['telefone'])
+        if not chave:
+            continue
+        recebida, bloqueio = por_chave.get(chave, (None, None))
+        por_chave[chave] = (_maior(recebida, row['last_inbound_at']), _maior(bloqueio, row['last_block_signal_at']))
+    return por_chave
+
+
+def backfill_consent_state():
+    """Comando avulso: python database_setup.py --backfill-consent"""
+    try:
+        conn = _conectar()
+        with closing(conn.cursor()) as cursor:
+            _backfill_consent_state(cursor)
+            conn.commit()
+        conn.close()
+    except Exception as e:
+        print(f"Erro ao reconstruir consent_state: {e}")
+
+
 if __name__ == '__main__':
-    criar_tabelas()
+    if '--backfill-consent' in sys.argv[1:]:
+        backfill_consent_state()
+    else:
+        criar_tabelas()
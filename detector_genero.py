@@ -1,3 +1,7 @@
+import os
+import argparse
+
+import numpy as np
 import pandas as pd
 import unidecode
 
@@ -101,27 +105,190 @@ nomes_femininos = [
     "YASMIN", "YENIFER", "ZAIDA", "ZENAIDE", "ZENILDA", "ZERONI"]
 
 
+GENERO_MASCULINO = "Masculino"
+GENERO_FEMININO = "Feminino"
+GENERO_INDETERMINADO = "Indeterminado"
+
+# Valor gravado em visitantes.genero (o mesmo dos formulários e das estatísticas)
+GENERO_DB = {GENERO_MASCULINO: "masculino", GENERO_FEMININO: "feminino"}
+
+CHUNK_PADRAO = 50000
+
+
+def _chave_nome(nome) -> str:
+    """Primeiro nome em maiúsculas e sem acentos (chave do dicionário)."""
+    partes = str(nome).split() if nome is not None else []
+    return unidecode.unidecode(partes[0].upper()) if partes else ""
+
+
+# Dicionário montado uma vez (listas com e sem acento viram a mesma chave);
+# nomes nas duas listas ficam masculinos, como na checagem original
+GENERO_POR_NOME = {
+    **{_chave_nome(n): GENERO_FEMININO for n in nomes_femininos},
+    **{_chave_nome(n): GENERO_MASCULINO for n in nomes_masculinos},
+}
+
+
 # Função para determinar o gênero
 def identificar_genero(nome):
-    primeiro_nome = unidecode.unidecode(nome.split()[0].upper())  # Remove acentos e usa apenas o primeiro nome
-    if primeiro_nome in nomes_masculinos:
-        return "Masculino"
-    elif primeiro_nome in nomes_femininos:
-        return "Feminino"
-    else:
-        return "Indeterminado"
+    return GENERO_POR_NOME.get(_chave_nome(nome), GENERO_INDETERMINADO)
+
+
+def classificar_nomes(nomes) -> pd.Series:
+    """
+    Classificação em lote: extrai o primeiro nome com operações vetorizadas de string,
+    tira acento e consulta o dicionário uma vez por nome distinto e espalha o resultado com numpy.
+    """
+    nomes = pd.Series(nomes)
+    primeiros = nomes.fillna("").astype(str).str.split(n=1).str[0].str.upper()
+    codigos, distintos = pd.factorize(primeiros)
+    rotulos = np.array(
+        [GENERO_POR_NOME.get(unidecode.unidecode(n), GENERO_INDETERMINADO) for n in distintos] + [GENERO_INDETERMINADO],
+        dtype=object,
+    )
+    # factorize devolve -1 para nulos: cai no último rótulo (Indeterminado)
+    return pd.Series(rotulos[codigos], index=nomes.index)
+
+
+def classificar_dataframe(df: pd.DataFrame, coluna: str = "NOME", destino: str = "Gênero") -> pd.DataFrame:
+    df[destino] = classificar_nomes(df[coluna]).values
+    return df
 
 
-# Carregar o arquivo Excel
-file_path = r"C:\Users\WilsonMartins\Downloads\nome_genero.xlsx"
-# ajuste o caminho se necessário
-df = pd.read_excel(file_path)
+# =========================
+# Arquivos grandes (CSV/XLSX em blocos)
+# =========================
+def _blocos_csv(caminho: str, chunk: int):
+    yield from pd.read_csv(caminho, chunksize=chunk, dtype=str, keep_default_na=False)
 
-# Aplicar a função de gênero
-df['Gênero'] = df['NOME'].apply(identificar_genero)
 
-# Salvar o resultado em um novo arquivo
-output_file = "nome_genero_classificado_v2.xlsx"
-df.to_excel(output_file, index=False)
+def _blocos_xlsx(caminho: str, chunk: int):
+    import openpyxl  # mesmo motor do pd.read_excel; só para XLSX
 
-print(f"Classificação concluída. O arquivo com gêneros foi salvo como {output_file}.")
+    wb = openpyxl.load_workbook(caminho, read_only=True, data_only=True)
+    try:
+        linhas = wb.active.iter_rows(values_only=True)
+        cabecalho = [str(c) if c is not None else "" for c in next(linhas, ())]
+        bloco = []
+        for linha in linhas:
+            bloco.append(linha)
+            if len(bloco) >= chunk:
+                yield pd.DataFrame(bloco, columns=cabecalho)
+                bloco = []
+        if bloco:
+            yield pd.DataFrame(bloco, columns=cabecalho)
+    finally:
+        wb.close()
+
+
+def classificar_arquivo(entrada: str, saida: str, coluna: str = "NOME", chunk: int = CHUNK_PADRAO) -> dict:
+    """
+    Classifica um export de membros/visitantes (CSV ou XLSX) em blocos de `chunk` linhas,
+    sem carregar o arquivo inteiro. A saída (CSV ou XLSX, pela extensão) ganha a coluna 'Gênero'.
+    """
+    blocos = _blocos_xlsx(entrada, chunk) if entrada.lower().endswith((".xlsx", ".xlsm")) else _blocos_csv(entrada, chunk)
+    saida_xlsx = saida.lower().endswith(".xlsx")
+    totais = {"linhas": 0, GENERO_MASCULINO: 0, GENERO_FEMININO: 0, GENERO_INDETERMINADO: 0}
+
+    wb = ws = None
+    if saida_xlsx:
+        import openpyxl
+
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet()
+    try:
+        for i, df in enumerate(blocos):
+            classificar_dataframe(df, coluna)
+            totais["linhas"] += len(df)
+            for genero, n in df["Gênero"].value_counts().items():
+                totais[genero] += int(n)
+            if saida_xlsx:
+                if i == 0:
+                    ws.append(list(df.columns))
+                for linha in df.itertuples(index=False, name=None):
+                    ws.append(list(linha))
+            else:
+                df.to_csv(saida, mode="w" if i == 0 else "a", header=(i == 0), index=False)
+            print(f"  ... {totais['linhas']} linha(s) classificada(s)")
+    finally:
+        if wb is not None:
+            wb.save(saida)
+    return totais
+
+
+# =========================
+# Backfill de visitantes.genero
+# =========================
+def backfill_genero_visitantes(lote: int = 1000, sobrescrever: bool = False) -> dict:
+    """
+    Preenche visitantes.genero pelo primeiro nome, em lotes por id (keyset).
+    Só grava masculino/feminino; indeterminados continuam vazios. Um commit por lote.
+
+    Args:
+        sobrescrever: reclassifica também quem já tem gênero preenchido
+    """
+    from database import get_db_connection  # só o backfill precisa do banco
+
+    totais = {"lidos": 0, "masculino": 0, "feminino": 0, "indeterminados": 0}
+    conn = get_db_connection()
+    if not conn:
+        print("Erro ao conectar no banco.")
+        return totais
+    try:
+        cursor = conn.cursor()
+        filtro = "" if sobrescrever else " AND (genero IS NULL OR genero = '')"
+        ultimo_id = 0
+        while True:
+            cursor.execute(f"""
+                SELECT id, nome FROM visitantes
+                WHERE id > %s{filtro}
+                ORDER BY id LIMIT %s
+            """, (ultimo_id, lote))
+            linhas = cursor.fetchall() or []
+            if not linhas:
+                break
+            ultimo_id = linhas[-1]["id"]
+            ids = np.array([r["id"] for r in linhas])
+            generos = classificar_nomes([r["nome"] for r in linhas]).to_numpy()
+
+            for genero, valor_db in GENERO_DB.items():
+                alvo = ids[generos == genero].tolist()
+                if alvo:
+                    cursor.execute(
+                        f"UPDATE visitantes SET genero = %s WHERE id IN ({','.join(['%s'] * len(alvo))})",
+                        (valor_db, *alvo),
+                    )
+                    totais[valor_db] += len(alvo)
+            conn.commit()
+            totais["lidos"] += len(linhas)
+            totais["indeterminados"] += int((generos == GENERO_INDETERMINADO).sum())
+            print(f"  ... {totais['lidos']} visitante(s) processado(s)")
+    except Exception as e:
+        conn.rollback()
+        print(f"Erro no backfill de gênero: {e}")
+    finally:
+        conn.close()
+    return totais
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Classifica gênero pelo primeiro nome.")
+    parser.add_argument("entrada", nargs="?", help="CSV ou XLSX com a coluna de nomes")
+    parser.add_argument("saida", nargs="?", help="arquivo de saída (.csv ou .xlsx)")
+    parser.add_argument("--coluna", default="NOME", help="coluna com o nome (padrão: NOME)")
+    parser.add_argument("--chunk", type=int, default=CHUNK_PADRAO, help="linhas por bloco")
+    parser.add_argument("--backfill-visitantes", action="store_true",
+                        help="preenche visitantes.genero no banco em vez de classificar um arquivo")
+    parser.add_argument("--sobrescrever", action="store_true", help="no backfill, reclassifica quem já tem gênero")
+    args = parser.parse_args()
+
+    if args.backfill_visitantes:
+        resultado = backfill_genero_visitantes(sobrescrever=args.sobrescrever)
+        print(f"Backfill concluído: {resultado}")
+    elif args.entrada:
+        base, ext = os.path.splitext(args.entrada)
+        output_file = args.saida or f"{base}_classificado{ext if ext.lower() in ('.csv', '.xlsx') else '.csv'}"
+        resultado = classificar_arquivo(args.entrada, output_file, coluna=args.coluna, chunk=args.chunk)
+        print(f"Classificação concluída ({resultado}). O arquivo com gêneros foi salvo como {output_file}.")
+    else:
+        parser.print_help()
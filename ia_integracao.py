@@ -1,20 +1,471 @@
 # ia_integracao.py - Integração com banco de dados (CORRIGIDA - Sem updated_at)
+import os
 import logging
 import re
+import threading
+import time
 import unicodedata
 from datetime import datetime
-from functools import lru_cache
 from contextlib import closing
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from database import get_db_connection
 from utilitarios.texto import normalizar_texto
+from servicos.cache_respostas_ia import CacheRespostas
+
+try:
+    import numpy as np
+    import scipy.sparse as sp
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    HAVE_SKLEARN = True
+except ImportError:  # pragma: no cover - scikit-learn/numpy estão no requirements.txt
+    np = None
+    sp = None
+    TfidfVectorizer = None
+    HAVE_SKLEARN = False
 
 log = logging.getLogger(__name__)
 
+# =========================
+# Config da busca local (TF-IDF)
+# =========================
+BUSCA_LOCAL_ENABLED = os.getenv("IA_BUSCA_LOCAL_ENABLED", "1") == "1"
+BUSCA_TOP_K = int(os.getenv("IA_BUSCA_TOP_K", "5"))
+BUSCA_SIM_MINIMA = float(os.getenv("IA_BUSCA_SIM_MINIMA", "0.25"))   # abaixo disso não é match
+BUSCA_SIM_FORTE = float(os.getenv("IA_BUSCA_SIM_FORTE", "0.65"))     # ~ FULLTEXT >= 2.0
+BUSCA_SIM_BOA = float(os.getenv("IA_BUSCA_SIM_BOA", "0.45"))         # ~ FULLTEXT >= 1.0
+BUSCA_PESO_PERGUNTA = 0.75  # restante vai para a resposta (FULLTEXT indexava question + answer)
+CHANGEFEED_SEC = float(os.getenv("IA_CHANGEFEED_SEC", "5"))          # intervalo de checagem do ia_changelog
+DELTAS_ATE_RECARGA = int(os.getenv("IA_DELTAS_ATE_RECARGA", "200"))  # acima disso (ou 25% da base) recarrega tudo
+CHANGEFEED_LACUNA_SEC = float(os.getenv("IA_CHANGEFEED_LACUNA_SEC", "300"))  # espera por id abaixo da versão ainda não commitado
+CHANGEFEED_JANELA_IDS = 500   # na carga, ids recentes que podem estar em transação aberta
+CHANGELOG_RETENCAO_DIAS = int(os.getenv("IA_CHANGELOG_RETENCAO_DIAS", "7"))
+CHANGELOG_LIMPEZA_SEC = 3600
+
+STOPWORDS = {
+    'o', 'a', 'os', 'as', 'um', 'uma', 'uns', 'umas', 'de', 'da', 'do', 
+    'das', 'dos', 'em', 'no', 'na', 'nos', 'nas', 'por', 'para', 'com', 
+    'sem', 'sob', 'sobre', 'que', 'qual', 'quais', 'quem', 'como', 
+    'quando', 'onde', 'por que', 'porque', 'entao', 'mas', 'e', 'ou', 
+    'se', 'nao', 'não', 'sim', 'ja', 'já', 'ainda', 'tambem', 'também', 
+    'so', 'só', 'somente', 'apenas', 'mais', 'menos', 'muito', 'pouco', 
+    'tudo', 'nada', 'algo', 'alguem', 'ninguem', 'todo', 'toda', 'todos', 
+    'todas', 'este', 'esta', 'estes', 'estas', 'esse', 'essa', 'esses', 
+    'essas', 'aquele', 'aquela', 'aqueles', 'aquelas', 'isto', 'isso', 'aquilo'
+}
+
+CATEGORIAS_CONHECIDAS = [
+    'horarios', 'culto', 'batismo', 'membro', 'oracao', 
+    'grupo', 'whatsapp', 'discipulado', 'novo come', 
+    'pastor', 'lider', 'evento', 'fundadores'
+]
+
+
+def _sem_acentos(texto: str) -> str:
+    texto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+
+
+def normalizar_para_busca(texto: str) -> str:
+    """
+    Normaliza texto para busca: lowercase, remove acentos, tokens únicos.
+    Ex: "Quais horários temos cultos?" → "cultos horarios temos"
+    """
+    tokens = re.findall(r'\b[a-zà-ú0-9]+\b', _sem_acentos(texto))
+    tokens = [t for t in tokens if t not in STOPWORDS]
+    # Junta tokens únicos (ordem não importa para busca)
+    return ' '.join(sorted(set(tokens)))
+
+
+# =========================
+# Índice em memória (knowledge_base + training_pairs)
+# =========================
+def _chave_doc(fonte: str, pergunta: str) -> Tuple[str, str]:
+    return fonte, (pergunta or '').strip()
+
+
+class _IndiceBusca:
+    """
+    Snapshot imutável das duas tabelas: matriz TF-IDF esparsa (n-gramas de caracteres
+    sobre o texto normalizado, tolera plural/erro de digitação) + dados para os
+    fallbacks por tokens e por categoria. Mudanças geram outro snapshot (com_delta)
+    e a troca da referência é atômica.
+    """
+
+    def __init__(self, linhas: List[Dict[str, Any]]):
+        self.vetorizador = None
+        self.n_delta = 0
+        self._definir_linhas(linhas)
+        self.ativo = np.ones(self.tamanho, dtype=bool)
+        self._indexar_categorias()
+        if not linhas:
+            return
+        textos_pergunta, textos_resposta = self._textos(linhas)
+        self.vetorizador = TfidfVectorizer(
+            analyzer='char_wb', ngram_range=(3, 5), lowercase=False,
+            sublinear_tf=True, dtype=np.float32,
+        )
+        self.vetorizador.fit(textos_pergunta + textos_resposta)
+        # Linhas L2-normalizadas: produto escalar = cosseno
+        self.m_pergunta = self.vetorizador.transform(textos_pergunta)
+        self.m_resposta = self.vetorizador.transform(textos_resposta)
+
+    @staticmethod
+    def _textos(linhas: List[Dict[str, Any]]) -> Tuple[List[str], List[str]]:
+        return ([normalizar_para_busca(str(r.get('question') or '')) for r in linhas],
+                [normalizar_para_busca(str(r.get('answer') or '')) for r in linhas])
+
+    def _definir_linhas(self, linhas: List[Dict[str, Any]]) -> None:
+        self.tamanho = len(linhas)
+        self.chaves = [_chave_doc(r['fonte'], str(r.get('question') or '')) for r in linhas]
+        self.respostas = [str(r.get('answer') or '') for r in linhas]
+        self.fontes = [r['fonte'] for r in linhas]
+        self.categorias = [r.get('category') for r in linhas]
+        # Pergunta como o LIKE via (collation sem acento/caixa)
+        self.perguntas = [_sem_acentos(str(r.get('question') or '')) for r in linhas]
+        self.criado_em = np.array([
+            r['created_at'].timestamp() if isinstance(r.get('created_at'), datetime) else 0.0
+            for r in linhas
+        ])
+        self.eh_kb = np.array([f == 'kb' for f in self.fontes], dtype=bool)
+
+    def _indexar_categorias(self) -> None:
+        """Categoria → resposta mais recente (ativa) da knowledge_base."""
+        self.por_categoria: Dict[str, int] = {}
+        for i, cat in enumerate(self.categorias):
+            if cat and self.eh_kb[i] and self.ativo[i]:
+                atual = self.por_categoria.get(cat)
+                if atual is None or self.criado_em[i] > self.criado_em[atual]:
+                    self.por_categoria[cat] = i
+
+    def com_delta(self, chaves: set, linhas: List[Dict[str, Any]]) -> Optional["_IndiceBusca"]:
+        """
+        Novo snapshot com as perguntas de `chaves` substituídas por `linhas` (estado atual no banco;
+        chave sem linha = removida). Versões antigas ficam inativas e as novas entram no fim,
+        vetorizadas com o vocabulário/idf atual. None = índice vazio, precisa de carga completa.
+        """
+        if self.vetorizador is None:
+            return None
+        novo = object.__new__(_IndiceBusca)
+        novo.vetorizador = self.vetorizador
+        novo.ativo = self.ativo.copy()
+        novo.ativo[[i for i, c in enumerate(self.chaves) if c in chaves]] = False
+
+        textos_pergunta, textos_resposta = self._textos(linhas)
+        extra = object.__new__(_IndiceBusca)
+        extra._definir_linhas(linhas)
+
+        novo.tamanho = self.tamanho + extra.tamanho
+        for campo in ('chaves', 'respostas', 'fontes', 'categorias', 'perguntas'):
+            setattr(novo, campo, getattr(self, campo) + getattr(extra, campo))
+        novo.criado_em = np.concatenate([self.criado_em, extra.criado_em])
+        novo.eh_kb = np.concatenate([self.eh_kb, extra.eh_kb])
+        novo.ativo = np.concatenate([novo.ativo, np.ones(extra.tamanho, dtype=bool)])
+        if linhas:
+            novo.m_pergunta = sp.vstack([self.m_pergunta, self.vetorizador.transform(textos_pergunta)], format='csr')
+            novo.m_resposta = sp.vstack([self.m_resposta, self.vetorizador.transform(textos_resposta)], format='csr')
+        else:
+            novo.m_pergunta, novo.m_resposta = self.m_pergunta, self.m_resposta
+        novo.n_delta = self.n_delta + len(chaves)
+        novo._indexar_categorias()
+        return novo
+
+    def top_k(self, pergunta_normalizada: str, k: int) -> List[Tuple[int, float]]:
+        """(índice, similaridade) dos k melhores, ordenados por similaridade e depois mais recente."""
+        if self.vetorizador is None or not pergunta_normalizada:
+            return []
+        v = self.vetorizador.transform([pergunta_normalizada]).T
+        sims = (BUSCA_PESO_PERGUNTA * (self.m_pergunta @ v).toarray().ravel()
+                + (1 - BUSCA_PESO_PERGUNTA) * (self.m_resposta @ v).toarray().ravel())
+        sims[~self.ativo] = -1.0
+        k = min(max(1, k), self.tamanho)
+        candidatos = np.argpartition(-sims, k - 1)[:k]
+        ordem = np.lexsort((-self.criado_em[candidatos], -sims[candidatos]))
+        return [(int(candidatos[i]), float(sims[candidatos[i]])) for i in ordem if self.ativo[candidatos[i]]]
+
+    def por_tokens(self, pergunta_normalizada: str) -> Optional[int]:
+        """Equivalente ao LIKE em AND: kb primeiro, depois o mais recente."""
+        tokens = [t for t in pergunta_normalizada.split() if len(t) >= 3]
+        if len(tokens) < 2:
+            tokens = [pergunta_normalizada]
+        achados = [i for i, q in enumerate(self.perguntas) if self.ativo[i] and all(t in q for t in tokens)]
+        if not achados:
+            return None
+        return max(achados, key=lambda i: (self.eh_kb[i], self.criado_em[i]))
+
+
+class MotorBuscaLocal:
+    """
+    Busca da IA sem ida ao MySQL: o índice é carregado em background na subida
+    (uma query por tabela) e compartilhado por todas as IAIntegracao do processo.
+    Enquanto não estiver pronto, IAIntegracao usa o caminho antigo (FULLTEXT/LIKE no banco).
+
+    Atualização: /api/ia/teach e salvar_par_treinamento gravam em ia_changelog; a cada
+    IA_CHANGEFEED_SEC o processo compara MAX(id) com sua versão e aplica só as perguntas
+    alteradas. Ouvintes (caches das IAIntegracao) são avisados a cada troca de índice.
+    Com escritores concorrentes um id menor pode commitar depois de um maior: ids que faltam
+    abaixo da versão viram lacunas e são reconsultados até aparecerem (ou por
+    IA_CHANGEFEED_LACUNA_SEC, se a transação foi desfeita).
+    """
+
+    def __init__(self):
+        self._indice: Optional[_IndiceBusca] = None
+        self._lock = threading.Lock()
+        self._lock_sync = threading.Lock()
+        self._carregando = False
+        self._carregado_em: Optional[str] = None
+        self._duracao_ms = 0
+        self._versao: Optional[int] = None   # MAX(ia_changelog.id) refletido no índice
+        self._lacunas: Dict[int, float] = {}  # id abaixo da versão ainda não visto → desde quando (monotonic)
+        self._ultimo_sync = 0.0
+        self._ultima_limpeza = 0.0
+        self._metricas = {"hits": 0, "misses": 0, "erros_carga": 0, "deltas_aplicados": 0}
+        self.ouvintes: List[Callable[[], None]] = []
+
+    @property
+    def pronto(self) -> bool:
+        return self._indice is not None
+
+    @property
+    def versao(self) -> Optional[int]:
+        """
+        Versão do change-feed refletida no índice (None = sem índice, sem ia_changelog ou com
+        lacuna pendente: o índice pode não ter um id abaixo de MAX(id) e não é comparável entre processos).
+        """
+        if self._indice is None or self._lacunas:
+            return None
+        return self._versao
+
+    @staticmethod
+    def _ler_versao(cursor) -> Optional[int]:
+        """MAX(id) do change-feed; None se a tabela ainda não existe (database_setup não rodou)."""
+        try:
+            cursor.execute("SELECT COALESCE(MAX(id), 0) AS versao FROM ia_changelog")
+            return int((cursor.fetchone() or {}).get('versao') or 0)
+        except Exception as e:
+            log.debug(f"⚠️ ia_changelog indisponível: {e}")
+            return None
+
+    @staticmethod
+    def _lacunas_recentes(cursor, versao: int) -> List[int]:
+        """Ids da janela final do change-feed que ainda não aparecem (transação aberta na carga)."""
+        inicio = max(0, versao - CHANGEFEED_JANELA_IDS)
+        cursor.execute("SELECT id FROM ia_changelog WHERE id > %s AND id <= %s", (inicio, versao))
+        vistos = {int(r['id']) for r in cursor.fetchall() or []}
+        return [i for i in range(inicio + 1, versao + 1) if i not in vistos]
+
+    def _limpar_changelog(self, cursor, conn) -> None:
+        """Apaga entradas antigas do change-feed (mantém a mais recente: MAX(id) é a versão)."""
+        if time.monotonic() - self._ultima_limpeza < CHANGELOG_LIMPEZA_SEC:
+            return
+        self._ultima_limpeza = time.monotonic()
+        cursor.execute("""
+            DELETE FROM ia_changelog
+            WHERE created_at < NOW() - INTERVAL %s DAY AND id < %s
+            LIMIT 5000
+        """, (CHANGELOG_RETENCAO_DIAS, self._versao))
+        conn.commit()
+        if cursor.rowcount:
+            log.info(f"🧹 ia_changelog: {cursor.rowcount} entrada(s) antiga(s) removida(s).")
+
+    def _trocar(self, indice: _IndiceBusca) -> None:
+        self._indice = indice
+        for ouvinte in list(self.ouvintes):
+            try:
+                ouvinte()
+            except Exception as e:
+                log.warning(f"⚠️ Falha ao avisar cache da IA sobre índice novo: {e}")
+
+    def carregar(self) -> bool:
+        """Lê knowledge_base + training_pairs e troca o índice. Retorna False se não conseguiu."""
+        if not (BUSCA_LOCAL_ENABLED and HAVE_SKLEARN):
+            return False
+        inicio = time.monotonic()
+        try:
+            with closing(get_db_connection()) as conn:
+                if not conn:
+                    self._metricas["erros_carga"] += 1
+                    return False
+                cursor = conn.cursor()
+                # Versão lida antes das tabelas: mudança concorrente é reaplicada no próximo sync
+                versao = self._ler_versao(cursor)
+                lacunas = self._lacunas_recentes(cursor, versao) if versao else []
+                cursor.execute("SELECT question, answer, category, created_at FROM knowledge_base")
+                linhas = [{**r, 'fonte': 'kb'} for r in cursor.fetchall() or []]
+                cursor.execute("SELECT question, answer, category, created_at FROM training_pairs")
+                linhas += [{**r, 'fonte': 'train'} for r in cursor.fetchall() or []]
+            indice = _IndiceBusca([r for r in linhas if r.get('answer')])
+        except Exception as e:
+            self._metricas["erros_carga"] += 1
+            log.error(f"❌ Falha ao montar índice local da IA: {e}", exc_info=True)
+            return False
+
+        self._versao = versao
+        agora = time.monotonic()
+        self._lacunas = {i: agora for i in lacunas}
+        self._ultimo_sync = agora
+        self._carregado_em = datetime.now().isoformat(timespec="seconds")
+        self._duracao_ms = int((time.monotonic() - inicio) * 1000)
+        self._trocar(indice)
+        log.info(f"🧠 Índice local da IA carregado: {indice.tamanho} pares em {self._duracao_ms}ms")
+        return True
+
+    def carregar_em_background(self, forcar: bool = False) -> None:
+        """Dispara a carga numa thread (ignora se já carregando ou, sem `forcar`, já carregado)."""
+        if not (BUSCA_LOCAL_ENABLED and HAVE_SKLEARN):
+            return
+        with self._lock:
+            if self._carregando or (self._indice is not None and not forcar):
+                return
+            self._carregando = True
+
+        def _rodar():
+            try:
+                self.carregar()
+            finally:
+                self._carregando = False
+
+        threading.Thread(target=_rodar, name="ia-indice", daemon=True).start()
+
+    def sincronizar(self) -> None:
+        """
+        Checagem barata do change-feed (no máximo a cada IA_CHANGEFEED_SEC, uma thread por vez):
+        uma query por PK; só com versão nova (ou lacuna pendente) busca as perguntas alteradas
+        e aplica o delta.
+        """
+        indice = self._indice
+        if indice is None or self._versao is None or self._carregando:
+            return
+        if time.monotonic() - self._ultimo_sync < CHANGEFEED_SEC:
+            return
+        if not self._lock_sync.acquire(blocking=False):
+            return
+        try:
+            agora = self._ultimo_sync = time.monotonic()
+            # Lacuna velha demais: transação desfeita (ou entrada já limpa), não vai mais aparecer
+            for i, desde in list(self._lacunas.items()):
+                if agora - desde > CHANGEFEED_LACUNA_SEC:
+                    del self._lacunas[i]
+            with closing(get_db_connection()) as conn:
+                if not conn:
+                    return
+                cursor = conn.cursor()
+                versao = self._ler_versao(cursor)
+                if versao is None:
+                    return
+                self._limpar_changelog(cursor, conn)
+                if versao <= self._versao and not self._lacunas:
+                    return
+                lacunas = sorted(self._lacunas)
+                filtro_lacunas = f"OR id IN ({','.join(['%s'] * len(lacunas))})" if lacunas else ""
+                cursor.execute(f"""
+                    SELECT id, fonte, question FROM ia_changelog
+                    WHERE (id > %s AND id <= %s) {filtro_lacunas}
+                """, (self._versao, max(versao, self._versao), *lacunas))
+                mudancas = cursor.fetchall() or []
+                vistos = {int(r['id']) for r in mudancas}
+                chaves = {_chave_doc(r['fonte'], r['question']) for r in mudancas}
+                linhas = []
+                for fonte, tabela in (('kb', 'knowledge_base'), ('train', 'training_pairs')):
+                    perguntas = [q for f, q in chaves if f == fonte]
+                    if not perguntas:
+                        continue
+                    cursor.execute(f"""
+                        SELECT question, answer, category, created_at FROM {tabela}
+                        WHERE question IN ({",".join(["%s"] * len(perguntas))})
+                    """, perguntas)
+                    linhas += [{**r, 'fonte': fonte} for r in cursor.fetchall() or [] if r.get('answer')]
+
+            lacunas_novas = {
+                i: agora for i in range(max(self._versao, versao - CHANGEFEED_JANELA_IDS) + 1, versao + 1)
+                if i not in vistos
+            }
+            if chaves:
+                novo = indice.com_delta(chaves, linhas)
+                if novo is None or novo.n_delta > max(DELTAS_ATE_RECARGA, indice.tamanho // 4):
+                    # Índice vazio ou muitos deltas (idf/vocabulário defasados): recarga completa
+                    self.carregar_em_background(forcar=True)
+                    return
+            for i in vistos:
+                self._lacunas.pop(i, None)
+            self._lacunas.update(lacunas_novas)
+            self._versao = max(versao, self._versao)
+            if chaves:
+                self._metricas["deltas_aplicados"] += len(chaves)
+                self._trocar(novo)
+                log.info(f"🧠 Índice local da IA atualizado: {len(chaves)} pergunta(s) (versão {self._versao})")
+        except Exception as e:
+            log.warning(f"⚠️ Falha ao sincronizar índice da IA: {e}")
+        finally:
+            self._lock_sync.release()
+
+    def responder(self, pergunta_normalizada: str, contar: bool = True) -> Optional[Tuple[str, float]]:
+        """Mesmas estratégias e confidences do caminho SQL; None = miss."""
+        indice = self._indice
+        if indice is None:
+            return None
+        resultado = self._buscar(indice, pergunta_normalizada)
+        if contar:
+            self._metricas["hits" if resultado else "misses"] += 1
+        return resultado
+
+    @staticmethod
+    def _buscar(indice: _IndiceBusca, pergunta_normalizada: str) -> Optional[Tuple[str, float]]:
+        # 🔍 ESTRATÉGIA 1: cosseno TF-IDF (substitui o FULLTEXT)
+        if len(pergunta_normalizada) >= 3:
+            melhores = indice.top_k(pergunta_normalizada, BUSCA_TOP_K)
+            if melhores and melhores[0][1] >= BUSCA_SIM_MINIMA:
+                i, sim = melhores[0]
+                kb = indice.eh_kb[i]
+                if sim >= BUSCA_SIM_FORTE:
+                    confidence = 0.98 if kb else 0.95
+                elif sim >= BUSCA_SIM_BOA:
+                    confidence = 0.95 if kb else 0.90
+                else:
+                    confidence = 0.85 if kb else 0.80
+                log.debug(f"✅ IA: TF-IDF match (similaridade={sim:.2f}, fonte={indice.fontes[i]}, conf={confidence})")
+                return indice.respostas[i], confidence
+
+        # 🔍 ESTRATÉGIA 2: tokens em AND na pergunta (substitui o LIKE)
+        i = indice.por_tokens(pergunta_normalizada)
+        if i is not None:
+            confidence = 0.90 if indice.eh_kb[i] else 0.85
+            log.debug(f"✅ IA: match por tokens (fonte={indice.fontes[i]}, conf={confidence})")
+            return indice.respostas[i], confidence
+
+        # 🔍 ESTRATÉGIA 3: categoria
+        for cat in CATEGORIAS_CONHECIDAS:
+            if cat in pergunta_normalizada and cat in indice.por_categoria:
+                log.debug(f"✅ IA: resposta por categoria '{cat}'")
+                return indice.respostas[indice.por_categoria[cat]], 0.80
+
+        return None
+
+    def stats(self) -> dict:
+        indice = self._indice
+        return {
+            "enabled": BUSCA_LOCAL_ENABLED and HAVE_SKLEARN,
+            "ready": indice is not None,
+            "documents": int(indice.ativo.sum()) if indice else 0,
+            "version": self._versao,
+            "pending_gaps": len(self._lacunas),
+            "loaded_at": self._carregado_em,
+            "build_ms": self._duracao_ms,
+            **self._metricas,
+        }
+
+
+# Um índice por processo (gunicorn sem preload: cada worker carrega o seu)
+motor_busca = MotorBuscaLocal()
+
+
 class IAIntegracao:
     def __init__(self, cache_size: int = 256):
         self.cache_size = cache_size
-        # Cache LRU para respostas frequentes (thread-safe)
-        self._cached_responder = lru_cache(maxsize=cache_size)(self._responder_sem_cache)
+        # Cache de respostas (exata/similar/compartilhada, com TTL); invalidado por entrada quando o índice muda
+        self._cache = CacheRespostas(tamanho=cache_size)
+        motor_busca.ouvintes.append(self._invalidar_afetadas)
+        # Índice local compartilhado: primeira instância dispara a carga
+        motor_busca.carregar_em_background()
 
     def responder_pergunta(self, pergunta_usuario: str = '', contexto: dict = None) -> tuple[str, float]:
         """
@@ -26,46 +477,90 @@ class IAIntegracao:
 
         # Normaliza a pergunta para cache e busca
         pergunta_normalizada = self._normalizar_para_busca(pergunta_usuario)
-        
+
+        # Aplica o que foi ensinado em outros processos (no máximo a cada IA_CHANGEFEED_SEC)
+        motor_busca.sincronizar()
+
         # Tenta cache primeiro (muito mais rápido)
-        try:
-            return self._cached_responder(pergunta_normalizada)
-        except Exception as e:
-            log.error(f"❌ Erro no cache da IA: {e}")
-            return self._responder_sem_cache(pergunta_normalizada)
+        versao = motor_busca.versao
+        resultado = self._cache.obter(pergunta_normalizada, versao)
+        if resultado is not None:
+            return resultado
 
-    def _normalizar_para_busca(self, texto: str) -> str:
+        resultado = self._responder_sem_cache(pergunta_normalizada)
+        self._cache.guardar(pergunta_normalizada, resultado, versao)
+        return resultado
+
+    def _invalidar_afetadas(self) -> None:
         """
-        Normaliza texto para busca: lowercase, remove acentos, tokens únicos.
-        Ex: "Quais horários temos cultos?" → "quais horario temos culto"
+        Ouvinte do índice: remove só as entradas cuja resposta mudaria com o índice novo
+        (reavalia cada pergunta em memória). A camada compartilhada se resolve pela versão.
         """
-        # Remove acentos
-        texto = unicodedata.normalize('NFKD', texto)
-        texto = ''.join(c for c in texto if not unicodedata.combining(c))
-        
-        # Lowercase e extrai apenas palavras
-        tokens = re.findall(r'\b[a-zà-ú0-9]+\b', texto.lower())
-        
-        # Remove stopwords comuns em português
-        stopwords = {
-            'o', 'a', 'os', 'as', 'um', 'uma', 'uns', 'umas', 'de', 'da', 'do', 
-            'das', 'dos', 'em', 'no', 'na', 'nos', 'nas', 'por', 'para', 'com', 
-            'sem', 'sob', 'sobre', 'que', 'qual', 'quais', 'quem', 'como', 
-            'quando', 'onde', 'por que', 'porque', 'entao', 'mas', 'e', 'ou', 
-            'se', 'nao', 'não', 'sim', 'ja', 'já', 'ainda', 'tambem', 'também', 
-            'so', 'só', 'somente', 'apenas', 'mais', 'menos', 'muito', 'pouco', 
-            'tudo', 'nada', 'algo', 'alguem', 'ninguem', 'todo', 'toda', 'todos', 
-            'todas', 'este', 'esta', 'estes', 'estas', 'esse', 'essa', 'esses', 
-            'essas', 'aquele', 'aquela', 'aqueles', 'aquelas', 'isto', 'isso', 'aquilo'
-        }
-        tokens = [t for t in tokens if t not in stopwords]
-        
-        # Junta tokens únicos (ordem não importa para busca)
-        return ' '.join(sorted(set(tokens)))
+        entradas = self._cache.itens()
+        if not entradas:
+            return
+        if not motor_busca.pronto:
+            self._cache.limpar(compartilhado=False)
+            return
+
+        sem_resposta = (self._fallback_response(), 0.5)
+        afetadas = [
+            pergunta for pergunta, atual in entradas
+            if (motor_busca.responder(pergunta, contar=False) or sem_resposta) != atual
+        ]
+        self._cache.remover(afetadas)
+        if afetadas:
+            log.info(f"🔄 Cache da IA: {len(afetadas)} de {len(entradas)} respostas invalidadas")
+
+    def _normalizar_para_busca(self, texto: str) -> str:
+        """Normaliza texto para busca (ver normalizar_para_busca)."""
+        return normalizar_para_busca(texto)
 
     def _responder_sem_cache(self, pergunta_normalizada: str) -> tuple[str, float]:
         """
-        Lógica real de busca no banco (sem cache).
+        Busca sem cache LRU: índice local em memória quando pronto (MySQL só no miss,
+        para registrar a pergunta); senão, o caminho no banco.
+        Retorna (resposta, confidence).
+        """
+        if not motor_busca.pronto:
+            # Carga falhou na subida (ex.: banco fora): tenta de novo em background
+            motor_busca.carregar_em_background()
+            return self._responder_no_banco(pergunta_normalizada)
+        try:
+            resultado = motor_busca.responder(pergunta_normalizada)
+            if resultado:
+                return resultado
+        except Exception as e:
+            log.error(f"❌ Erro na busca local da IA, usando banco: {e}", exc_info=True)
+            return self._responder_no_banco(pergunta_normalizada)
+
+        # ❌ Nada encontrado: registra para treinamento futuro
+        try:
+            with closing(get_db_connection()) as conn:
+                if not conn:
+                    return self._fallback_response(), 0.3
+                self._registrar_pergunta_pendente(conn, pergunta_normalizada)
+        except Exception as e:
+            log.error(f"❌ Erro na busca da IA: {e}", exc_info=True)
+            return self._fallback_response(), 0.2
+        return self._fallback_response(), 0.5
+
+    def _registrar_pergunta_pendente(self, conn, pergunta_normalizada: str) -> None:
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO unknown_questions (user_id, question, status, created_at)
+                VALUES (%s, %s, %s, NOW())
+                ON DUPLICATE KEY UPDATE status = VALUES(status), updated_at = NOW()
+            """, ("whatsapp", pergunta_normalizada, "pending"))
+            conn.commit()
+            log.info(f"📝 Pergunta registrada para treino: '{pergunta_normalizada[:60]}...'")
+        except Exception as e:
+            log.warning(f"⚠️ Não foi possível registrar pergunta pendente: {e}")
+
+    def _responder_no_banco(self, pergunta_normalizada: str) -> tuple[str, float]:
+        """
+        Busca direto no banco (índice local indisponível).
         ✅ ESTRATÉGIA: FULLTEXT MATCH (principal) → LIKE (fallback) → Categoria (último recurso)
         Retorna (resposta, confidence).
         """
@@ -185,13 +680,7 @@ class IAIntegracao:
                         return str(resposta), confidence
                 
                 # 🔍 ESTRATÉGIA 3: Busca por categoria (fallback final)
-                categorias_conhecidas = [
-                    'horarios', 'culto', 'batismo', 'membro', 'oracao', 
-                    'grupo', 'whatsapp', 'discipulado', 'novo come', 
-                    'pastor', 'lider', 'evento', 'fundadores'
-                ]
-                
-                for cat in categorias_conhecidas:
+                for cat in CATEGORIAS_CONHECIDAS:
                     if cat in pergunta_normalizada:
                         # ✅ CORREÇÃO: Usar apenas created_at na ordenação
                         cursor.execute("""
@@ -211,17 +700,7 @@ class IAIntegracao:
                                 return str(resposta), 0.80
                 
                 # ❌ Nada encontrado: registra para treinamento futuro
-                try:
-                    cursor.execute("""
-                        INSERT INTO unknown_questions (user_id, question, status, created_at)
-                        VALUES (%s, %s, %s, NOW())
-                        ON DUPLICATE KEY UPDATE status = VALUES(status), updated_at = NOW()
-                    """, ("whatsapp", pergunta_normalizada, "pending"))
-                    conn.commit()
-                    log.info(f"📝 Pergunta registrada para treino: '{pergunta_normalizada[:60]}...'")
-                except Exception as e:
-                    log.warning(f"⚠️ Não foi possível registrar pergunta pendente: {e}")
-                
+                self._registrar_pergunta_pendente(conn, pergunta_normalizada)
                 return self._fallback_response(), 0.5
                 
         except Exception as e:
@@ -233,20 +712,16 @@ class IAIntegracao:
         return "Ainda não tenho essa resposta, mas já registrei sua pergunta para nosso time. 🙏"
 
     def limpar_cache(self):
-        """Limpa o cache LRU (útil após novo treinamento)."""
-        self._cached_responder.cache_clear()
+        """Limpa o cache LRU e recarrega o índice local (útil após novo treinamento)."""
+        self._cache.limpar()
+        motor_busca.carregar()
         log.info("🔄 Cache da IA limpo")
 
     def get_cache_stats(self) -> dict:
-        """Retorna estatísticas do cache para monitoramento."""
-        cache_info = self._cached_responder.cache_info()
-        total = cache_info.hits + cache_info.misses
+        """Retorna estatísticas do cache (total e por camada) para monitoramento."""
         return {
-            "hits": cache_info.hits,
-            "misses": cache_info.misses,
-            "size": cache_info.currsize,
-            "maxsize": cache_info.maxsize,
-            "hit_rate": round(cache_info.hits / max(total, 1) * 100, 1)
+            **self._cache.stats(),
+            "busca_local": motor_busca.stats(),
         }
 
 
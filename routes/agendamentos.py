@@ -3,8 +3,8 @@ from database import get_db_connection
 from contextlib import closing
 from datetime import datetime, timedelta
 
-# 🔗 Z-API
-from servicos.zapi_cliente import enviar_mensagem
+# 🔗 Z-API (pela fila: com bulkhead cheio/Z-API fora o aviso é adiado, não perdido)
+from servicos.fila_mensagens import adicionar_na_fila, TIPO_INTERNO
 
 bp_agenda = Blueprint("agendamentos", __name__)
 
@@ -294,7 +294,7 @@ def alterar_status(id, acao):
             f"das {r['hora_inicio']} às {r['hora_fim']} foi *{novo_status.upper()}*."
         )
 
-        enviar_mensagem(r["telefone"], mensagem)
+        adicionar_na_fila(r["telefone"], mensagem, meta={"tipo": TIPO_INTERNO, "origem": "agendamento"})
 
         return jsonify({"success": True})
 
@@ -329,7 +329,7 @@ def excluir_reserva(id):
             f"das {r['hora_inicio']} às {r['hora_fim']} foi *EXCLUÍDA* pela Secretaria."
         )
 
-        enviar_mensagem(r["telefone"], mensagem)
+        adicionar_na_fila(r["telefone"], mensagem, meta={"tipo": TIPO_INTERNO, "origem": "agendamento"})
 
         return jsonify({"success": True})
 
@@ -1,13 +1,16 @@
 import logging
 import os
-import requests  # ✅ Usar requests diretamente para status Z-API
 from flask import Blueprint, render_template, jsonify, request
 from datetime import datetime, timedelta
 from contextlib import closing
-from database import get_db_connection
+from database import get_db_connection, obter_metricas_pool
 from servicos.fila_mensagens import get_queue_anti_spam_stats
+from servicos.fila_entrada import get_inbound_stats
+from servicos.zapi_cliente import verificar_status_instancia, obter_metricas_http, obter_metricas_status
 # ❌ REMOVIDO: from servicos.zapi_cliente import ZAPIClient  # Não existe!
 
+log = logging.getLogger(__name__)
+
 monitor_bp = Blueprint("app_monitor_bp", __name__)
 
 def register(app):
@@ -155,13 +158,35 @@ def monitor_status():
                 "batch_pause_sec": int(os.getenv("FILA_BATCH_PAUSE_MIN_SEC", "600"))
             }),
             
+            # Raias de prioridade (pendentes + espera p50/p95)
+            "lanes": stats.get("lanes", {}),
+
+            # Wakeup por evento do worker (polls evitados)
+            "queue_wakeup": stats.get("wakeup", {}),
+            "queue_scheduler": stats.get("scheduler", {}),
+
+            # Circuit breaker / bulkhead do envio Z-API (estado + transições)
+            "zapi_circuit": stats.get("circuit", {}),
+
             # Métricas calculadas
             "delivery_rate": delivery_rate,
             "health_status": health_status,
             "health_message": health_message,
             
             # Últimos envios para a tabela
-            "recent_sends": recent_sends
+            "recent_sends": recent_sends,
+
+            # Pool de conexões MySQL (deste worker Gunicorn)
+            "db_pool": obter_metricas_pool(),
+
+            # Fila de entrada de webhooks (profundidade + lag)
+            "inbound": get_inbound_stats(),
+
+            # Sessão HTTP Z-API (reuso de conexões keep-alive deste worker)
+            "zapi_http": obter_metricas_http(),
+
+            # Cache compartilhado de status da instância (prober)
+            "zapi_status": obter_metricas_status()
         }
         
         # 🔍 LOG DA RESPOSTA (debug)
@@ -289,7 +314,7 @@ def fila_consent_stats():
 
 
 # ==========================================================
-# 🆕 NOVO: Status Real do WhatsApp (Z-API) via requests
+# 🆕 NOVO: Status Real do WhatsApp (Z-API) via cache compartilhado
 # ==========================================================
 
 @monitor_bp.route('/api/whatsapp/status', methods=['GET'])
@@ -298,56 +323,29 @@ def whatsapp_status():
     Retorna status real da instância Z-API para o frontend.
     Usado pelo painel /app/whatsapp para mostrar 🟢 Conectado / 🔌 Desconectado
     
-    ✅ Usa requests diretamente (não depende de ZAPIClient inexistente)
+    ✅ Lê o cache compartilhado (zapi_status_cache): o polling do painel
+    não gera chamadas extras à Z-API.
     """
     try:
-        # Lê config do .env
-        instance_id = os.getenv("ZAPI_INSTANCE")
-        token = os.getenv("ZAPI_TOKEN")
-        client_token = os.getenv("ZAPI_CLIENT_TOKEN")
-        base_url = os.getenv("ZAPI_BASE_URL", "https://api.z-api.io/instances")
-        
-        if not all([instance_id, token, client_token]):
-            return jsonify({
-                "connected": False,
-                "error": "Configuração Z-API incompleta",
-                "message": "🔌 Desconectado"
-            }), 200
-        
-        # Consulta status via Z-API usando requests direto
-        url = f"{base_url}/{instance_id}/status"
-        headers = {
-            "x-client-token": client_token,
-            "Authorization": f"Bearer {token}"
-        }
-        
-        response = requests.get(url, headers=headers, timeout=10)
-        
-        if response.status_code == 200:
-            data = response.json()
-            # Z-API retorna: {"connected": true, "phone": "...", ...}
-            is_connected = data.get("connected", False)
-            phone = data.get("phone", "")
-            
-            return jsonify({
-                "connected": is_connected,
-                "phone": phone,
-                "message": "🟢 Conectado" if is_connected else "🔌 Desconectado",
-                "last_seen": data.get("last_seen")
-            }), 200
-        else:
+        st = verificar_status_instancia()
+        data = st.get("resposta") or {}
+        is_connected = bool(st.get("online"))
+
+        if not data and not is_connected:
             return jsonify({
                 "connected": False,
-                "error": f"Z-API retornou {response.status_code}",
+                "error": st.get("mensagem"),
                 "message": "🔌 Desconectado"
             }), 200
-            
-    except requests.Timeout:
+
+        # Z-API retorna: {"connected": true, "phone": "...", ...}
         return jsonify({
-            "connected": False,
-            "error": "Timeout ao consultar Z-API",
-            "message": "🔌 Desconectado"
+            "connected": is_connected,
+            "phone": data.get("phone", ""),
+            "message": "🟢 Conectado" if is_connected else "🔌 Desconectado",
+            "last_seen": data.get("last_seen")
         }), 200
+            
     except Exception as e:
         logging.error(f"❌ Erro em /api/whatsapp/status: {e}")
         return jsonify({
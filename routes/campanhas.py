@@ -4,19 +4,20 @@
 # 📢 Rotas de Campanhas e Eventos - CRM Church
 # Envio 100% texto (sem imagem) para máxima entregabilidade
 # ✅ Enfileira e só marca "enviado" após confirmação real do worker (DB Queue)
+# 🗂️ Disparo e reprocesso rodam como jobs em background (servicos/campanhas_jobs.py)
 # ================================================
 
 import logging
 from flask import request, jsonify
 from datetime import datetime
-from contextlib import closing
 
 import database
-from database import get_db_connection
-from servicos.fila_mensagens import adicionar_na_fila
+from servicos import campanhas_jobs, planejador_envios
 
 
 def register(app):
+    # Retoma jobs de campanha interrompidos (processo que morreu no meio da audiência)
+    campanhas_jobs.iniciar_worker_jobs()
 
     # ------------------------------------------------
     # 🔍 1. Filtro de Visitantes
@@ -61,34 +62,31 @@ def register(app):
 
 
     # ------------------------------------------------
-    # Helpers (opcionais) - anti duplicidade
+    # 📢 2. Enviar Campanha (job em background; quem marca ENVIADO é o worker da fila)
     # ------------------------------------------------
-    def _envio_ja_existe(visitante_id: int, evento_nome: str) -> bool:
-        """
-        Evita duplicar campanhas se o mesmo evento for disparado duas vezes.
-        Considera como "já existe" qualquer status diferente de 'falha'.
-        """
-        try:
-            with closing(get_db_connection()) as conn:
-                if not conn:
-                    return False  # se sem conexão, não bloqueia
-                cur = conn.cursor()
-                cur.execute("""
-                    SELECT 1
-                    FROM eventos_envios
-                    WHERE visitante_id = %s
-                      AND evento_nome = %s
-                      AND status <> 'falha'
-                    LIMIT 1
-                """, (int(visitante_id), str(evento_nome)))
-                return cur.fetchone() is not None
-        except Exception:
-            return False
-
+    def _resposta_job(resultado: dict, mensagem_ok: str, mensagem_vazio: str):
+        if not resultado:
+            return jsonify({"error": "Sem conexão com o banco"}), 500
+        if "conflict_job_id" in resultado:
+            job_id = resultado["conflict_job_id"]
+            if job_id is None:
+                return jsonify({"error": "Esta campanha já está sendo disparada. Tente novamente em instantes."}), 409
+            return jsonify({
+                "error": "Já existe um job em andamento para esta campanha.",
+                "job_id": job_id,
+                "status_url": f"/api/campanhas/jobs/{job_id}"
+            }), 409
+        if not resultado.get("job_id"):
+            return jsonify({"message": mensagem_vazio}), 200
+        job_id = resultado["job_id"]
+        return jsonify({
+            "message": mensagem_ok,
+            "job_id": job_id,
+            "total_alvo": resultado["audience_size"],
+            "status_url": f"/api/campanhas/jobs/{job_id}",
+            "obs": "O status 'enviado' será marcado automaticamente após o envio real pelo worker (DB Queue)."
+        }), 202
 
-    # ------------------------------------------------
-    # 📢 2. Enviar Campanha (enfileira e CONFIRMA no worker)
-    # ------------------------------------------------
     @app.route('/api/campanhas/enviar', methods=['POST'])
     def enviar_campanha():
         try:
@@ -99,110 +97,24 @@ def register(app):
             if not nome_evento or not mensagem:
                 return jsonify({"error": "nome_evento e mensagem são obrigatórios"}), 400
 
-            data_inicio = data.get("dataInicio")
-            data_fim = data.get("dataFim")
-            idade_min = data.get("idadeMin")
-            idade_max = data.get("idadeMax")
-            genero = data.get("genero")
-
-            visitantes = database.filtrar_visitantes_para_evento(
-                data_inicio=data_inicio,
-                data_fim=data_fim,
-                idade_min=idade_min,
-                idade_max=idade_max,
-                genero=genero
-            ) or []
-
-            if not visitantes:
-                return jsonify({"message": "Nenhum visitante encontrado para envio."}), 200
-
-            enfileirados = 0
-            sem_telefone = 0
-            erro_registro = 0
-            erro_fila = 0
-            pulados_duplicidade = 0
-
-            # ⚠️ Anti-timeout: nada de chamar Z-API aqui. Só DB.
-            for v in visitantes:
-                visitante_id = v.get("id")
-                telefone = v.get("telefone")
-                nome = v.get("nome") or "-"
-
-                if not visitante_id:
-                    erro_registro += 1
-                    logging.error(f"❌ Visitante sem ID válido (nome={nome}). Ignorando.")
-                    continue
-
-                # (Opcional) evita duplicar se já existe envio desse evento (exceto falha)
-                if _envio_ja_existe(visitante_id, nome_evento):
-                    pulados_duplicidade += 1
-                    continue
-
-                # 1) Registra envio (pendente) — fica em eventos_envios
-                try:
-                    database.salvar_envio_evento(
-                        visitante_id=visitante_id,
-                        evento_nome=nome_evento,
-                        mensagem=mensagem,
-                        imagem_url=None,
-                        status="pendente",
-                        origem="campanha"
-                    )
-                except Exception as e:
-                    erro_registro += 1
-                    logging.error(f"❌ Falha ao registrar envio_evento (pendente) p/ {nome}: {e}")
-                    continue
-
-                # 2) Sem telefone => falha imediata
-                if not telefone:
-                    sem_telefone += 1
-                    try:
-                        database.atualizar_status_envio_evento(visitante_id, nome_evento, "falha")
-                    except Exception as e:
-                        logging.error(f"❌ atualizar_status_envio_evento(falha) sem telefone vid={visitante_id}: {e}")
-                    logging.warning(f"⚠️ Visitante sem telefone: {nome}")
-                    continue
-
-                # 3) Marca como em fila (quem marca ENVIADO é o worker)
-                try:
-                    database.atualizar_status_envio_evento(visitante_id, nome_evento, "em_fila")
-                except Exception as e:
-                    logging.error(f"❌ atualizar_status_envio_evento(em_fila) vid={visitante_id}: {e}")
-
-                # 4) Enfileira no MySQL (fila_envios)
-                ok_fila = adicionar_na_fila(
-                    telefone,
-                    mensagem,
-                    imagem_url=None,
-                    meta={
-                        "origem": "campanha",
-                        "evento": nome_evento,
-                        "visitante_id": int(visitante_id),
-                        "telefone_raw": telefone
-                    }
-                )
-
-                if ok_fila:
-                    enfileirados += 1
-                    logging.info(f"📬 Visitante {nome} enfileirado para campanha '{nome_evento}'.")
-                else:
-                    erro_fila += 1
-                    try:
-                        database.atualizar_status_envio_evento(visitante_id, nome_evento, "falha")
-                    except Exception:
-                        pass
-                    logging.error(f"❌ Falha ao enfileirar tel={telefone} (campanha).")
-
-            return jsonify({
-                "message": f"📢 Campanha '{nome_evento}' enfileirada.",
-                "total_alvo": len(visitantes),
-                "enfileirados": enfileirados,
-                "sem_telefone": sem_telefone,
-                "erro_registro": erro_registro,
-                "erro_fila": erro_fila,
-                "pulados_duplicidade": pulados_duplicidade,
-                "obs": "O status 'enviado' será marcado automaticamente após o envio real pelo worker (DB Queue)."
-            }), 200
+            # ⚠️ Anti-timeout: a rota só grava o job; audiência, consentimento e fila rodam em background
+            resultado = campanhas_jobs.criar_job(
+                campanhas_jobs.TIPO_ENVIO,
+                evento_nome=nome_evento,
+                mensagem=mensagem,
+                filtros={
+                    "data_inicio": data.get("dataInicio"),
+                    "data_fim": data.get("dataFim"),
+                    "idade_min": data.get("idadeMin"),
+                    "idade_max": data.get("idadeMax"),
+                    "genero": data.get("genero"),
+                }
+            )
+            return _resposta_job(
+                resultado,
+                f"📢 Campanha '{nome_evento}' em preparação ({resultado.get('audience_size', 0)} visitantes).",
+                "Nenhum visitante encontrado para envio."
+            )
 
         except Exception as e:
             logging.exception(f"Erro geral ao enviar campanha: {e}")
@@ -210,78 +122,96 @@ def register(app):
 
 
     # ------------------------------------------------
-    # 🔁 3. Reprocessar Falhas (reenfileira)
+    # 🔁 3. Reprocessar Falhas (job em background)
     # ------------------------------------------------
     @app.route('/api/campanhas/reprocessar', methods=['POST'])
     def reprocessar_falhas():
         try:
-            # ✅ Busca direto no DB as falhas (com visitante_id garantido)
-            with closing(get_db_connection()) as conn:
-                if not conn:
-                    return jsonify({"error": "Sem conexão com o banco"}), 500
-
-                cur = conn.cursor()
-                cur.execute("""
-                    SELECT
-                        e.id AS envio_id,
-                        e.visitante_id,
-                        e.evento_nome,
-                        e.mensagem,
-                        v.telefone
-                    FROM eventos_envios e
-                    JOIN visitantes v ON v.id = e.visitante_id
-                    WHERE e.status = 'falha'
-                    ORDER BY e.data_envio DESC
-                    LIMIT 400
-                """)
-                falhas = cur.fetchall() or []
-
-            reprocessados = 0
-            ignorados = 0
-
-            for f in falhas:
-                telefone = f.get("telefone")
-                mensagem = f.get("mensagem")
-                evento_nome = f.get("evento_nome")
-                visitante_id = f.get("visitante_id")
-
-                if not telefone or not mensagem or not evento_nome or not visitante_id:
-                    ignorados += 1
-                    continue
-
-                # Marca como em fila
-                try:
-                    database.atualizar_status_envio_evento(visitante_id, evento_nome, "em_fila")
-                except Exception as e:
-                    logging.error(f"❌ atualizar_status_envio_evento(em_fila) reprocesso vid={visitante_id}: {e}")
-
-                ok_fila = adicionar_na_fila(
-                    telefone,
-                    mensagem,
-                    imagem_url=None,
-                    meta={
-                        "origem": "campanha_reprocesso",
-                        "evento": evento_nome,
-                        "visitante_id": int(visitante_id),
-                        "telefone_raw": telefone
-                    }
-                )
-
-                if ok_fila:
-                    reprocessados += 1
-                else:
-                    ignorados += 1
-
-            return jsonify({
-                "message": f"🔄 {reprocessados} falhas reenfileiradas.",
-                "ignorados": ignorados
-            }), 200
+            data = request.get_json(silent=True) or {}
+            nome_evento = (data.get("nome_evento") or "").strip() or None
+            resultado = campanhas_jobs.criar_job(campanhas_jobs.TIPO_REPROCESSO, evento_nome=nome_evento)
+            return _resposta_job(
+                resultado,
+                f"🔄 Reprocessamento de {resultado.get('audience_size', 0)} falhas em andamento.",
+                "🔄 Nenhuma falha para reprocessar."
+            )
 
         except Exception as e:
             logging.exception(f"Erro ao reprocessar falhas: {e}")
             return jsonify({"error": "Falha ao reprocessar"}), 500
 
 
+    # ------------------------------------------------
+    # 📅 Capacidade de envio / previsão de término
+    # ------------------------------------------------
+    @app.route('/api/campanhas/capacidade', methods=['GET'])
+    def capacidade_envio():
+        try:
+            plano = planejador_envios.planejar()
+            if plano is None:
+                return jsonify({"error": "Sem conexão com o banco"}), 500
+            return jsonify(plano), 200
+        except Exception as e:
+            logging.exception(f"Erro ao calcular capacidade de envio: {e}")
+            return jsonify({"error": "Falha ao calcular capacidade"}), 500
+
+    @app.route('/api/campanhas/planejar', methods=['POST'])
+    def planejar_campanha():
+        """Prévia antes de confirmar: audiência, consentimento e previsão de término."""
+        try:
+            data = request.get_json() or {}
+            plano = planejador_envios.planejar_campanha(
+                evento_nome=(data.get("nome_evento") or "").strip() or None,
+                filtros={
+                    "data_inicio": data.get("dataInicio"),
+                    "data_fim": data.get("dataFim"),
+                    "idade_min": data.get("idadeMin"),
+                    "idade_max": data.get("idadeMax"),
+                    "genero": data.get("genero"),
+                }
+            )
+            if plano is None:
+                return jsonify({"error": "Sem conexão com o banco"}), 500
+            return jsonify(plano), 200
+        except Exception as e:
+            logging.exception(f"Erro ao planejar campanha: {e}")
+            return jsonify({"error": "Falha ao planejar campanha"}), 500
+
+
+    # ------------------------------------------------
+    # 🗂️ Jobs de campanha (progresso / retomada)
+    # ------------------------------------------------
+    @app.route('/api/campanhas/jobs', methods=['GET'])
+    def listar_jobs_campanha():
+        try:
+            limit = min(100, max(1, int(request.args.get("limit", 20))))
+            return jsonify({"jobs": campanhas_jobs.listar_jobs(limit)}), 200
+        except Exception as e:
+            logging.exception(f"Erro ao listar jobs de campanha: {e}")
+            return jsonify({"error": "Falha ao listar jobs"}), 500
+
+    @app.route('/api/campanhas/jobs/<int:job_id>', methods=['GET'])
+    def status_job_campanha(job_id):
+        try:
+            job = campanhas_jobs.obter_job(job_id)
+            if not job:
+                return jsonify({"error": "Job não encontrado"}), 404
+            return jsonify(job), 200
+        except Exception as e:
+            logging.exception(f"Erro ao obter job de campanha {job_id}: {e}")
+            return jsonify({"error": "Falha ao carregar job"}), 500
+
+    @app.route('/api/campanhas/jobs/<int:job_id>/retomar', methods=['POST'])
+    def retomar_job_campanha(job_id):
+        try:
+            if not campanhas_jobs.retomar_job(job_id):
+                return jsonify({"error": "Job não está parado com erro"}), 409
+            return jsonify({"message": f"♻️ Job #{job_id} retomado do último checkpoint."}), 200
+        except Exception as e:
+            logging.exception(f"Erro ao retomar job de campanha {job_id}: {e}")
+            return jsonify({"error": "Falha ao retomar job"}), 500
+
+
     # ------------------------------------------------
     # 📊 4. Status de Campanhas
     # ------------------------------------------------
@@ -298,6 +228,7 @@ def register(app):
                     "enviados": c.get("enviados", 0),
                     "falhas": c.get("falhas", 0),
                     "pendentes": c.get("pendentes", 0),
+                    "bloqueados_consentimento": c.get("bloqueados_consentimento", 0),
                     "status": (
                         "✅ Concluída" if c.get("falhas", 0) == 0 and c.get("pendentes", 0) == 0
                         else "⚠️ Parcial"
@@ -1,9 +1,10 @@
-import logging, os, requests, time
+import logging, os, time
 from flask import request, jsonify
 from database import (
     salvar_envio_evento, listar_envios_eventos,
     filtrar_visitantes_para_evento, get_db_connection
 )
+from servicos.zapi_cliente import obter_sessao
 
 def register(app):
     # --- FILTRAR VISITANTES ---
@@ -65,7 +66,7 @@ def register(app):
                         url = f"https://api.z-api.io/instances/{ZAPI_INSTANCE}/token/{ZAPI_TOKEN}/send-text"
 
                     logging.info(f"➡️ Enviando para {telefone_envio} via {url}")
-                    response = requests.post(url, json=payload, headers=headers, timeout=15)
+                    response = obter_sessao().post(url, json=payload, headers=headers, timeout=15)
                     status = "enviado" if response.ok else f"falha: {response.status_code}"
 
                     salvar_envio_evento(visitante_id, evento_nome, mensagem, imagem_url, status)
@@ -145,7 +146,7 @@ def register(app):
                             payload = {"phone": telefone_envio, "message": mensagem}
                             url = f"https://api.z-api.io/instances/{ZAPI_INSTANCE}/token/{ZAPI_TOKEN}/send-text"
 
-                        response = requests.post(url, json=payload, headers=headers, timeout=15)
+                        response = obter_sessao().post(url, json=payload, headers=headers, timeout=15)
                         status = "enviado" if response.ok else f"falha: {response.status_code}"
 
                         cursor.execute("UPDATE eventos_envios SET status = %s, data_envio = NOW() WHERE id = %s",
@@ -1,6 +1,6 @@
 import logging
 from flask import request, jsonify, render_template, session, redirect, url_for
-from database import get_db_connection
+from database import get_db_connection, registrar_mudanca_ia
 from servicos.anti_spam_controller import AntiSpamController
 import os
 
@@ -114,6 +114,9 @@ def register(app):
                 WHERE question = %s
             """, (question,))
 
+            # 🔔 Avisa os workers: cada um aplica a pergunta no índice da IA
+            registrar_mudanca_ia(cursor, 'kb', question)
+
             conn.commit()
             return jsonify({
                 "success": True,
@@ -3,9 +3,14 @@ from flask import request, jsonify
 from botmsg import tratar_mensagem_webhook
 from database import normalizar_para_recebimento, verificar_sid_existente
 from constantes import DEBUG
+from servicos.fila_entrada import WEBHOOK_ASYNC, enfileirar_webhook, iniciar_processadores
 
 def register(app):
 
+    # 📥 Modo assíncrono: drena itens que ficaram na fila_entrada antes de um restart
+    if WEBHOOK_ASYNC:
+        iniciar_processadores()
+
     # --- Webhook TWILIO ---
     @app.route('/api/webhook', methods=['POST'])
     def webhook_twilio():
@@ -79,14 +84,24 @@ def register(app):
                 logging.info("🛑 Ignorado: mensagem enviada pelo próprio bot (fromMe=True).")
                 return jsonify({"status": "ignored", "reason": "sent_by_bot"}), 200
 
+            # Normaliza o número
+            from_number_normalizado = normalizar_para_recebimento(from_number)
+
+            # 📥 Modo assíncrono: grava o payload (dedup por UNIQUE message_sid) e responde já
+            if WEBHOOK_ASYNC:
+                enfileirado = enfileirar_webhook(data, from_number_normalizado, message_sid, origem=origem)
+                if enfileirado:
+                    return jsonify({"status": "queued", "origem": origem}), 200
+                if enfileirado is False:
+                    logging.info(f"🔁 Mensagem com SID={message_sid} já recebida. Ignorando.")
+                    return jsonify({"status": "ignored", "reason": "duplicate_sid"}), 200
+                logging.warning(f"⚠️ Fila de entrada indisponível, processando SID={message_sid} de forma síncrona.")
+
             # ✅ Verifica se SID já foi processado (evita loop/duplicação)
             if message_sid and message_sid != "?" and verificar_sid_existente(message_sid):
                 logging.info(f"🔁 Mensagem com SID={message_sid} já processada. Ignorando.")
                 return jsonify({"status": "ignored", "reason": "duplicate_sid"}), 200
 
-            # Normaliza o número
-            from_number_normalizado = normalizar_para_recebimento(from_number)
-            
             # ✅ Processa como resposta conversacional (is_webhook_reply=True)
             resultado = tratar_mensagem_webhook(
                 dados=data,
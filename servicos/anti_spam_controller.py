@@ -9,12 +9,16 @@
 import os
 import time
 import random
+import atexit
+import socket
 import logging
+import threading
 from datetime import datetime, timedelta
 from contextlib import closing
-from typing import Tuple, Dict, Optional
+from typing import Tuple, Dict, List, Optional
 
 from database import get_db_connection
+from servicos.zapi_cliente import instancia_padrao
 
 log = logging.getLogger(__name__)
 
@@ -33,6 +37,73 @@ OUTSIDE_HOURS_ACTION = os.getenv("FILA_OUTSIDE_HOURS_ACTION", "reequeue").lower(
 ERROR_RATE_THRESHOLD = float(os.getenv("FILA_ERROR_RATE_THRESHOLD", "0.02"))
 SLOWDOWN_FACTOR = float(os.getenv("FILA_SLOWDOWN_FACTOR", "5.0"))
 
+# Janela deslizante da taxa de erro (baldes de 1 minuto) com histerese
+ERROR_WINDOW_MIN = max(1, int(os.getenv("FILA_ERROR_WINDOW_MIN", "30")))
+ERROR_MIN_SAMPLES = int(os.getenv("FILA_ERROR_MIN_SAMPLES", "10"))
+ERROR_RECOVERY_THRESHOLD = min(
+    ERROR_RATE_THRESHOLD,
+    float(os.getenv("FILA_ERROR_RECOVERY_THRESHOLD", str(ERROR_RATE_THRESHOLD / 2))),
+)
+JANELA_RETENCAO_DIAS = int(os.getenv("FILA_ERROR_WINDOW_RETENTION_DAYS", "2"))
+
+# Write-behind + token bucket do limite diário
+FLUSH_SEC = float(os.getenv("FILA_RATELIMIT_FLUSH_SEC", "15"))
+TOKEN_BLOCK = max(1, int(os.getenv("FILA_RATELIMIT_TOKEN_BLOCK", "2")))
+TOKEN_IDLE_SEC = float(os.getenv("FILA_RATELIMIT_TOKEN_IDLE_SEC", "60"))
+RESERVA_ORFA_SEC = int(os.getenv("FILA_RATELIMIT_ORPHAN_SEC", "300"))
+# Heartbeat da reserva (flush sem contadores) e varredura de órfãs: bem abaixo de RESERVA_ORFA_SEC
+HEARTBEAT_SEC = max(FLUSH_SEC, RESERVA_ORFA_SEC / 3.0)
+JANELA_AVALIACAO_SEC = max(FLUSH_SEC, 60.0)  # baldes são de 1 minuto
+
+# Uma única thread de flush por processo para todas as instâncias
+_controllers: List["AntiSpamController"] = []
+_flusher: Optional[threading.Thread] = None
+_flusher_pid: Optional[int] = None
+_flusher_lock = threading.Lock()
+
+
+def _id_reserva() -> str:
+    """Dono das reservas de tokens deste processo (host:pid)."""
+    return f"{socket.gethostname()}:{os.getpid()}"[:64]
+
+
+def _loop_flush():
+    while True:
+        time.sleep(FLUSH_SEC)
+        with _flusher_lock:
+            controllers = list(_controllers)
+        for controller in controllers:
+            try:
+                controller._ciclo_flush()
+            except Exception as e:
+                log.error(f"❌ Erro no flush do anti-spam ({controller.instance_id}): {e}")
+
+
+def parametros_pacing(slowdown: bool = False) -> dict:
+    """
+    Regras de pacing de proativos/manuais em valores médios, para planejamento (sem sleep).
+    Um batch começa quando a pausa desde o início do anterior venceu: o ciclo de um batch
+    é o maior entre a pausa e o tempo de enviar as BATCH_SEND_LIMIT mensagens.
+    """
+    fator = SLOWDOWN_FACTOR if slowdown else 1.0
+    delay = (MIN_DELAY_SEC + MAX_DELAY_SEC) / 2.0 * fator
+    pausa = (BATCH_PAUSE_MIN_SEC + BATCH_PAUSE_MAX_SEC) / 2.0 * fator
+    lote = max(1, BATCH_SEND_LIMIT)
+    return {
+        "delay_sec": delay,
+        "batch_size": lote,
+        "batch_cycle_sec": max(pausa, lote * delay),
+        "daily_limit": DAILY_LIMIT,
+        "business_start": BUSINESS_START,
+        "business_end": BUSINESS_END,
+    }
+
+
+def segundos_por_envio(slowdown: bool = False) -> float:
+    """Ritmo médio de envios proativos/manuais de uma instância (segundos por mensagem)."""
+    p = parametros_pacing(slowdown)
+    return p["batch_cycle_sec"] / p["batch_size"]
+
 
 class AntiSpamController:
     """
@@ -50,6 +121,27 @@ class AntiSpamController:
     - is_manual=True: Boas-vindas para visitantes novos (bypass consentimento, mas respeita limites)
     - is_reply=False, is_manual=False: Regras completas para campanhas proativas
     
+    ⚙️ Contadores em memória (write-behind):
+    - O limite diário é um token bucket: cada processo reserva blocos de tokens
+      com um UPDATE condicional (compare-and-set) em fila_rate_limit.tokens_reservados,
+      então os 4 processos Gunicorn juntos nunca passam do DAILY_LIMIT.
+    - Cada processo (host:pid) tem sua linha em fila_rate_limit_reservas com os tokens
+      que segura e o próprio heartbeat; tokens_reservados é a soma dessas linhas.
+    - total_sent/total_failed acumulam em memória e vão para o banco
+      a cada FILA_RATELIMIT_FLUSH_SEC (uma thread de flush por processo para
+      todas as instâncias; sem contadores, só o heartbeat a cada HEARTBEAT_SEC).
+    - O slot de batch (proativos/manuais) é reservado por CAS na hora do envio.
+    - Reservas de processos sem heartbeat há RESERVA_ORFA_SEC (processo que morreu)
+      são recuperadas por dono, mesmo com outros processos vivos; na inicialização
+      total_sent é reconciliado com os envios confirmados em fila_envios.
+
+    📉 Throttling adaptativo por janela deslizante:
+    - Sucessos/falhas vão para baldes de 1 minuto (fila_rate_limit_janela),
+      compartilhados entre os processos.
+    - A taxa de erro considera só os últimos FILA_ERROR_WINDOW_MIN minutos.
+    - Histerese: liga acima de FILA_ERROR_RATE_THRESHOLD (com amostras
+      suficientes) e só desliga abaixo de FILA_ERROR_RECOVERY_THRESHOLD.
+
     Thread-safe para uso em worker único (Gunicorn com gthread).
     """
     
@@ -65,6 +157,21 @@ class AntiSpamController:
         self._cache_ts: float = 0
         self._cache_ttl: int = 30  # segundos
 
+        # Estado write-behind (só usado pela instância que envia)
+        self._lock = threading.RLock()
+        self._deltas = {"total_sent": 0, "total_failed": 0}
+        self._deltas_date: Optional[str] = None
+        self._tokens = 0
+        self._tokens_date: Optional[str] = None
+        self._linha_date: Optional[str] = None
+        self._ultimo_uso_token = 0.0
+        self._baldes: Dict[datetime, List[int]] = {}  # minuto -> [sent, failed] ainda não gravados
+        self._ultimo_heartbeat = 0.0
+        self._ultima_varredura = 0.0
+        self._ultima_avaliacao = 0.0
+        self._ultima_limpeza_janela = 0.0
+        self._reconciliado = False
+
     # ------------------------------------------
     # Helpers Internos
     # ------------------------------------------
@@ -81,7 +188,7 @@ class AntiSpamController:
         
         # Retorna do cache se válido (evita queries excessivas)
         if now - self._cache_ts < self._cache_ttl:
-            return self._cache.copy()
+            return self._com_deltas(self._cache)
 
         try:
             with closing(get_db_connection()) as conn:
@@ -120,7 +227,7 @@ class AntiSpamController:
                     "slowdown_active": bool(row.get("slowdown_active") or False),
                 }
                 self._cache_ts = now
-                return self._cache.copy()
+                return self._com_deltas(self._cache)
                 
         except Exception as e:
             log.error(f"❌ Erro ao buscar rate limits: {e}")
@@ -136,101 +243,541 @@ class AntiSpamController:
             "slowdown_active": False
         }
 
-    def _update_counter(self, field: str, increment: int = 1):
+    def _com_deltas(self, base: dict) -> dict:
+        """Snapshot do banco + contadores locais ainda não gravados."""
+        view = dict(base)
+        with self._lock:
+            if self._deltas_date in (None, self._get_today_key()):
+                view["total_sent"] = view.get("total_sent", 0) + self._deltas["total_sent"]
+                view["total_failed"] = view.get("total_failed", 0) + self._deltas["total_failed"]
+        return view
+
+    def _iniciar_flusher(self):
+        """Registra a instância na thread de write-behind do processo (sobe uma vez por pid)."""
+        global _flusher, _flusher_pid
+        with _flusher_lock:
+            if self not in _controllers:
+                _controllers.append(self)
+                atexit.register(self.flush, devolver_tokens=True)
+            if _flusher and _flusher.is_alive() and _flusher_pid == os.getpid():
+                return
+            _flusher = threading.Thread(target=_loop_flush, name="anti-spam-flush", daemon=True)
+            _flusher_pid = os.getpid()
+            _flusher.start()
+
+    def _ciclo_flush(self):
+        """Um ciclo da thread de flush: contadores, heartbeat, órfãs e janela de erros."""
+        agora = time.time()
+        ocioso = agora - self._ultimo_uso_token > TOKEN_IDLE_SEC
+        gravou = self.flush(devolver_tokens=ocioso)
+        if agora - self._ultima_varredura > HEARTBEAT_SEC:
+            self._recuperar_reservas_orfas()
+        # Reavalia mesmo sem envios: a janela anda e os erros antigos saem dela
+        if gravou or agora - self._ultima_avaliacao > JANELA_AVALIACAO_SEC:
+            self._avaliar_janela()
+        if agora - self._ultima_limpeza_janela > 3600:
+            self._limpar_janela()
+
+    def flush(self, devolver_tokens: bool = False) -> bool:
         """
-        Atualiza contador no banco de forma atômica.
-        
+        Grava os contadores acumulados (+ baldes da janela) numa transação.
+        Os envios confirmados saem da reserva deste processo (e de tokens_reservados)
+        e entram em total_sent juntos. Sem contadores a gravar, só vai ao banco
+        para o heartbeat da reserva, a cada HEARTBEAT_SEC.
+
         Args:
-            field: Nome do campo a atualizar
-            increment: Valor a somar (padrão: 1)
+            devolver_tokens: Se True, devolve ao banco os tokens não usados
+
+        Returns:
+            True se gravou contadores ou devolveu tokens
+        """
+        with self._lock:
+            d_sent = self._deltas["total_sent"]
+            d_failed = self._deltas["total_failed"]
+            data = self._deltas_date or self._get_today_key()
+            devolver = self._tokens if devolver_tokens and self._tokens_date == data else 0
+            baldes = [(m, v[0], v[1]) for m, v in self._baldes.items()]
+            # Com tokens em mãos, o flush também serve de heartbeat da reserva
+            segurando = self._tokens > 0 and self._tokens_date == data
+            heartbeat = segurando and time.time() - self._ultimo_heartbeat >= HEARTBEAT_SEC
+            if not (d_sent or d_failed or devolver or heartbeat):
+                return False
+            perdida = False
+            try:
+                with closing(get_db_connection()) as conn:
+                    if not conn:
+                        return False
+                    cur = conn.cursor()
+                    # Ordem de locks igual à do CAS e da varredura: linha do dia → reservas
+                    cur.execute("""
+                        UPDATE fila_rate_limit
+                        SET total_sent = total_sent + %s,
+                            total_failed = total_failed + %s,
+                            updated_at = NOW()
+                        WHERE instance_id=%s AND date=%s
+                    """, (d_sent, d_failed, self.instance_id, data))
+                    if d_sent or devolver or segurando:
+                        perdida = self._baixar_reserva(cur, data, d_sent + devolver) and segurando
+                    if baldes:
+                        placeholders = ", ".join(["(%s, %s, %s, %s)"] * len(baldes))
+                        params = []
+                        for minuto, sent, failed in baldes:
+                            params.extend([self.instance_id, minuto, sent, failed])
+                        cur.execute(f"""
+                            INSERT INTO fila_rate_limit_janela (instance_id, minuto, sent, failed)
+                            VALUES {placeholders}
+                            ON DUPLICATE KEY UPDATE sent = sent + VALUES(sent), failed = failed + VALUES(failed)
+                        """, params)
+                    conn.commit()
+            except Exception as e:
+                log.error(f"❌ Erro ao gravar contadores anti-spam (write-behind): {e}")
+                return False
+
+            self._deltas = {"total_sent": 0, "total_failed": 0}
+            self._deltas_date = None
+            self._baldes = {}
+            self._tokens -= devolver
+            self._ultimo_heartbeat = time.time()
+            self._cache_ts = 0
+            if perdida:
+                # Outro processo nos deu como mortos e devolveu a reserva: os tokens locais não valem mais
+                log.warning(f"♻️ Reserva de tokens deste processo foi recuperada por outro ({self._tokens} descartados)")
+                self._tokens = 0
+            if d_sent or d_failed or devolver:
+                log.debug(f"💾 Anti-spam flush | sent+={d_sent} failed+={d_failed} tokens_devolvidos={devolver}")
+            return bool(d_sent or d_failed or devolver)
+
+    def _baixar_reserva(self, cur, data: str, consumidos: int) -> bool:
+        """
+        Tira `consumidos` tokens da reserva deste processo e de tokens_reservados
+        (nunca mais do que a reserva ainda tem) e renova o heartbeat.
+        Retorna True se a reserva não existe mais (recuperada como órfã).
+        """
+        cur.execute("""
+            SELECT tokens FROM fila_rate_limit_reservas
+            WHERE instance_id=%s AND date=%s AND holder=%s
+            FOR UPDATE
+        """, (self.instance_id, data, _id_reserva()))
+        row = cur.fetchone()
+        if not row:
+            return True
+        liberar = min(int(row.get("tokens") or 0), consumidos)
+        cur.execute("""
+            UPDATE fila_rate_limit_reservas
+            SET tokens = tokens - %s, heartbeat_at = NOW()
+            WHERE instance_id=%s AND date=%s AND holder=%s
+        """, (liberar, self.instance_id, data, _id_reserva()))
+        if liberar:
+            cur.execute("""
+                UPDATE fila_rate_limit
+                SET tokens_reservados = GREATEST(0, CAST(tokens_reservados AS SIGNED) - %s)
+                WHERE instance_id=%s AND date=%s
+            """, (liberar, self.instance_id, data))
+        return False
+
+    def _recuperar_reservas_orfas(self, cur=None) -> int:
+        """
+        Devolve ao bucket os tokens de processos sem heartbeat há RESERVA_ORFA_SEC
+        (por dono: processos vivos não seguram a recuperação dos mortos) e
+        recalcula tokens_reservados como a soma das reservas que sobraram.
+        Sem `cur`, abre a própria conexão e faz commit.
+        """
+        self._ultima_varredura = time.time()
+        if cur is None:
+            try:
+                with closing(get_db_connection()) as conn:
+                    if not conn:
+                        return 0
+                    recuperados = self._recuperar_reservas_orfas(conn.cursor())
+                    conn.commit()
+                    return recuperados
+            except Exception as e:
+                log.error(f"❌ Erro ao recuperar reservas de tokens órfãs: {e}")
+                return 0
+
+        today = self._get_today_key()
+        cur.execute("""
+            SELECT tokens_reservados FROM fila_rate_limit
+            WHERE instance_id=%s AND date=%s
+            FOR UPDATE
+        """, (self.instance_id, today))
+        linha = cur.fetchone()
+        if not linha:
+            return 0
+        cur.execute("""
+            SELECT holder, tokens, heartbeat_at < NOW() - INTERVAL %s SECOND AS orfa
+            FROM fila_rate_limit_reservas
+            WHERE instance_id=%s AND date=%s
+            FOR UPDATE
+        """, (RESERVA_ORFA_SEC, self.instance_id, today))
+        meu = _id_reserva()
+        orfas, vivos = [], 0
+        for r in cur.fetchall() or []:
+            if r.get("orfa") and r["holder"] != meu:
+                orfas.append(r)
+            else:
+                vivos += int(r.get("tokens") or 0)
+        if orfas:
+            holders = [r["holder"] for r in orfas]
+            cur.execute(f"""
+                DELETE FROM fila_rate_limit_reservas
+                WHERE instance_id=%s AND date=%s AND holder IN ({", ".join(["%s"] * len(holders))})
+            """, (self.instance_id, today, *holders))
+        recuperados = int(linha.get("tokens_reservados") or 0) - vivos
+        if recuperados:
+            cur.execute("""
+                UPDATE fila_rate_limit SET tokens_reservados = %s
+                WHERE instance_id=%s AND date=%s
+            """, (vivos, self.instance_id, today))
+        if recuperados > 0:
+            log.warning(
+                f"♻️ {recuperados} token(s) de reservas órfãs recuperados "
+                f"({', '.join(r['holder'] for r in orfas) or 'sem dono'})"
+            )
+        return max(0, recuperados)
+
+    # ------------------------------------------
+    # Janela deslizante da taxa de erro
+    # ------------------------------------------
+    def _serie_janela(self, cur) -> List[dict]:
+        """
+        Ring buffer dos últimos ERROR_WINDOW_MIN minutos (mais antigo → mais recente).
+        Minutos sem envio aparecem zerados para o gráfico não ter buracos.
         """
+        agora = datetime.now().replace(second=0, microsecond=0)
+        inicio = agora - timedelta(minutes=ERROR_WINDOW_MIN - 1)
+        cur.execute("""
+            SELECT minuto, sent, failed FROM fila_rate_limit_janela
+            WHERE instance_id=%s AND minuto >= %s
+        """, (self.instance_id, inicio))
+        serie = [
+            {"minuto": (inicio + timedelta(minutes=i)).strftime("%H:%M"), "sent": 0, "failed": 0}
+            for i in range(ERROR_WINDOW_MIN)
+        ]
+        for row in cur.fetchall() or []:
+            idx = int((row["minuto"] - inicio).total_seconds() // 60)
+            if 0 <= idx < ERROR_WINDOW_MIN:
+                serie[idx]["sent"] += int(row.get("sent") or 0)
+                serie[idx]["failed"] += int(row.get("failed") or 0)
+        return serie
+
+    @staticmethod
+    def _taxa_da_serie(serie: List[dict]) -> Tuple[float, int]:
+        """Retorna (taxa_de_erro, amostras) somando os baldes da janela."""
+        sent = sum(b["sent"] for b in serie)
+        failed = sum(b["failed"] for b in serie)
+        total = sent + failed
+        return (failed / total if total else 0.0), total
+
+    @staticmethod
+    def _decidir_slowdown(ativo: bool, taxa: float, amostras: int) -> bool:
+        """
+        Histerese do throttling adaptativo:
+        - liga só com amostras suficientes e taxa acima do limiar de ativação;
+        - desliga quando a taxa cai abaixo do limiar de recuperação, ou quando
+          não sobrou nenhuma falha na janela (tráfego baixo demais para medir).
+        """
+        if not ativo:
+            return amostras >= ERROR_MIN_SAMPLES and taxa > ERROR_RATE_THRESHOLD
+        if amostras >= ERROR_MIN_SAMPLES:
+            return taxa >= ERROR_RECOVERY_THRESHOLD
+        return taxa > 0
+
+    def _avaliar_janela(self):
+        """Recalcula a taxa de erro da janela e liga/desliga o slowdown (histerese)."""
+        self._ultima_avaliacao = time.time()
         try:
             with closing(get_db_connection()) as conn:
                 if not conn:
                     return
                 cur = conn.cursor()
                 today = self._get_today_key()
-                cur.execute(f"""
+                serie = self._serie_janela(cur)
+                taxa, amostras = self._taxa_da_serie(serie)
+                cur.execute("""
+                    SELECT slowdown_active FROM fila_rate_limit
+                    WHERE instance_id=%s AND date=%s
+                """, (self.instance_id, today))
+                row = cur.fetchone()
+                if not row:
+                    return
+                ativo = bool(row.get("slowdown_active"))
+                novo = self._decidir_slowdown(ativo, taxa, amostras)
+                cur.execute("""
                     UPDATE fila_rate_limit
-                    SET {field} = {field} + %s, updated_at = NOW()
+                    SET current_error_rate=%s, slowdown_active=%s
                     WHERE instance_id=%s AND date=%s
-                """, (increment, self.instance_id, today))
+                """, (round(taxa, 3), novo, self.instance_id, today))
                 conn.commit()
-                # Invalida cache para próxima leitura
-                self._cache_ts = 0
+                if novo != ativo:
+                    self._cache_ts = 0
+                    if novo:
+                        log.warning(
+                            f"🐌 Slowdown ATIVADO | erro {taxa:.1%} em {amostras} envios "
+                            f"nos últimos {ERROR_WINDOW_MIN}min (limiar {ERROR_RATE_THRESHOLD:.1%})"
+                        )
+                    else:
+                        log.info(
+                            f"✅ Slowdown desativado | erro {taxa:.1%} em {amostras} envios "
+                            f"nos últimos {ERROR_WINDOW_MIN}min (recuperação < {ERROR_RECOVERY_THRESHOLD:.1%})"
+                        )
+        except Exception as e:
+            log.error(f"❌ Erro ao avaliar janela de erros: {e}")
+
+    def _estado_janela(self) -> dict:
+        """Série da janela para o dashboard (/api/monitor-status)."""
+        estado = {
+            "window_min": ERROR_WINDOW_MIN,
+            "threshold_on": round(ERROR_RATE_THRESHOLD * 100, 1),
+            "threshold_off": round(ERROR_RECOVERY_THRESHOLD * 100, 1),
+            "min_samples": ERROR_MIN_SAMPLES,
+            "samples": 0,
+            "error_rate": 0.0,
+            "series": [],
+        }
+        try:
+            with closing(get_db_connection()) as conn:
+                if not conn:
+                    return estado
+                serie = self._serie_janela(conn.cursor())
+                taxa, amostras = self._taxa_da_serie(serie)
+                estado.update({"samples": amostras, "error_rate": round(taxa * 100, 1), "series": serie})
         except Exception as e:
-            log.error(f"❌ Erro ao atualizar contador '{field}': {e}")
+            log.error(f"❌ Erro ao montar série da janela de erros: {e}")
+        return estado
 
-    def _update_error_rate(self, was_success: bool):
+    def _limpar_janela(self):
+        """Remove baldes antigos da janela (só servem para o gráfico recente) e reservas de dias passados."""
+        self._ultima_limpeza_janela = time.time()
+        try:
+            with closing(get_db_connection()) as conn:
+                if not conn:
+                    return
+                cur = conn.cursor()
+                cur.execute("""
+                    DELETE FROM fila_rate_limit_janela
+                    WHERE minuto < NOW() - INTERVAL %s DAY
+                """, (JANELA_RETENCAO_DIAS,))
+                cur.execute("DELETE FROM fila_rate_limit_reservas WHERE date < CURDATE()")
+                conn.commit()
+        except Exception as e:
+            log.error(f"❌ Erro ao limpar janela de erros: {e}")
+
+    def _reconciliar(self):
         """
-        Recalcula taxa de erro com média móvel simples.
-        
-        Args:
-            was_success: True se o envio foi bem-sucedido
+        Recuperação na subida do processo:
+        - reservas de tokens sem heartbeat recente são de processos mortos → devolve;
+        - total_sent nunca fica abaixo dos envios feitos hoje (enviado_em) em fila_envios por esta
+          instância (contadores em memória perdidos num crash); itens antigos sem instance_id
+          contam para a instância padrão.
         """
+        if self._reconciliado:
+            return
+        self._reconciliado = True
         try:
-            limits = self._fetch_limits()
-            total = limits["total_sent"] + limits["total_failed"] + 1
-            failed = limits["total_failed"] + (0 if was_success else 1)
-            new_rate = failed / max(total, 1)
-            
             with closing(get_db_connection()) as conn:
                 if not conn:
                     return
                 cur = conn.cursor()
                 today = self._get_today_key()
-                slowdown = new_rate > ERROR_RATE_THRESHOLD
-                
+                cur.execute("""
+                    INSERT INTO fila_rate_limit (instance_id, date)
+                    VALUES (%s, %s)
+                    ON DUPLICATE KEY UPDATE updated_at=NOW()
+                """, (self.instance_id, today))
+                self._recuperar_reservas_orfas(cur)
+                inicio_dia = datetime.combine(datetime.now().date(), datetime.min.time())
+                padrao = self.instance_id in (instancia_padrao(), "default")
+                # Pela hora do envio (enviado_em), não da entrada na fila; itens gravados antes
+                # da coluna existir caem no claim, que é segundos antes do envio
+                cur.execute("""
+                    SELECT COUNT(*) AS enviados FROM fila_envios
+                    WHERE status='enviado'
+                      AND (enviado_em >= %s OR (enviado_em IS NULL AND claimed_at >= %s))
+                      AND (instance_id = %s OR (%s AND instance_id IS NULL))
+                """, (inicio_dia, inicio_dia, self.instance_id, padrao))
+                enviados = int((cur.fetchone() or {}).get("enviados") or 0)
                 cur.execute("""
                     UPDATE fila_rate_limit
-                    SET current_error_rate=%s, slowdown_active=%s, updated_at=NOW()
+                    SET total_sent = GREATEST(total_sent, %s)
                     WHERE instance_id=%s AND date=%s
-                """, (round(new_rate, 3), slowdown, self.instance_id, today))
+                """, (enviados, self.instance_id, today))
                 conn.commit()
                 self._cache_ts = 0
-                
         except Exception as e:
-            log.error(f"❌ Erro ao atualizar error_rate: {e}")
+            log.error(f"❌ Erro na reconciliação do anti-spam: {e}")
 
-    def _get_batch_pause_duration(self, slowdown: bool) -> float:
+    def _obter_token(self) -> bool:
         """
-        Calcula duração da pausa entre batches.
-        
-        Args:
-            slowdown: Se deve aplicar fator de redução de velocidade
-            
-        Returns:
-            float: segundos de pausa necessários
+        Consome 1 token do limite diário. Sem tokens locais, reserva um bloco
+        no banco via UPDATE condicional (nunca ultrapassa DAILY_LIMIT somando
+        o que já foi enviado e o que outros processos têm reservado).
         """
-        base_pause = random.uniform(BATCH_PAUSE_MIN_SEC, BATCH_PAUSE_MAX_SEC)
-        return base_pause * (SLOWDOWN_FACTOR if slowdown else 1.0)
+        if DAILY_LIMIT <= 0:
+            return True
+        today = self._get_today_key()
+        with self._lock:
+            if self._tokens_date != today:
+                self._tokens, self._tokens_date = 0, today
+            if self._tokens > 0:
+                self._tokens -= 1
+                self._ultimo_uso_token = time.time()
+                return True
+            try:
+                with closing(get_db_connection()) as conn:
+                    if not conn:
+                        return False
+                    cur = conn.cursor()
+                    if self._linha_date != today:
+                        # Virada do dia: o CAS abaixo precisa da linha de hoje
+                        cur.execute("""
+                            INSERT INTO fila_rate_limit (instance_id, date)
+                            VALUES (%s, %s)
+                            ON DUPLICATE KEY UPDATE updated_at=NOW()
+                        """, (self.instance_id, today))
+                        self._linha_date = today
+                    for bloco in sorted({TOKEN_BLOCK, 1}, reverse=True):
+                        cur.execute("""
+                            UPDATE fila_rate_limit
+                            SET tokens_reservados = tokens_reservados + %s,
+                                tokens_heartbeat_at = NOW()
+                            WHERE instance_id=%s AND date=%s
+                              AND total_sent + tokens_reservados + %s <= %s
+                        """, (bloco, self.instance_id, today, bloco, DAILY_LIMIT))
+                        if cur.rowcount:
+                            cur.execute("""
+                                INSERT INTO fila_rate_limit_reservas (instance_id, date, holder, tokens, heartbeat_at)
+                                VALUES (%s, %s, %s, %s, NOW())
+                                ON DUPLICATE KEY UPDATE tokens = tokens + VALUES(tokens), heartbeat_at = NOW()
+                            """, (self.instance_id, today, _id_reserva(), bloco))
+                            conn.commit()
+                            self._tokens += bloco - 1
+                            self._ultimo_uso_token = self._ultimo_heartbeat = time.time()
+                            log.debug(f"🎟️ Reservados {bloco} token(s) do limite diário")
+                            return True
+                    conn.commit()
+                    return False
+            except Exception as e:
+                log.error(f"❌ Erro ao reservar tokens do limite diário: {e}")
+                return False
+
+    def _devolver_token(self):
+        """Envio não aconteceu/falhou: o token volta para o bucket local."""
+        if DAILY_LIMIT <= 0:
+            return
+        with self._lock:
+            if self._tokens_date == self._get_today_key():
+                self._tokens += 1
 
-    def _register_batch_pause(self):
-        """Registra que um batch foi concluído e pausa iniciada."""
+    def _reservar_slot_batch(self, limits: dict) -> Tuple[bool, str]:
+        """
+        Reserva atomicamente uma vaga no batch atual (proativos/manuais).
+        Batch cheio: se a pausa já passou, abre um novo batch (CAS) e ocupa a 1ª vaga.
+        """
         try:
             with closing(get_db_connection()) as conn:
                 if not conn:
-                    return
+                    return False, "Sem conexão com o banco"
                 cur = conn.cursor()
                 today = self._get_today_key()
                 cur.execute("""
                     UPDATE fila_rate_limit
-                    SET messages_in_current_batch=0,
-                        last_batch_pause_at=NOW(),
-                        updated_at=NOW()
+                    SET messages_in_current_batch = messages_in_current_batch + 1, updated_at = NOW()
+                    WHERE instance_id=%s AND date=%s AND messages_in_current_batch < %s
+                """, (self.instance_id, today, BATCH_SEND_LIMIT))
+                if cur.rowcount:
+                    conn.commit()
+                    self._cache_ts = 0
+                    return True, "ok"
+
+                pause_needed = self._get_batch_pause_duration(limits["slowdown_active"])
+                cur.execute("""
+                    UPDATE fila_rate_limit
+                    SET messages_in_current_batch = 1, last_batch_pause_at = NOW(), updated_at = NOW()
                     WHERE instance_id=%s AND date=%s
-                """, (self.instance_id, today))
+                      AND messages_in_current_batch >= %s
+                      AND (last_batch_pause_at IS NULL OR last_batch_pause_at <= NOW() - INTERVAL %s SECOND)
+                """, (self.instance_id, today, BATCH_SEND_LIMIT, int(pause_needed)))
+                conn.commit()
+                self._cache_ts = 0
+                if cur.rowcount:
+                    log.info(f"📦 Batch de {BATCH_SEND_LIMIT} mensagens concluído - iniciando pausa")
+                    return True, "ok"
+
+                cur.execute("""
+                    SELECT GREATEST(0, %s - TIMESTAMPDIFF(SECOND, last_batch_pause_at, NOW())) AS restante
+                    FROM fila_rate_limit WHERE instance_id=%s AND date=%s
+                """, (int(pause_needed), self.instance_id, today))
+                remaining = int((cur.fetchone() or {}).get("restante") or 0)
+                log.info(f"⏸️ Pausa entre batches: aguarde {remaining}s")
+                return False, f"Pausa entre batches: aguarde {remaining}s"
+        except Exception as e:
+            log.error(f"❌ Erro ao reservar vaga no batch: {e}")
+            return False, "Erro ao reservar vaga no batch"
+
+    def _devolver_slot_batch(self):
+        """Envio proativo falhou: libera a vaga reservada no batch."""
+        try:
+            with closing(get_db_connection()) as conn:
+                if not conn:
+                    return
+                cur = conn.cursor()
+                cur.execute("""
+                    UPDATE fila_rate_limit
+                    SET messages_in_current_batch = GREATEST(0, CAST(messages_in_current_batch AS SIGNED) - 1),
+                        updated_at = NOW()
+                    WHERE instance_id=%s AND date=%s
+                """, (self.instance_id, self._get_today_key()))
                 conn.commit()
                 self._cache_ts = 0
         except Exception as e:
-            log.error(f"❌ Erro ao registrar batch pause: {e}")
+            log.error(f"❌ Erro ao devolver vaga do batch: {e}")
+
+    def _get_batch_pause_duration(self, slowdown: bool) -> float:
+        """
+        Calcula duração da pausa entre batches.
+        
+        Args:
+            slowdown: Se deve aplicar fator de redução de velocidade
+            
+        Returns:
+            float: segundos de pausa necessários
+        """
+        base_pause = random.uniform(BATCH_PAUSE_MIN_SEC, BATCH_PAUSE_MAX_SEC)
+        return base_pause * (SLOWDOWN_FACTOR if slowdown else 1.0)
 
     # ------------------------------------------
     # API Pública - Verificações
     # ------------------------------------------
+    def _checar_horario(self, now: datetime, is_manual: bool) -> Optional[Tuple[bool, str]]:
+        """Janela de horário comercial. Retorna None se está dentro da janela."""
+        # ✅ Manuais podem ser enviados fora do horário (opcional - configurable)
+        if is_manual or (BUSINESS_START <= now.hour < BUSINESS_END):
+            return None
+        if OUTSIDE_HOURS_ACTION == "skip":
+            log.info(f"⏭️ Fora do horário comercial ({BUSINESS_START}h-{BUSINESS_END}h) - pulando")
+            return False, f"Fora do horário comercial ({BUSINESS_START}h-{BUSINESS_END}h)"
+        elif OUTSIDE_HOURS_ACTION == "reequeue":
+            if now.hour < BUSINESS_START:
+                next_send = now.replace(hour=BUSINESS_START, minute=0, second=0, microsecond=0)
+            else:
+                next_send = now.replace(hour=BUSINESS_START, minute=0, second=0, microsecond=0) + timedelta(days=1)
+            log.info(f"⏰ Fora do horário - re-agendando para {next_send}")
+            return False, f"reequeue:{next_send.isoformat()}"
+        return None
+
+    def _log_slowdown(self, limits: dict):
+        if limits["slowdown_active"]:
+            log.warning(
+                f"🐌 Throttling adaptativo ATIVO | "
+                f"error_rate={limits['error_rate']:.1%} > {ERROR_RATE_THRESHOLD:.1%} | "
+                f"delays multiplicados por {SLOWDOWN_FACTOR}x"
+            )
+
     def can_send_now(self, is_reply: bool = False, is_manual: bool = False) -> Tuple[bool, str]:
         """
-        Verifica se pode enviar mensagem agora.
+        Verifica se pode enviar mensagem agora (somente leitura, não reserva nada).
+        Para enviar de fato use reservar_envio().
         
         Args:
             is_reply: Se True, aplica regras flexíveis para respostas conversacionais
@@ -244,99 +791,114 @@ class AntiSpamController:
         """
         limits = self._fetch_limits()
         now = datetime.now()
-        current_hour = now.hour
 
-        # 🎯 Respostas conversacionais: regras mais flexíveis
+        # 1. Limite diário (PARA TODOS: respostas, proativos e manuais)
+        if DAILY_LIMIT > 0 and limits["total_sent"] >= DAILY_LIMIT:
+            log.warning(f"🚫 Limite diário atingido: {limits['total_sent']}/{DAILY_LIMIT}")
+            return False, f"Limite diário atingido ({DAILY_LIMIT} envios)"
+
+        # ✅ Respostas não entram em batch, não verificam horário, delay mínimo
         if is_reply:
-            # ✅ Só verifica limite diário
-            if DAILY_LIMIT > 0 and limits["total_sent"] >= DAILY_LIMIT:
-                log.warning(f"🚫 Limite diário atingido para resposta: {limits['total_sent']}/{DAILY_LIMIT}")
-                return False, f"Limite diário atingido ({DAILY_LIMIT} envios)"
-            # ✅ Respostas não entram em batch, não verificam horário, delay mínimo
             return True, "ok"
+
+        # 2. Janela de horário comercial
+        bloqueio = self._checar_horario(now, is_manual)
+        if bloqueio:
+            return bloqueio
+
+        # 3. Batch (para proativos e manuais)
+        if limits["messages_in_batch"] >= BATCH_SEND_LIMIT and limits["last_batch_pause"]:
+            last_pause = limits["last_batch_pause"]
+            if isinstance(last_pause, str):
+                last_pause_str = last_pause.replace("Z", "+00:00")
+                if "+" in last_pause_str and last_pause_str.count("+") == 1:
+                    last_pause_str = last_pause_str.split("+")[0]
+                try:
+                    last_pause = datetime.fromisoformat(last_pause_str)
+                except ValueError:
+                    last_pause = datetime.strptime(last_pause_str[:19], "%Y-%m-%d %H:%M:%S")
+
+            elapsed = (now - last_pause).total_seconds()
+            pause_needed = self._get_batch_pause_duration(limits["slowdown_active"])
+            if elapsed < pause_needed:
+                remaining = int(pause_needed - elapsed)
+                return False, f"Pausa entre batches: aguarde {remaining}s"
+
+        self._log_slowdown(limits)
+        return True, "ok"
+
+    def reservar_envio(self, is_reply: bool = False, is_manual: bool = False) -> Tuple[bool, str]:
+        """
+        Verifica E reserva capacidade para um envio (usado pelo worker da fila).
+        Consome 1 token do limite diário e, para proativos/manuais, 1 vaga do batch.
+        Toda reserva deve ser seguida de register_send() (que devolve em caso de falha).
         
-        # 📦 Para envios proativos e manuais, aplica regras anti-spam
-        # ✅ IMPORTANTE: Manuais TAMBÉM contam no limite diário e respeitam batch/delay
-        
-        # 1. Verifica limite diário (PARA TODOS: proativos e manuais)
-        if DAILY_LIMIT > 0 and limits["total_sent"] >= DAILY_LIMIT:
-            log.warning(f"🚫 Limite diário atingido: {limits['total_sent']}/{DAILY_LIMIT}")
+        Returns:
+            Mesmo contrato de can_send_now()
+        """
+        self._reconciliar()
+        self._iniciar_flusher()
+
+        if not is_reply:
+            bloqueio = self._checar_horario(datetime.now(), is_manual)
+            if bloqueio:
+                return bloqueio
+
+        if not self._obter_token():
+            log.warning(f"🚫 Limite diário atingido ({DAILY_LIMIT} envios) | reply={is_reply}")
             return False, f"Limite diário atingido ({DAILY_LIMIT} envios)"
 
-        # 2. Verifica janela de horário comercial
-        # ✅ Manuais podem ser enviados fora do horário (opcional - configurable)
-        if not is_manual and not (BUSINESS_START <= current_hour < BUSINESS_END):
-            if OUTSIDE_HOURS_ACTION == "skip":
-                log.info(f"⏭️ Fora do horário comercial ({BUSINESS_START}h-{BUSINESS_END}h) - pulando")
-                return False, f"Fora do horário comercial ({BUSINESS_START}h-{BUSINESS_END}h)"
-            elif OUTSIDE_HOURS_ACTION == "reequeue":
-                if current_hour < BUSINESS_START:
-                    next_send = now.replace(hour=BUSINESS_START, minute=0, second=0, microsecond=0)
-                else:
-                    next_send = now.replace(hour=BUSINESS_START, minute=0, second=0, microsecond=0) + timedelta(days=1)
-                log.info(f"⏰ Fora do horário - re-agendando para {next_send}")
-                return False, f"reequeue:{next_send.isoformat()}"
-
-        # 3. Verifica batch (para proativos e manuais)
-        if limits["messages_in_batch"] >= BATCH_SEND_LIMIT:
-            if limits["last_batch_pause"]:
-                last_pause = limits["last_batch_pause"]
-                if isinstance(last_pause, str):
-                    last_pause_str = last_pause.replace("Z", "+00:00")
-                    if "+" in last_pause_str and last_pause_str.count("+") == 1:
-                        last_pause_str = last_pause_str.split("+")[0]
-                    try:
-                        last_pause = datetime.fromisoformat(last_pause_str)
-                    except ValueError:
-                        last_pause = datetime.strptime(last_pause_str[:19], "%Y-%m-%d %H:%M:%S")
-                
-                elapsed = (now - last_pause).total_seconds()
-                pause_needed = self._get_batch_pause_duration(limits["slowdown_active"])
-                
-                if elapsed < pause_needed:
-                    remaining = int(pause_needed - elapsed)
-                    log.info(f"⏸️ Pausa entre batches: aguarde {remaining}s")
-                    return False, f"Pausa entre batches: aguarde {remaining}s"
-            
-            log.info(f"📦 Batch de {BATCH_SEND_LIMIT} mensagens concluído - iniciando pausa")
-            self._register_batch_pause()
+        if is_reply:
+            return True, "ok"
 
-        # 4. Log de throttling
-        if limits["slowdown_active"]:
-            log.warning(
-                f"🐌 Throttling adaptativo ATIVO | "
-                f"error_rate={limits['error_rate']:.1%} > {ERROR_RATE_THRESHOLD:.1%} | "
-                f"delays multiplicados por {SLOWDOWN_FACTOR}x"
-            )
+        limits = self._fetch_limits()
+        ok, motivo = self._reservar_slot_batch(limits)
+        if not ok:
+            self._devolver_token()
+            return False, motivo
 
+        self._log_slowdown(limits)
         return True, "ok"
 
+    def cancelar_reserva(self, is_reply: bool = False, is_manual: bool = False):
+        """
+        Desfaz reservar_envio() quando o envio nem chegou a sair
+        (ex.: circuit breaker da Z-API aberto). Não conta como falha.
+        """
+        self._devolver_token()
+        if not is_reply:
+            self._devolver_slot_batch()
+
     # ------------------------------------------
     # API Pública - Registro de Envios
     # ------------------------------------------
     def register_send(self, success: bool, is_reply: bool = False, is_manual: bool = False):
         """
-        Registra um envio concluído e atualiza métricas.
+        Registra um envio concluído (em memória; o banco é atualizado pelo flush).
         
         Args:
             success: True se o envio foi bem-sucedido
             is_reply: Se True, não conta para batch (só para limite diário)
             is_manual: Se True, é envio manual (boas-vindas) - conta no limite diário e batch
         """
-        # Sempre atualiza total de enviados/falhas (PARA TODOS os tipos)
-        self._update_counter("total_sent" if success else "total_failed")
-        
-        # ✅ Incrementa batch se:
-        # - Foi sucesso
-        # - E NÃO é resposta conversacional
-        # (Manuais e proativos contam no batch)
-        if success and not is_reply:
-            self._update_counter("messages_in_current_batch")
-        
-        # Recalcula taxa de erro (inclui todos os envios)
-        self._update_error_rate(success)
-        
-        # Log resumido
+        today = self._get_today_key()
+        with self._lock:
+            if self._deltas_date and self._deltas_date != today:
+                # Virada do dia: grava o que é de ontem antes de acumular hoje
+                self.flush()
+            self._deltas_date = today
+            self._deltas["total_sent" if success else "total_failed"] += 1
+            minuto = datetime.now().replace(second=0, microsecond=0)
+            self._baldes.setdefault(minuto, [0, 0])[0 if success else 1] += 1
+
+        if not success:
+            # Falha não consome limite diário nem vaga do batch
+            self._devolver_token()
+            if not is_reply:
+                self._devolver_slot_batch()
+
+        self._iniciar_flusher()
+
         limits = self._fetch_limits()
         log.debug(
             f"📊 Rate limit update | sent={limits['total_sent']}/{DAILY_LIMIT if DAILY_LIMIT>0 else '∞'} | "
@@ -375,6 +937,10 @@ class AntiSpamController:
     # ------------------------------------------
     # API Pública - Monitoramento e Utilitários
     # ------------------------------------------
+    def get_seconds_per_send(self) -> float:
+        """Ritmo médio atual (segundos por envio proativo), considerando slowdown."""
+        return segundos_por_envio(self._fetch_limits()["slowdown_active"])
+
     def get_daily_stats(self) -> dict:
         """
         Retorna estatísticas do dia para monitoramento.
@@ -384,6 +950,7 @@ class AntiSpamController:
         """
         limits = self._fetch_limits()
         can_send, reason = self.can_send_now()
+        total_dia = limits["total_sent"] + limits["total_failed"]
         
         return {
             "instance_id": self.instance_id,
@@ -395,7 +962,9 @@ class AntiSpamController:
             "in_batch": limits["messages_in_batch"],
             "batch_limit": BATCH_SEND_LIMIT,
             "error_rate": round(limits["error_rate"] * 100, 1),
+            "error_rate_day": round(limits["total_failed"] / total_dia * 100, 1) if total_dia else 0.0,
             "slowdown_active": limits["slowdown_active"],
+            "error_window": self._estado_janela(),
             "can_send_now": can_send,
             "block_reason": None if can_send else reason,
             "next_delay_sec": round(self.get_next_delay(), 1),
@@ -448,9 +1017,20 @@ class AntiSpamController:
                         messages_in_current_batch = 0,
                         slowdown_active = FALSE,
                         current_error_rate = 0.000,
+                        tokens_reservados = 0,
                         updated_at = NOW()
                 """, (self.instance_id, today))
+                cur.execute("DELETE FROM fila_rate_limit_janela WHERE instance_id=%s", (self.instance_id,))
+                cur.execute(
+                    "DELETE FROM fila_rate_limit_reservas WHERE instance_id=%s AND date=%s",
+                    (self.instance_id, today)
+                )
                 conn.commit()
+                with self._lock:
+                    self._deltas = {"total_sent": 0, "total_failed": 0}
+                    self._deltas_date = None
+                    self._tokens = 0
+                    self._baldes = {}
                 self._cache_ts = 0
                 log.info(f"🔄 Limites diários resetados para {self.instance_id}")
         except Exception as e:
@@ -1,12 +1,13 @@
 import logging
-from database import salvar_conversa, atualizar_status
-from servicos.fila_mensagens import adicionar_na_fila
+from database import VisitorContext
 from constantes import EstadoVisitante
 
-def processar_evento_enviado(numero: str, nome_visitante: str, message_sid: str, origem: str = "integra+"):
+def processar_evento_enviado(contexto: VisitorContext, message_sid: str, origem: str = "integra+"):
     """
     Processa quando o visitante recebeu convite de evento e precisa escolher uma opção.
     """
+    numero = contexto.telefone
+    nome_visitante = contexto.primeiro_nome
     resposta = (f"👋 Oi {nome_visitante}, vi que você recebeu nosso convite para o evento! 🎉\n"
                 "Gostaria de confirmar sua presença ou saber mais detalhes?\n\n"
                 "Responda com:\n"
@@ -15,9 +16,9 @@ def processar_evento_enviado(numero: str, nome_visitante: str, message_sid: str,
                 "3️⃣ Não posso participar desta vez.")
 
     try:
-        atualizar_status(numero, EstadoVisitante.INICIO.value, origem=origem)
-        adicionar_na_fila(numero, resposta)
-        salvar_conversa(numero, resposta, tipo="enviada", sid=message_sid, origem=origem)
+        contexto.definir_fase(EstadoVisitante.INICIO.value, origem=origem)
+        contexto.enfileirar(numero, resposta)
+        contexto.registrar_conversa(resposta, tipo="enviada", sid=message_sid, origem=origem)
 
         return {
             "resposta": resposta,
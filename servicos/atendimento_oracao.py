@@ -1,17 +1,19 @@
 import logging
 from datetime import datetime
 from constantes import EstadoVisitante
-from database import normalizar_para_envio, atualizar_status, salvar_conversa, registrar_estatistica
-from servicos.zapi_cliente import enviar_mensagem
-from servicos.fila_mensagens import enviar_mensagem_para_fila
+from database import VisitorContext
+from servicos.fila_mensagens import TIPO_INTERNO
 
 # 📜 Lista de números dos intercessores
 LISTA_INTERCESSORES = ['48984949640', '48999449961']
 
 
-def enviar_pedido_oracao(lista_intercessores: list, nome_visitante: str, numero_visitante: str, texto_recebido: str):
+def enviar_pedido_oracao(contexto: VisitorContext, lista_intercessores: list, nome_visitante: str,
+                         numero_visitante: str, texto_recebido: str):
     """
     Envia um pedido de oração para todos os intercessores cadastrados.
+    Vai pela fila junto com o resto do atendimento (aviso interno, sem checagem de
+    consentimento), para um retry da mensagem recebida não repetir o aviso.
     """
     mensagem = (
         f"📖 Pedido de Oração\n\n"
@@ -22,26 +24,24 @@ def enviar_pedido_oracao(lista_intercessores: list, nome_visitante: str, numero_
     )
 
     for numero in lista_intercessores:
-        try:
-            numero_normalizado_oracao = normalizar_para_envio(numero)
-            enviar_mensagem(numero_normalizado_oracao, mensagem)
-        except Exception as e:
-            logging.error(f"❌ Erro ao enviar pedido de oração para {numero}: {e}")
+        contexto.enfileirar(numero, mensagem, meta={"tipo": TIPO_INTERNO, "origem": "pedido_oracao"})
 
 
-def processar_pedido_oracao(numero: str, nome_visitante: str, texto_recebido: str, message_sid: str, origem: str = "integra+"):
+def processar_pedido_oracao(contexto: VisitorContext, texto_recebido: str, message_sid: str, origem: str = "integra+"):
     """
     Processa o pedido de oração do visitante:
     - Envia aos intercessores
     - Responde ao visitante
     - Atualiza o status e estatísticas
     """
+    numero = contexto.telefone
+    nome_visitante = contexto.primeiro_nome
     try:
         # 🕊️ Registrar o pedido no histórico
-        salvar_conversa(numero, f"Pedido de oração: {texto_recebido}", tipo="recebida", sid=message_sid, origem=origem)
+        contexto.registrar_conversa(f"Pedido de oração: {texto_recebido}", tipo="recebida", sid=message_sid, origem=origem)
 
         # 📤 Enviar para o Ministério de Intercessão
-        enviar_pedido_oracao(LISTA_INTERCESSORES, nome_visitante, numero, texto_recebido)
+        enviar_pedido_oracao(contexto, LISTA_INTERCESSORES, nome_visitante, numero, texto_recebido)
 
         # 💬 Mensagem personalizada ao visitante
         if texto_recebido.strip().lower() in ["pedido de oração solicitado pelo visitante.", "pedido de oracao solicitado pelo visitante."]:
@@ -61,18 +61,17 @@ def processar_pedido_oracao(numero: str, nome_visitante: str, texto_recebido: st
                 f"Se quiser continuar conversando, estou aqui pra te ouvir. 💬"
             )
 
-        # 🔄 Atualizar status e estatísticas
-        atualizar_status(numero, EstadoVisitante.FIM.value, origem=origem)
-        registrar_estatistica(numero, EstadoVisitante.PEDIDO_ORACAO.value, EstadoVisitante.FIM.value)
+        # 🔄 Estatística (PEDIDO_ORACAO → FIM)
+        contexto.registrar_estatistica(EstadoVisitante.PEDIDO_ORACAO.value, EstadoVisitante.FIM.value)
 
         # 📦 Enviar e registrar a resposta
-        enviar_mensagem_para_fila(numero, resposta)
-        salvar_conversa(numero, resposta, tipo="enviada", sid=message_sid, origem=origem)
+        contexto.enfileirar(numero, resposta)
+        contexto.registrar_conversa(resposta, tipo="enviada", sid=message_sid, origem=origem)
 
         logging.info(f"🙏 Pedido de oração processado com sucesso para {numero}")
 
-        # 🔁 Reinicia o fluxo para retornar ao menu inicial
-        atualizar_status(numero, EstadoVisitante.INICIO.value, origem=origem)
+        # 🔁 Reinicia o fluxo para retornar ao menu inicial (FIM é transitório: grava direto INICIO)
+        contexto.definir_fase(EstadoVisitante.INICIO.value, origem=origem)
 
         return {
             "resposta": resposta,
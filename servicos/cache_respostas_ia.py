@@ -0,0 +1,299 @@
+# ==============================================
+# servicos/cache_respostas_ia.py
+# ==============================================
+# 🧠 Cache de respostas da IA (IAIntegracao)
+# Camadas, na ordem da consulta:
+# - exata: chave normalizada (tokens únicos ordenados), LRU por tamanho + TTL
+# - similar: MinHash/LSH sobre o conjunto de tokens, confirmado por Jaccard
+#   (só respostas positivas: "não sei" de uma pergunta parecida não vale para outra)
+# - compartilhada (opcional): SQLite local entre os workers do gunicorn da mesma máquina,
+#   cada entrada marcada com a versão do índice da IA que a produziu
+# Respostas negativas (fallback, conf 0.5) ficam com TTL curto; erros (conf < 0.5) não entram.
+# ==============================================
+
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+log = logging.getLogger(__name__)
+
+# =========================
+# Config
+# =========================
+CACHE_TTL_SEC = int(os.getenv("IA_CACHE_TTL_SEC", "3600"))
+CACHE_TTL_NEGATIVO_SEC = int(os.getenv("IA_CACHE_TTL_NEGATIVO_SEC", "120"))
+CACHE_JACCARD_MIN = float(os.getenv("IA_CACHE_JACCARD_MIN", "0.8"))
+CACHE_COMPARTILHADO_PATH = os.getenv("IA_CACHE_SHARED_PATH", "")   # ex.: /tmp/ia_cache.sqlite3 ("" = desligado)
+CACHE_COMPARTILHADO_MAX = int(os.getenv("IA_CACHE_SHARED_MAX", "5000"))
+
+MINHASH_BANDAS = 8
+MINHASH_LINHAS = 4
+_PRIMO = (1 << 61) - 1
+_COEFICIENTES = [
+    (int.from_bytes(hashlib.blake2b(f"a{i}".encode(), digest_size=8).digest(), "big") % _PRIMO | 1,
+     int.from_bytes(hashlib.blake2b(f"b{i}".encode(), digest_size=8).digest(), "big") % _PRIMO)
+    for i in range(MINHASH_BANDAS * MINHASH_LINHAS)
+]
+
+Resultado = Tuple[str, float]
+
+
+# =========================
+# Assinatura do conjunto de tokens
+# =========================
+def tokens_canonicos(chave: str) -> frozenset:
+    """Tokens da chave normalizada com plural simples dobrado (cultos → culto)."""
+    return frozenset(t[:-1] if len(t) > 3 and t.endswith("s") else t for t in chave.split())
+
+
+def minhash(tokens: frozenset) -> Tuple[int, ...]:
+    hashes = [int.from_bytes(hashlib.blake2b(t.encode(), digest_size=8).digest(), "big") for t in tokens]
+    return tuple(min((a * h + b) % _PRIMO for h in hashes) for a, b in _COEFICIENTES)
+
+
+def _bandas(assinatura: Tuple[int, ...]) -> List[Tuple[int, Tuple[int, ...]]]:
+    return [(i, assinatura[i * MINHASH_LINHAS:(i + 1) * MINHASH_LINHAS]) for i in range(MINHASH_BANDAS)]
+
+
+def _jaccard(a: frozenset, b: frozenset) -> float:
+    return len(a & b) / max(len(a | b), 1)
+
+
+# =========================
+# Camada compartilhada (SQLite)
+# =========================
+class _ArmazemCompartilhado:
+    """Tabela única num arquivo SQLite (WAL): leitura/escrita por chave, limpeza ocasional."""
+
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        self._local = threading.local()
+        self._escritas = 0
+        self._conexao()  # valida o arquivo já na subida
+
+    def _conexao(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.caminho, timeout=1.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS respostas (
+                    chave TEXT PRIMARY KEY,
+                    resposta TEXT NOT NULL,
+                    confianca REAL NOT NULL,
+                    versao INTEGER NOT NULL,
+                    expira_em REAL NOT NULL
+                )
+            """)
+            self._local.conn = conn
+        return conn
+
+    def obter(self, chave: str, versao: int) -> Optional[Tuple[Resultado, float]]:
+        row = self._conexao().execute(
+            "SELECT resposta, confianca, expira_em FROM respostas WHERE chave = ? AND versao = ? AND expira_em > ?",
+            (chave, versao, time.time()),
+        ).fetchone()
+        return ((row[0], row[1]), row[2]) if row else None
+
+    def guardar(self, chave: str, resultado: Resultado, versao: int, expira_em: float) -> None:
+        conn = self._conexao()
+        conn.execute(
+            "INSERT OR REPLACE INTO respostas (chave, resposta, confianca, versao, expira_em) VALUES (?, ?, ?, ?, ?)",
+            (chave, resultado[0], resultado[1], versao, expira_em),
+        )
+        self._escritas += 1
+        if self._escritas % 200 == 0:
+            conn.execute("DELETE FROM respostas WHERE expira_em <= ? OR versao < ?", (time.time(), versao))
+            conn.execute("""
+                DELETE FROM respostas WHERE chave IN (
+                    SELECT chave FROM respostas ORDER BY expira_em DESC LIMIT -1 OFFSET ?
+                )
+            """, (CACHE_COMPARTILHADO_MAX,))
+
+    def remover(self, chaves: List[str]) -> None:
+        if chaves:
+            self._conexao().executemany("DELETE FROM respostas WHERE chave = ?", [(c,) for c in chaves])
+
+    def limpar(self) -> None:
+        self._conexao().execute("DELETE FROM respostas")
+
+
+# =========================
+# Cache
+# =========================
+class CacheRespostas:
+    def __init__(self, tamanho: int = 256, ttl: int = CACHE_TTL_SEC, ttl_negativo: int = CACHE_TTL_NEGATIVO_SEC,
+                 caminho_compartilhado: str = CACHE_COMPARTILHADO_PATH):
+        self.tamanho = tamanho
+        self.ttl = ttl
+        self.ttl_negativo = ttl_negativo
+        self._lock = threading.Lock()
+        # chave → (resultado, expira_em, negativo, tokens)
+        self._entradas: "OrderedDict[str, Tuple[Resultado, float, bool, frozenset]]" = OrderedDict()
+        self._baldes: Dict[Tuple[int, Tuple[int, ...]], Set[str]] = {}
+        self._assinaturas: Dict[str, Tuple[int, ...]] = {}
+        self._metricas = {"exata": 0, "similar": 0, "compartilhada": 0, "misses": 0, "expiradas": 0, "despejadas": 0}
+
+        self._compartilhado: Optional[_ArmazemCompartilhado] = None
+        if caminho_compartilhado:
+            try:
+                self._compartilhado = _ArmazemCompartilhado(caminho_compartilhado)
+                log.info(f"🧠 Cache da IA compartilhado em {caminho_compartilhado}")
+            except Exception as e:
+                log.warning(f"⚠️ Cache compartilhado da IA indisponível ({caminho_compartilhado}): {e}")
+
+    # ---------- internos (com _lock) ----------
+    def _remover(self, chave: str) -> None:
+        self._entradas.pop(chave, None)
+        assinatura = self._assinaturas.pop(chave, None)
+        if assinatura:
+            for banda in _bandas(assinatura):
+                balde = self._baldes.get(banda)
+                if balde:
+                    balde.discard(chave)
+                    if not balde:
+                        del self._baldes[banda]
+
+    def _inserir(self, chave: str, resultado: Resultado, expira_em: float, negativo: bool) -> None:
+        self._remover(chave)
+        tokens = tokens_canonicos(chave)
+        self._entradas[chave] = (resultado, expira_em, negativo, tokens)
+        if not negativo and tokens:
+            assinatura = minhash(tokens)
+            self._assinaturas[chave] = assinatura
+            for banda in _bandas(assinatura):
+                self._baldes.setdefault(banda, set()).add(chave)
+        while len(self._entradas) > self.tamanho:
+            self._remover(next(iter(self._entradas)))
+            self._metricas["despejadas"] += 1
+
+    def _vivo(self, chave: str, agora: float) -> Optional[Resultado]:
+        entrada = self._entradas.get(chave)
+        if entrada is None:
+            return None
+        if entrada[1] <= agora:
+            self._remover(chave)
+            self._metricas["expiradas"] += 1
+            return None
+        self._entradas.move_to_end(chave)
+        return entrada[0]
+
+    def _similar(self, chave: str, agora: float) -> Optional[Resultado]:
+        tokens = tokens_canonicos(chave)
+        if not tokens:
+            return None
+        candidatos: Set[str] = set()
+        for banda in _bandas(minhash(tokens)):
+            candidatos |= self._baldes.get(banda, set())
+        melhor, melhor_j = None, CACHE_JACCARD_MIN
+        for candidato in candidatos:
+            entrada = self._entradas.get(candidato)
+            if entrada is None or entrada[1] <= agora:
+                continue
+            j = _jaccard(tokens, entrada[3])
+            if j >= melhor_j:
+                melhor, melhor_j = candidato, j
+        return self._entradas[melhor][0] if melhor else None
+
+    # ---------- API ----------
+    def obter(self, chave: str, versao: Optional[int] = None) -> Optional[Resultado]:
+        """Exata → similar → compartilhada (só com `versao` do índice conhecida)."""
+        agora = time.time()
+        with self._lock:
+            resultado = self._vivo(chave, agora)
+            if resultado is not None:
+                self._metricas["exata"] += 1
+                return resultado
+            resultado = self._similar(chave, agora)
+            if resultado is not None:
+                self._metricas["similar"] += 1
+                self._inserir(chave, resultado, agora + self.ttl, negativo=False)
+                return resultado
+
+        if self._compartilhado is not None and versao is not None:
+            try:
+                achado = self._compartilhado.obter(chave, versao)
+            except Exception as e:
+                log.debug(f"⚠️ Cache compartilhado da IA: leitura falhou: {e}")
+                achado = None
+            if achado:
+                resultado, expira_em = achado
+                with self._lock:
+                    self._metricas["compartilhada"] += 1
+                    self._inserir(chave, resultado, expira_em, negativo=resultado[1] <= 0.5)
+                return resultado
+
+        with self._lock:
+            self._metricas["misses"] += 1
+        return None
+
+    def guardar(self, chave: str, resultado: Resultado, versao: Optional[int] = None) -> None:
+        """Positivo: TTL normal; fallback (conf 0.5): TTL curto; erro (conf < 0.5): não guarda."""
+        confianca = resultado[1]
+        if confianca < 0.5:
+            return
+        negativo = confianca <= 0.5
+        expira_em = time.time() + (self.ttl_negativo if negativo else self.ttl)
+        with self._lock:
+            self._inserir(chave, resultado, expira_em, negativo)
+        if self._compartilhado is not None and versao is not None:
+            try:
+                self._compartilhado.guardar(chave, resultado, versao, expira_em)
+            except Exception as e:
+                log.debug(f"⚠️ Cache compartilhado da IA: escrita falhou: {e}")
+
+    def itens(self) -> List[Tuple[str, Resultado]]:
+        with self._lock:
+            return [(chave, entrada[0]) for chave, entrada in self._entradas.items()]
+
+    def remover(self, chaves: List[str]) -> None:
+        with self._lock:
+            for chave in chaves:
+                self._remover(chave)
+        if self._compartilhado is not None:
+            try:
+                self._compartilhado.remover(chaves)
+            except Exception as e:
+                log.debug(f"⚠️ Cache compartilhado da IA: remoção falhou: {e}")
+
+    def limpar(self, compartilhado: bool = True) -> None:
+        with self._lock:
+            self._entradas.clear()
+            self._baldes.clear()
+            self._assinaturas.clear()
+        if compartilhado and self._compartilhado is not None:
+            try:
+                self._compartilhado.limpar()
+            except Exception as e:
+                log.debug(f"⚠️ Cache compartilhado da IA: limpeza falhou: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            m = dict(self._metricas)
+            tamanho = len(self._entradas)
+            negativas = sum(1 for e in self._entradas.values() if e[2])
+        hits = m["exata"] + m["similar"] + m["compartilhada"]
+        consultas = max(hits + m["misses"], 1)
+        return {
+            "hits": hits,
+            "misses": m["misses"],
+            "size": tamanho,
+            "maxsize": self.tamanho,
+            "hit_rate": round(hits / consultas * 100, 1),
+            "negative_entries": negativas,
+            "expired": m["expiradas"],
+            "evicted": m["despejadas"],
+            "ttl_sec": self.ttl,
+            "negative_ttl_sec": self.ttl_negativo,
+            "shared": self._compartilhado is not None,
+            "tiers": {
+                nome: {"hits": m[camada], "hit_rate": round(m[camada] / consultas * 100, 1)}
+                for nome, camada in (("exact", "exata"), ("similar", "similar"), ("shared", "compartilhada"))
+            },
+        }
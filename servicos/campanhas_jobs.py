@@ -0,0 +1,528 @@
+# ==============================================
+# servicos/campanhas_jobs.py
+# ==============================================
+# 📢 Jobs de campanha em background (tabela campaign_jobs)
+# - a rota só grava o job (definição + tamanho da audiência) e responde na hora
+# - um worker por processo materializa a audiência em blocos, em ordem de id;
+#   cada bloco é uma transação: dedup + eventos_envios + fila_envios + progresso/checkpoint
+# - lease (claimed_by/lease_expires_at) renovado a cada bloco: job de processo que
+#   morreu é retomado do último checkpoint por qualquer outro processo
+# ==============================================
+
+import os
+import json
+import time
+import socket
+import hashlib
+import logging
+import threading
+from contextlib import closing
+from typing import Any, Dict, List, Optional
+
+import database
+from database import get_db_connection
+from servicos.fila_mensagens import (
+    RAIA_MANUAL, adicionar_lote_na_fila, avaliar_consentimento_em_lote,
+    estimar_vazao_campanhas, notificar_fila,
+)
+
+log = logging.getLogger(__name__)
+
+# =========================
+# Config
+# =========================
+JOBS_ENABLED = os.getenv("CAMPANHA_JOBS_ENABLED", "1") == "1"
+JOB_CHUNK = max(1, int(os.getenv("CAMPANHA_JOB_CHUNK", "500")))
+JOB_LEASE_SEC = int(os.getenv("CAMPANHA_JOB_LEASE_SEC", "120"))
+JOB_POLL_SEC = float(os.getenv("CAMPANHA_JOB_POLL_SEC", "10"))
+JOB_CRIACAO_LOCK_TIMEOUT_SEC = 5
+
+TIPO_ENVIO = "envio"
+TIPO_REPROCESSO = "reprocesso"
+
+STATUS_ATIVOS = ("pendente", "executando")
+FILTROS_AUDIENCIA = ("data_inicio", "data_fim", "idade_min", "idade_max", "genero")
+
+# =========================
+# Estado (deste processo)
+# =========================
+_lock = threading.Lock()
+_thread: Optional[threading.Thread] = None
+_thread_pid: Optional[int] = None
+_evento = threading.Event()
+
+
+def _dono() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:jobs"[:64]
+
+
+def _nome_lock_evento(evento_nome: Optional[str]) -> str:
+    """Lock nomeado do MySQL por evento (nome do evento em hash: GET_LOCK aceita até 64 chars)."""
+    return "campaign_job:" + hashlib.sha1((evento_nome or "").encode("utf-8")).hexdigest()
+
+
+# =========================
+# API pública
+# =========================
+def criar_job(tipo: str, evento_nome: Optional[str] = None, mensagem: Optional[str] = None,
+              filtros: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Grava um job de campanha e acorda o worker.
+
+    Returns:
+        {"job_id", "audience_size"} | {"conflict_job_id"} (já há job ativo do mesmo evento,
+        ou outro disparo dele está sendo criado agora) | {"audience_size": 0} (nada a fazer,
+        job não criado) | {} (sem banco)
+    """
+    filtros = {k: (filtros or {}).get(k) for k in FILTROS_AUDIENCIA}
+    with closing(get_db_connection()) as conn:
+        if not conn:
+            return {}
+        cur = conn.cursor()
+
+        # Um job ativo por evento: dois disparos simultâneos duplicariam envios.
+        # Checagem + INSERT + commit sob GET_LOCK do evento para ficar atômico entre processos.
+        nome_lock = _nome_lock_evento(evento_nome)
+        if not database.obter_lock_nomeado(conn, nome_lock, JOB_CRIACAO_LOCK_TIMEOUT_SEC):
+            log.warning(f"⚠️ Outro disparo do evento {evento_nome!r} está sendo criado; job não criado.")
+            return {"conflict_job_id": None}
+        try:
+            cur.execute(f"""
+                SELECT id FROM campaign_jobs
+                WHERE kind = %s AND status IN ({",".join(["%s"] * len(STATUS_ATIVOS))})
+                  AND COALESCE(evento_nome, '') = %s
+                ORDER BY id LIMIT 1
+            """, (tipo, *STATUS_ATIVOS, evento_nome or ""))
+            ativo = cur.fetchone()
+            if ativo:
+                return {"conflict_job_id": int(ativo["id"])}
+
+            if tipo == TIPO_ENVIO:
+                audiencia = database.contar_visitantes_para_evento(cur, **filtros)
+            else:
+                filtro_evento = "AND evento_nome = %s" if evento_nome else ""
+                cur.execute(f"""
+                    SELECT COUNT(*) AS total FROM eventos_envios
+                    WHERE status = 'falha' {filtro_evento}
+                """, (evento_nome,) if evento_nome else ())
+                audiencia = int((cur.fetchone() or {}).get("total") or 0)
+            if not audiencia:
+                return {"audience_size": 0}
+
+            cur.execute("""
+                INSERT INTO campaign_jobs (kind, evento_nome, mensagem, filtros_json, status, audience_size)
+                VALUES (%s, %s, %s, %s, 'pendente', %s)
+            """, (tipo, evento_nome, mensagem, json.dumps(filtros, ensure_ascii=False), audiencia))
+            job_id = int(cur.lastrowid)
+            conn.commit()
+        finally:
+            cur.execute("SELECT RELEASE_LOCK(%s)", (nome_lock,))
+            cur.fetchone()
+
+    log.info(f"🗂️ Job de campanha #{job_id} criado ({tipo}, evento={evento_nome!r}, audiência={audiencia}).")
+    iniciar_worker_jobs()
+    _evento.set()
+    return {"job_id": job_id, "audience_size": audiencia}
+
+
+def obter_job(job_id: int) -> Optional[Dict[str, Any]]:
+    """Progresso de um job (para a UI acompanhar por polling)."""
+    with closing(get_db_connection()) as conn:
+        if not conn:
+            return None
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM campaign_jobs WHERE id = %s", (int(job_id),))
+        row = cur.fetchone()
+        return _formatar_job(cur, row) if row else None
+
+
+def listar_jobs(limit: int = 20) -> List[Dict[str, Any]]:
+    """Jobs mais recentes primeiro."""
+    with closing(get_db_connection()) as conn:
+        if not conn:
+            return []
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM campaign_jobs ORDER BY id DESC LIMIT %s", (int(limit),))
+        return [_formatar_job(cur, row) for row in cur.fetchall() or []]
+
+
+def retomar_job(job_id: int) -> bool:
+    """Job que parou com erro volta para a fila de jobs e continua do checkpoint."""
+    with closing(get_db_connection()) as conn:
+        if not conn:
+            return False
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE campaign_jobs
+            SET status = 'pendente', claimed_by = NULL, lease_expires_at = NULL, finished_at = NULL
+            WHERE id = %s AND status = 'erro'
+        """, (int(job_id),))
+        conn.commit()
+        retomado = cur.rowcount > 0
+    if retomado:
+        iniciar_worker_jobs()
+        _evento.set()
+    return retomado
+
+
+def iniciar_worker_jobs() -> None:
+    """Sobe (uma vez por processo) a thread que executa/retoma os jobs de campanha."""
+    global _thread, _thread_pid
+    if not JOBS_ENABLED:
+        return
+    pid = os.getpid()
+    if _thread_pid == pid and _thread and _thread.is_alive():
+        return
+    with _lock:
+        if _thread_pid == pid and _thread and _thread.is_alive():
+            return
+        _thread_pid = pid
+        _thread = threading.Thread(target=_loop_jobs, name="campanha-jobs", daemon=True)
+        _thread.start()
+
+
+# =========================
+# Progresso / ETA
+# =========================
+def _formatar_job(cur, row: Dict[str, Any]) -> Dict[str, Any]:
+    audiencia = int(row.get("audience_size") or 0)
+    processados = int(row.get("processed") or 0)
+    try:
+        detalhes = json.loads(row.get("details_json") or "{}")
+    except ValueError:
+        detalhes = {}
+
+    def _data(campo):
+        valor = row.get(campo)
+        return valor.isoformat() if valor else None
+
+    return {
+        "job_id": int(row["id"]),
+        "type": row.get("kind"),
+        "evento": row.get("evento_nome"),
+        "status": row.get("status"),
+        "audience_size": audiencia,
+        "processed": processados,
+        "progress_pct": round(processados / audiencia * 100, 1) if audiencia else 100.0,
+        "enqueued": int(row.get("enqueued") or 0),
+        "skipped": int(row.get("skipped") or 0),
+        "failed": int(row.get("failed") or 0),
+        "details": detalhes,
+        "eta_sec": _eta_segundos(cur, row),
+        "last_error": row.get("last_error"),
+        "created_at": _data("created_at"),
+        "started_at": _data("started_at"),
+        "finished_at": _data("finished_at"),
+    }
+
+
+def _eta_segundos(cur, row: Dict[str, Any]) -> Optional[int]:
+    """
+    Estimativa pelo pacing anti-spam: itens com pacing à frente/do job ainda na fila_envios
+    + audiência ainda não materializada, divididos pela vazão somada das instâncias.
+    Não considera limite diário nem horário comercial.
+    """
+    try:
+        na_fila = 0
+        if row.get("last_fila_id"):
+            cur.execute("""
+                SELECT COUNT(*) AS total FROM fila_envios
+                WHERE status IN ('pendente', 'processando') AND prioridade >= %s AND id <= %s
+            """, (RAIA_MANUAL, int(row["last_fila_id"])))
+            na_fila = int((cur.fetchone() or {}).get("total") or 0)
+        restantes = 0
+        if row.get("status") in STATUS_ATIVOS:
+            restantes = max(0, int(row.get("audience_size") or 0) - int(row.get("processed") or 0))
+        if not (na_fila or restantes):
+            return 0
+        vazao = estimar_vazao_campanhas()
+        return int((na_fila + restantes) / vazao) if vazao > 0 else None
+    except Exception as e:
+        log.debug(f"ETA do job #{row.get('id')} indisponível: {e}")
+        return None
+
+
+# =========================
+# Worker
+# =========================
+def _loop_jobs() -> None:
+    log.info("🗂️ Worker de jobs de campanha iniciado.")
+    while True:
+        try:
+            job = _claim_job()
+        except Exception as e:
+            log.error(f"❌ Erro ao buscar job de campanha: {e}")
+            job = None
+        if job:
+            _executar_job(job)
+            continue
+        _evento.wait(JOB_POLL_SEC)
+        _evento.clear()
+
+
+def _claim_job() -> Optional[Dict[str, Any]]:
+    """Pega o job pendente mais antigo, ou um 'executando' cujo lease venceu (processo morto)."""
+    with closing(get_db_connection()) as conn:
+        if not conn:
+            return None
+        cur = conn.cursor()
+        conn.begin()
+        cur.execute("""
+            SELECT id FROM campaign_jobs
+            WHERE status = 'pendente'
+               OR (status = 'executando' AND (lease_expires_at IS NULL OR lease_expires_at < NOW()))
+            ORDER BY id
+            LIMIT 1
+            FOR UPDATE
+        """)
+        row = cur.fetchone()
+        if not row:
+            conn.commit()
+            return None
+        cur.execute("""
+            UPDATE campaign_jobs
+            SET status = 'executando', claimed_by = %s, lease_expires_at = NOW() + INTERVAL %s SECOND,
+                started_at = COALESCE(started_at, NOW())
+            WHERE id = %s
+        """, (_dono(), JOB_LEASE_SEC, row["id"]))
+        conn.commit()
+        cur.execute("SELECT * FROM campaign_jobs WHERE id = %s", (row["id"],))
+        job = cur.fetchone()
+        conn.commit()
+    if job and int(job.get("processed") or 0):
+        log.info(f"♻️ Retomando job de campanha #{job['id']} do checkpoint id>{job.get('checkpoint_id')}.")
+    return job
+
+
+def _executar_job(job: Dict[str, Any]) -> None:
+    inicio = time.monotonic()
+    while True:
+        try:
+            continuar = _processar_bloco(job)
+        except Exception as e:
+            log.exception(f"❌ Job de campanha #{job['id']} interrompido: {e}")
+            _marcar_erro(job, str(e))
+            return
+        if not continuar:
+            break
+    log.info(f"🗂️ Job de campanha #{job['id']} liberado após {time.monotonic() - inicio:.1f}s.")
+
+
+def _marcar_erro(job: Dict[str, Any], erro: str) -> None:
+    try:
+        with closing(get_db_connection()) as conn:
+            if not conn:
+                return
+            cur = conn.cursor()
+            cur.execute("""
+                UPDATE campaign_jobs
+                SET status = 'erro', last_error = %s, claimed_by = NULL, lease_expires_at = NULL, finished_at = NOW()
+                WHERE id = %s AND claimed_by = %s
+            """, (erro[:500], job["id"], _dono()))
+            conn.commit()
+    except Exception as e:
+        log.error(f"❌ Erro ao marcar job #{job['id']} com erro: {e}")
+
+
+def _somar(detalhes: Dict[str, Any], contadores: Dict[str, Any]) -> Dict[str, Any]:
+    for chave, valor in contadores.items():
+        if isinstance(valor, dict):
+            detalhes[chave] = _somar(dict(detalhes.get(chave) or {}), valor)
+        else:
+            detalhes[chave] = int(detalhes.get(chave) or 0) + int(valor)
+    return detalhes
+
+
+def _processar_bloco(job: Dict[str, Any]) -> bool:
+    """
+    Processa o próximo bloco do job numa transação (envios + progresso + checkpoint).
+    Retorna True se ainda há blocos; False se concluiu ou perdeu o job.
+    """
+    enfileirados = 0
+    with closing(get_db_connection()) as conn:
+        if not conn:
+            return False  # lease vence e o job é retomado depois
+        cur = conn.cursor()
+        conn.begin()
+        cur.execute("""
+            SELECT * FROM campaign_jobs
+            WHERE id = %s AND status = 'executando' AND claimed_by = %s
+            FOR UPDATE
+        """, (job["id"], _dono()))
+        atual = cur.fetchone()
+        if not atual:
+            conn.rollback()
+            log.warning(f"⚠️ Job de campanha #{job['id']} não é mais deste processo (lease vencido).")
+            return False
+
+        apos_id = int(atual.get("checkpoint_id") or 0)
+        if atual.get("kind") == TIPO_REPROCESSO:
+            ultimo_id, n, contadores = _bloco_reprocesso(cur, atual, apos_id)
+        else:
+            ultimo_id, n, contadores = _bloco_envio(cur, atual, apos_id)
+        enfileirados = int(contadores.get("enfileirados") or 0)
+
+        last_fila_id = atual.get("last_fila_id")
+        if enfileirados:
+            cur.execute("SELECT MAX(id) AS ultimo FROM fila_envios")
+            last_fila_id = (cur.fetchone() or {}).get("ultimo") or last_fila_id
+
+        detalhes = _somar(json.loads(atual.get("details_json") or "{}"), contadores)
+        concluido = ultimo_id is None
+        cur.execute("""
+            UPDATE campaign_jobs
+            SET processed = processed + %s,
+                enqueued = enqueued + %s,
+                skipped = skipped + %s,
+                failed = failed + %s,
+                details_json = %s,
+                checkpoint_id = %s,
+                last_fila_id = %s,
+                status = %s,
+                claimed_by = IF(%s, NULL, claimed_by),
+                lease_expires_at = IF(%s, NULL, NOW() + INTERVAL %s SECOND),
+                finished_at = IF(%s, NOW(), NULL)
+            WHERE id = %s
+        """, (
+            n, enfileirados, int(contadores.get("_pulados") or 0), int(contadores.get("_falhas") or 0),
+            json.dumps({k: v for k, v in detalhes.items() if not k.startswith("_")}, ensure_ascii=False),
+            apos_id if concluido else ultimo_id, last_fila_id,
+            "concluido" if concluido else "executando",
+            concluido, concluido, JOB_LEASE_SEC, concluido, job["id"],
+        ))
+        conn.commit()
+
+    if enfileirados:
+        notificar_fila()
+    if concluido:
+        log.info(f"✅ Job de campanha #{job['id']} concluído.")
+    return not concluido
+
+
+def _bloco_envio(cur, job: Dict[str, Any], apos_id: int):
+    """
+    Próximo bloco da audiência de uma campanha: dedup, consentimento, eventos_envios e fila_envios.
+    Retorna (último id do bloco ou None se acabou, visitantes processados, contadores).
+    """
+    filtros = json.loads(job.get("filtros_json") or "{}")
+    nome_evento, mensagem = job["evento_nome"], job["mensagem"]
+    visitantes = database.listar_visitantes_para_evento_apos(cur, apos_id, JOB_CHUNK, **filtros)
+    if not visitantes:
+        return None, 0, {}
+
+    contadores: Dict[str, Any] = {
+        "enfileirados": 0, "sem_telefone": 0, "erro_fila": 0,
+        "pulados_duplicidade": 0, "excluidos_consentimento": 0, "excluidos_por_motivo": {},
+    }
+
+    # 🛡️ Consentimento do bloco inteiro de uma vez (em vez de falhar item a item no worker)
+    # No cursor do job (a linha está FOR UPDATE): sem segunda conexão do pool
+    inelegiveis = avaliar_consentimento_em_lote(
+        [v.get("telefone") for v in visitantes if v.get("telefone")], cur=cur
+    )
+    if inelegiveis is None:
+        log.warning("⚠️ Consentimento em lote indisponível: o worker valida cada envio.")
+        inelegiveis = {}
+
+    ja_enviados = database.visitantes_com_envio_evento(cur, nome_evento, [v["id"] for v in visitantes])
+
+    status_por_visitante: Dict[int, str] = {}
+    a_enfileirar = []
+    for v in visitantes:
+        visitante_id = int(v["id"])
+        telefone = v.get("telefone")
+        nome = v.get("nome") or "-"
+
+        # Evita duplicar se já existe envio desse evento (exceto falha/bloqueio)
+        if visitante_id in ja_enviados:
+            contadores["pulados_duplicidade"] += 1
+            continue
+
+        # Sem telefone => falha imediata
+        if not telefone:
+            contadores["sem_telefone"] += 1
+            status_por_visitante[visitante_id] = "falha"
+            log.warning(f"⚠️ Visitante sem telefone: {nome}")
+            continue
+
+        # Sem consentimento => bloqueado já na criação, não entra na fila
+        motivo = inelegiveis.get(telefone)
+        if motivo:
+            contadores["excluidos_consentimento"] += 1
+            contadores["excluidos_por_motivo"][motivo] = contadores["excluidos_por_motivo"].get(motivo, 0) + 1
+            status_por_visitante[visitante_id] = "bloqueado_consentimento"
+            continue
+
+        # Em fila (quem marca ENVIADO é o worker da fila)
+        status_por_visitante[visitante_id] = "em_fila"
+        a_enfileirar.append((visitante_id, telefone, {
+            "origem": "campanha",
+            "evento": nome_evento,
+            "visitante_id": visitante_id,
+            "telefone_raw": telefone,
+            "campaign_job_id": int(job["id"]),
+        }))
+
+    gravados = adicionar_lote_na_fila(cur, [(telefone, mensagem, None, meta) for _, telefone, meta in a_enfileirar])
+    for (visitante_id, telefone, _), ok_fila in zip(a_enfileirar, gravados):
+        if ok_fila:
+            contadores["enfileirados"] += 1
+        else:
+            contadores["erro_fila"] += 1
+            status_por_visitante[visitante_id] = "falha"
+            log.error(f"❌ Falha ao enfileirar tel={telefone} (campanha).")
+
+    database.registrar_envios_evento_em_lote(cur, nome_evento, mensagem, status_por_visitante, origem="campanha")
+
+    contadores["_pulados"] = contadores["pulados_duplicidade"] + contadores["excluidos_consentimento"]
+    contadores["_falhas"] = contadores["sem_telefone"] + contadores["erro_fila"]
+    log.info(
+        f"📬 Job #{job['id']} ('{nome_evento}'): bloco de {len(visitantes)} → "
+        f"{contadores['enfileirados']} enfileirado(s), {contadores['_pulados']} pulado(s), {contadores['_falhas']} falha(s)"
+    )
+    return int(visitantes[-1]["id"]), len(visitantes), contadores
+
+
+def _bloco_reprocesso(cur, job: Dict[str, Any], apos_id: int):
+    """Próximo bloco de eventos_envios em falha: reenfileira e marca em_fila."""
+    filtro_evento = "AND e.evento_nome = %s" if job.get("evento_nome") else ""
+    cur.execute(f"""
+        SELECT
+            e.id AS envio_id,
+            e.visitante_id,
+            e.evento_nome,
+            e.mensagem,
+            v.telefone
+        FROM eventos_envios e
+        JOIN visitantes v ON v.id = e.visitante_id
+        WHERE e.status = 'falha' AND e.id > %s {filtro_evento}
+        ORDER BY e.id
+        LIMIT %s
+    """, (apos_id, *((job["evento_nome"],) if job.get("evento_nome") else ()), JOB_CHUNK))
+    falhas = cur.fetchall() or []
+    if not falhas:
+        return None, 0, {}
+
+    validas = [f for f in falhas if f.get("telefone") and f.get("mensagem") and f.get("evento_nome") and f.get("visitante_id")]
+    gravados = adicionar_lote_na_fila(cur, [
+        (f["telefone"], f["mensagem"], None, {
+            "origem": "campanha_reprocesso",
+            "evento": f["evento_nome"],
+            "visitante_id": int(f["visitante_id"]),
+            "telefone_raw": f["telefone"],
+            "campaign_job_id": int(job["id"]),
+        })
+        for f in validas
+    ])
+    ids = [f["envio_id"] for f, ok in zip(validas, gravados) if ok]
+    if ids:
+        cur.execute(f"""
+            UPDATE eventos_envios SET status = 'em_fila', data_envio = NOW()
+            WHERE id IN ({",".join(["%s"] * len(ids))})
+        """, tuple(ids))
+
+    ignorados = len(falhas) - len(ids)
+    log.info(f"🔄 Job #{job['id']}: {len(ids)} falha(s) reenfileirada(s), {ignorados} ignorada(s).")
+    return int(falhas[-1]["envio_id"]), len(falhas), {
+        "enfileirados": len(ids), "ignorados": ignorados, "_pulados": ignorados,
+    }
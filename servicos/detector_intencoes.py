@@ -0,0 +1,368 @@
+# ==============================================
+# servicos/detector_intencoes.py
+# ==============================================
+# 🎯 Motor de intenções do atendimento
+# Todos os padrões (ministérios, agradecimento, saudação, pastores, horários, grupos,
+# batismo, localização e opções do menu) viram literais num único autômato Aho–Corasick,
+# montado uma vez no import. Uma passada pelo texto marca todas as intenções; a ordem de
+# prioridade é a mesma da cadeia de detectores do processar_mensagem.
+# Os padrões regex antigos são finitos: alternativas/opcionais são expandidos em literais
+# e ".*" vira sequência de literais que precisam aparecer em ordem.
+# ==============================================
+
+import itertools
+from collections import deque
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from constantes import palavras_chave_ministerios
+from utilitarios.texto import normalizar_texto
+
+# =========================
+# Prioridades (menor = verificada antes no processar_mensagem)
+# =========================
+MINISTERIO = "ministerio"
+AGRADECIMENTO = "agradecimento"
+SAUDACAO = "saudacao"
+PEDIDO_ORACAO = "pedido_oracao"
+PASTORES = "pastores"
+HORARIOS_CULTOS = "horarios_cultos"
+GRUPO_WHATSAPP = "grupo_whatsapp"
+BATISMO_MEMBRO = "batismo_membro"
+LOCALIZACAO = "localizacao"
+OPCAO_MENU = "opcao_menu"
+
+PRIORIDADES = {
+    MINISTERIO: 10,
+    AGRADECIMENTO: 20,
+    SAUDACAO: 30,
+    PEDIDO_ORACAO: 40,
+    PASTORES: 50,
+    HORARIOS_CULTOS: 60,
+    GRUPO_WHATSAPP: 70,
+    BATISMO_MEMBRO: 80,
+    LOCALIZACAO: 90,
+    OPCAO_MENU: 100,
+}
+
+# =========================
+# Padrões
+# =========================
+SAUDACOES = [
+    "ola", "oi", "bom dia", "boa tarde", "boa noite",
+    "eae", "e aí", "saudacoes", "a paz do senhor", "a paz de cristo", "paz"
+]
+
+PALAVRAS_AGRADECIMENTO = [
+    "obrigado", "obrigada", "grato", "grata",
+    "agradecido", "agradecida", "muito obrigado", "muito obrigada",
+    "amem", "amém", "aleluia", "gloria a deus"
+]
+
+# Mensagem inteira (não substring)
+PEDIDO_ORACAO_EXATO = ["3", "3.", "3️⃣", "pedido de oração", "pedido de oracao"]
+OPCOES_MENU_EXATAS = {
+    **{str(n): str(n) for n in range(1, 7)},
+    **{f"{n}.": str(n) for n in range(1, 7)},
+    **{f"{n}️⃣": str(n) for n in range(1, 7)},
+}
+
+PADROES = {
+    # Nomes + Instagram + contato secretaria (aceita artigos e variações naturais)
+    PASTORES: [
+        # === QUEM SÃO OS PASTORES (informação) ===
+        r"quem (é|são|e|sao) (os |o |as |a )?pastores?",
+        r"quem (são|sao|é|e) (o |os |a |as )?pastor(es)?",
+        r"qual (é|e|são|sao) (o |os |a |as )?pastor(es)?",
+        r"quem é o pastor",
+        r"quem são os líderes",
+        r"pastores? da igreja",
+        r"nome dos pastores",
+        r"quem (são|sao) (os )?lideres?",
+        r"fundadores da igreja",
+        r"historia da igreja",
+
+        # === CONTATO / FALAR COM PASTORES ===
+        r"falar (com|para) (o |a |os |as )?pastor(es)?",
+        r"contato (com|dos|do|da) (o |a |os |as )?pastor(es)?",
+        r"ligar (para|pros|pra) (o |a |os |as )?pastor(es)?",
+        r"whatsapp (dos|do|da) (o |a |os |as )?pastor(es)?",
+        r"numero (dos|do|da) (o |a |os |as )?pastor(es)?",
+        r"telefone (dos|do|da) (o |a |os |as )?pastor(es)?",
+        r"como falo com (os |as )?pastor(es)?",
+        r"como entro em contato com (os |as )?pastor(es)?",
+
+        # === AGENDAR VISITA / MARCAR AGENDA ===
+        r"agenda (com|dos|do|da) (o |a |os |as )?pastor(es)?",
+        r"agendar (com|uma visita com) (o |a |os |as )?pastor",
+        r"marcar (com|uma visita com) (o |a |os |as )?pastor",
+        r"marcar.*agenda.*pastor",
+        r"quero.*falar.*pastor",
+        r"preciso.*contato.*pastor",
+        r"visita pastoral",
+        r"visita (dos|do|da) (o |a |os |as )?pastor(es)?",
+        r"receber visita pastoral",
+        r"visita dos pastores",
+        r"agendar.*pastor",
+
+        # === SECRETARIA / WILSON (como canal de contato) ===
+        r"secretario wilson",
+        r"wilson martins",
+        r"falar com a secretaria",
+        r"contato da secretaria",
+        r"ligar para a secretaria",
+        r"whatsapp da secretaria",
+        r"secretaria da igreja",
+    ],
+    # Horários de cultos e programação da igreja
+    HORARIOS_CULTOS: [
+        r"horarios? (de )?cultos?",
+        r"horarios? (da )?igreja",
+        r"quando (temos|são|sao|é|e) (os )?cultos?",
+        r"qual (é|e) (o )?horario (do )?culto",
+        r"programa(ç|c)ao (da )?igreja",
+        r"programa(ç|c)ao dos cultos",
+        r"cultos? (quando|horario)",
+        r"que horas (é|e) (o )?culto",
+        r"que dia (temos|são|sao) cultos?",
+        r"agenda (da )?igreja",
+        r"calendario (da )?igreja",
+        r"eventos (da )?igreja",
+        r"o que tem hoje na igreja",
+        r"o que vai ter hoje",
+        r"tem culto hoje",
+        r"vai ter culto",
+    ],
+    # Grupos de WhatsApp / GC
+    GRUPO_WHATSAPP: [
+        r"grupo (do )?whatsapp",
+        r"entrar (no )?grupo",
+        r"participar (do )?grupo",
+        r"gc",
+        r"grupo de comunh[aã]o",
+        r"grupos? da igreja",
+        r"como entro no grupo",
+        r"link (do )?grupo",
+        r"quero estar no grupo",
+        r"me add no grupo",
+        r"grupo do whatsapp",
+    ],
+    # Batismo / tornar-se membro
+    BATISMO_MEMBRO: [
+        r"batismo",
+        r"batizar",
+        r"mergulho",
+        r"imersão",
+        r"tornar membro",
+        r"virar membro",
+        r"ser membro",
+        r"membership",
+        r"como me tornar membro",
+        r"quero ser membro",
+        r"membro da igreja",
+        r"o que preciso para ser membro",
+        r"requisitos para membro",
+    ],
+    # Endereço / localização da igreja
+    LOCALIZACAO: [
+        r"onde fica a igreja",
+        r"endereco da igreja",
+        r"localização da igreja",
+        r"como chegar na igreja",
+        r"rua da igreja",
+        r"bairro da igreja",
+        r"canasvieiras igreja",
+        r"igreja em canasvieiras",
+        r"mapa da igreja",
+        r"google maps igreja",
+    ],
+}
+
+# Texto descritivo das opções do menu (a primeira opção que casar vence)
+PADROES_OPCOES_MENU = {
+    "1": [r"ja fiz batismo", r"já fiz batismo", r"batizado", r"quero ser membro e ja fui batizado"],
+    "2": [r"nao fiz batismo", r"não fiz batismo", r"ainda nao fui batizado", r"ainda não fui batizado", r"quero ser membro mas nao sou batizado"],
+    "3": [r"pedido de oração", r"pedido de oracao", r"quero oração", r"quero oracao", r"orar por mim"],
+    "4": [r"horarios cultos", r"horários cultos", r"quando tem culto", r"programação igreja"],
+    "5": [r"grupo whatsapp", r"entrar grupo", r"gc", r"grupo de comunhão"],
+    "6": [r"outro assunto", r"outro", r"nenhuma das opções", r"não é isso"],
+}
+
+
+class Intencao(NamedTuple):
+    nome: str
+    prioridade: int
+    valor: Optional[str] = None   # ministério: palavra-chave; menu: opção "1".."6"
+
+
+# =========================
+# Expansão dos padrões
+# =========================
+_CORINGA = "\x00"   # marca de ".*" durante a expansão
+
+
+def _expandir(padrao: str) -> List[Tuple[str, ...]]:
+    """
+    Expande o subconjunto de regex usado nos detectores (literais, (a|b), [ab], ?, .*)
+    em sequências de literais. Sintaxe fora disso é erro de programação: falha no import.
+    """
+    def alternativas(i: int, fim: str) -> Tuple[List[str], int]:
+        opcoes, atual = [], [""]
+        while i < len(padrao) and padrao[i] not in fim:
+            c = padrao[i]
+            if c == "(":
+                atomo, i = alternativas(i + 1, "|)")
+                opcoes_grupo = list(atomo)
+                while padrao[i] == "|":
+                    mais, i = alternativas(i + 1, "|)")
+                    opcoes_grupo += mais
+                i += 1  # ")"
+                atomo = opcoes_grupo
+            elif c == "[":
+                j = padrao.index("]", i)
+                atomo, i = list(padrao[i + 1:j]), j + 1
+            elif padrao.startswith(".*", i):
+                atomo, i = [_CORINGA], i + 2
+            elif c in "\\^$+{}.*?|)":
+                raise ValueError(f"Padrão de intenção não suportado: {padrao!r}")
+            else:
+                atomo, i = [c], i + 1
+            if i < len(padrao) and padrao[i] == "?":
+                atomo, i = atomo + [""], i + 1
+            atual = [a + b for a, b in itertools.product(atual, atomo)]
+        opcoes += atual
+        return opcoes, i
+
+    expandidos, _ = alternativas(0, "")
+    return sorted({tuple(p for p in e.split(_CORINGA) if p) for e in expandidos})
+
+
+# =========================
+# Autômato
+# =========================
+class _AhoCorasick:
+    def __init__(self, literais: List[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._falha: List[int] = [0]
+        self._saida: List[List[int]] = [[]]
+        self.literais = literais
+        for indice, literal in enumerate(literais):
+            estado = 0
+            for c in literal:
+                if c not in self._goto[estado]:
+                    self._goto.append({})
+                    self._falha.append(0)
+                    self._saida.append([])
+                    self._goto[estado][c] = len(self._goto) - 1
+                estado = self._goto[estado][c]
+            self._saida[estado].append(indice)
+
+        fila = deque(self._goto[0].values())
+        while fila:
+            estado = fila.popleft()
+            for c, proximo in self._goto[estado].items():
+                fila.append(proximo)
+                f = self._falha[estado]
+                while f and c not in self._goto[f]:
+                    f = self._falha[f]
+                self._falha[proximo] = self._goto[f].get(c, 0) if estado else 0
+                self._saida[proximo] = self._saida[proximo] + self._saida[self._falha[proximo]]
+
+    def ocorrencias(self, texto: str) -> Dict[int, List[int]]:
+        """literal → posições de início (em ordem), numa passada."""
+        achados: Dict[int, List[int]] = {}
+        estado = 0
+        for fim, c in enumerate(texto, 1):
+            while estado and c not in self._goto[estado]:
+                estado = self._falha[estado]
+            estado = self._goto[estado].get(c, 0)
+            for indice in self._saida[estado]:
+                achados.setdefault(indice, []).append(fim - len(self.literais[indice]))
+        return achados
+
+
+def _montar():
+    literais: List[str] = []
+    posicao: Dict[str, int] = {}
+    # (intenção, valor, sequências de literais)
+    regras: List[Tuple[str, Optional[str], List[Tuple[int, ...]]]] = []
+
+    def registrar(nome: str, valor: Optional[str], padroes: List[str], expandir: bool = True) -> None:
+        sequencias = []
+        for padrao in padroes:
+            for pecas in (_expandir(padrao) if expandir else [(padrao,)]):
+                ids = []
+                for peca in pecas:
+                    if peca not in posicao:
+                        posicao[peca] = len(literais)
+                        literais.append(peca)
+                    ids.append(posicao[peca])
+                sequencias.append(tuple(ids))
+        regras.append((nome, valor, sequencias))
+
+    # Ministério: "palavra in texto or palavra.rstrip('s') in texto" == forma sem 's' final
+    for palavra in palavras_chave_ministerios:
+        registrar(MINISTERIO, palavra, [palavra.rstrip("s")], expandir=False)
+    registrar(AGRADECIMENTO, None, PALAVRAS_AGRADECIMENTO, expandir=False)
+    registrar(SAUDACAO, None, SAUDACOES, expandir=False)
+    for nome, padroes in PADROES.items():
+        registrar(nome, None, padroes)
+    for opcao, padroes in PADROES_OPCOES_MENU.items():
+        registrar(OPCAO_MENU, opcao, padroes)
+
+    # Gatilho = primeiro literal da sequência: só se verifica o que o texto realmente tocou
+    gatilhos: Dict[int, List[Tuple[int, Tuple[int, ...]]]] = {}
+    for r, (_, _, sequencias) in enumerate(regras):
+        for sequencia in sequencias:
+            gatilhos.setdefault(sequencia[0], []).append((r, sequencia))
+    return _AhoCorasick(literais), regras, gatilhos
+
+
+_AUTOMATO, _REGRAS, _GATILHOS = _montar()
+
+
+def _casa(sequencia: Tuple[int, ...], achados: Dict[int, List[int]]) -> bool:
+    """Literais da sequência aparecem em ordem, sem sobreposição (semântica de a.*b)."""
+    pos = 0
+    for indice in sequencia:
+        inicio = next((p for p in achados.get(indice, ()) if p >= pos), None)
+        if inicio is None:
+            return False
+        pos = inicio + len(_AUTOMATO.literais[indice])
+    return True
+
+
+# =========================
+# API pública
+# =========================
+def detectar_intencoes(texto: str) -> List[Intencao]:
+    """
+    Todas as intenções presentes no texto, ordenadas pela prioridade do atendimento.
+    Por nome vem no máximo uma intenção: a primeira palavra-chave de ministério
+    (ordem de constantes) e a menor opção de menu que casarem.
+    """
+    texto = normalizar_texto(texto or "")
+    if not texto:
+        return []
+    achados = _AUTOMATO.ocorrencias(texto)
+
+    encontradas: Dict[str, Intencao] = {}
+    if texto in PEDIDO_ORACAO_EXATO:
+        encontradas[PEDIDO_ORACAO] = Intencao(PEDIDO_ORACAO, PRIORIDADES[PEDIDO_ORACAO])
+    if texto in OPCOES_MENU_EXATAS:
+        encontradas[OPCAO_MENU] = Intencao(OPCAO_MENU, PRIORIDADES[OPCAO_MENU], OPCOES_MENU_EXATAS[texto])
+
+    casadas = set()
+    for literal in achados:
+        for r, sequencia in _GATILHOS.get(literal, ()):
+            if r not in casadas and _casa(sequencia, achados):
+                casadas.add(r)
+    # Regras na ordem de registro: primeiro ministério de constantes, menor opção de menu
+    for r in sorted(casadas):
+        nome, valor, _ = _REGRAS[r]
+        if nome not in encontradas:
+            encontradas[nome] = Intencao(nome, PRIORIDADES[nome], valor)
+    return sorted(encontradas.values(), key=lambda i: i.prioridade)
+
+
+def intencoes_por_nome(texto: str) -> Dict[str, Intencao]:
+    return {i.nome: i for i in detectar_intencoes(texto)}
@@ -1,5 +1,5 @@
 from constantes import palavras_chave_ministerios
-from utilitarios.texto import normalizar_texto
+from servicos.detector_intencoes import MINISTERIO, intencoes_por_nome
 
 def detectar_palavra_chave_ministerio(texto_recebido: str):
     """
@@ -10,8 +10,5 @@ def detectar_palavra_chave_ministerio(texto_recebido: str):
     if not texto_recebido:
         return None
 
-    texto_recebido = normalizar_texto(texto_recebido).replace('ç', 'c')
-    for palavra, resposta in palavras_chave_ministerios.items():
-        if palavra in texto_recebido or palavra.rstrip('s') in texto_recebido:
-            return resposta
-    return None
+    ministerio = intencoes_por_nome(texto_recebido).get(MINISTERIO)
+    return palavras_chave_ministerios[ministerio.valor] if ministerio else None
@@ -0,0 +1,254 @@
+# ==============================================
+# servicos/fila_async.py
+# ==============================================
+# ⚡ Engine asyncio do worker da fila_envios (FILA_ENGINE=async)
+# Mesmo schema e mesma API (adicionar_na_fila); muda só quem drena a fila:
+# - claim / consentimento / anti-spam / marcação rodam num executor (PyMySQL é bloqueante)
+# - o POST para a Z-API é aiohttp, com concorrência limitada por instância
+# - pacing e delays viram asyncio.sleep: conversas e raias se sobrepõem numa thread só
+# ==============================================
+
+import os
+import time
+import heapq
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Set
+
+try:
+    import aiohttp
+    AIOHTTP_DISPONIVEL = True
+except ImportError:  # pragma: no cover - aiohttp está no requirements.txt
+    aiohttp = None
+    AIOHTTP_DISPONIVEL = False
+
+from servicos import fila_mensagens as fila
+from servicos.zapi_cliente import (
+    enviar_mensagem_async, circuito_segundos_ate_liberar, circuito_meio_aberto, listar_instancias,
+)
+
+log = logging.getLogger(__name__)
+
+# =========================
+# Config
+# =========================
+ASYNC_CONCORRENCIA = int(os.getenv("FILA_ASYNC_CONCURRENCY", "4"))         # POSTs simultâneos por instância
+ASYNC_MAX_EM_VOO = int(os.getenv("FILA_ASYNC_MAX_INFLIGHT", str(fila.BATCH_SIZE)))  # respostas em memória
+ASYNC_DB_THREADS = int(os.getenv("FILA_ASYNC_DB_THREADS", "4"))
+
+# =========================
+# Estado (deste processo)
+# =========================
+_metricas: Dict[str, Any] = {
+    "enviados": 0,
+    "respostas_em_voo": 0,
+    "posts_em_voo": 0,
+    "pico_posts_em_voo": 0,
+}
+_semaforos: Dict[str, asyncio.Semaphore] = {}
+_locks_numero: Dict[str, asyncio.Lock] = {}
+
+
+def obter_metricas_engine() -> dict:
+    """Métricas da engine async (para /api/monitor-status)."""
+    return {
+        "type": "async",
+        "max_concurrency": ASYNC_CONCORRENCIA,
+        "max_inflight": ASYNC_MAX_EM_VOO,
+        "sent": _metricas["enviados"],
+        "replies_in_flight": _metricas["respostas_em_voo"],
+        "posts_in_flight": _metricas["posts_em_voo"],
+        "peak_posts_in_flight": _metricas["pico_posts_em_voo"],
+    }
+
+
+def rodar_engine_async() -> None:
+    """Alvo da thread do worker: roda o event loop até parar_worker()."""
+    fila._inicializar_worker()
+    log.info("⚡ Worker DB-Queue iniciado (engine asyncio).")
+    try:
+        asyncio.run(_motor())
+    except Exception as e:
+        log.error(f"❌ Engine async da fila finalizada com erro: {e}", exc_info=True)
+    fila._flush_resultados()
+    log.info("🛑 Worker DB-Queue finalizado (engine asyncio).")
+
+
+# =========================
+# Helpers
+# =========================
+def _semaforo(instance_id: Optional[str]) -> asyncio.Semaphore:
+    chave = instance_id or "default"
+    if chave not in _semaforos:
+        _semaforos[chave] = asyncio.Semaphore(max(1, ASYNC_CONCORRENCIA))
+    return _semaforos[chave]
+
+
+def _drenar_agenda() -> Optional[float]:
+    """
+    Na engine async o heap só guarda despertares (retry/circuito agendados pelo
+    _concluir_envio). Remove os vencidos e retorna quanto falta para o próximo.
+    """
+    agora = time.monotonic()
+    with fila._agenda_lock:
+        while fila._agenda and fila._agenda[0][0] <= agora:
+            heapq.heappop(fila._agenda)
+            fila._scheduler_metricas["despertares_timer"] += 1
+        return (fila._agenda[0][0] - agora) if fila._agenda else None
+
+
+class _Motor:
+    def __init__(self, http, executor: ThreadPoolExecutor):
+        self.http = http
+        self.executor = executor
+        self.loop = asyncio.get_running_loop()
+        self.evento = asyncio.Event()
+        self.tarefas: Set[asyncio.Task] = set()
+
+    async def db(self, fn, *args):
+        return await self.loop.run_in_executor(self.executor, fn, *args)
+
+    def acordar(self) -> None:
+        self.loop.call_soon_threadsafe(self.evento.set)
+
+    async def esperar(self, timeout: float) -> bool:
+        """Dorme até um sinal (enfileiramento/parada) ou o timeout."""
+        try:
+            await asyncio.wait_for(self.evento.wait(), timeout=max(0.0, timeout))
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.evento.clear()
+
+    async def enviar(self, envio: Dict[str, Any]) -> Optional[float]:
+        """POST (com semáforo da instância) + conclusão no executor."""
+        async with _semaforo(envio.get("instancia")):
+            _metricas["posts_em_voo"] += 1
+            _metricas["pico_posts_em_voo"] = max(_metricas["pico_posts_em_voo"], _metricas["posts_em_voo"])
+            try:
+                res = await enviar_mensagem_async(
+                    self.http, envio["numero_envio"], envio["mensagem_envio"], envio["imagem_url"],
+                    instancia=envio.get("instancia"),
+                )
+            except Exception as e:
+                res = {"success": False, "erro": str(e)}
+            finally:
+                _metricas["posts_em_voo"] -= 1
+        _metricas["enviados"] += 1
+        return await self.db(fila._concluir_envio, envio, res)
+
+    # ---------- Raia de respostas: várias conversas em paralelo, 1 por número ----------
+    async def resposta(self, item: Dict[str, Any]) -> None:
+        numero = item.get("numero") or ""
+        lock = _locks_numero.setdefault(numero, asyncio.Lock())
+        _metricas["respostas_em_voo"] += 1
+        processado = False
+        try:
+            async with lock:
+                processado = True
+                envio, espera = await self.db(fila._preparar_envio, item)
+                if envio is not None:
+                    espera = await self.enviar(envio)
+                if espera:
+                    # Delay natural de conversa: segura o número, não a engine
+                    await asyncio.sleep(espera)
+        except asyncio.CancelledError:
+            if not processado:
+                await self.db(fila._db_liberar_item, item["id"])
+            raise
+        except Exception as e:
+            log.error(f"❌ Erro na resposta envio_id={item.get('id')}: {e}", exc_info=True)
+        finally:
+            _metricas["respostas_em_voo"] -= 1
+            if not lock.locked() and _locks_numero.get(numero) is lock:
+                _locks_numero.pop(numero, None)
+
+    async def raia_respostas(self) -> None:
+        espera_ociosa = fila.POLL_SECONDS
+        while fila._worker_running:
+            circuito = circuito_segundos_ate_liberar()
+            proximo = _drenar_agenda()
+            if circuito > 0:
+                await self.esperar(circuito)
+                continue
+
+            vagas = ASYNC_MAX_EM_VOO - _metricas["respostas_em_voo"]
+            itens = []
+            if vagas > 0:
+                limite = 1 if circuito_meio_aberto() else min(fila.BATCH_SIZE, vagas)
+                itens = await self.db(fila._db_claim_batch, limite, fila.RAIA_RESPOSTA, fila._instancias_prontas())
+            for item in itens:
+                tarefa = asyncio.create_task(self.resposta(item))
+                self.tarefas.add(tarefa)
+                tarefa.add_done_callback(self.tarefas.discard)
+            if itens:
+                espera_ociosa = fila.POLL_SECONDS
+                await asyncio.sleep(0)
+                continue
+
+            fila._wakeup_metricas["polls_vazios"] += 1
+            timeout = espera_ociosa if proximo is None else min(espera_ociosa, proximo)
+            if await self.esperar(timeout):
+                espera_ociosa = fila.POLL_SECONDS
+            else:
+                espera_ociosa = min(espera_ociosa * 2, fila.POLL_MAX_SECONDS)
+
+    # ---------- Raias com pacing (manual → campanha): 1 item por vez, pacing por instância ----------
+    async def raia_pacing(self) -> None:
+        espera_ociosa = fila.POLL_SECONDS
+        while fila._worker_running:
+            circuito = circuito_segundos_ate_liberar()
+            if circuito > 0:
+                await self.esperar(circuito)
+                continue
+
+            prontas = fila._instancias_prontas(com_pacing=True)
+            itens = []
+            if prontas is None or prontas:
+                itens = (await self.db(fila._db_claim_batch, 1, fila.RAIA_MANUAL, prontas)
+                         or await self.db(fila._db_claim_batch, 1, fila.RAIA_CAMPANHA, prontas))
+            if not itens:
+                # Pacing anti-spam: a raia dorme até a primeira instância liberar, as respostas continuam
+                proximo = fila._proximo_pacing()
+                timeout = espera_ociosa if proximo is None else min(espera_ociosa, proximo)
+                if await self.esperar(timeout):
+                    espera_ociosa = fila.POLL_SECONDS
+                else:
+                    espera_ociosa = min(espera_ociosa * 2, fila.POLL_MAX_SECONDS)
+                continue
+
+            espera_ociosa = fila.POLL_SECONDS
+            try:
+                envio, espera = await self.db(fila._preparar_envio, itens[0])
+                if envio is not None:
+                    espera = await self.enviar(envio)
+            except Exception as e:
+                log.error(f"❌ Erro na raia com pacing envio_id={itens[0].get('id')}: {e}", exc_info=True)
+                espera = fila.ENVIO_INTERVALO_SEG
+            if espera:
+                fila._registrar_pacing(fila._instancia_do_item(itens[0]), espera)
+
+
+async def _motor() -> None:
+    # Primitivas asyncio ficam presas ao loop: um novo loop (reinício do worker) começa do zero
+    _semaforos.clear()
+    _locks_numero.clear()
+    # Todas as instâncias usam o mesmo host: o pool comporta o semáforo de cada uma
+    n_instancias = max(1, len(listar_instancias()))
+    conector = aiohttp.TCPConnector(limit=max(1, ASYNC_CONCORRENCIA) * n_instancias * 2, keepalive_timeout=60)
+    executor = ThreadPoolExecutor(max_workers=max(2, ASYNC_DB_THREADS), thread_name_prefix="fila-async-db")
+    async with aiohttp.ClientSession(connector=conector) as http:
+        motor = _Motor(http, executor)
+        fila._ouvintes_sinal.append(motor.acordar)
+        try:
+            await asyncio.gather(motor.raia_respostas(), motor.raia_pacing())
+        finally:
+            fila._ouvintes_sinal.remove(motor.acordar)
+            # Parada: respostas que ainda esperavam a vez do número voltam para a fila
+            for tarefa in list(motor.tarefas):
+                tarefa.cancel()
+            if motor.tarefas:
+                await asyncio.gather(*motor.tarefas, return_exceptions=True)
+            executor.shutdown(wait=True)
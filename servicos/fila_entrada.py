@@ -0,0 +1,398 @@
+# ==============================================
+# servicos/fila_entrada.py  (INGESTÃO ASSÍNCRONA DE WEBHOOKS)
+# ==============================================
+# 📥 Fila de entrada persistida no MySQL (tabela fila_entrada)
+# O webhook só valida, deduplica (UNIQUE message_sid) e grava o payload bruto;
+# processadores em background drenam a fila chamando tratar_mensagem_webhook.
+# ✅ Ordem garantida por telefone: no máximo 1 item 'processando' por número
+# ✅ Lease: itens presos em 'processando' (worker morto) voltam para 'pendente'
+# ✅ Retry sem efeito repetido: o atendimento grava conversa recebida (message_sid), fase,
+#    estatísticas e envios numa transação só; se commitou, o retry cai no "já registrada"
+#    do tratar_mensagem_webhook, se não commitou, nada foi feito
+# ✅ Métricas: profundidade da fila e lag (recebido → processado) para o monitor
+# ==============================================
+
+import os
+import json
+import time
+import socket
+import threading
+import logging
+from contextlib import closing
+from typing import Any, Dict, List, Optional, Tuple
+
+from database import get_db_connection, obter_lock_nomeado
+from botmsg import tratar_mensagem_webhook
+
+log = logging.getLogger(__name__)
+
+# =========================
+# Config - Variáveis do .env
+# =========================
+WEBHOOK_ASYNC = os.getenv("WEBHOOK_ASYNC", "0") == "1"
+PROCESSADORES = max(1, int(os.getenv("ENTRADA_PROCESSADORES", "2")))
+POLL_SECONDS = float(os.getenv("ENTRADA_POLL_SECONDS", "0.5"))
+BATCH_SIZE = int(os.getenv("ENTRADA_BATCH_SIZE", "5"))
+LEASE_SEC = int(os.getenv("ENTRADA_LEASE_SEC", "120"))
+MAX_TENTATIVAS = int(os.getenv("ENTRADA_MAX_TENTATIVAS", "3"))
+RETENCAO_DIAS = int(os.getenv("ENTRADA_RETENCAO_DIAS", "7"))
+
+# Lock nomeado do MySQL que serializa o "claim" entre todos os processos Gunicorn
+_CLAIM_LOCK_NAME = "fila_entrada_claim"
+_CLAIM_LOCK_TIMEOUT_SEC = 5
+_LIMPEZA_INTERVALO_SEC = 3600
+
+# =========================
+# Processadores
+# =========================
+_lock = threading.Lock()
+_processadores_ativos = False
+_threads: List[threading.Thread] = []
+_ultima_limpeza = 0.0
+
+_metricas_lock = threading.Lock()
+_metricas: Dict[str, Any] = {
+    "enfileirados": 0,
+    "duplicados": 0,
+    "processados": 0,
+    "falhas": 0,
+    "retentativas": 0,
+    "reclamados": 0,
+    "lag_ultimo_ms": 0.0,
+    "lag_max_ms": 0.0,
+    "lag_total_ms": 0.0,
+}
+
+
+def _incrementar(chave: str, valor: float = 1) -> None:
+    with _metricas_lock:
+        _metricas[chave] += valor
+
+
+def _worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+# =========================
+# DB helpers
+# =========================
+
+def _db_inserir(telefone: str, message_sid: Optional[str], payload: Dict[str, Any], origem: str) -> Optional[bool]:
+    """
+    Grava o payload bruto. Retorna True se inseriu, False se o SID já existia
+    (duplicado) e None em caso de erro de banco.
+    """
+    try:
+        payload_json = json.dumps(payload or {}, ensure_ascii=False, default=str)
+        with closing(get_db_connection()) as conn:
+            if not conn:
+                return None
+            cur = conn.cursor()
+            cur.execute("""
+                INSERT IGNORE INTO fila_entrada (message_sid, telefone, payload_json, origem, status, tentativas)
+                VALUES (%s, %s, %s, %s, 'pendente', 0)
+            """, (message_sid, telefone, payload_json, origem))
+            conn.commit()
+            return cur.rowcount > 0
+    except Exception as e:
+        log.error(f"❌ Falha ao gravar webhook na fila_entrada: {e}")
+        return None
+
+
+def _db_claim(limit: int) -> List[Dict[str, Any]]:
+    """
+    Reserva até `limit` itens, no máximo 1 por telefone e somente para telefones
+    sem item em 'processando' — é isso que garante a ordem por número.
+    O claim inteiro roda sob GET_LOCK para ficar atômico entre processos.
+    """
+    try:
+        with closing(get_db_connection()) as conn:
+            if not conn:
+                return []
+            if not obter_lock_nomeado(conn, _CLAIM_LOCK_NAME, _CLAIM_LOCK_TIMEOUT_SEC):
+                return []
+            cur = conn.cursor()
+            try:
+                # ♻️ Lease expirado → devolve para a fila (processador morreu no meio)
+                cur.execute("""
+                    UPDATE fila_entrada
+                    SET status = 'pendente', locked_by = NULL, locked_at = NULL
+                    WHERE status = 'processando'
+                      AND locked_at < NOW() - INTERVAL %s SECOND
+                """, (LEASE_SEC,))
+                if cur.rowcount:
+                    _incrementar("reclamados", cur.rowcount)
+                    log.warning(f"♻️ {cur.rowcount} item(ns) da fila_entrada com lease expirado voltaram para 'pendente'.")
+
+                cur.execute("""
+                    SELECT e.id, e.message_sid, e.telefone, e.payload_json, e.origem, e.tentativas
+                    FROM fila_entrada e
+                    JOIN (
+                        SELECT MIN(id) AS id
+                        FROM fila_entrada
+                        WHERE status = 'pendente'
+                        GROUP BY telefone
+                    ) prox ON prox.id = e.id
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM fila_entrada p
+                        WHERE p.telefone = e.telefone AND p.status = 'processando'
+                    )
+                    ORDER BY e.id ASC
+                    LIMIT %s
+                """, (limit,))
+                rows = cur.fetchall() or []
+
+                if rows:
+                    ids = [int(r["id"]) for r in rows]
+                    marcadores = ", ".join(["%s"] * len(ids))
+                    cur.execute(f"""
+                        UPDATE fila_entrada
+                        SET status = 'processando', locked_by = %s, locked_at = NOW(),
+                            tentativas = tentativas + 1
+                        WHERE id IN ({marcadores})
+                    """, (_worker_id()[:64], *ids))
+                conn.commit()
+                return rows
+            finally:
+                cur.execute("SELECT RELEASE_LOCK(%s)", (_CLAIM_LOCK_NAME,))
+                cur.fetchone()
+    except Exception as e:
+        log.error(f"❌ Erro ao reservar itens da fila_entrada: {e}")
+        return []
+
+
+def _db_finalizar(item_id: int, ok: bool, tentativas: int, erro: str = "") -> Tuple[str, Optional[float]]:
+    """Marca item como concluído, devolve para retry ou falha. Retorna (status, lag_ms)."""
+    if ok:
+        novo_status = "concluido"
+    elif tentativas < MAX_TENTATIVAS:
+        novo_status = "pendente"
+    else:
+        novo_status = "falha"
+
+    try:
+        with closing(get_db_connection()) as conn:
+            if not conn:
+                return novo_status, None
+            cur = conn.cursor()
+            cur.execute("""
+                UPDATE fila_entrada
+                SET status = %s,
+                    last_error = %s,
+                    locked_by = NULL,
+                    locked_at = NULL,
+                    processed_at = CASE WHEN %s = 'pendente' THEN NULL ELSE NOW(3) END
+                WHERE id = %s
+            """, (novo_status, erro[:1000] if erro else None, novo_status, item_id))
+            cur.execute("""
+                SELECT TIMESTAMPDIFF(MICROSECOND, created_at, processed_at) / 1000 AS lag_ms
+                FROM fila_entrada WHERE id = %s
+            """, (item_id,))
+            row = cur.fetchone() or {}
+            conn.commit()
+            lag = row.get("lag_ms")
+            return novo_status, float(lag) if lag is not None else None
+    except Exception as e:
+        log.error(f"❌ Erro ao finalizar item {item_id} da fila_entrada: {e}")
+        return novo_status, None
+
+
+def _db_limpar_antigos() -> None:
+    """Remove itens concluídos além da retenção (no máximo 1x por hora por processo)."""
+    global _ultima_limpeza
+    agora = time.time()
+    if agora - _ultima_limpeza < _LIMPEZA_INTERVALO_SEC:
+        return
+    _ultima_limpeza = agora
+    try:
+        with closing(get_db_connection()) as conn:
+            if not conn:
+                return
+            cur = conn.cursor()
+            cur.execute("""
+                DELETE FROM fila_entrada
+                WHERE status = 'concluido'
+                  AND created_at < NOW() - INTERVAL %s DAY
+                LIMIT 5000
+            """, (RETENCAO_DIAS,))
+            conn.commit()
+            if cur.rowcount:
+                log.info(f"🧹 fila_entrada: {cur.rowcount} itens concluídos removidos (>{RETENCAO_DIAS} dias).")
+    except Exception as e:
+        log.error(f"❌ Erro na limpeza da fila_entrada: {e}")
+
+
+# =========================
+# Processamento
+# =========================
+
+def _processar_item(item: Dict[str, Any]) -> None:
+    item_id = int(item["id"])
+    tentativas = int(item.get("tentativas") or 0) + 1
+    ok, erro = False, ""
+
+    try:
+        dados = json.loads(item.get("payload_json") or "{}")
+        resultado = tratar_mensagem_webhook(
+            dados=dados,
+            origem=item.get("origem") or "integra+",
+            is_webhook_reply=True
+        )
+        status = (resultado or {}).get("status")
+        ok = status != "erro"
+        if not ok:
+            erro = str((resultado or {}).get("detalhe") or "erro_no_processamento")
+    except Exception as e:
+        erro = str(e)
+        log.error(f"❌ Erro ao processar item {item_id} da fila_entrada: {e}", exc_info=True)
+
+    novo_status, lag_ms = _db_finalizar(item_id, ok, tentativas, erro)
+
+    if novo_status == "concluido":
+        _incrementar("processados")
+        if lag_ms is not None:
+            with _metricas_lock:
+                _metricas["lag_ultimo_ms"] = lag_ms
+                _metricas["lag_max_ms"] = max(_metricas["lag_max_ms"], lag_ms)
+                _metricas["lag_total_ms"] += lag_ms
+        log.debug(f"✅ fila_entrada id={item_id} tel={item.get('telefone')} processado | lag={lag_ms}ms")
+    elif novo_status == "pendente":
+        _incrementar("retentativas")
+        log.warning(f"🔁 fila_entrada id={item_id} volta para a fila (tentativa {tentativas}/{MAX_TENTATIVAS}) | err={erro[:120]}")
+    else:
+        _incrementar("falhas")
+        log.error(f"❌ fila_entrada id={item_id} falhou em definitivo após {tentativas} tentativas | err={erro[:120]}")
+
+
+def _processador_loop() -> None:
+    log.info(f"🧵 Processador da fila de entrada iniciado ({threading.current_thread().name}).")
+    while _processadores_ativos:
+        try:
+            itens = _db_claim(BATCH_SIZE)
+            if not itens:
+                _db_limpar_antigos()
+                time.sleep(POLL_SECONDS)
+                continue
+            for item in itens:
+                _processar_item(item)
+        except Exception as e:
+            log.error(f"❌ Erro no loop do processador da fila de entrada: {e}")
+            time.sleep(POLL_SECONDS)
+
+
+def iniciar_processadores() -> None:
+    """Sobe o pool de processadores deste processo (idempotente)."""
+    global _processadores_ativos, _threads
+    with _lock:
+        vivos = [t for t in _threads if t.is_alive()]
+        if len(vivos) >= PROCESSADORES:
+            return
+        _processadores_ativos = True
+        for i in range(len(vivos), PROCESSADORES):
+            t = threading.Thread(target=_processador_loop, name=f"fila-entrada-{i}", daemon=True)
+            t.start()
+            vivos.append(t)
+        _threads = vivos
+        log.info(f"🚀 Fila de entrada ligada com {PROCESSADORES} processador(es).")
+
+
+def parar_processadores() -> None:
+    global _processadores_ativos
+    with _lock:
+        _processadores_ativos = False
+
+
+# =========================
+# API pública
+# =========================
+
+def enfileirar_webhook(dados: Dict[str, Any], telefone: str, message_sid: Optional[str], origem: str = "integra+") -> Optional[bool]:
+    """
+    Persiste o payload do webhook para processamento assíncrono.
+
+    Args:
+        dados: Payload bruto recebido do Z-API
+        telefone: Número já normalizado (chave de ordenação)
+        message_sid: ID da mensagem (deduplicação via UNIQUE)
+        origem: Origem da mensagem
+
+    Returns:
+        True se enfileirou, False se o SID é duplicado, None se falhou
+        (o chamador deve então processar de forma síncrona).
+    """
+    sid = message_sid if message_sid and message_sid != "?" else None
+    inserido = _db_inserir(telefone, sid, dados, origem)
+    if inserido is None:
+        return None
+    if not inserido:
+        _incrementar("duplicados")
+        return False
+
+    _incrementar("enfileirados")
+    iniciar_processadores()
+    return True
+
+
+def get_inbound_stats() -> Dict[str, Any]:
+    """Profundidade da fila de entrada e lag de processamento para o monitor."""
+    with _metricas_lock:
+        m = dict(_metricas)
+
+    stats: Dict[str, Any] = {
+        "enabled": WEBHOOK_ASYNC,
+        "processadores": sum(1 for t in _threads if t.is_alive()),
+        "processo": {
+            "enfileirados": m["enfileirados"],
+            "duplicados": m["duplicados"],
+            "processados": m["processados"],
+            "falhas": m["falhas"],
+            "retentativas": m["retentativas"],
+            "reclamados": m["reclamados"],
+            "lag_ultimo_ms": round(m["lag_ultimo_ms"], 1),
+            "lag_max_ms": round(m["lag_max_ms"], 1),
+            "lag_medio_ms": round(m["lag_total_ms"] / m["processados"], 1) if m["processados"] else 0.0,
+        },
+        "depth": {"pendente": 0, "processando": 0, "falha_24h": 0},
+        "oldest_pending_sec": 0,
+        "lag_15min_ms": {"avg": 0.0, "max": 0.0},
+    }
+
+    try:
+        with closing(get_db_connection()) as conn:
+            if not conn:
+                return stats
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT
+                    COUNT(CASE WHEN status='pendente' THEN 1 END) AS pendente,
+                    COUNT(CASE WHEN status='processando' THEN 1 END) AS processando,
+                    COUNT(CASE WHEN status='falha' AND created_at >= NOW() - INTERVAL 1 DAY THEN 1 END) AS falha_24h,
+                    TIMESTAMPDIFF(SECOND, MIN(CASE WHEN status='pendente' THEN created_at END), NOW()) AS oldest_pending_sec
+                FROM fila_entrada
+                WHERE status IN ('pendente', 'processando', 'falha')
+            """)
+            row = cur.fetchone() or {}
+            stats["depth"] = {
+                "pendente": int(row.get("pendente") or 0),
+                "processando": int(row.get("processando") or 0),
+                "falha_24h": int(row.get("falha_24h") or 0),
+            }
+            stats["oldest_pending_sec"] = int(row.get("oldest_pending_sec") or 0)
+
+            cur.execute("""
+                SELECT
+                    AVG(TIMESTAMPDIFF(MICROSECOND, created_at, processed_at)) / 1000 AS avg_ms,
+                    MAX(TIMESTAMPDIFF(MICROSECOND, created_at, processed_at)) / 1000 AS max_ms
+                FROM fila_entrada
+                WHERE status = 'concluido'
+                  AND processed_at >= NOW() - INTERVAL 15 MINUTE
+            """)
+            row = cur.fetchone() or {}
+            stats["lag_15min_ms"] = {
+                "avg": round(float(row.get("avg_ms") or 0), 1),
+                "max": round(float(row.get("max_ms") or 0), 1),
+            }
+    except Exception as e:
+        log.error(f"❌ Erro ao buscar stats da fila_entrada: {e}")
+
+    return stats
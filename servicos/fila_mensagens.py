@@ -18,15 +18,28 @@ import json
 import threading
 import logging
 import hashlib
+import heapq
+import itertools
+import math
 import random
+import re
+import socket
+import tempfile
+import atexit
 from contextlib import closing
 from datetime import datetime, timedelta, timezone
 from typing import Any, Tuple, Optional, Callable, Dict, List
 
+import pymysql
+
 import database
-from database import get_db_connection, salvar_conversa
-from servicos.zapi_cliente import enviar_mensagem
-from servicos.anti_spam_controller import AntiSpamController
+from database import get_db_connection, chave_consentimento
+from servicos.zapi_cliente import (
+    enviar_mensagem, iniciar_prober_status,
+    circuito_segundos_ate_liberar, circuito_meio_aberto, obter_estado_circuito,
+    listar_instancias, instancia_padrao, instancia_do_numero,
+)
+from servicos.anti_spam_controller import AntiSpamController, segundos_por_envio
 
 log = logging.getLogger(__name__)
 
@@ -43,6 +56,10 @@ MAX_DELAY_SEG = float(os.getenv("FILA_MAX_DELAY_SEC", "45"))
 RETRY_MAX = int(os.getenv("FILA_RETRY_MAX", "2"))
 RETRY_SLEEP_SEG = float(os.getenv("FILA_RETRY_SLEEP_SEG", "3"))
 
+# 💾 Write-back dos resultados: marcação + pós-envio acumulados e gravados em lote
+WRITEBACK_SEC = float(os.getenv("FILA_WRITEBACK_SEC", "1"))      # 0 = grava a cada item (sem lote)
+WRITEBACK_LOTE = int(os.getenv("FILA_WRITEBACK_BATCH", "50"))    # tamanho que antecipa o flush
+
 # 📦 Batch e Polling
 POLL_SECONDS = float(os.getenv("FILA_POLL_SECONDS", "1"))
 BATCH_SIZE = int(os.getenv("FILA_BATCH_SIZE", "20"))
@@ -56,6 +73,31 @@ ERROR_RATE_THRESHOLD = float(os.getenv("FILA_ERROR_RATE_THRESHOLD", "0.02"))
 SLOWDOWN_FACTOR = float(os.getenv("FILA_SLOWDOWN_FACTOR", "5.0"))
 STATUS_TTL_SEC = int(os.getenv("FILA_STATUS_TTL_SEC", "30"))
 
+# 🔒 Claim multi-worker (SKIP LOCKED + lease)
+CLAIM_SKIP_LOCKED = os.getenv("FILA_CLAIM_SKIP_LOCKED", "1") == "1"
+CLAIM_LEASE_SEC = int(os.getenv("FILA_CLAIM_LEASE_SEC", "900"))
+RECLAIM_INTERVAL_SEC = int(os.getenv("FILA_RECLAIM_INTERVAL_SEC", "60"))
+
+# ⏱️ Scheduler de pacing (not-before por raia/número em vez de time.sleep)
+PAUSA_REAVALIAR_SEC = int(os.getenv("FILA_PAUSA_REAVALIAR_SEC", "60"))
+
+# ⚙️ Engine do worker: "thread" (padrão, 1 thread bloqueante) ou "async" (asyncio + aiohttp)
+FILA_ENGINE = os.getenv("FILA_ENGINE", "thread").lower()
+
+# 🔔 Wakeup por evento (fila vazia → worker dorme até alguém enfileirar)
+POLL_MAX_SECONDS = float(os.getenv("FILA_POLL_MAX_SECONDS", "30"))
+WAKEUP_ENABLED = os.getenv("FILA_WAKEUP_ENABLED", "1") == "1"
+WAKEUP_DIR = os.getenv("FILA_WAKEUP_DIR", os.path.join(tempfile.gettempdir(), "crm_fila_wakeup"))
+
+# 🚦 Raias de prioridade (coluna fila_envios.prioridade: menor = mais urgente)
+RAIA_RESPOSTA = 0   # respostas conversacionais (meta.is_reply=True)
+RAIA_MANUAL = 1     # boas-vindas/envios manuais (meta.tipo="manual")
+RAIA_CAMPANHA = 2   # campanhas, proativos e demais
+NOMES_RAIAS = {RAIA_RESPOSTA: "reply", RAIA_MANUAL: "manual", RAIA_CAMPANHA: "campaign"}
+# Aviso interno da equipe (ex.: pedido de oração aos intercessores): raia manual,
+# sem checagem de consentimento e sem pós-envio de fase no CRM
+TIPO_INTERNO = "interno"
+
 # 🕐 Horário Comercial (em horário do Brasil - BRT/UTC-3)
 # ⚠️ Estes valores SÃO em horário do Brasil, não UTC
 BUSINESS_HOURS_START = int(os.getenv("FILA_BUSINESS_HOURS_START", "8"))
@@ -79,7 +121,56 @@ CallbackFn = Optional[Callable[[Dict[str, Any]], None]]
 _lock = threading.Lock()
 _worker_running = False
 _worker_thread = None
-_anti_spam: Optional[AntiSpamController] = None  # Instância do controller anti-spam
+_anti_spam: Dict[str, AntiSpamController] = {}  # Controller anti-spam por instância Z-API
+_skip_locked_suportado = CLAIM_SKIP_LOCKED  # vira False se o MySQL não suportar (< 8.0)
+_ultimo_reclaim = 0.0
+_dono_lease: Optional[str] = None  # claimed_by do worker deste processo (fixado no início do worker)
+_dono_lease_pid: Optional[int] = None
+
+# Write-back: resultados ainda não gravados (id, status, efeitos no CRM)
+_resultados: List[Dict[str, Any]] = []
+_resultados_lock = threading.Lock()
+_resultados_flush_lock = threading.Lock()  # um flush por vez (worker, flusher, atexit)
+_writeback_evento = threading.Event()
+_writeback_thread: Optional[threading.Thread] = None
+_writeback_pid: Optional[int] = None
+_writeback_metricas: Dict[str, Any] = {
+    "flushes": 0,
+    "itens": 0,
+    "ignorados": 0,      # resultado de item que já não era deste worker (idempotência)
+    "erros": 0,
+    "maior_lote": 0,
+    "erros_pos_envio": 0,
+}
+
+# Scheduler: min-heap de (not_before, seq, item) + not-before das raias com pacing.
+# item=None é só um despertar (ex.: retry cujo scheduled_for vence no banco).
+_agenda: List[Tuple[float, int, Optional[Dict[str, Any]]]] = []
+_agenda_seq = itertools.count()
+_agenda_lock = threading.Lock()  # engine async agenda despertares a partir de threads do executor
+_pacing_liberado_em: Dict[str, float] = {}   # raias manual/campanha: por instância (monotonic)
+_resposta_liberada_em: Dict[str, float] = {}  # respostas: por número (monotonic)
+_scheduler_metricas: Dict[str, Any] = {
+    "adiados": 0,            # itens que esperaram no heap em vez de bloquear o worker
+    "adiados_circuito": 0,   # itens devolvidos em bloco com o circuit breaker aberto
+    "despertares_timer": 0,
+    "pacing_total_sec": 0.0, # tempo de pacing em que o worker continuou livre
+}
+
+# Sinalização: condition variable local + socket Unix (datagrama) por processo
+_sinal = threading.Condition()
+_trabalho_sinalizado = False
+_ouvintes_sinal: List[Callable[[], None]] = []  # ex.: engine async (asyncio.Event via call_soon_threadsafe)
+_wakeup_sock: Optional[socket.socket] = None
+_wakeup_path: Optional[str] = None
+_wakeup_metricas: Dict[str, Any] = {
+    "polls_vazios": 0,           # claims que voltaram vazios
+    "despertares_evento": 0,     # esperas encerradas por sinal (local ou de outro processo)
+    "despertares_timeout": 0,    # esperas encerradas pelo backoff
+    "sinais_enviados": 0,
+    "sinais_recebidos": 0,
+    "segundos_ociosos": 0.0,
+}
 
 
 def _digits(s: Any) -> str:
@@ -214,6 +305,21 @@ def _esta_dentro_horario_comercial() -> bool:
         return True  # Fail-safe: permite envio se houver erro na verificação
 
 
+def _limites_consentimento() -> Tuple[datetime, datetime]:
+    """
+    Limites das janelas de consentimento: (bloqueios desde, engajamento desde).
+
+    ✅ CORREÇÃO: Calcular intervalos em BRT e converter para UTC
+    Isso evita conflito de timezone entre servidor (UTC) e horário Brasil (BRT)
+    """
+    agora_br = datetime.now(TZ_BRASIL)
+    # 30 dias atrás em BRT → UTC para bloqueios
+    trinta_dias_atras_utc = (agora_br - timedelta(days=30)).astimezone(timezone.utc)
+    # 7 dias atrás em BRT → UTC para engajamento
+    sete_dias_atras_utc = (agora_br - timedelta(days=7)).astimezone(timezone.utc)
+    return trinta_dias_atras_utc, sete_dias_atras_utc
+
+
 def _pode_enviar_proativo(numero: str) -> bool:
     """
     Verifica se podemos enviar mensagem proativa para este número.
@@ -225,7 +331,7 @@ def _pode_enviar_proativo(numero: str) -> bool:
     - ✅ Respeita horário comercial do Brasil
     
     Args:
-        numero: Número normalizado (sem 55) - formato: 48999999999
+        numero: Número do item da fila (com ou sem 55); a chave vem de chave_consentimento
     
     Returns:
         bool: True se pode enviar mensagem proativa
@@ -243,56 +349,27 @@ def _pode_enviar_proativo(numero: str) -> bool:
             
             cur = conn.cursor()
             
-            # ✅ CORREÇÃO: Calcular intervalos em BRT e converter para UTC
-            # Isso evita conflito de timezone entre servidor (UTC) e horário Brasil (BRT)
-            agora_br = datetime.now(TZ_BRASIL)
-            
-            # 30 dias atrás em BRT → UTC para query de bloqueios
-            trinta_dias_atras_br = agora_br - timedelta(days=30)
-            trinta_dias_atras_utc = trinta_dias_atras_br.astimezone(timezone.utc)
-            
-            # 7 dias atrás em BRT → UTC para query de engajamento
-            sete_dias_atras_br = agora_br - timedelta(days=7)
-            sete_dias_atras_utc = sete_dias_atras_br.astimezone(timezone.utc)
-            
-            # 🔍 Verifica bloqueios/denúncias recentes (30 dias)
-            patterns = ['%pare%', '%bloque%', '%spam%', '%denuncia%']
+            trinta_dias_atras_utc, sete_dias_atras_utc = _limites_consentimento()
+
+            # 🔍 Uma leitura por chave primária no índice de consentimento (consent_state),
+            # mantido por salvar_conversa / salvar_contexto_visitante a cada mensagem recebida
             cur.execute("""
-                SELECT COUNT(*) as bloqueios 
-                FROM conversas c
-                INNER JOIN visitantes v ON c.visitante_id = v.id
-                WHERE v.telefone = %s 
-                AND (
-                    c.tipo = 'bloqueado' 
-                    OR c.mensagem LIKE %s 
-                    OR c.mensagem LIKE %s
-                    OR c.mensagem LIKE %s
-                    OR c.mensagem LIKE %s
-                )
-                AND c.created_at >= %s
-            """, (numero, *patterns, trinta_dias_atras_utc))  # ← Usa timestamp UTC
-            
-            resultado = cur.fetchone()
-            if resultado and resultado.get('bloqueios', 0) > 0:
+                SELECT
+                    last_block_signal_at >= %s AS bloqueado,
+                    last_inbound_at >= %s AS engajado
+                FROM consent_state
+                WHERE telefone = %s
+            """, (trinta_dias_atras_utc, sete_dias_atras_utc, chave_consentimento(numero)))  # ← Usa timestamps UTC
+            estado = cur.fetchone() or {}
+
+            # Bloqueios/denúncias recentes (30 dias)
+            if estado.get('bloqueado'):
                 log.info(f"🚫 Bloqueado/denunciado recentemente: {numero}")
                 return False
-            
-            # 🔍 Verifica engajamento recente (7 dias) - com timezone correto
-            cur.execute("""
-                SELECT COUNT(*) as interacoes 
-                FROM conversas c
-                INNER JOIN visitantes v ON c.visitante_id = v.id
-                WHERE v.telefone = %s 
-                AND c.tipo = 'recebida'
-                AND c.created_at >= %s
-            """, (numero, sete_dias_atras_utc))  # ← Usa timestamp UTC
-            
-            resultado = cur.fetchone()
-            interacoes = resultado.get('interacoes', 0) if resultado else 0
-            
-            # ✅ Pode enviar se interagiu recentemente
-            if interacoes > 0:
-                log.debug(f"✅ Consentimento válido: {interacoes} interações recentes para {numero}")
+
+            # ✅ Pode enviar se interagiu recentemente (7 dias)
+            if estado.get('engajado'):
+                log.debug(f"✅ Consentimento válido: interação recente para {numero}")
                 return True
             
             # ⚠️ Falha segura: se não temos histórico claro, não enviamos proativo
@@ -304,6 +381,70 @@ def _pode_enviar_proativo(numero: str) -> bool:
         return False  # Fail-safe: não enviar em caso de dúvida
 
 
+def _estados_consentimento(cur, chaves: List[str]) -> Dict[str, dict]:
+    """{chave: {bloqueado, engajado}} das chaves presentes em consent_state (blocos de 1000)."""
+    trinta_dias_atras_utc, sete_dias_atras_utc = _limites_consentimento()
+    estados: Dict[str, dict] = {}
+    for i in range(0, len(chaves), 1000):
+        bloco = chaves[i:i + 1000]
+        placeholders = ",".join(["%s"] * len(bloco))
+        cur.execute(f"""
+            SELECT
+                telefone,
+                last_block_signal_at >= %s AS bloqueado,
+                last_inbound_at >= %s AS engajado
+            FROM consent_state
+            WHERE telefone IN ({placeholders})
+        """, (trinta_dias_atras_utc, sete_dias_atras_utc, *bloco))
+        for row in cur.fetchall() or []:
+            estados[row["telefone"]] = row
+    return estados
+
+
+def avaliar_consentimento_em_lote(telefones: List[str], cur=None) -> Optional[Dict[str, str]]:
+    """
+    Mesmas regras de _pode_enviar_proativo (menos o horário comercial, que é do momento
+    do envio) para uma audiência inteira: uma query por bloco de telefones em consent_state.
+
+    Args:
+        telefones: telefones em qualquer formato (a chave vem de chave_consentimento, a mesma
+            do _pode_enviar_proativo sobre o número que vai para a fila)
+        cur: cursor de uma conexão já aberta por quem chama (sem checkout de outra conexão do pool)
+
+    Returns:
+        {telefone recebido: motivo} só dos inelegíveis ("bloqueio_recente" | "sem_engajamento_recente"),
+        ou None se não deu para avaliar (quem chama enfileira e o worker valida item a item).
+    """
+    chaves = {t: chave_consentimento(t) for t in telefones if t}
+    unicos = sorted({c for c in chaves.values() if c})
+    if not unicos:
+        return {}
+    try:
+        if cur is not None:
+            estados = _estados_consentimento(cur, unicos)
+        else:
+            with closing(get_db_connection()) as conn:
+                if not conn:
+                    log.warning("⚠️ Sem conexão DB para validar consentimento em lote")
+                    return None
+                estados = _estados_consentimento(conn.cursor(), unicos)
+
+        motivos: Dict[str, str] = {}
+        for chave in unicos:
+            estado = estados.get(chave) or {}
+            if estado.get("bloqueado"):
+                motivos[chave] = "bloqueio_recente"
+            elif not estado.get("engajado"):
+                motivos[chave] = "sem_engajamento_recente"
+        log.info(f"🛡️ Consentimento em lote: {len(unicos) - len(motivos)}/{len(unicos)} elegíveis")
+        inelegiveis = {tel: motivos[chave] for tel, chave in chaves.items() if chave in motivos}
+        return inelegiveis
+
+    except Exception as e:
+        log.error(f"❌ Erro ao validar consentimento em lote: {e}")
+        return None
+
+
 def _variar_mensagem(mensagem_base: str, numero: str) -> str:
     """
     Adiciona variações sutis para evitar padrões detectáveis pelo WhatsApp.
@@ -386,6 +527,34 @@ def _safe_call(cb: CallbackFn, payload: Dict[str, Any]) -> None:
 # DB helpers
 # =========================
 
+def _raia_do_meta(meta: Dict[str, Any]) -> int:
+    """Define a raia de prioridade do item a partir do meta."""
+    if meta.get("is_reply"):
+        return RAIA_RESPOSTA
+    if meta.get("tipo") in ("manual", TIPO_INTERNO):
+        return RAIA_MANUAL
+    return RAIA_CAMPANHA
+
+
+def _instancia_do_envio(numero_envio: str, meta: Dict[str, Any]) -> Optional[str]:
+    """
+    Instância Z-API que vai enviar o item: a pedida no meta (se configurada)
+    ou a fixa do número, para a conversa não trocar de remetente.
+    """
+    pedida = meta.get("instance_id")
+    if pedida and pedida in listar_instancias():
+        return pedida
+    return instancia_do_numero(numero_envio)
+
+
+def _instancia_do_item(item: Dict[str, Any]) -> Optional[str]:
+    """Instância gravada no item; se não estiver mais configurada, reroteia pelo número."""
+    instancia = item.get("instance_id")
+    if instancia and instancia in listar_instancias():
+        return instancia
+    return instancia_do_numero(item.get("numero") or "")
+
+
 def _db_insert_item(numero_envio: str, mensagem: str, imagem_url: Optional[str], meta: Dict[str, Any]) -> bool:
     try:
         meta_json = json.dumps(meta or {}, ensure_ascii=False)
@@ -394,9 +563,10 @@ def _db_insert_item(numero_envio: str, mensagem: str, imagem_url: Optional[str],
                 return False
             cur = conn.cursor()
             cur.execute("""
-                INSERT INTO fila_envios (numero, mensagem, imagem_url, status, tentativas, meta_json)
-                VALUES (%s, %s, %s, 'pendente', 0, %s)
-            """, (numero_envio, mensagem, imagem_url, meta_json))
+                INSERT INTO fila_envios (numero, mensagem, imagem_url, status, tentativas, meta_json, prioridade, instance_id)
+                VALUES (%s, %s, %s, 'pendente', 0, %s, %s, %s)
+            """, (numero_envio, mensagem, imagem_url, meta_json, _raia_do_meta(meta or {}),
+                  _instancia_do_envio(numero_envio, meta or {})))
             conn.commit()
             return True
     except Exception as e:
@@ -404,8 +574,110 @@ def _db_insert_item(numero_envio: str, mensagem: str, imagem_url: Optional[str],
         return False
 
 
-def _db_claim_batch(limit: int) -> List[Dict[str, Any]]:
-    """Pega lote de pendentes com lock transacional."""
+def _worker_id() -> str:
+    """
+    Identificador do dono do lease: host:pid:thread do worker.
+    Fixado no início do worker: claim, renovação e write-back rodam em threads
+    diferentes (executor da engine async, flusher) e precisam do mesmo dono.
+    """
+    if _dono_lease and _dono_lease_pid == os.getpid():
+        return _dono_lease
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"[:64]
+
+
+def _db_reclaim_expirados() -> int:
+    """
+    Devolve para 'pendente' itens presos em 'processando' com lease vencido
+    (worker/processo que morreu no meio do lote) e atribui instância aos
+    pendentes sem uma. Roda no máximo 1x por RECLAIM_INTERVAL_SEC.
+    """
+    global _ultimo_reclaim
+    agora = time.time()
+    if agora - _ultimo_reclaim < RECLAIM_INTERVAL_SEC:
+        return 0
+    _ultimo_reclaim = agora
+    try:
+        with closing(get_db_connection()) as conn:
+            if not conn:
+                return 0
+            cur = conn.cursor()
+            cur.execute("""
+                UPDATE fila_envios
+                SET status='pendente', claimed_by=NULL, lease_expires_at=NULL
+                WHERE status='processando'
+                  AND (lease_expires_at IS NULL OR lease_expires_at < NOW())
+            """)
+            conn.commit()
+            if cur.rowcount:
+                log.warning(f"♻️ {cur.rowcount} item(ns) da fila_envios com lease vencido voltaram para 'pendente'.")
+            recuperados = cur.rowcount
+        _db_atribuir_instancias()
+        return recuperados
+    except Exception as e:
+        log.error(f"❌ Erro ao recuperar itens com lease vencido: {e}")
+        return 0
+
+
+def _db_atribuir_instancias(limite: int = 5000) -> int:
+    """
+    Atribui instância aos pendentes sem uma válida (itens anteriores ao sharding
+    ou de instância removida da config). O claim filtra por instância, então
+    sem isso esses itens nunca sairiam.
+    """
+    instancias = listar_instancias()
+    if not instancias:
+        return 0
+    try:
+        with closing(get_db_connection()) as conn:
+            if not conn:
+                return 0
+            cur = conn.cursor()
+            placeholders = ','.join(['%s'] * len(instancias))
+            cur.execute(f"""
+                SELECT id, numero FROM fila_envios
+                WHERE status = 'pendente'
+                  AND (instance_id IS NULL OR instance_id NOT IN ({placeholders}))
+                LIMIT %s
+            """, (*instancias, limite))
+            por_instancia: Dict[str, List[int]] = {}
+            for row in cur.fetchall() or []:
+                por_instancia.setdefault(instancia_do_numero(row["numero"]), []).append(row["id"])
+            total = 0
+            for instancia, ids in por_instancia.items():
+                placeholders = ','.join(['%s'] * len(ids))
+                cur.execute(f"""
+                    UPDATE fila_envios SET instance_id=%s
+                    WHERE status = 'pendente' AND id IN ({placeholders})
+                """, (instancia, *ids))
+                total += cur.rowcount
+            conn.commit()
+            if total:
+                log.info(f"🔀 {total} item(ns) pendentes atribuídos às instâncias Z-API.")
+            return total
+    except Exception as e:
+        log.error(f"❌ Erro ao atribuir instâncias aos itens da fila: {e}")
+        return 0
+
+
+def _db_claim_batch(
+    limit: int,
+    raia: Optional[int] = None,
+    instancias: Optional[List[str]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Pega lote de pendentes com FOR UPDATE SKIP LOCKED e grava o lease
+    (claimed_by, lease_expires_at). Workers de processos diferentes pegam
+    linhas disjuntas em vez de esperar pelos mesmos locks.
+
+    Args:
+        limit: Máximo de itens
+        raia: Se informado, só itens dessa raia de prioridade
+        instancias: Se informado, só itens dessas instâncias Z-API (lista vazia = nada)
+    """
+    global _skip_locked_suportado
+    if instancias is not None and not instancias:
+        return []
+    _db_reclaim_expirados()
     try:
         with closing(get_db_connection()) as conn:
             if not conn:
@@ -413,15 +685,33 @@ def _db_claim_batch(limit: int) -> List[Dict[str, Any]]:
             cur = conn.cursor()
             conn.begin()
             # ✅ FILTRAR mensagens agendadas para o futuro (evita loop de re-agendamento)
-            cur.execute("""
-                SELECT id, numero, mensagem, imagem_url, tentativas, meta_json
+            filtro_raia = "AND prioridade = %s" if raia is not None else ""
+            filtro_instancia = (
+                f"AND instance_id IN ({','.join(['%s'] * len(instancias))})" if instancias else ""
+            )
+            params = ((raia,) if raia is not None else ()) + tuple(instancias or ()) + (limit,)
+            sql = f"""
+                SELECT id, numero, mensagem, imagem_url, tentativas, meta_json, prioridade, instance_id
                 FROM fila_envios
                 WHERE status = 'pendente'
                 AND (scheduled_for IS NULL OR scheduled_for <= NOW())
-                ORDER BY created_at ASC
+                {filtro_raia}
+                {filtro_instancia}
+                ORDER BY prioridade ASC, created_at ASC
                 LIMIT %s
                 FOR UPDATE
-            """, (limit,))
+            """
+            try:
+                cur.execute(sql + (" SKIP LOCKED" if _skip_locked_suportado else ""), params)
+            except pymysql.err.ProgrammingError as e:
+                if not _skip_locked_suportado:
+                    raise
+                # MySQL < 8.0 não conhece SKIP LOCKED → volta para FOR UPDATE simples
+                log.warning(f"⚠️ SKIP LOCKED não suportado pelo MySQL, usando FOR UPDATE: {e}")
+                _skip_locked_suportado = False
+                conn.rollback()
+                conn.begin()
+                cur.execute(sql, params)
             rows = cur.fetchall() or []
             if not rows:
                 conn.commit()
@@ -429,8 +719,13 @@ def _db_claim_batch(limit: int) -> List[Dict[str, Any]]:
             ids = [r["id"] for r in rows]
             placeholders = ','.join(['%s'] * len(ids))
             cur.execute(
-                f"UPDATE fila_envios SET status='processando' WHERE status='pendente' AND id IN ({placeholders})",
-                tuple(ids)
+                f"""
+                UPDATE fila_envios
+                SET status='processando', claimed_by=%s, lease_expires_at=NOW() + INTERVAL %s SECOND,
+                    claimed_at=COALESCE(claimed_at, NOW())
+                WHERE status='pendente' AND id IN ({placeholders})
+                """,
+                (_worker_id(), CLAIM_LEASE_SEC, *ids)
             )
             conn.commit()
             return rows
@@ -439,44 +734,269 @@ def _db_claim_batch(limit: int) -> List[Dict[str, Any]]:
         return []
 
 
-def _db_mark_success(envio_id: int, status_code: int = 200) -> None:
+def _db_renovar_lease(envio_id: int) -> bool:
+    """
+    Renova o lease antes de processar o item. Retorna False se o item não é
+    mais nosso (lease venceu e outro worker recuperou) — nesse caso não envia.
+    """
     try:
         with closing(get_db_connection()) as conn:
             if not conn:
-                return
+                return True  # sem DB não dá para checar; segue o fluxo antigo
             cur = conn.cursor()
             cur.execute("""
                 UPDATE fila_envios
-                SET status='enviado', status_code=%s, last_error=NULL
-                WHERE id=%s
-            """, (int(status_code or 0), envio_id))
+                SET lease_expires_at = NOW() + INTERVAL %s SECOND
+                WHERE id=%s AND status='processando' AND claimed_by=%s
+            """, (CLAIM_LEASE_SEC, envio_id, _worker_id()))
             conn.commit()
+            return cur.rowcount > 0
     except Exception as e:
-        log.error(f"❌ Erro ao marcar sucesso envio_id={envio_id}: {e}")
+        log.error(f"❌ Erro ao renovar lease envio_id={envio_id}: {e}")
+        return True
 
 
-def _db_mark_fail_or_retry(envio_id: int, next_attempt_count: int, status_code: int, err: str) -> str:
-    err = (err or "")[:480]
+def _db_liberar_item(envio_id: int) -> None:
+    """Devolve item reservado para 'pendente' (ex.: pausa do anti-spam)."""
     try:
         with closing(get_db_connection()) as conn:
             if not conn:
-                return "falha"
+                return
             cur = conn.cursor()
-            # ✅ PASSA O NÚMERO DA TENTATIVA PARA _should_retry (backoff exponencial)
-            allow_retry = (next_attempt_count < MAX_ATTEMPTS) and _should_retry(
-                err, int(status_code or 0), attempt=next_attempt_count
-            )
-            novo_status = "pendente" if allow_retry else "falha"
             cur.execute("""
                 UPDATE fila_envios
-                SET status=%s, tentativas=%s, status_code=%s, last_error=%s
-                WHERE id=%s
-            """, (novo_status, int(next_attempt_count), int(status_code or 0), err, envio_id))
+                SET status='pendente', claimed_by=NULL, lease_expires_at=NULL
+                WHERE id=%s AND status='processando'
+            """, (envio_id,))
             conn.commit()
-            return novo_status
     except Exception as e:
-        log.error(f"❌ Erro ao marcar falha/retry envio_id={envio_id}: {e}")
-        return "falha"
+        log.error(f"❌ Erro ao liberar envio_id={envio_id}: {e}")
+
+
+def _status_apos_falha(next_attempt_count: int, status_code: int, err: str) -> str:
+    """'pendente' (retry com not-before) ou 'falha' (final)."""
+    # ✅ PASSA O NÚMERO DA TENTATIVA PARA _should_retry (backoff exponencial)
+    allow_retry = (next_attempt_count < MAX_ATTEMPTS) and _should_retry(
+        err or "", int(status_code or 0), attempt=next_attempt_count
+    )
+    return "pendente" if allow_retry else "falha"
+
+
+def _registrar_resultado(
+    envio_id: int,
+    status: str,
+    status_code: int = 0,
+    erro: Optional[str] = None,
+    tentativas: Optional[int] = None,
+    efeitos: Optional[Dict[str, list]] = None,
+) -> None:
+    """
+    Acumula o resultado do item para o write-back em lote (status na fila_envios
+    + efeitos no CRM). O item segue 'processando' com lease até o flush.
+    """
+    resultado = {
+        "id": envio_id,
+        "status": status,
+        "status_code": int(status_code or 0),
+        "erro": (erro or "")[:480] if status != "enviado" else None,
+        # Hora real do envio (o write-back pode gravar segundos depois, até depois da meia-noite)
+        "enviado_em": datetime.now() if status == "enviado" else None,
+        "tentativas": tentativas,
+        "dono": _worker_id(),
+        "efeitos": efeitos or {},
+    }
+    with _resultados_lock:
+        _resultados.append(resultado)
+        cheio = len(_resultados) >= WRITEBACK_LOTE
+    if WRITEBACK_SEC <= 0:
+        _flush_resultados()
+    elif cheio:
+        _writeback_evento.set()
+
+
+def _db_gravar_resultados(lote: List[Dict[str, Any]]) -> bool:
+    """
+    Grava um lote de resultados numa transação:
+    1. trava as linhas ainda 'processando' do dono que registrou o resultado
+       (idempotência: reaplicar o lote ou item recuperado por outro worker não remarca);
+    2. um UPDATE multi-linha (CASE por id) com status/tentativas/erro/not-before;
+    3. efeitos no CRM (conversas, fase, eventos_envios) só das linhas marcadas agora.
+    """
+    try:
+        with closing(get_db_connection()) as conn:
+            if not conn:
+                return False
+            cur = conn.cursor()
+            conn.begin()
+            ids = [r["id"] for r in lote]
+            placeholders = ','.join(['%s'] * len(ids))
+            cur.execute(f"""
+                SELECT id, status, claimed_by FROM fila_envios
+                WHERE id IN ({placeholders})
+                FOR UPDATE
+            """, tuple(ids))
+            atuais = {int(row["id"]): row for row in cur.fetchall() or []}
+            validos, descartados = [], []
+            for r in lote:
+                atual = atuais.get(r["id"]) or {}
+                if atual.get("status") == "processando" and atual.get("claimed_by") == r["dono"]:
+                    validos.append(r)
+                else:
+                    descartados.append((r, atual))
+            ignorados = len(descartados)
+            _logar_descartados(descartados)
+            if not validos:
+                conn.commit()
+                _writeback_metricas["ignorados"] += ignorados
+                return True
+
+            casos_status, casos_code, casos_erro, casos_tent, casos_env = [], [], [], [], []
+            p_status, p_code, p_erro, p_tent, p_env = [], [], [], [], []
+            retry_ids = []
+            for r in validos:
+                casos_status.append("WHEN %s THEN %s"); p_status += [r["id"], r["status"]]
+                casos_code.append("WHEN %s THEN %s"); p_code += [r["id"], r["status_code"]]
+                casos_erro.append("WHEN %s THEN %s"); p_erro += [r["id"], r["erro"]]
+                if r["tentativas"] is not None:
+                    casos_tent.append("WHEN %s THEN %s"); p_tent += [r["id"], int(r["tentativas"])]
+                if r.get("enviado_em"):
+                    casos_env.append("WHEN %s THEN %s"); p_env += [r["id"], r["enviado_em"]]
+                if r["status"] == "pendente":
+                    retry_ids.append(r["id"])
+            ids_validos = [r["id"] for r in validos]
+            sql_tent = f"CASE id {' '.join(casos_tent)} ELSE tentativas END" if casos_tent else "tentativas"
+            sql_env = f"CASE id {' '.join(casos_env)} ELSE enviado_em END" if casos_env else "enviado_em"
+            sql_retry = (
+                f"CASE WHEN id IN ({','.join(['%s'] * len(retry_ids))}) "
+                f"THEN NOW() + INTERVAL %s SECOND ELSE scheduled_for END"
+            ) if retry_ids else "scheduled_for"
+            p_retry = [*retry_ids, int(math.ceil(RETRY_SLEEP_SEG))] if retry_ids else []
+            # Retry não dorme no worker: vira not-before (scheduled_for) do próprio item
+            cur.execute(f"""
+                UPDATE fila_envios
+                SET status = CASE id {' '.join(casos_status)} END,
+                    status_code = CASE id {' '.join(casos_code)} END,
+                    last_error = CASE id {' '.join(casos_erro)} END,
+                    tentativas = {sql_tent},
+                    enviado_em = {sql_env},
+                    scheduled_for = {sql_retry},
+                    claimed_by = NULL, lease_expires_at = NULL
+                WHERE id IN ({','.join(['%s'] * len(ids_validos))})
+            """, (*p_status, *p_code, *p_erro, *p_tent, *p_env, *p_retry, *ids_validos))
+
+            # Efeitos no CRM: falha aqui não desfaz a marcação (como no pós-envio item a item)
+            conversas, fases, eventos = [], [], []
+            for r in validos:
+                conversas += r["efeitos"].get("conversas", [])
+                fases += r["efeitos"].get("fases", [])
+                eventos += r["efeitos"].get("eventos", [])
+            if conversas or fases or eventos:
+                cur.execute("SAVEPOINT pos_envio")
+                try:
+                    database.aplicar_pos_envio_em_lote(cur, conversas, fases, eventos)
+                except Exception as e:
+                    cur.execute("ROLLBACK TO SAVEPOINT pos_envio")
+                    _writeback_metricas["erros_pos_envio"] += 1
+                    log.error(f"❌ Pós-envio em lote falhou ({len(validos)} itens): {e}", exc_info=True)
+
+            conn.commit()
+            _writeback_metricas["flushes"] += 1
+            _writeback_metricas["itens"] += len(validos)
+            _writeback_metricas["ignorados"] += ignorados
+            _writeback_metricas["maior_lote"] = max(_writeback_metricas["maior_lote"], len(validos))
+            return True
+    except Exception as e:
+        _writeback_metricas["erros"] += 1
+        log.error(f"❌ Erro no write-back de {len(lote)} resultado(s) da fila_envios: {e}")
+        return False
+
+
+def _logar_descartados(descartados: List[Tuple[Dict[str, Any], Dict[str, Any]]]) -> None:
+    """
+    Um log por resultado descartado no write-back (item já não era deste worker).
+    Se o resultado era 'enviado', o item foi recuperado por outro worker e pode ter saído duas vezes.
+    """
+    for r, atual in descartados:
+        msg = (
+            f"envio_id={r['id']} resultado={r['status']} dono={r['dono']} | "
+            f"atual: status={atual.get('status', 'inexistente')} claimed_by={atual.get('claimed_by')}"
+        )
+        if r["status"] == "enviado":
+            log.error(f"♻️ Write-back descartou envio já feito (possível duplicado): {msg}")
+        else:
+            log.warning(f"♻️ Write-back descartou resultado (item já não era deste worker): {msg}")
+
+
+def _db_renovar_leases_pendentes(lote: List[Dict[str, Any]]) -> None:
+    """
+    Flush falhou: renova o lease dos itens com resultado ainda no buffer, para o reclaim
+    não devolvê-los para 'pendente' (e reenviá-los) enquanto o write-back tenta de novo.
+    """
+    por_dono: Dict[str, List[int]] = {}
+    for r in lote:
+        por_dono.setdefault(r["dono"], []).append(r["id"])
+    try:
+        with closing(get_db_connection()) as conn:
+            if not conn:
+                return
+            cur = conn.cursor()
+            renovados = 0
+            for dono, ids in por_dono.items():
+                placeholders = ','.join(['%s'] * len(ids))
+                cur.execute(f"""
+                    UPDATE fila_envios
+                    SET lease_expires_at = NOW() + INTERVAL %s SECOND
+                    WHERE status='processando' AND claimed_by=%s AND id IN ({placeholders})
+                """, (CLAIM_LEASE_SEC, dono, *ids))
+                renovados += cur.rowcount
+            conn.commit()
+            if renovados < len(lote):
+                log.warning(f"⚠️ Write-back: lease renovado para {renovados}/{len(lote)} item(ns) no buffer.")
+    except Exception as e:
+        log.error(f"❌ Erro ao renovar lease de {len(lote)} item(ns) no buffer do write-back: {e}")
+
+
+def _flush_resultados() -> int:
+    """
+    Grava os resultados acumulados. Se o banco falhar, o lote volta para a próxima rodada
+    e os leases dos itens são renovados (o item segue 'processando' até ser gravado).
+    """
+    with _resultados_flush_lock:
+        with _resultados_lock:
+            lote = _resultados[:]
+            _resultados.clear()
+        if not lote:
+            return 0
+        if not _db_gravar_resultados(lote):
+            with _resultados_lock:
+                _resultados[:0] = lote
+            _db_renovar_leases_pendentes(lote)
+            return 0
+        return len(lote)
+
+
+def _loop_writeback() -> None:
+    while True:
+        _writeback_evento.wait(WRITEBACK_SEC)
+        _writeback_evento.clear()
+        try:
+            _flush_resultados()
+        except Exception as e:
+            log.error(f"❌ Erro no flusher do write-back: {e}")
+
+
+def _iniciar_writeback() -> None:
+    """Sobe (uma vez por processo) a thread que grava os resultados em lote."""
+    global _writeback_thread, _writeback_pid
+    if WRITEBACK_SEC <= 0:
+        return
+    pid = os.getpid()
+    if _writeback_pid == pid and _writeback_thread and _writeback_thread.is_alive():
+        return
+    _writeback_pid = pid
+    _writeback_thread = threading.Thread(target=_loop_writeback, name="fila-writeback", daemon=True)
+    _writeback_thread.start()
+    atexit.register(_flush_resultados)
 
 
 def _db_reequeue_item(envio_id: int, scheduled_for: datetime) -> bool:
@@ -488,7 +1008,8 @@ def _db_reequeue_item(envio_id: int, scheduled_for: datetime) -> bool:
             cur = conn.cursor()
             cur.execute("""
                 UPDATE fila_envios
-                SET status='pendente', scheduled_for=%s
+                SET status='pendente', scheduled_for=%s,
+                    claimed_by=NULL, lease_expires_at=NULL
                 WHERE id=%s
             """, (scheduled_for, envio_id))
             conn.commit()
@@ -498,11 +1019,125 @@ def _db_reequeue_item(envio_id: int, scheduled_for: datetime) -> bool:
         return False
 
 
+def _db_adiar_itens(ids: List[int], segundos: float) -> int:
+    """
+    Devolve itens reservados para 'pendente' com not-before, em um único UPDATE,
+    sem consumir tentativa (circuit breaker da Z-API aberto ou bulkhead cheio).
+    """
+    if not ids:
+        return 0
+    try:
+        with closing(get_db_connection()) as conn:
+            if not conn:
+                return 0
+            cur = conn.cursor()
+            placeholders = ','.join(['%s'] * len(ids))
+            cur.execute(f"""
+                UPDATE fila_envios
+                SET status='pendente', claimed_by=NULL, lease_expires_at=NULL,
+                    scheduled_for = NOW() + INTERVAL %s SECOND
+                WHERE status='processando' AND id IN ({placeholders})
+            """, (int(math.ceil(segundos)), *ids))
+            conn.commit()
+            _scheduler_metricas["adiados_circuito"] += cur.rowcount
+            return cur.rowcount
+    except Exception as e:
+        log.error(f"❌ Erro ao adiar {len(ids)} itens (circuit breaker): {e}")
+        return 0
+
+
+def _adiar_por_circuito(itens: List[Dict[str, Any]], instancia: Optional[str] = None) -> None:
+    """Circuito aberto: devolve o lote inteiro e agenda reavaliação para quando a sonda puder sair."""
+    espera = max(POLL_SECONDS, circuito_segundos_ate_liberar(instancia))
+    n = _db_adiar_itens([it["id"] for it in itens], espera)
+    if n:
+        origem = f" [{instancia}]" if instancia else ""
+        log.warning(f"🔌 Circuit breaker aberto{origem}: {n} envio(s) adiados por {espera:.0f}s (sem gastar tentativa)")
+    _agendar_despertar(espera)
+
+
+def _adiar_por_bulkhead(itens: List[Dict[str, Any]]) -> None:
+    """Bulkhead da Z-API cheio: devolve os itens para a próxima volta do worker (sem gastar tentativa)."""
+    n = _db_adiar_itens([it["id"] for it in itens], POLL_SECONDS)
+    if n:
+        log.warning(f"🚧 Bulkhead da Z-API cheio: {n} envio(s) adiados por {POLL_SECONDS:.0f}s (sem gastar tentativa)")
+    _agendar_despertar(POLL_SECONDS)
+
+
+def _instancias_prontas(com_pacing: bool = False) -> Optional[List[str]]:
+    """
+    Instâncias que podem enviar agora: circuito liberado e, nas raias com
+    pacing, not-before da instância vencido. None = nenhuma instância
+    configurada (claim sem filtro, como antes do sharding).
+    """
+    agora = time.monotonic()
+    instancias = listar_instancias()
+    if not instancias:
+        if com_pacing and _pacing_liberado_em.get("default", 0.0) > agora:
+            return []
+        return None
+    return [
+        inst for inst in instancias
+        if circuito_segundos_ate_liberar(inst) == 0
+        and (not com_pacing or _pacing_liberado_em.get(inst, 0.0) <= agora)
+    ]
+
+
+def _proximo_pacing() -> Optional[float]:
+    """Segundos até a próxima instância sair do pacing (None se nenhuma está em pacing)."""
+    agora = time.monotonic()
+    restantes = [t - agora for t in _pacing_liberado_em.values() if t > agora]
+    return min(restantes) if restantes else None
+
+
+def _registrar_pacing(instancia: Optional[str], espera: float) -> None:
+    chave = instancia or "default"
+    _pacing_liberado_em[chave] = max(_pacing_liberado_em.get(chave, 0.0), time.monotonic() + espera)
+    _scheduler_metricas["pacing_total_sec"] += espera
+
+
+def _anti_spam_de(instancia: Optional[str]) -> Optional[AntiSpamController]:
+    """Controller anti-spam da instância (None antes do worker inicializar)."""
+    if not _anti_spam:
+        return None
+    chave = instancia or instancia_padrao() or "default"
+    controller = _anti_spam.get(chave)
+    if controller is None:
+        controller = _anti_spam.setdefault(chave, AntiSpamController(chave))
+    return controller
+
+
+def estimar_vazao_campanhas() -> float:
+    """
+    Envios de campanha por segundo somando as instâncias, pelo ritmo anti-spam de cada uma
+    (controller do worker deste processo, se existir; senão a configuração, sem slowdown).
+    """
+    total = 0.0
+    for instancia in (listar_instancias() or [None]):
+        controller = _anti_spam_de(instancia)
+        seg = controller.get_seconds_per_send() if controller else segundos_por_envio()
+        total += 1.0 / max(seg, 0.001)
+    return total
+
+
 # =========================
 # 🛡️ Anti-Spam: Verificação e Delay (com is_reply e is_manual)
 # =========================
 
-def _check_anti_spam_and_sleep(envio_id: int, numero: str, meta: Dict[str, Any]) -> Tuple[bool, str]:
+def _espera_do_motivo(motivo: str) -> float:
+    """Converte o motivo de bloqueio do anti-spam em segundos até reavaliar."""
+    m = re.search(r"aguarde (\d+)s", motivo or "")
+    if m:
+        return max(POLL_SECONDS, float(m.group(1)))
+    return float(PAUSA_REAVALIAR_SEC)
+
+
+def _check_anti_spam(
+    envio_id: int,
+    numero: str,
+    meta: Dict[str, Any],
+    instancia: Optional[str] = None,
+) -> Tuple[bool, str]:
     """
     Verifica anti-spam antes do envio.
     
@@ -510,20 +1145,22 @@ def _check_anti_spam_and_sleep(envio_id: int, numero: str, meta: Dict[str, Any])
         envio_id: ID do envio na fila
         numero: Número do destinatário
         meta: Metadados do envio (contém is_reply e tipo)
+        instancia: Instância Z-API do envio (limite diário e pacing são dela)
     
     Returns:
         Tuple[bool, str]: (pode_enviar, motivo)
         Se não puder e for reequeue, re-agenda o item e retorna False.
+        Não dorme: quem chama transforma a pausa em not-before da raia.
     """
-    global _anti_spam
-    if not _anti_spam:
+    anti_spam = _anti_spam_de(instancia)
+    if not anti_spam:
         return True, "ok"  # Fallback se controller não estiver inicializado
 
     is_reply = meta.get("is_reply", False)
     is_manual = meta.get("tipo") == "manual"  # ← NOVO: detectar envio manual (boas-vindas)
     
-    # ✅ Passa is_manual para o controller anti-spam
-    can_send, reason = _anti_spam.can_send_now(is_reply=is_reply, is_manual=is_manual)
+    # ✅ Reserva token diário/vaga de batch (devolvidos em register_send se o envio falhar)
+    can_send, reason = anti_spam.reservar_envio(is_reply=is_reply, is_manual=is_manual)
     
     if not can_send:
         if reason.startswith("reequeue:"):
@@ -537,8 +1174,7 @@ def _check_anti_spam_and_sleep(envio_id: int, numero: str, meta: Dict[str, Any])
             except Exception as e:
                 log.error(f"❌ Falha ao re-agendar envio_id={envio_id}: {e}")
         else:
-            log.info(f"⏸️ Aguardando anti-spam: {reason} | envio_id={envio_id} | reply={is_reply} | manual={is_manual}")
-            time.sleep(5)  # Pequena pausa antes de reavaliar
+            log.info(f"⏸️ Aguardando anti-spam [{anti_spam.instance_id}]: {reason} | envio_id={envio_id} | reply={is_reply} | manual={is_manual}")
     
     return can_send, reason
 
@@ -547,13 +1183,14 @@ def _check_anti_spam_and_sleep(envio_id: int, numero: str, meta: Dict[str, Any])
 # Pós-envio: campanha (confirma no CRM)
 # =========================
 
-def _pos_envio_sucesso(meta: Dict[str, Any], mensagem: str, numero_envio: str) -> None:
+def _efeitos_pos_envio_sucesso(meta: Dict[str, Any], mensagem: str, numero_envio: str) -> Dict[str, list]:
     """
-    Pós-envio confirmado (Z-API OK):
+    Pós-envio confirmado (Z-API OK), gravado no write-back em lote:
     - salva conversa como enviada
     - atualiza status/fase quando necessário
     - trata campanha e manual
     """
+    efeitos: Dict[str, list] = {}
     try:
         origem = meta.get("origem", "integra+")
         tipo = meta.get("tipo")  # ex.: "manual"
@@ -565,30 +1202,9 @@ def _pos_envio_sucesso(meta: Dict[str, Any], mensagem: str, numero_envio: str) -
         # ==========================================================
         if tipo == "manual":
             log.info(f"🎯 Pós-envio manual | tel_db={telefone_db} | origem={origem}")
-            
-            # salva conversa
-            try:
-                salvar_conversa(
-                    numero=telefone_db,
-                    mensagem=mensagem,
-                    tipo="enviada",
-                    sid=None,
-                    origem=origem
-                )
-                log.info(f"✅ salvar_conversa manual OK | tel={telefone_db}")
-            except Exception as e:
-                log.error(f"❌ salvar_conversa manual falhou: {e}")
-
-            # ✅ Atualiza status para INICIO
-            try:
-                log.info(f"🔄 Chamando database.atualizar_status('{telefone_db}', 'INICIO', origem='{origem}')")
-                resultado = database.atualizar_status(telefone_db, "INICIO", origem=origem)
-                log.info(f"✅ atualizar_status retornou: {resultado}")
-                
-            except Exception as e:
-                log.error(f"❌ atualizar_status(INICIO) manual falhou tel={telefone_db}: {e}", exc_info=True)
-
-            return  # manual resolvido
+            efeitos["conversas"] = [(telefone_db, mensagem, origem)]
+            efeitos["fases"] = [(telefone_db, "INICIO", origem)]
+            return efeitos  # manual resolvido
 
         # ==========================================================
         # 2) CAMPANHA: mantém comportamento atual
@@ -597,187 +1213,460 @@ def _pos_envio_sucesso(meta: Dict[str, Any], mensagem: str, numero_envio: str) -
         evento_nome = meta.get("evento")
 
         if visitante_id and evento_nome:
-            try:
-                salvar_conversa(
-                    numero=_normalizar_para_salvar_no_banco(numero_envio),
-                    mensagem=mensagem,
-                    tipo="enviada",
-                    sid=None,
-                    origem=origem
-                )
-            except Exception as e:
-                log.error(f"❌ salvar_conversa campanha falhou: {e}")
-
-            try:
-                database.atualizar_status_envio_evento(int(visitante_id), str(evento_nome), "enviado")
-            except Exception as e:
-                log.error(f"❌ atualizar_status_envio_evento(enviado) falhou: {e}")
+            efeitos["conversas"] = [(_normalizar_para_salvar_no_banco(numero_envio), mensagem, origem)]
+            efeitos["eventos"] = [(int(visitante_id), str(evento_nome), "enviado")]
 
     except Exception as e:
         log.error(f"❌ Pós-envio sucesso falhou: {e}", exc_info=True)
+    return efeitos
 
 
-def _pos_envio_falha_final(meta: Dict[str, Any]) -> None:
+def _efeitos_falha_final(meta: Dict[str, Any]) -> Dict[str, list]:
     """Marca eventos_envios como falha quando for falha final."""
+    visitante_id = meta.get("visitante_id")
+    evento_nome = meta.get("evento")
+    if not visitante_id or not evento_nome:
+        return {}
     try:
-        visitante_id = meta.get("visitante_id")
-        evento_nome = meta.get("evento")
-        if not visitante_id or not evento_nome:
-            return
-        database.atualizar_status_envio_evento(int(visitante_id), str(evento_nome), "falha")
-    except Exception as e:
+        return {"eventos": [(int(visitante_id), str(evento_nome), "falha")]}
+    except (TypeError, ValueError) as e:
         log.error(f"❌ Pós-envio falha final (campanha) falhou: {e}")
+        return {}
+
+
+# =========================
+# 🔔 Wakeup por evento
+# =========================
+
+def _sinalizar_local() -> None:
+    global _trabalho_sinalizado
+    with _sinal:
+        _trabalho_sinalizado = True
+        _sinal.notify_all()
+    for ouvinte in list(_ouvintes_sinal):
+        try:
+            ouvinte()
+        except Exception as e:
+            log.debug(f"🔕 Ouvinte de sinal falhou: {e}")
+
+
+def _aguardar_sinal(timeout: float) -> bool:
+    """
+    Bloqueia até chegar trabalho (sinal) ou estourar o timeout.
+    Retorna True se acordou por sinal.
+    """
+    global _trabalho_sinalizado
+    inicio = time.monotonic()
+    with _sinal:
+        acordou = _sinal.wait_for(lambda: _trabalho_sinalizado or not _worker_running, timeout=timeout)
+        _trabalho_sinalizado = False
+    _wakeup_metricas["segundos_ociosos"] += time.monotonic() - inicio
+    _wakeup_metricas["despertares_evento" if acordou else "despertares_timeout"] += 1
+    return bool(acordou)
+
+
+def _escutar_wakeup(sock: socket.socket) -> None:
+    while True:
+        try:
+            sock.recv(16)
+        except OSError:
+            return
+        _wakeup_metricas["sinais_recebidos"] += 1
+        _sinalizar_local()
+
+
+def _iniciar_listener_wakeup() -> None:
+    """Cada processo Gunicorn abre um socket Unix em WAKEUP_DIR/<pid>.sock."""
+    global _wakeup_sock, _wakeup_path
+    if not WAKEUP_ENABLED or not hasattr(socket, "AF_UNIX"):
+        return
+    path = os.path.join(WAKEUP_DIR, f"{os.getpid()}.sock")
+    if _wakeup_path == path:
+        return
+    try:
+        os.makedirs(WAKEUP_DIR, exist_ok=True)
+        if os.path.exists(path):
+            os.unlink(path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(path)
+    except OSError as e:
+        log.warning(f"⚠️ Wakeup entre processos indisponível ({e}); usando só polling adaptativo.")
+        return
+    _wakeup_sock, _wakeup_path = sock, path
+    threading.Thread(target=_escutar_wakeup, args=(sock,), name="fila-wakeup", daemon=True).start()
+    log.info(f"🔔 Wakeup da fila escutando em {path}")
+
+
+def _notificar_trabalho() -> None:
+    """Acorda o worker deste processo e os workers dos outros processos do host."""
+    _sinalizar_local()
+    if not WAKEUP_ENABLED or not hasattr(socket, "AF_UNIX"):
+        return
+    try:
+        nomes = [n for n in os.listdir(WAKEUP_DIR) if n.endswith(".sock")]
+    except OSError:
+        return
+    if not nomes:
+        return
+    try:
+        with closing(socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)) as sender:
+            sender.setblocking(False)
+            for nome in nomes:
+                path = os.path.join(WAKEUP_DIR, nome)
+                if path == _wakeup_path:
+                    continue
+                try:
+                    sender.sendto(b"1", path)
+                    _wakeup_metricas["sinais_enviados"] += 1
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # Processo que morreu deixou o socket para trás
+                    try:
+                        os.unlink(path)
+                    except OSError:
+                        pass
+                except BlockingIOError:
+                    pass  # buffer cheio = já existe sinal pendente lá
+    except OSError as e:
+        log.debug(f"🔕 Falha ao notificar outros processos: {e}")
 
 
 # =========================
 # Worker loop
 # =========================
 
-def _processar_fila_worker():
-    global _worker_running, _anti_spam
+def _processar_item(item: Dict[str, Any]) -> Optional[float]:
+    """
+    Processa um item reservado (consentimento, anti-spam, envio, pós-envio).
 
-    # 🛡️ Inicializa controller anti-spam
-    _anti_spam = AntiSpamController(os.getenv("ZAPI_INSTANCE"))
-    log.info(f"🛡️ AntiSpamController inicializado para instância: {_anti_spam.instance_id}")
+    Returns:
+        Segundos até a raia (ou, nas respostas, o número) poder enviar de novo
+        — pacing pós-envio ou pausa do anti-spam —, ou None se não há espera.
+    """
+    envio, espera = _preparar_envio(item)
+    if envio is None:
+        return espera
+
+    # 📤 ENVIO DA MENSAGEM
+    try:
+        res = enviar_mensagem(
+            envio["numero_envio"], envio["mensagem_envio"], envio["imagem_url"], instancia=envio["instancia"]
+        )
+    except Exception as e:
+        res = {"success": False, "erro": str(e)}
+    return _concluir_envio(envio, res)
+
+
+def _preparar_envio(item: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[float]]:
+    """
+    Etapas antes do POST (lease, número, consentimento, breaker, anti-spam).
+    Compartilhado pela engine de thread e pela engine asyncio.
+
+    Returns:
+        (envio, None) se o item deve ser enviado agora;
+        (None, espera) se não — espera é a pausa do anti-spam ou None.
+    """
+    envio_id = item["id"]
+    numero = item["numero"]
+    mensagem = item["mensagem"]
+    tentativas_atual = int(item.get("tentativas") or 0)
+
+    # 🔒 Lote pode ser longo (delays anti-spam): renova o lease item a item
+    if not _db_renovar_lease(envio_id):
+        log.warning(f"♻️ envio_id={envio_id} não pertence mais a este worker (lease vencido). Pulando.")
+        return None, None
+
+    meta = {}
+    try:
+        if item.get("meta_json"):
+            meta = json.loads(item["meta_json"]) if isinstance(item["meta_json"], str) else (item["meta_json"] or {})
+    except Exception:
+        meta = {}
+
+    # valida número
+    numero_envio = _normalizar_para_envio(numero)
+    if not numero_envio:
+        novo_status = _status_apos_falha(tentativas_atual + 1, 0, "numero_invalido")
+        _registrar_resultado(
+            envio_id, novo_status, 0, "numero_invalido", tentativas_atual + 1,
+            _efeitos_falha_final(meta) if novo_status == "falha" else None,
+        )
+        log.warning(f"⚠️ envio_id={envio_id} número inválido. status={novo_status}")
+        return None, None
+
+    # 🛡️ VERIFICAÇÃO DE CONSENTIMENTO para envios proativos
+    # ✅ BYPASS: Manuais (boas-vindas) NÃO passam por validação de consentimento
+    is_reply = meta.get("is_reply", False)
+    tipo_envio = meta.get("tipo", "bot")
+    is_manual = tipo_envio == "manual"
+    
+    # ✅ Manuais ignoram consentimento, mas proativos validam
+    if not is_manual and not is_reply and tipo_envio in ("campanha", "proativo", "bot"):
+        if not _pode_enviar_proativo(numero):
+            log.info(f"🚫 Consentimento não validado para proativo | envio_id={envio_id} | {numero}")
+            # Marca como falha suave (não conta como erro de reputação)
+            novo_status = _status_apos_falha(tentativas_atual + 1, 0, "consentimento_nao_validado")
+            _registrar_resultado(envio_id, novo_status, 0, "consentimento_nao_validado", tentativas_atual + 1)
+            return None, None
+
+    # 🔌 Circuit breaker da instância aberto: não reserva anti-spam nem gasta tentativa
+    instancia = _instancia_do_item(item)
+    if circuito_segundos_ate_liberar(instancia) > 0:
+        _adiar_por_circuito([item], instancia)
+        return None, None
+
+    # 🛡️ VERIFICAÇÃO ANTI-SPAM ANTES DO ENVIO (com is_reply e is_manual)
+    pode_enviar, motivo = _check_anti_spam(envio_id, numero, meta, instancia)
+    if not pode_enviar:
+        if motivo.startswith("reequeued:"):
+            return None, None  # Item re-agendado, pula para próximo
+        # Se foi apenas pausa, devolve o item para a fila e fecha a raia até a pausa acabar
+        _db_liberar_item(envio_id)
+        return None, _espera_do_motivo(motivo)
+
+    # ✨ APLICA VARIAÇÃO SUTIL na mensagem (apenas para proativos)
+    mensagem_para_envio = mensagem
+    if not is_reply and tipo_envio in ("manual", "campanha", "proativo"):
+        mensagem_para_envio = _variar_mensagem(mensagem, numero)
+        if mensagem_para_envio != mensagem:
+            log.debug(f"✨ Mensagem variada para {numero}: '{mensagem[:30]}...' → '{mensagem_para_envio[:30]}...'")
+
+    return {
+        "item": item,
+        "envio_id": envio_id,
+        "numero": numero,
+        "numero_envio": numero_envio,
+        "mensagem_envio": mensagem_para_envio,
+        "imagem_url": item.get("imagem_url"),
+        "tentativas": tentativas_atual,
+        "meta": meta,
+        "is_reply": is_reply,
+        "is_manual": is_manual,
+        "instancia": instancia,
+    }, None
+
+
+def _concluir_envio(envio: Dict[str, Any], last_res: Any) -> Optional[float]:
+    """Etapas depois do POST (anti-spam, marcação, pós-envio, callbacks). Retorna o pacing."""
+    item = envio["item"]
+    envio_id = envio["envio_id"]
+    numero = envio["numero"]
+    numero_envio = envio["numero_envio"]
+    mensagem_para_envio = envio["mensagem_envio"]
+    meta = envio["meta"]
+    is_reply = envio["is_reply"]
+    is_manual = envio["is_manual"]
+    instancia = envio.get("instancia")
+    anti_spam = _anti_spam_de(instancia)
+
+    if isinstance(last_res, dict) and last_res.get("circuit_open"):
+        # Breaker abriu entre a checagem e o envio: nada saiu, desfaz a reserva
+        if anti_spam:
+            anti_spam.cancelar_reserva(is_reply=is_reply, is_manual=is_manual)
+        _adiar_por_circuito([item], instancia)
+        return None
+
+    if isinstance(last_res, dict) and last_res.get("bulkhead_full"):
+        # Bulkhead cheio (envios simultâneos do processo): nada saiu, volta logo para a fila
+        if anti_spam:
+            anti_spam.cancelar_reserva(is_reply=is_reply, is_manual=is_manual)
+        _adiar_por_bulkhead([item])
+        return None
+
+    ok, last_err, last_code = _parse_result(last_res)
+
+    # 🛡️ REGISTRA RESULTADO NO CONTROLLER ANTI-SPAM (com is_reply e is_manual)
+    if anti_spam:
+        anti_spam.register_send(ok, is_reply=is_reply, is_manual=is_manual)  # ← Passa is_manual
+
+    msg_preview = (mensagem_para_envio or "").replace("\n", " ")[:60]
+    err_preview = (last_err or "").replace("\n", " ")[:180]
+
+    payload = {
+        "ok": ok,
+        "numero": numero,
+        "numero_envio": numero_envio,
+        "status_code": last_code,
+        "erro": last_err,
+        "mensagem": mensagem_para_envio,
+        "imagem_url": envio["imagem_url"],
+        "res": last_res,
+        "meta": meta,
+        "envio_id": envio_id,
+        "instance_id": instancia,
+    }
+
+    on_success = meta.get("_on_success_cb")
+    on_fail = meta.get("_on_fail_cb")
+
+    if ok:
+        _registrar_resultado(
+            envio_id, "enviado", last_code,
+            efeitos=_efeitos_pos_envio_sucesso(meta, mensagem_para_envio, numero_envio),
+        )
+        log.info(f"✅ Fila(DB) → {numero_envio} | {msg_preview}... | code={last_code} | envio_id={envio_id}")
+        _safe_call(on_success, payload)
+    else:
+        # ✅ PASSA O NÚMERO DA TENTATIVA PARA BACKOFF EXPONENCIAL
+        novo_status = _status_apos_falha(envio["tentativas"] + 1, last_code, last_err)
+        _registrar_resultado(
+            envio_id, novo_status, last_code, last_err, envio["tentativas"] + 1,
+            _efeitos_falha_final(meta) if novo_status == "falha" else None,
+        )
+        if novo_status == "pendente":
+            log.warning(f"🔁 Retry agendado → envio_id={envio_id} | {numero_envio} | code={last_code} | err={err_preview}")
+            _agendar_despertar(RETRY_SLEEP_SEG + WRITEBACK_SEC)
+        else:
+            log.error(f"❌ Falha final → envio_id={envio_id} | {numero_envio} | code={last_code} | err={err_preview}")
+            _safe_call(on_fail, payload)
+
+    # 🛡️ DELAY ALEATÓRIO PÓS-ENVIO (anti-spam com is_reply e is_manual)
+    if anti_spam:
+        delay = anti_spam.get_next_delay(is_reply=is_reply, is_manual=is_manual)  # ← Passa is_manual
+        # Pacing anti-spam só vale para as raias proativas; respostas mantêm o delay natural (1-3s)
+        if not is_reply:
+            delay = max(MIN_DELAY_SEG, min(MAX_DELAY_SEG, delay))
+        log.debug(f"😴 Delay aplicado: {delay:.1f}s (reply={is_reply}, manual={is_manual})")
+        return delay
+    return ENVIO_INTERVALO_SEG
+
+
+
+def _inicializar_worker() -> None:
+    """Setup comum às duas engines (dono do lease, controllers anti-spam, logs de config)."""
+    global _dono_lease, _dono_lease_pid
+    _dono_lease = f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"[:64]
+    _dono_lease_pid = os.getpid()
+
+    # 🛡️ Um controller anti-spam por instância: limite diário, batch e janela de erro são de cada remetente
+    for instancia in listar_instancias() or ["default"]:
+        _anti_spam[instancia] = AntiSpamController(instancia)
+        log.info(f"🛡️ AntiSpamController inicializado para instância: {instancia}")
+    _db_atribuir_instancias()
     
     # 🕐 Log do horário Brasil para debug
     agora_br = _get_hora_brasil()
     log.info(f"🕐 Worker iniciado | Horário Brasil: {agora_br.strftime('%H:%M %d/%m')} | UTC: {datetime.now(timezone.utc).strftime('%H:%M %d/%m')}")
     log.info(f"⚙️ Config: daily_limit={DAILY_LIMIT}, batch={BATCH_SEND_LIMIT}, delay=[{MIN_DELAY_SEG}s,{MAX_DELAY_SEG}s]")
 
+
+def _processar_fila_worker():
+    global _worker_running
+
+    _inicializar_worker()
     log.info("🧵 Worker DB-Queue iniciado.")
 
+    espera_ociosa = POLL_SECONDS
     while True:
         with _lock:
             if not _worker_running:
                 log.info("🛑 Worker DB-Queue finalizado (flag).")
+                _liberar_agenda()
+                _flush_resultados()
                 return
 
-        itens = _db_claim_batch(BATCH_SIZE)
-        if not itens:
-            time.sleep(POLL_SECONDS)
+        trabalhou = False
+        circuito_espera = circuito_segundos_ate_liberar()
+
+        if circuito_espera > 0:
+            # 🔌 Z-API degradada: não faz claim; itens já em memória voltam para o banco em bloco
+            while _agenda and _agenda[0][0] <= time.monotonic() and _agenda[0][2] is None:
+                heapq.heappop(_agenda)
+            adiados = [item for _, _, item in _agenda if item is not None]
+            if adiados:
+                _agenda[:] = [e for e in _agenda if e[2] is None]
+                heapq.heapify(_agenda)
+                _adiar_por_circuito(adiados)
+        else:
+            # 0) Itens adiados cujo not-before já passou
+            while _agenda and _agenda[0][0] <= time.monotonic():
+                _, _, item = heapq.heappop(_agenda)
+                _scheduler_metricas["despertares_timer"] += 1
+                if item is not None:
+                    _executar_item(item)
+                    trabalhou = True
+
+            # 1) Raia de respostas sempre primeiro (sem pacing de campanha), só das instâncias com circuito liberado
+            # Todas em half-open: só 1 item (a sonda); o resto espera o veredito
+            itens = _db_claim_batch(
+                1 if circuito_meio_aberto() else BATCH_SIZE, raia=RAIA_RESPOSTA, instancias=_instancias_prontas()
+            )
+            for i, item in enumerate(itens):
+                trabalhou = True
+                if circuito_segundos_ate_liberar() > 0:
+                    _adiar_por_circuito(itens[i:])
+                    break
+                _executar_ou_adiar(item)
+
+            # 2) Raias com pacing: 1 item por vez, só de instâncias cujo not-before do pacing já passou
+            prontas = _instancias_prontas(com_pacing=True)
+            if prontas is None or prontas:
+                itens = (_db_claim_batch(1, raia=RAIA_MANUAL, instancias=prontas)
+                         or _db_claim_batch(1, raia=RAIA_CAMPANHA, instancias=prontas))
+                for item in itens:
+                    trabalhou = True
+                    _executar_item(item)
+
+        if trabalhou:
+            espera_ociosa = POLL_SECONDS
             continue
 
-        for item in itens:
-            envio_id = item["id"]
-            numero = item["numero"]
-            mensagem = item["mensagem"]
-            imagem_url = item.get("imagem_url")
-            tentativas_atual = int(item.get("tentativas") or 0)
+        # 💤 Nada elegível: dorme até o próximo not-before, um sinal ou o backoff
+        _wakeup_metricas["polls_vazios"] += 1
+        timeout = espera_ociosa
+        if circuito_espera > 0:
+            timeout = min(timeout, circuito_espera)
+        if _agenda:
+            timeout = min(timeout, _agenda[0][0] - time.monotonic())
+        pacing_restante = _proximo_pacing()
+        if pacing_restante is not None:
+            timeout = min(timeout, pacing_restante)
+        if _aguardar_sinal(max(0.0, timeout)):
+            espera_ociosa = POLL_SECONDS
+        else:
+            espera_ociosa = min(espera_ociosa * 2, POLL_MAX_SECONDS)
 
-            meta = {}
-            try:
-                if item.get("meta_json"):
-                    meta = json.loads(item["meta_json"]) if isinstance(item["meta_json"], str) else (item["meta_json"] or {})
-            except Exception:
-                meta = {}
-
-            # valida número
-            numero_envio = _normalizar_para_envio(numero)
-            if not numero_envio:
-                novo_status = _db_mark_fail_or_retry(envio_id, tentativas_atual + 1, 0, "numero_invalido")
-                if novo_status == "falha":
-                    _pos_envio_falha_final(meta)
-                log.warning(f"⚠️ envio_id={envio_id} número inválido. status={novo_status}")
-                continue
-
-            # 🛡️ VERIFICAÇÃO DE CONSENTIMENTO para envios proativos
-            # ✅ BYPASS: Manuais (boas-vindas) NÃO passam por validação de consentimento
-            is_reply = meta.get("is_reply", False)
-            tipo_envio = meta.get("tipo", "bot")
-            is_manual = tipo_envio == "manual"
-            
-            # ✅ Manuais ignoram consentimento, mas proativos validam
-            if not is_manual and not is_reply and tipo_envio in ("campanha", "proativo", "bot"):
-                if not _pode_enviar_proativo(numero):
-                    log.info(f"🚫 Consentimento não validado para proativo | envio_id={envio_id} | {numero}")
-                    # Marca como falha suave (não conta como erro de reputação)
-                    _db_mark_fail_or_retry(envio_id, tentativas_atual + 1, 0, "consentimento_nao_validado")
-                    continue
 
-            # 🛡️ VERIFICAÇÃO ANTI-SPAM ANTES DO ENVIO (com is_reply e is_manual)
-            pode_enviar, motivo = _check_anti_spam_and_sleep(envio_id, numero, meta)
-            if not pode_enviar:
-                if motivo.startswith("reequeued:"):
-                    continue  # Item re-agendado, pula para próximo
-                # Se foi apenas pausa, continua o loop para reavaliar
-                continue
-
-            ok = False
-            last_err = ""
-            last_code = 0
-            last_res: Any = None
-
-            # ✨ APLICA VARIAÇÃO SUTIL na mensagem (apenas para proativos)
-            mensagem_para_envio = mensagem
-            if not is_reply and tipo_envio in ("manual", "campanha", "proativo"):
-                mensagem_para_envio = _variar_mensagem(mensagem, numero)
-                if mensagem_para_envio != mensagem:
-                    log.debug(f"✨ Mensagem variada para {numero}: '{mensagem[:30]}...' → '{mensagem_para_envio[:30]}...'")
-
-            # 📤 ENVIO DA MENSAGEM
-            try:
-                last_res = enviar_mensagem(numero_envio, mensagem_para_envio, imagem_url)
-                ok, last_err, last_code = _parse_result(last_res)
-            except Exception as e:
-                ok = False
-                last_err = str(e)
-                last_code = 0
-                last_res = None
-
-            # 🛡️ REGISTRA RESULTADO NO CONTROLLER ANTI-SPAM (com is_reply e is_manual)
-            if _anti_spam:
-                _anti_spam.register_send(ok, is_reply=is_reply, is_manual=is_manual)  # ← Passa is_manual
-
-            msg_preview = (mensagem_para_envio or "").replace("\n", " ")[:60]
-            err_preview = (last_err or "").replace("\n", " ")[:180]
-
-            payload = {
-                "ok": ok,
-                "numero": numero,
-                "numero_envio": numero_envio,
-                "status_code": last_code,
-                "erro": last_err,
-                "mensagem": mensagem_para_envio,
-                "imagem_url": imagem_url,
-                "res": last_res,
-                "meta": meta,
-                "envio_id": envio_id
-            }
-
-            on_success = meta.get("_on_success_cb")
-            on_fail = meta.get("_on_fail_cb")
-
-            if ok:
-                _db_mark_success(envio_id, last_code)
-                _pos_envio_sucesso(meta, mensagem_para_envio, numero_envio)
-                log.info(f"✅ Fila(DB) → {numero_envio} | {msg_preview}... | code={last_code} | envio_id={envio_id}")
-                _safe_call(on_success, payload)
-            else:
-                # ✅ PASSA O NÚMERO DA TENTATIVA PARA BACKOFF EXPONENCIAL
-                novo_status = _db_mark_fail_or_retry(
-                    envio_id, 
-                    tentativas_atual + 1, 
-                    last_code, 
-                    last_err
-                )
-                if novo_status == "pendente":
-                    log.warning(f"🔁 Retry agendado → envio_id={envio_id} | {numero_envio} | code={last_code} | err={err_preview}")
-                    time.sleep(RETRY_SLEEP_SEG)
-                else:
-                    _pos_envio_falha_final(meta)
-                    log.error(f"❌ Falha final → envio_id={envio_id} | {numero_envio} | code={last_code} | err={err_preview}")
-                    _safe_call(on_fail, payload)
-
-            # 🛡️ DELAY ALEATÓRIO PÓS-ENVIO (anti-spam com is_reply e is_manual)
-            if _anti_spam:
-                delay = _anti_spam.get_next_delay(is_reply=is_reply, is_manual=is_manual)  # ← Passa is_manual
-                # Garante que delay esteja dentro dos limites configurados
-                delay = max(MIN_DELAY_SEG, min(MAX_DELAY_SEG, delay))
-                log.debug(f"😴 Delay aplicado: {delay:.1f}s (reply={is_reply}, manual={is_manual})")
-                time.sleep(delay)
-            else:
-                time.sleep(ENVIO_INTERVALO_SEG)
+def _agendar_despertar(segundos: float) -> None:
+    """Garante que o worker reavalie a fila daqui a `segundos` (ex.: retry no banco)."""
+    with _agenda_lock:
+        heapq.heappush(_agenda, (time.monotonic() + segundos, next(_agenda_seq), None))
+
+
+def _executar_ou_adiar(item: Dict[str, Any]) -> None:
+    """Respostas: respeita o delay natural por número sem travar as outras conversas."""
+    liberado_em = _resposta_liberada_em.get(item.get("numero") or "", 0.0)
+    if liberado_em > time.monotonic():
+        heapq.heappush(_agenda, (liberado_em, next(_agenda_seq), item))
+        _scheduler_metricas["adiados"] += 1
+        return
+    _executar_item(item)
+
+
+def _executar_item(item: Dict[str, Any]) -> None:
+    """Processa o item e converte a espera devolvida em not-before da instância/número."""
+    espera = _processar_item(item)
+    if not espera:
+        return
+
+    agora = time.monotonic()
+    raia = item.get("prioridade")
+    raia = RAIA_CAMPANHA if raia is None else int(raia)
+    if raia == RAIA_RESPOSTA:
+        _resposta_liberada_em[item.get("numero") or ""] = agora + espera
+        if len(_resposta_liberada_em) > 1000:
+            for numero, t in list(_resposta_liberada_em.items()):
+                if t <= agora:
+                    del _resposta_liberada_em[numero]
+    else:
+        _registrar_pacing(_instancia_do_item(item), espera)
+
+
+def _liberar_agenda() -> None:
+    """Ao parar o worker, devolve para a fila os itens que estavam adiados no heap."""
+    while _agenda:
+        _, _, item = heapq.heappop(_agenda)
+        if item is not None:
+            _db_liberar_item(item["id"])
 
 
 def iniciar_worker() -> None:
@@ -786,15 +1675,26 @@ def iniciar_worker() -> None:
         if _worker_thread and _worker_thread.is_alive():
             return
         _worker_running = True
-        _worker_thread = threading.Thread(target=_processar_fila_worker, daemon=True)
+        _iniciar_listener_wakeup()
+        _iniciar_writeback()
+        iniciar_prober_status()
+        alvo = _processar_fila_worker
+        if FILA_ENGINE == "async":
+            from servicos.fila_async import AIOHTTP_DISPONIVEL, rodar_engine_async
+            if AIOHTTP_DISPONIVEL:
+                alvo = rodar_engine_async
+            else:
+                log.warning("⚠️ FILA_ENGINE=async sem aiohttp instalado; usando engine de thread.")
+        _worker_thread = threading.Thread(target=alvo, daemon=True)
         _worker_thread.start()
-        log.info("🚀 Worker DB-Queue ligado.")
+        log.info(f"🚀 Worker DB-Queue ligado (engine={'async' if alvo is not _processar_fila_worker else 'thread'}).")
 
 
 def parar_worker() -> None:
     global _worker_running
     with _lock:
         _worker_running = False
+    _sinalizar_local()
 
 
 # =========================
@@ -833,7 +1733,7 @@ def adicionar_na_fila(
         if not ok:
             return False
 
-        iniciar_worker()
+        notificar_fila()
         return True
 
     except Exception as e:
@@ -841,6 +1741,48 @@ def adicionar_na_fila(
         return False
 
 
+def adicionar_lote_na_fila(cursor, itens: List[Tuple[str, str, Optional[str], Dict[str, Any]]]) -> List[bool]:
+    """
+    Enfileira vários itens com INSERT multi-linha no cursor de quem chama, para entrar na
+    mesma transação dos registros do chamador (ex.: eventos_envios de uma campanha).
+    Quem chama faz o commit e depois chama notificar_fila().
+
+    Args:
+        itens: (numero, mensagem, imagem_url, meta), como em adicionar_na_fila
+
+    Returns:
+        Lista alinhada com itens: False para número inválido (não enfileirado)
+    """
+    gravados: List[bool] = []
+    linhas = []
+    for numero, mensagem, imagem_url, meta in itens:
+        numero_envio = _normalizar_para_envio(numero)
+        gravados.append(bool(numero_envio))
+        if not numero_envio:
+            log.warning(f"⚠️ Número inválido no lote da fila: {numero!r}")
+            continue
+        meta = meta or {}
+        linhas.append((numero_envio, mensagem, imagem_url, json.dumps(meta, ensure_ascii=False),
+                       _raia_do_meta(meta), _instancia_do_envio(numero_envio, meta)))
+
+    for i in range(0, len(linhas), 500):
+        bloco = linhas[i:i + 500]
+        valores = ", ".join(["(%s, %s, %s, 'pendente', 0, %s, %s, %s)"] * len(bloco))
+        cursor.execute(f"""
+            INSERT INTO fila_envios (numero, mensagem, imagem_url, status, tentativas, meta_json, prioridade, instance_id)
+            VALUES {valores}
+        """, tuple(v for linha in bloco for v in linha))
+    if linhas:
+        log.info(f"📥 {len(linhas)} item(ns) enfileirado(s) em lote.")
+    return gravados
+
+
+def notificar_fila() -> None:
+    """Garante o worker rodando e acorda os workers para itens recém-gravados."""
+    iniciar_worker()
+    _notificar_trabalho()
+
+
 # ✅ Alias para compatibilidade
 enviar_mensagem_para_fila = adicionar_na_fila
 
@@ -849,12 +1791,134 @@ enviar_mensagem_para_fila = adicionar_na_fila
 # 🛠️ Utilitários de Monitoramento
 # =========================
 
+def _percentil(valores: List[float], p: float) -> float:
+    """Percentil por nearest-rank (valores já ordenados)."""
+    if not valores:
+        return 0.0
+    idx = max(0, min(len(valores) - 1, math.ceil(p / 100.0 * len(valores)) - 1))
+    return valores[idx]
+
+
+def _nome_raia(prioridade: Any) -> str:
+    """Nome da raia para as métricas (prioridade 0 é a raia de respostas, não "vazio")."""
+    raia = RAIA_CAMPANHA if prioridade is None else int(prioridade)
+    return NOMES_RAIAS.get(raia, "campaign")
+
+
+def _stats_raias(cur) -> Dict[str, Any]:
+    """
+    Espera na fila por raia (últimas 24h): tempo entre ficar elegível
+    (created_at ou scheduled_for) e ser reservado pelo worker.
+    """
+    raias: Dict[str, Any] = {
+        nome: {"pending": 0, "claimed_24h": 0, "wait_p50_sec": 0.0, "wait_p95_sec": 0.0}
+        for nome in NOMES_RAIAS.values()
+    }
+    try:
+        cur.execute("""
+            SELECT prioridade, COUNT(*) AS pendentes
+            FROM fila_envios
+            WHERE status = 'pendente'
+            GROUP BY prioridade
+        """)
+        for row in cur.fetchall() or []:
+            nome = _nome_raia(row.get("prioridade"))
+            raias[nome]["pending"] += int(row.get("pendentes") or 0)
+
+        cur.execute("""
+            SELECT prioridade,
+                   TIMESTAMPDIFF(SECOND, GREATEST(created_at, COALESCE(scheduled_for, created_at)), claimed_at) AS espera_sec
+            FROM fila_envios
+            WHERE claimed_at >= NOW() - INTERVAL 1 DAY
+            ORDER BY claimed_at DESC
+            LIMIT 5000
+        """)
+        esperas: Dict[str, List[float]] = {nome: [] for nome in NOMES_RAIAS.values()}
+        for row in cur.fetchall() or []:
+            nome = _nome_raia(row.get("prioridade"))
+            esperas[nome].append(max(0.0, float(row.get("espera_sec") or 0)))
+
+        for nome, valores in esperas.items():
+            valores.sort()
+            raias[nome]["claimed_24h"] = len(valores)
+            raias[nome]["wait_p50_sec"] = round(_percentil(valores, 50), 1)
+            raias[nome]["wait_p95_sec"] = round(_percentil(valores, 95), 1)
+    except Exception as e:
+        log.error(f"❌ Erro ao calcular stats por raia: {e}")
+    return raias
+
+
+def _stats_wakeup() -> Dict[str, Any]:
+    """Polls evitados pelo wakeup por evento (deste processo)."""
+    m = dict(_wakeup_metricas)
+    polls_equivalentes = int(m["segundos_ociosos"] / POLL_SECONDS) if POLL_SECONDS > 0 else 0
+    return {
+        "enabled": WAKEUP_ENABLED and _wakeup_path is not None,
+        "idle_polls": m["polls_vazios"],
+        "idle_polls_fixed_interval_est": polls_equivalentes,
+        "idle_polls_saved": max(0, polls_equivalentes - m["polls_vazios"]),
+        "wakeups_event": m["despertares_evento"],
+        "wakeups_timeout": m["despertares_timeout"],
+        "signals_sent": m["sinais_enviados"],
+        "signals_received": m["sinais_recebidos"],
+        "idle_seconds": round(m["segundos_ociosos"], 1),
+        "poll_range_sec": [POLL_SECONDS, POLL_MAX_SECONDS],
+    }
+
+
+def _stats_scheduler() -> Dict[str, Any]:
+    """Estado do scheduler de pacing (deste processo)."""
+    agora = time.monotonic()
+    return {
+        "heap_size": len(_agenda),
+        "deferred_items": sum(1 for _, _, item in list(_agenda) if item is not None),
+        "deferred_total": _scheduler_metricas["adiados"],
+        "timer_wakeups": _scheduler_metricas["despertares_timer"],
+        "pacing_remaining_sec": round(_proximo_pacing() or 0.0, 1),
+        "pacing_by_instance": {
+            inst: round(max(0.0, t - agora), 1) for inst, t in list(_pacing_liberado_em.items())
+        },
+        "pacing_non_blocking_sec": round(_scheduler_metricas["pacing_total_sec"], 1),
+        "circuit_deferred_total": _scheduler_metricas["adiados_circuito"],
+    }
+
+
+def _stats_writeback() -> Dict[str, Any]:
+    """Write-back em lote dos resultados (deste processo)."""
+    m = dict(_writeback_metricas)
+    with _resultados_lock:
+        pendentes = len(_resultados)
+    return {
+        "interval_sec": WRITEBACK_SEC,
+        "batch_size": WRITEBACK_LOTE,
+        "pending": pendentes,
+        "flushes": m["flushes"],
+        "items": m["itens"],
+        "avg_batch": round(m["itens"] / m["flushes"], 1) if m["flushes"] else 0.0,
+        "max_batch": m["maior_lote"],
+        "skipped_not_owner": m["ignorados"],
+        "errors": m["erros"],
+        "post_send_errors": m["erros_pos_envio"],
+    }
+
+
 def get_queue_anti_spam_stats() -> dict:
     """Retorna stats da fila + anti-spam para dashboard."""
-    global _anti_spam
-    stats = {}
+    stats = {
+        "wakeup": _stats_wakeup(),
+        "scheduler": _stats_scheduler(),
+        "circuit": obter_estado_circuito(),
+        "writeback": _stats_writeback(),
+    }
+    if FILA_ENGINE == "async":
+        from servicos.fila_async import obter_metricas_engine
+        stats["engine"] = obter_metricas_engine()
     if _anti_spam:
-        stats["anti_spam"] = _anti_spam.get_daily_stats()
+        # Topo: instância padrão (formato antigo); todas em "instances"
+        por_instancia = {inst: ctrl.get_daily_stats() for inst, ctrl in list(_anti_spam.items())}
+        padrao = _anti_spam_de(None)
+        stats["anti_spam"] = por_instancia.get(padrao.instance_id) if padrao else None
+        stats["instances"] = {inst: {"anti_spam": st} for inst, st in por_instancia.items()}
     
     try:
         with closing(get_db_connection()) as conn:
@@ -883,6 +1947,18 @@ def get_queue_anti_spam_stats() -> dict:
                     "failed": row.get("failed", 0),
                     "consent_blocked": row.get("consent_blocked", 0),
                 }
+
+                stats["lanes"] = _stats_raias(cur)
+
+                cur.execute("""
+                    SELECT instance_id, COUNT(*) AS pendentes
+                    FROM fila_envios
+                    WHERE status = 'pendente'
+                    GROUP BY instance_id
+                """)
+                for row in cur.fetchall() or []:
+                    inst = row.get("instance_id") or "unassigned"
+                    stats.setdefault("instances", {}).setdefault(inst, {})["pending"] = int(row.get("pendentes") or 0)
     except Exception as e:
         log.error(f"❌ Erro ao buscar stats da fila: {e}")
         # Fallback seguro
@@ -3,6 +3,7 @@ import unicodedata
 from database import salvar_conversa, atualizar_status
 from servicos.fila_mensagens import adicionar_na_fila
 from constantes import EstadoVisitante, palavras_chave_ministerios
+from servicos.detector_intencoes import AGRADECIMENTO, MINISTERIO, SAUDACAO, intencoes_por_nome
 
 # ------------------------
 # Utilitários de texto
@@ -19,21 +20,11 @@ def normalizar_texto(texto: str) -> str:
 # Detectores
 # ------------------------
 def detectar_saudacao(texto: str) -> bool:
-    saudacoes = [
-        "ola", "oi", "bom dia", "boa tarde", "boa noite", "eae", "e aí",
-        "saudacoes", "a paz do senhor", "a paz de cristo", "paz"
-    ]
-    texto_normalizado = normalizar_texto(texto)
-    return any(s in texto_normalizado for s in saudacoes)
+    return SAUDACAO in intencoes_por_nome(texto)
 
 
 def detectar_agradecimento(texto: str) -> bool:
-    palavras_agradecimento = [
-        "obrigado", "obrigada", "grato", "grata", "agradecido", "agradecida",
-        "muito obrigado", "muito obrigada", "amem", "amém", "aleluia", "gloria a deus"
-    ]
-    texto_normalizado = normalizar_texto(texto)
-    return any(p in texto_normalizado for p in palavras_agradecimento)
+    return AGRADECIMENTO in intencoes_por_nome(texto)
 
 
 def detectar_palavra_chave_ministerio(texto_recebido: str):
@@ -41,11 +32,8 @@ def detectar_palavra_chave_ministerio(texto_recebido: str):
     Detecta se a mensagem contém alguma palavra-chave ligada a ministérios.
     Retorna a resposta configurada em 'constantes.palavras_chave_ministerios'.
     """
-    texto_recebido = normalizar_texto(texto_recebido).replace('ç', 'c')
-    for palavra, resposta in palavras_chave_ministerios.items():
-        if palavra in texto_recebido or palavra.rstrip('s') in texto_recebido:
-            return resposta
-    return None
+    ministerio = intencoes_por_nome(texto_recebido).get(MINISTERIO)
+    return palavras_chave_ministerios[ministerio.valor] if ministerio else None
 
 # ------------------------
 # Processadores
@@ -1,11 +1,11 @@
 import logging
 from datetime import datetime
-from database import normalizar_para_envio
-from servicos.zapi_cliente import enviar_mensagem
+from servicos.fila_mensagens import adicionar_na_fila, TIPO_INTERNO
 
 def enviar_pedido_oracao(lista_intercessores: list, nome_visitante: str, numero_visitante: str, texto_recebido: str):
     """
     Envia um pedido de oração para todos os intercessores cadastrados.
+    Vai pela fila de envios: com a Z-API ocupada ou fora, o pedido é adiado, não perdido.
     """
     mensagem = (
         f"📖 Pedido de Oração\n\n"
@@ -17,8 +17,7 @@ def enviar_pedido_oracao(lista_intercessores: list, nome_visitante: str, numero_
 
     for numero in lista_intercessores:
         try:
-            numero_normalizado_oracao = normalizar_para_envio(numero)
-            enviar_mensagem(numero_normalizado_oracao, mensagem)
+            if not adicionar_na_fila(numero, mensagem, meta={"tipo": TIPO_INTERNO, "origem": "pedido_oracao"}):
+                logging.error(f"Erro ao enfileirar pedido de oração para {numero}")
         except Exception as e:
             logging.error(f"Erro ao enviar pedido de oração para {numero}: {e}")
-
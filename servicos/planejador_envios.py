@@ -0,0 +1,271 @@
+# ==============================================
+# servicos/planejador_envios.py
+# ==============================================
+# 📅 Planejador de capacidade de envio (campanhas)
+# Simula as regras do AntiSpamController sobre o backlog da fila_envios sem dormir:
+# - delay médio entre mensagens, batches de BATCH_SEND_LIMIT com pausa entre inícios
+# - horário comercial e limite diário por instância (descontando o que já saiu hoje)
+# O instante de conclusão de cada posição da fila é calculado em lote (numpy),
+# então projetar milhares de itens custa uma query + aritmética vetorizada.
+# Valores médios: delays/pausas reais são aleatórios e respostas também gastam o limite diário.
+# ==============================================
+
+import logging
+from contextlib import closing
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+import database
+from database import get_db_connection
+from servicos.anti_spam_controller import parametros_pacing
+from servicos.fila_mensagens import RAIA_MANUAL, avaliar_consentimento_em_lote
+from servicos.zapi_cliente import listar_instancias, instancia_padrao
+
+log = logging.getLogger(__name__)
+
+DIA_SEG = 86400.0
+
+
+# =========================
+# Estado de cada instância
+# =========================
+def _chave_instancia(instancia: Optional[str]) -> str:
+    """Mesma chave do AntiSpamController da fila (fila_rate_limit.instance_id)."""
+    return instancia or instancia_padrao() or "default"
+
+
+def _estados_instancias(cur, agora: datetime) -> Dict[str, Dict[str, Any]]:
+    """Uso de hoje (fila_rate_limit) + regras de pacing de cada instância configurada."""
+    chaves = [_chave_instancia(i) for i in (listar_instancias() or [None])]
+    cur.execute(f"""
+        SELECT instance_id, total_sent, messages_in_current_batch, last_batch_pause_at, slowdown_active
+        FROM fila_rate_limit
+        WHERE date = %s AND instance_id IN ({",".join(["%s"] * len(chaves))})
+    """, (agora.date().isoformat(), *chaves))
+    linhas = {r["instance_id"]: r for r in cur.fetchall() or []}
+
+    estados = {}
+    for chave in chaves:
+        row = linhas.get(chave) or {}
+        pacing = parametros_pacing(bool(row.get("slowdown_active")))
+        estados[chave] = {
+            **pacing,
+            "sent_today": int(row.get("total_sent") or 0),
+            "in_batch": int(row.get("messages_in_current_batch") or 0),
+            "batch_started_at": row.get("last_batch_pause_at"),
+            "slowdown_active": bool(row.get("slowdown_active")),
+        }
+    return estados
+
+
+def _slots_na_janela(segundos: float, p: Dict[str, Any]) -> int:
+    """Quantas mensagens cabem numa janela: batches completos + o que cabe do último."""
+    if segundos <= 0:
+        return 0
+    ciclos = int(segundos // p["batch_cycle_sec"])
+    resto = segundos - ciclos * p["batch_cycle_sec"]
+    ultimo = min(p["batch_size"], int(np.ceil(resto / p["delay_sec"]))) if p["delay_sec"] > 0 else p["batch_size"]
+    return ciclos * p["batch_size"] + ultimo
+
+
+def _capacidade(estado: Dict[str, Any], agora: datetime) -> Dict[str, Any]:
+    """Janela de hoje (a partir de agora) e teto de um dia cheio para uma instância."""
+    inicio_hoje = agora.replace(hour=estado["business_start"], minute=0, second=0, microsecond=0)
+    fim_hoje = agora.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(hours=estado["business_end"])
+    janela_seg = (fim_hoje - inicio_hoje).total_seconds()
+
+    # Batch cheio: o próximo só começa quando a pausa desde o início dele vencer
+    base_hoje = max(agora, inicio_hoje)
+    iniciado = estado.get("batch_started_at")
+    if isinstance(iniciado, datetime) and estado["in_batch"] >= estado["batch_size"]:
+        base_hoje = max(base_hoje, iniciado + timedelta(seconds=estado["batch_cycle_sec"]))
+
+    limite = estado["daily_limit"]
+    slots_hoje = _slots_na_janela((fim_hoje - base_hoje).total_seconds(), estado)
+    slots_dia = _slots_na_janela(janela_seg, estado)
+    if limite > 0:
+        slots_hoje = min(slots_hoje, max(0, limite - estado["sent_today"]))
+        slots_dia = min(slots_dia, limite)
+    return {
+        "base_hoje": base_hoje,
+        "inicio_hoje": inicio_hoje,
+        "hoje": slots_hoje,
+        "dia": slots_dia,
+    }
+
+
+def _instantes(posicoes: np.ndarray, estado: Dict[str, Any], cap: Dict[str, Any]) -> np.ndarray:
+    """
+    Instante estimado (epoch) em que sai a mensagem de cada posição (0 = próxima) da fila
+    de uma instância. Vetorizado: dia de envio, posição no dia e batch saem de divisões inteiras.
+    """
+    if cap["dia"] <= 0:
+        return np.full(posicoes.shape, np.inf)
+    hoje = cap["hoje"]
+    depois = np.maximum(posicoes - hoje, 0)
+    dia = np.where(posicoes < hoje, 0, 1 + depois // cap["dia"])
+    no_dia = np.where(posicoes < hoje, posicoes, depois % cap["dia"])
+    base = np.where(
+        dia == 0,
+        cap["base_hoje"].timestamp(),
+        cap["inicio_hoje"].timestamp() + dia * DIA_SEG,
+    )
+    return (base
+            + (no_dia // estado["batch_size"]) * estado["batch_cycle_sec"]
+            + (no_dia % estado["batch_size"]) * estado["delay_sec"])
+
+
+def _iso(epoch: float) -> Optional[str]:
+    return datetime.fromtimestamp(epoch).isoformat(timespec="minutes") if np.isfinite(epoch) else None
+
+
+# =========================
+# API pública
+# =========================
+def planejar(novos_envios: int = 0, evento_novo: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Projeção do backlog de envios com pacing (raias manual + campanha) por instância e por campanha.
+
+    Args:
+        novos_envios: mensagens de uma campanha ainda não criada (prévia antes de confirmar);
+                      entram no fim da fila, divididas entre as instâncias
+        evento_novo: nome da campanha da prévia
+
+    Returns:
+        {"generated_at", "daily_ceiling", "instances", "campaigns", "new_campaign"} ou None sem banco
+    """
+    agora = datetime.now()
+    with closing(get_db_connection()) as conn:
+        if not conn:
+            return None
+        cur = conn.cursor()
+        estados = _estados_instancias(cur, agora)
+        cur.execute("""
+            SELECT instance_id, prioridade,
+                   JSON_UNQUOTE(JSON_EXTRACT(meta_json, '$.evento')) AS evento
+            FROM fila_envios
+            WHERE status IN ('pendente', 'processando') AND prioridade >= %s
+            ORDER BY prioridade ASC, created_at ASC
+        """, (RAIA_MANUAL,))
+        backlog = cur.fetchall() or []
+
+    # Fila de cada instância na ordem do claim (prioridade, created_at)
+    filas: Dict[str, List[str]] = {chave: [] for chave in estados}
+    for item in backlog:
+        chave = _chave_instancia(item.get("instance_id"))
+        rotulo = item.get("evento") or ("manual" if int(item.get("prioridade") or 0) == RAIA_MANUAL else "outros")
+        filas.setdefault(chave, []).append(rotulo)
+
+    # Prévia: audiência nova dividida entre as instâncias (roteamento por hash é ~uniforme)
+    novos_por_instancia: Dict[str, int] = {}
+    if novos_envios > 0:
+        base, extra = divmod(int(novos_envios), len(estados))
+        for i, chave in enumerate(estados):
+            novos_por_instancia[chave] = base + (1 if i < extra else 0)
+
+    instancias = []
+    fim_campanha: Dict[str, float] = {}
+    pendentes_campanha: Dict[str, int] = {}
+    fim_novo = 0.0
+    for chave, rotulos in filas.items():
+        estado = estados.get(chave) or {**parametros_pacing(), "sent_today": 0, "in_batch": 0, "batch_started_at": None}
+        cap = _capacidade(estado, agora)
+        novos = novos_por_instancia.get(chave, 0)
+        tempos = _instantes(np.arange(len(rotulos) + novos), estado, cap)
+
+        if rotulos:
+            nomes, inverso = np.unique(np.array(rotulos, dtype=object), return_inverse=True)
+            ultimos = np.full(len(nomes), -np.inf)
+            np.maximum.at(ultimos, inverso, tempos[:len(rotulos)])
+            contagem = np.bincount(inverso, minlength=len(nomes))
+            for nome, fim, n in zip(nomes, ultimos, contagem):
+                fim_campanha[nome] = max(fim_campanha.get(nome, -np.inf), fim)
+                pendentes_campanha[nome] = pendentes_campanha.get(nome, 0) + int(n)
+        if novos:
+            fim_novo = max(fim_novo, float(tempos[-1]))
+
+        instancias.append({
+            "instance_id": chave,
+            "backlog": len(rotulos),
+            "sent_today": estado["sent_today"],
+            "remaining_today": cap["hoje"],
+            "daily_ceiling": cap["dia"],
+            "slowdown_active": estado.get("slowdown_active", False),
+            "backlog_done_at": _iso(float(tempos[len(rotulos) - 1])) if rotulos else None,
+            "pacing": {
+                "delay_sec": round(estado["delay_sec"], 1),
+                "batch_size": estado["batch_size"],
+                "batch_cycle_sec": round(estado["batch_cycle_sec"], 1),
+                "business_hours": f"{estado['business_start']}h-{estado['business_end']}h",
+                "daily_limit": estado["daily_limit"] or None,
+            },
+        })
+
+    agora_ts = agora.timestamp()
+    campanhas = sorted(
+        (
+            {
+                "evento": nome,
+                "pending": pendentes_campanha[nome],
+                "completion_at": _iso(fim),
+                "eta_sec": int(max(0.0, fim - agora_ts)) if np.isfinite(fim) else None,
+            }
+            for nome, fim in fim_campanha.items()
+        ),
+        key=lambda c: (c["eta_sec"] is None, c["eta_sec"] or 0),
+    )
+
+    resultado = {
+        "generated_at": agora.isoformat(timespec="seconds"),
+        "daily_ceiling": sum(i["daily_ceiling"] for i in instancias),
+        "remaining_today": sum(i["remaining_today"] for i in instancias),
+        "backlog": len(backlog),
+        "instances": instancias,
+        "campaigns": campanhas,
+        "new_campaign": None,
+    }
+    if novos_envios > 0:
+        resultado["new_campaign"] = {
+            "evento": evento_novo,
+            "messages": int(novos_envios),
+            "completion_at": _iso(fim_novo),
+            "eta_sec": int(max(0.0, fim_novo - agora_ts)) if np.isfinite(fim_novo) else None,
+            "days": (
+                (datetime.fromtimestamp(fim_novo).date() - agora.date()).days + 1
+                if np.isfinite(fim_novo) else None
+            ),
+        }
+    return resultado
+
+
+def planejar_campanha(evento_nome: Optional[str] = None, filtros: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Prévia antes de confirmar o disparo: audiência, quantos passam no consentimento
+    e quando a campanha terminaria atrás do backlog atual.
+    """
+    with closing(get_db_connection()) as conn:
+        if not conn:
+            return None
+        cur = conn.cursor()
+        total, telefones = database.listar_telefones_audiencia_evento(cur, **(filtros or {}))
+        # Mesmo filtro (e mesma chave de telefone) do job de campanha e do worker
+        inelegiveis = avaliar_consentimento_em_lote(telefones, cur=cur)
+    if inelegiveis is None:
+        return None
+
+    motivos = [inelegiveis[t] for t in telefones if t in inelegiveis]   # por visitante
+    audiencia = {
+        "total": total,
+        "sem_telefone": total - len(telefones),
+        "bloqueio_recente": motivos.count("bloqueio_recente"),
+        "sem_engajamento_recente": motivos.count("sem_engajamento_recente"),
+        "elegiveis": len(telefones) - len(motivos),
+    }
+
+    plano = planejar(novos_envios=audiencia["elegiveis"], evento_novo=evento_nome)
+    if plano is None:
+        return None
+    plano["audience"] = audiencia
+    return plano
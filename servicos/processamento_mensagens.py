@@ -1,17 +1,16 @@
 import logging
-import re
-from database import salvar_conversa, atualizar_status, obter_estado_atual_do_banco, obter_nome_do_visitante, salvar_novo_visitante
+from database import VisitorContext, carregar_contexto_visitante, salvar_contexto_visitante
 from constantes import EstadoVisitante
 from utilitarios.texto import normalizar_texto
-from utilitarios.identificacao import obter_primeiro_nome
-from servicos.fila_mensagens import enviar_mensagem_para_fila
-from servicos.saudacoes import detectar_saudacao, processar_saudacao
-from servicos.agradecimentos import detectar_agradecimento, processar_agradecimento
+from servicos.fila_mensagens import adicionar_lote_na_fila, notificar_fila
+from servicos.saudacoes import processar_saudacao
+from servicos.agradecimentos import processar_agradecimento
 from servicos.atendimento_oracao import processar_pedido_oracao
 from servicos.atendimento_outros import processar_outro
 from servicos.atendimento_eventos import processar_evento_enviado
 from servicos.fluxo_transicoes import obter_proximo_estado, obter_mensagem_estado
-from servicos.detector_ministerio import detectar_palavra_chave_ministerio
+from servicos import detector_intencoes as intencao
+from constantes import palavras_chave_ministerios
 from ia_integracao import IAIntegracao
 
 # IA de apoio
@@ -30,12 +29,36 @@ def processar_mensagem(numero: str, texto_recebido: str, message_sid: str, acao_
     # Normalização
     numero_normalizado = numero.lstrip("55")  # 🔧 Corrige: banco só guarda número nacional
     texto_normalizado = normalizar_texto(texto_recebido)
-    
+
+    # 📦 Contexto do visitante: 1 leitura agora, 1 transação de escrita no final
+    contexto = carregar_contexto_visitante(numero_normalizado)
+
     # Salva mensagem recebida
-    salvar_conversa(numero_normalizado, texto_recebido, tipo="recebida", sid=message_sid, origem=origem)
+    contexto.registrar_conversa(texto_recebido, tipo="recebida", sid=message_sid, origem=origem)
+
+    try:
+        return _processar_com_contexto(contexto, texto_recebido, texto_normalizado, message_sid, origem, is_webhook_reply)
+    finally:
+        # 💾 Conversas/status/estatísticas e envios numa transação só: o worker já encontra a
+        # mensagem recebida (consentimento) e um retry do webhook não duplica nada.
+        # Sem gravar, nada foi feito: erro para a fila de entrada tentar de novo.
+        tinha_envios = bool(contexto.envios_pendentes)
+        if not salvar_contexto_visitante(contexto, gravar_envios=adicionar_lote_na_fila):
+            raise RuntimeError(f"falha ao gravar atendimento de {numero_normalizado} (sid={message_sid})")
+        if tinha_envios:
+            notificar_fila()
+
+
+def _processar_com_contexto(contexto: VisitorContext, texto_recebido: str, texto_normalizado: str,
+                            message_sid: str, origem: str, is_webhook_reply: bool) -> dict:
+    """
+    Aplica as regras de atendimento sobre o contexto já carregado.
+    Nenhuma escrita vai ao banco aqui: tudo fica pendente no contexto.
+    """
+    numero_normalizado = contexto.telefone
 
     # Estado atual do visitante
-    estado_str = obter_estado_atual_do_banco(numero_normalizado)
+    estado_str = contexto.fase
     estado_atual = EstadoVisitante[estado_str] if estado_str in EstadoVisitante.__members__ else EstadoVisitante.INICIO
 
     logging.debug(f"📊 Estado atual no banco: {estado_str} → {estado_atual.name}")
@@ -50,11 +73,14 @@ def processar_mensagem(numero: str, texto_recebido: str, message_sid: str, acao_
             "sid_origem": message_sid,
         }
 
+    # 🎯 Todas as intenções do texto numa passada (ranqueadas na ordem das checagens abaixo)
+    intencoes = intencao.intencoes_por_nome(texto_normalizado)
+
     # ========== Palavra-chave de ministério ==========
-    resposta_ministerio = detectar_palavra_chave_ministerio(texto_normalizado)
-    if resposta_ministerio:
-        enviar_mensagem_para_fila(numero_normalizado, resposta_ministerio, meta=_criar_meta())
-        salvar_conversa(numero_normalizado, resposta_ministerio, tipo="enviada", sid=message_sid, origem=origem)
+    if intencao.MINISTERIO in intencoes:
+        resposta_ministerio = palavras_chave_ministerios[intencoes[intencao.MINISTERIO].valor]
+        contexto.enfileirar(numero_normalizado, resposta_ministerio, meta=_criar_meta())
+        contexto.registrar_conversa(resposta_ministerio, tipo="enviada", sid=message_sid, origem=origem)
         return {
             "resposta": resposta_ministerio,
             "estado_atual": "MINISTERIO",
@@ -62,38 +88,36 @@ def processar_mensagem(numero: str, texto_recebido: str, message_sid: str, acao_
         }
 
     # ========== Agradecimento ==========
-    if detectar_agradecimento(texto_normalizado):
-        return processar_agradecimento(numero_normalizado, message_sid, origem)
+    if intencao.AGRADECIMENTO in intencoes:
+        return processar_agradecimento(contexto, message_sid, origem)
 
     # ========== Visitante novo ==========
     if not estado_str:
         resposta = ("Olá! Parece que você ainda não está cadastrado no nosso sistema. "
                     "Para começar, por favor, me diga o seu nome completo.")
-        atualizar_status(numero_normalizado, "PEDIR_NOME", origem=origem)
-        enviar_mensagem_para_fila(numero_normalizado, resposta, meta=_criar_meta())
-        salvar_conversa(numero_normalizado, resposta, tipo="enviada", sid=message_sid, origem=origem)
+        contexto.definir_fase("PEDIR_NOME", origem=origem)
+        contexto.enfileirar(numero_normalizado, resposta, meta=_criar_meta())
+        contexto.registrar_conversa(resposta, tipo="enviada", sid=message_sid, origem=origem)
         return {"resposta": resposta, "estado_atual": "NOVO", "proximo_estado": "PEDIR_NOME"}
 
     # ========== Saudação ==========
-    if detectar_saudacao(texto_normalizado):
-        return processar_saudacao(numero_normalizado, message_sid, origem)
+    if intencao.SAUDACAO in intencoes:
+        return processar_saudacao(contexto, message_sid, origem)
 
     # ========== Evento enviado ==========
     if estado_atual.name == "EVENTO_ENVIADO":
-        visitor_name = obter_nome_do_visitante(numero_normalizado).split()[0]
-        return processar_evento_enviado(numero_normalizado, visitor_name, message_sid, origem)
+        return processar_evento_enviado(contexto, message_sid, origem)
 
     # ========== Novo tratamento direto da opção 3 (Pedido de Oração) ==========
-    if texto_normalizado in ["3", "3.", "3️⃣", "pedido de oração", "pedido de oracao"]:
-        visitor_name = obter_nome_do_visitante(numero_normalizado).split()[0]
+    if intencao.PEDIDO_ORACAO in intencoes:
+        visitor_name = contexto.primeiro_nome
         texto_pedido_generico = "Pedido de oração solicitado pelo visitante."
         
         logging.info(f"🙏 Pedido de oração automático iniciado para {visitor_name} ({numero_normalizado})")
 
         # Processa automaticamente o pedido genérico
         return processar_pedido_oracao(
-            numero=numero_normalizado,
-            nome_visitante=visitor_name,
+            contexto=contexto,
             texto_recebido=texto_pedido_generico,
             message_sid=message_sid,
             origem=origem
@@ -101,13 +125,11 @@ def processar_mensagem(numero: str, texto_recebido: str, message_sid: str, acao_
 
     # ========== Pedido de oração (mensagem complementar) ==========
     if estado_atual == EstadoVisitante.PEDIDO_ORACAO:
-        visitor_name = obter_nome_do_visitante(numero_normalizado).split()[0]
-        return processar_pedido_oracao(numero_normalizado, visitor_name, texto_recebido, message_sid, origem)
+        return processar_pedido_oracao(contexto, texto_recebido, message_sid, origem)
 
     # ========== Outro assunto ==========
     if estado_atual == EstadoVisitante.OUTRO:
-        visitor_name = obter_nome_do_visitante(numero_normalizado).split()[0]
-        return processar_outro(numero_normalizado, visitor_name, texto_recebido, message_sid, origem)
+        return processar_outro(contexto, texto_recebido, message_sid, origem)
 
     # ==========================================================
     # 🔍 DETECÇÕES INTELIGENTES (ORDEM ESTRATÉGICA!)
@@ -115,68 +137,7 @@ def processar_mensagem(numero: str, texto_recebido: str, message_sid: str, acao_
     
     # 🎯 PRIORIDADE 1: Pastores (UNIFICADO: nomes + Instagram + contato secretaria)
     # ✅ Esta detecção cobre: "quem são os pastores", "falar com pastores", "agenda com pastores", etc.
-    def detectar_intencao_pastores_unificado(texto: str) -> bool:
-        """
-        Detecta qualquer intenção relacionada aos pastores:
-        - Quem são / nomes dos pastores
-        - Falar com / contato com pastores
-        - Agendar visita pastoral / marcar agenda
-        - WhatsApp / telefone dos pastores
-        - Secretaria / Wilson Martins (como canal de contato)
-        
-        ✅ Regex flexível para aceitar artigos e variações naturais.
-        """
-        texto = texto.lower().strip()
-        
-        padroes = [
-            # === QUEM SÃO OS PASTORES (informação) ===
-            r"quem (é|são|e|sao) (os |o |as |a )?pastores?",
-            r"quem (são|sao|é|e) (o |os |a |as )?pastor(es)?",
-            r"qual (é|e|são|sao) (o |os |a |as )?pastor(es)?",
-            r"quem é o pastor",
-            r"quem são os líderes",
-            r"pastores? da igreja",
-            r"nome dos pastores",
-            r"quem (são|sao) (os )?lideres?",
-            r"fundadores da igreja",
-            r"historia da igreja",
-            
-            # === CONTATO / FALAR COM PASTORES ===
-            r"falar (com|para) (o |a |os |as )?pastor(es)?",
-            r"contato (com|dos|do|da) (o |a |os |as )?pastor(es)?",
-            r"ligar (para|pros|pra) (o |a |os |as )?pastor(es)?",
-            r"whatsapp (dos|do|da) (o |a |os |as )?pastor(es)?",
-            r"numero (dos|do|da) (o |a |os |as )?pastor(es)?",
-            r"telefone (dos|do|da) (o |a |os |as )?pastor(es)?",
-            r"como falo com (os |as )?pastor(es)?",
-            r"como entro em contato com (os |as )?pastor(es)?",
-            
-            # === AGENDAR VISITA / MARCAR AGENDA ===
-            r"agenda (com|dos|do|da) (o |a |os |as )?pastor(es)?",
-            r"agendar (com|uma visita com) (o |a |os |as )?pastor",
-            r"marcar (com|uma visita com) (o |a |os |as )?pastor",
-            r"marcar.*agenda.*pastor",
-            r"quero.*falar.*pastor",
-            r"preciso.*contato.*pastor",
-            r"visita pastoral",
-            r"visita (dos|do|da) (o |a |os |as )?pastor(es)?",
-            r"receber visita pastoral",
-            r"visita dos pastores",
-            r"agendar.*pastor",
-            
-            # === SECRETARIA / WILSON (como canal de contato) ===
-            r"secretario wilson",
-            r"wilson martins",
-            r"falar com a secretaria",
-            r"contato da secretaria",
-            r"ligar para a secretaria",
-            r"whatsapp da secretaria",
-            r"secretaria da igreja",
-        ]
-        
-        return any(re.search(p, texto) for p in padroes)
-
-    if detectar_intencao_pastores_unificado(texto_normalizado):
+    if intencao.PASTORES in intencoes:
         # ✅ RESPOSTA UNIFICADA: Nomes + Instagram + Contato Secretaria
         resposta = (
             "Nossos pastores atuais são:\n"
@@ -189,8 +150,8 @@ def processar_mensagem(numero: str, texto_recebido: str, message_sid: str, acao_
             "👤 *Secretário Presbítero Wilson Martins*\n\n"
             "Estaremos felizes em atendê-lo! 🙏"
         )
-        enviar_mensagem_para_fila(numero_normalizado, resposta, meta=_criar_meta())
-        salvar_conversa(numero_normalizado, resposta, tipo="enviada", sid=message_sid, origem=origem)
+        contexto.enfileirar(numero_normalizado, resposta, meta=_criar_meta())
+        contexto.registrar_conversa(resposta, tipo="enviada", sid=message_sid, origem=origem)
         return {
             "resposta": resposta,
             "estado_atual": estado_atual.name,
@@ -198,35 +159,7 @@ def processar_mensagem(numero: str, texto_recebido: str, message_sid: str, acao_
         }
 
     # 🎯 PRIORIDADE 2: Horários de cultos / programação da igreja
-    def detectar_intencao_horarios_cultos(texto: str) -> bool:
-        """
-        Detecta perguntas sobre horários de cultos e programação da igreja.
-        ✅ Aceita variações naturais e perguntas indiretas.
-        """
-        texto = texto.lower().strip()
-        
-        padroes = [
-            r"horarios? (de )?cultos?",
-            r"horarios? (da )?igreja",
-            r"quando (temos|são|sao|é|e) (os )?cultos?",
-            r"qual (é|e) (o )?horario (do )?culto",
-            r"programa(ç|c)ao (da )?igreja",
-            r"programa(ç|c)ao dos cultos",
-            r"cultos? (quando|horario)",
-            r"que horas (é|e) (o )?culto",
-            r"que dia (temos|são|sao) cultos?",
-            r"agenda (da )?igreja",
-            r"calendario (da )?igreja",
-            r"eventos (da )?igreja",
-            r"o que tem hoje na igreja",
-            r"o que vai ter hoje",
-            r"tem culto hoje",
-            r"vai ter culto",
-        ]
-        
-        return any(re.search(p, texto) for p in padroes)
-
-    if detectar_intencao_horarios_cultos(texto_normalizado):
+    if intencao.HORARIOS_CULTOS in intencoes:
         resposta = (
             "*Seguem nossos horários de cultos:*\n\n"
             "🌅 *Domingo*\n"
@@ -237,8 +170,8 @@ def processar_mensagem(numero: str, texto_recebido: str, message_sid: str, acao_
             "📍 *Local:* Rua das Flores, 123 - Canasvieiras\n\n"
             "Estamos esperando por você! 🙏"
         )
-        enviar_mensagem_para_fila(numero_normalizado, resposta, meta=_criar_meta())
-        salvar_conversa(numero_normalizado, resposta, tipo="enviada", sid=message_sid, origem=origem)
+        contexto.enfileirar(numero_normalizado, resposta, meta=_criar_meta())
+        contexto.registrar_conversa(resposta, tipo="enviada", sid=message_sid, origem=origem)
         return {
             "resposta": resposta,
             "estado_atual": estado_atual.name,
@@ -246,29 +179,7 @@ def processar_mensagem(numero: str, texto_recebido: str, message_sid: str, acao_
         }
 
     # 🎯 PRIORIDADE 3: Grupos de WhatsApp / GC
-    def detectar_intencao_grupo_whatsapp(texto: str) -> bool:
-        """
-        Detecta interesse em entrar em grupos de WhatsApp ou GC.
-        """
-        texto = texto.lower().strip()
-        
-        padroes = [
-            r"grupo (do )?whatsapp",
-            r"entrar (no )?grupo",
-            r"participar (do )?grupo",
-            r"gc",
-            r"grupo de comunh[aã]o",
-            r"grupos? da igreja",
-            r"como entro no grupo",
-            r"link (do )?grupo",
-            r"quero estar no grupo",
-            r"me add no grupo",
-            r"grupo do whatsapp",
-        ]
-        
-        return any(re.search(p, texto) for p in padroes)
-
-    if detectar_intencao_grupo_whatsapp(texto_normalizado):
+    if intencao.GRUPO_WHATSAPP in intencoes:
         resposta = (
             "*Grupos de Comunhão (GC)* - _Pequenos encontros semanais nos lares!_\n\n"
             "Para entrar em um GC próximo a você:\n"
@@ -277,8 +188,8 @@ def processar_mensagem(numero: str, texto_recebido: str, message_sid: str, acao_
             "Ou fale diretamente com nossa secretaria: *(48) 99828-4104*\n\n"
             "Queremos caminhar com você! 🙏"
         )
-        enviar_mensagem_para_fila(numero_normalizado, resposta, meta=_criar_meta())
-        salvar_conversa(numero_normalizado, resposta, tipo="enviada", sid=message_sid, origem=origem)
+        contexto.enfileirar(numero_normalizado, resposta, meta=_criar_meta())
+        contexto.registrar_conversa(resposta, tipo="enviada", sid=message_sid, origem=origem)
         return {
             "resposta": resposta,
             "estado_atual": estado_atual.name,
@@ -286,31 +197,7 @@ def processar_mensagem(numero: str, texto_recebido: str, message_sid: str, acao_
         }
 
     # 🎯 PRIORIDADE 4: Batismo / Tornar-se membro
-    def detectar_intencao_batismo_membro(texto: str) -> bool:
-        """
-        Detecta interesse em batismo ou tornar-se membro.
-        """
-        texto = texto.lower().strip()
-        
-        padroes = [
-            r"batismo",
-            r"batizar",
-            r"mergulho",
-            r"imersão",
-            r"tornar membro",
-            r"virar membro",
-            r"ser membro",
-            r"membership",
-            r"como me tornar membro",
-            r"quero ser membro",
-            r"membro da igreja",
-            r"o que preciso para ser membro",
-            r"requisitos para membro",
-        ]
-        
-        return any(re.search(p, texto) for p in padroes)
-
-    if detectar_intencao_batismo_membro(texto_normalizado):
+    if intencao.BATISMO_MEMBRO in intencoes:
         resposta = (
             "*Que bom que você deseja caminhar conosco!* 🙏\n\n"
             "Para se tornar membro da Mais de Cristo Canasvieiras:\n\n"
@@ -322,8 +209,8 @@ def processar_mensagem(numero: str, texto_recebido: str, message_sid: str, acao_
             "• Digite *2* se ainda não foi batizado\n\n"
             "Ou fale com nossa secretaria: *(48) 99828-4104*"
         )
-        enviar_mensagem_para_fila(numero_normalizado, resposta, meta=_criar_meta())
-        salvar_conversa(numero_normalizado, resposta, tipo="enviada", sid=message_sid, origem=origem)
+        contexto.enfileirar(numero_normalizado, resposta, meta=_criar_meta())
+        contexto.registrar_conversa(resposta, tipo="enviada", sid=message_sid, origem=origem)
         return {
             "resposta": resposta,
             "estado_atual": estado_atual.name,
@@ -331,28 +218,7 @@ def processar_mensagem(numero: str, texto_recebido: str, message_sid: str, acao_
         }
 
     # 🎯 PRIORIDADE 5: Localização / Endereço da igreja
-    def detectar_intencao_localizacao(texto: str) -> bool:
-        """
-        Detecta perguntas sobre endereço ou localização da igreja.
-        """
-        texto = texto.lower().strip()
-        
-        padroes = [
-            r"onde fica a igreja",
-            r"endereco da igreja",
-            r"localização da igreja",
-            r"como chegar na igreja",
-            r"rua da igreja",
-            r"bairro da igreja",
-            r"canasvieiras igreja",
-            r"igreja em canasvieiras",
-            r"mapa da igreja",
-            r"google maps igreja",
-        ]
-        
-        return any(re.search(p, texto) for p in padroes)
-
-    if detectar_intencao_localizacao(texto_normalizado):
+    if intencao.LOCALIZACAO in intencoes:
         resposta = (
             "*📍 Nossa Localização:*\n\n"
             "Rua das Flores, 123\n"
@@ -363,8 +229,8 @@ def processar_mensagem(numero: str, texto_recebido: str, message_sid: str, acao_
             "• Estacionamento disponível no local\n\n"
             "Estamos te esperando! 🙏"
         )
-        enviar_mensagem_para_fila(numero_normalizado, resposta, meta=_criar_meta())
-        salvar_conversa(numero_normalizado, resposta, tipo="enviada", sid=message_sid, origem=origem)
+        contexto.enfileirar(numero_normalizado, resposta, meta=_criar_meta())
+        contexto.registrar_conversa(resposta, tipo="enviada", sid=message_sid, origem=origem)
         return {
             "resposta": resposta,
             "estado_atual": estado_atual.name,
@@ -372,47 +238,16 @@ def processar_mensagem(numero: str, texto_recebido: str, message_sid: str, acao_
         }
 
     # 🎯 PRIORIDADE 6: Opções do menu numérico (1-6)
-    def detectar_opcao_menu(texto: str) -> str | None:
-        """
-        Detecta se o visitante digitou uma opção do menu (1, 2, 3, 4, 5, 6).
-        Retorna a opção detectada ou None.
-        """
-        texto = texto.strip()
-        
-        # Opções exatas
-        if texto in ["1", "2", "3", "4", "5", "6"]:
-            return texto
-        
-        # Variações com pontuação ou emojis
-        if texto in ["1.", "2.", "3.", "4.", "5.", "6.", "1️⃣", "2️⃣", "3️⃣", "4️⃣", "5️⃣", "6️⃣"]:
-            return texto[0]  # Retorna apenas o número
-        
-        # Texto descritivo das opções
-        opcoes = {
-            "1": [r"ja fiz batismo", r"já fiz batismo", r"batizado", r"quero ser membro e ja fui batizado"],
-            "2": [r"nao fiz batismo", r"não fiz batismo", r"ainda nao fui batizado", r"ainda não fui batizado", r"quero ser membro mas nao sou batizado"],
-            "3": [r"pedido de oração", r"pedido de oracao", r"quero oração", r"quero oracao", r"orar por mim"],
-            "4": [r"horarios cultos", r"horários cultos", r"quando tem culto", r"programação igreja"],
-            "5": [r"grupo whatsapp", r"entrar grupo", r"gc", r"grupo de comunhão"],
-            "6": [r"outro assunto", r"outro", r"nenhuma das opções", r"não é isso"],
-        }
-        
-        for opcao, padroes in opcoes.items():
-            if any(re.search(p, texto) for p in padroes):
-                return opcao
-        
-        return None
-
-    opcao_menu = detectar_opcao_menu(texto_normalizado)
-    if opcao_menu:
+    if intencao.OPCAO_MENU in intencoes:
+        opcao_menu = intencoes[intencao.OPCAO_MENU].valor
         # Redireciona para o fluxo normal de transições
         proximo_estado = obter_proximo_estado(estado_atual, opcao_menu)
         if proximo_estado:
-            visitor_name = obter_nome_do_visitante(numero_normalizado).split()[0]
+            visitor_name = contexto.primeiro_nome
             resposta = obter_mensagem_estado(proximo_estado, visitor_name)
-            atualizar_status(numero_normalizado, proximo_estado.value, origem=origem)
-            enviar_mensagem_para_fila(numero_normalizado, resposta, meta=_criar_meta())
-            salvar_conversa(numero_normalizado, resposta, tipo="enviada", sid=message_sid, origem=origem)
+            contexto.definir_fase(proximo_estado.value, origem=origem)
+            contexto.enfileirar(numero_normalizado, resposta, meta=_criar_meta())
+            contexto.registrar_conversa(resposta, tipo="enviada", sid=message_sid, origem=origem)
             return {"resposta": resposta, "estado_atual": estado_atual.name, "proximo_estado": proximo_estado.name}
 
     # ==========================================================
@@ -420,11 +255,11 @@ def processar_mensagem(numero: str, texto_recebido: str, message_sid: str, acao_
     # ==========================================================
     proximo_estado = obter_proximo_estado(estado_atual, texto_normalizado)
     if proximo_estado:
-        visitor_name = obter_nome_do_visitante(numero_normalizado).split()[0]
+        visitor_name = contexto.primeiro_nome
         resposta = obter_mensagem_estado(proximo_estado, visitor_name)
-        atualizar_status(numero_normalizado, proximo_estado.value, origem=origem)
-        enviar_mensagem_para_fila(numero_normalizado, resposta, meta=_criar_meta())
-        salvar_conversa(numero_normalizado, resposta, tipo="enviada", sid=message_sid, origem=origem)
+        contexto.definir_fase(proximo_estado.value, origem=origem)
+        contexto.enfileirar(numero_normalizado, resposta, meta=_criar_meta())
+        contexto.registrar_conversa(resposta, tipo="enviada", sid=message_sid, origem=origem)
         return {"resposta": resposta, "estado_atual": estado_atual.name, "proximo_estado": proximo_estado.name}
 
     # ==========================================================
@@ -433,9 +268,9 @@ def processar_mensagem(numero: str, texto_recebido: str, message_sid: str, acao_
     try:
         resposta_ia, confianca = ia_integracao.responder_pergunta(pergunta_usuario=texto_recebido)
         if resposta_ia and confianca > 0.3:  # Threshold um pouco mais alto para evitar respostas fracas
-            enviar_mensagem_para_fila(numero_normalizado, resposta_ia, meta=_criar_meta())
-            salvar_conversa(numero_normalizado, resposta_ia, tipo="enviada", sid=message_sid, origem=origem)
-            atualizar_status(numero_normalizado, EstadoVisitante.INICIO.value, origem=origem)
+            contexto.enfileirar(numero_normalizado, resposta_ia, meta=_criar_meta())
+            contexto.registrar_conversa(resposta_ia, tipo="enviada", sid=message_sid, origem=origem)
+            contexto.definir_fase(EstadoVisitante.INICIO.value, origem=origem)
             return {"resposta": resposta_ia, "estado_atual": estado_atual.name, "proximo_estado": EstadoVisitante.INICIO.name}
     except Exception as e:
         logging.error(f"❌ Erro IA: {e}")
@@ -443,7 +278,7 @@ def processar_mensagem(numero: str, texto_recebido: str, message_sid: str, acao_
     # ==========================================================
     # ❌ Fallback inteligente e conversacional
     # ==========================================================
-    visitor_name = obter_nome_do_visitante(numero_normalizado).split()[0]
+    visitor_name = contexto.primeiro_nome
     
     # Resposta mais útil que guia o usuário
     resposta = (
@@ -456,7 +291,7 @@ def processar_mensagem(numero: str, texto_recebido: str, message_sid: str, acao_
         f"Como posso te ajudar hoje?"
     )
     
-    enviar_mensagem_para_fila(numero_normalizado, resposta, meta=_criar_meta())
-    salvar_conversa(numero_normalizado, resposta, tipo="enviada", sid=message_sid, origem=origem)
+    contexto.enfileirar(numero_normalizado, resposta, meta=_criar_meta())
+    contexto.registrar_conversa(resposta, tipo="enviada", sid=message_sid, origem=origem)
 
     return {"resposta": resposta, "estado_atual": estado_atual.name, "proximo_estado": estado_atual.name}
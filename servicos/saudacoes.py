@@ -1,31 +1,22 @@
 import logging
-from utilitarios.texto import normalizar_texto
-from database import obter_nome_do_visitante, salvar_conversa, atualizar_status
+from servicos.detector_intencoes import SAUDACAO, intencoes_por_nome
+from database import VisitorContext
 from constantes import EstadoVisitante
-from servicos.fila_mensagens import enviar_mensagem_para_fila
 
 def detectar_saudacao(texto: str) -> bool:
     """
     Verifica se a mensagem contém uma saudação comum.
     """
-    saudacoes = [
-        "ola", "oi", "bom dia", "boa tarde", "boa noite",
-        "eae", "e aí", "saudacoes", "a paz do senhor", "a paz de cristo", "paz"
-    ]
-    texto_normalizado = normalizar_texto(texto)
-    return any(saudacao in texto_normalizado for saudacao in saudacoes)
+    return SAUDACAO in intencoes_por_nome(texto)
 
 
-def processar_saudacao(numero: str, message_sid: str, origem: str = "integra+") -> dict:
+def processar_saudacao(contexto: VisitorContext, message_sid: str, origem: str = "integra+") -> dict:
     """
     Processa mensagens de saudação e envia a resposta inicial do Integra+.
     """
+    numero = contexto.telefone
     try:
-        visitor_name = obter_nome_do_visitante(numero)
-        if visitor_name:
-            visitor_name = visitor_name.split()[0]
-        else:
-            visitor_name = "Visitante"
+        visitor_name = contexto.primeiro_nome
 
         resposta = f"""Olá, {visitor_name}!   
 Sou o _*Integra+*_, assistente do Ministério de Integração da MAIS DE CRISTO Canasvieiras.
@@ -42,10 +33,10 @@ Como posso te ajudar hoje?
 Estou aqui pra caminhar com você! """
 
 
-        # Atualiza o status e envia resposta
-        atualizar_status(numero, EstadoVisitante.INICIO.value, origem=origem)
-        enviar_mensagem_para_fila(numero, resposta)
-        salvar_conversa(numero, resposta, tipo="enviada", sid=message_sid, origem=origem)
+        # Atualiza o status e envia resposta (gravados no fim da mensagem)
+        contexto.definir_fase(EstadoVisitante.INICIO.value, origem=origem)
+        contexto.enfileirar(numero, resposta)
+        contexto.registrar_conversa(resposta, tipo="enviada", sid=message_sid, origem=origem)
 
         logging.info(f"🤝 Saudação processada para {numero}")
 
@@ -6,25 +6,54 @@
 # ==============================================
 
 import os
+import json
+import asyncio
+import hashlib
 import time
+import socket
 import logging
 import threading
 import requests
+from collections import deque
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
-from typing import Optional, TypedDict
-from database import normalizar_para_envio
+from contextlib import closing
+from typing import Dict, List, Optional, TypedDict
+from database import normalizar_para_envio, get_db_connection
 
 log = logging.getLogger(__name__)
 
 ZAPI_INSTANCE = os.getenv("ZAPI_INSTANCE")
 ZAPI_TOKEN = os.getenv("ZAPI_TOKEN")
 ZAPI_CLIENT_TOKEN = os.getenv("ZAPI_CLIENT_TOKEN")
-
-# Cache simples do status (evita GET antes de cada envio)
-_STATUS_CACHE = {"ts": 0, "data": {"online": True, "mensagem": "cache_init"}}
+# Base configurável (ex.: stub HTTP local em testes: http://127.0.0.1:8099/instances)
+ZAPI_BASE_URL = os.getenv("ZAPI_BASE_URL", "https://api.z-api.io/instances").rstrip("/")
+# Várias instâncias (sharding do envio): "id1:token1,id2:token2[:client_token]".
+# Vazio = só ZAPI_INSTANCE/ZAPI_TOKEN. A primeira da lista é a instância padrão.
+ZAPI_INSTANCES = os.getenv("ZAPI_INSTANCES", "")
+
+# Pool HTTP compartilhado (keep-alive: 1 handshake TLS por conexão, não por envio)
+HTTP_POOL_CONNECTIONS = int(os.getenv("ZAPI_POOL_CONNECTIONS", "4"))   # hosts distintos em cache
+HTTP_POOL_MAXSIZE = int(os.getenv("ZAPI_POOL_MAXSIZE", "16"))          # conexões reaproveitáveis por host
+
+# Cache do status (por instância): cópia local (lida no envio) + linha compartilhada em zapi_status_cache.
+# Um único prober (em qualquer worker Gunicorn) consulta a Z-API por TTL; os demais só leem o banco.
+_STATUS_CACHE: Dict[str, dict] = {}
 _STATUS_CACHE_LOCK = threading.Lock()
 STATUS_TTL_SEC = int(os.getenv("ZAPI_STATUS_TTL_SEC", "30"))  # 30s padrão
+STATUS_PROBE_SEC = float(os.getenv("ZAPI_STATUS_PROBE_SEC", "5"))  # leitura da linha compartilhada
+
+# Circuit breaker (closed → open → half_open) sobre as chamadas de envio
+CB_JANELA = int(os.getenv("ZAPI_CB_WINDOW", "20"))               # últimas N chamadas avaliadas
+CB_MIN_CHAMADAS = int(os.getenv("ZAPI_CB_MIN_CALLS", "5"))
+CB_TAXA_ERRO = float(os.getenv("ZAPI_CB_ERROR_RATE", "0.5"))     # abre com >= 50% de falhas
+CB_LENTO_MS = float(os.getenv("ZAPI_CB_SLOW_MS", "8000"))        # chamada acima disso conta como lenta
+CB_TAXA_LENTAS = float(os.getenv("ZAPI_CB_SLOW_RATE", "0.8"))    # abre com >= 80% de lentas
+CB_ABERTO_SEC = float(os.getenv("ZAPI_CB_OPEN_SEC", "60"))       # espera antes da sonda (half-open)
+
+# Bulkhead: máximo de envios simultâneos à Z-API neste processo
+BULKHEAD_MAX = int(os.getenv("ZAPI_BULKHEAD_MAX", "4"))
+BULKHEAD_ESPERA_SEC = float(os.getenv("ZAPI_BULKHEAD_WAIT_SEC", "5"))
 
 # Timeouts configuráveis por endpoint
 TIMEOUTS = {
@@ -46,14 +75,73 @@ class ZapiResponse(TypedDict, total=False):
     resposta: Optional[str]
     status_instancia: Optional[dict]
     url: Optional[str]
+    circuit_open: Optional[bool]
+    bulkhead_full: Optional[bool]
+    instance_id: Optional[str]
+
+
+# ==============================================
+# Instâncias (sharding)
+# ==============================================
+def _carregar_instancias() -> Dict[str, dict]:
+    """Lê ZAPI_INSTANCES (ou o par ZAPI_INSTANCE/ZAPI_TOKEN) preservando a ordem."""
+    instancias: Dict[str, dict] = {}
+    for entrada in ZAPI_INSTANCES.split(","):
+        partes = [p.strip() for p in entrada.strip().split(":")]
+        if len(partes) < 2 or not partes[0] or not partes[1]:
+            if entrada.strip():
+                log.error(f"❌ Entrada inválida em ZAPI_INSTANCES (esperado id:token[:client_token]): {entrada.strip()[:20]}...")
+            continue
+        instancias[partes[0]] = {
+            "token": partes[1],
+            "client_token": partes[2] if len(partes) > 2 and partes[2] else ZAPI_CLIENT_TOKEN,
+        }
+    if not instancias and ZAPI_INSTANCE and ZAPI_TOKEN:
+        instancias[ZAPI_INSTANCE] = {"token": ZAPI_TOKEN, "client_token": ZAPI_CLIENT_TOKEN}
+    return instancias
+
+
+_INSTANCIAS = _carregar_instancias()
+
+
+def listar_instancias() -> List[str]:
+    """IDs das instâncias configuradas (a primeira é a padrão)."""
+    return list(_INSTANCIAS)
+
+
+def instancia_padrao() -> Optional[str]:
+    return next(iter(_INSTANCIAS), None)
+
+
+def instancia_do_numero(numero: str) -> Optional[str]:
+    """
+    Instância que atende o número (roteamento fixo por visitante).
+    Rendezvous hashing: todos os processos chegam à mesma instância sem estado
+    compartilhado, e incluir/remover uma instância só move os números dela.
+    """
+    if len(_INSTANCIAS) <= 1:
+        return instancia_padrao()
+    try:
+        chave = normalizar_para_envio(numero)
+    except Exception:
+        chave = "".join(ch for ch in str(numero or "") if ch.isdigit())
+    return max(
+        _INSTANCIAS,
+        key=lambda inst: hashlib.sha1(f"{inst}:{chave}".encode()).digest(),
+    )
+
+
+def _resolver_instancia(instancia: Optional[str]) -> Optional[str]:
+    return instancia if instancia in _INSTANCIAS else instancia_padrao()
 
 
 # ==============================================
 # Helpers
 # ==============================================
-def _cfg_ok() -> bool:
-    """Verifica se todas as variáveis de ambiente estão configuradas."""
-    return bool(ZAPI_INSTANCE and ZAPI_TOKEN and ZAPI_CLIENT_TOKEN)
+def _cfg_ok(instancia: Optional[str] = None) -> bool:
+    """Verifica se a instância (ou a padrão) está configurada com os três tokens."""
+    cfg = _INSTANCIAS.get(_resolver_instancia(instancia) or "")
+    return bool(cfg and cfg["token"] and cfg["client_token"])
 
 
 def _create_session() -> requests.Session:
@@ -65,11 +153,102 @@ def _create_session() -> requests.Session:
         status_forcelist=[429, 500, 502, 503, 504],
         allowed_methods=["GET", "POST"],
     )
-    adapter = HTTPAdapter(max_retries=retry)
+    adapter = HTTPAdapter(
+        max_retries=retry,
+        pool_connections=HTTP_POOL_CONNECTIONS,
+        pool_maxsize=HTTP_POOL_MAXSIZE,
+    )
     session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Connection": "keep-alive"})
     return session
 
 
+# ==============================================
+# Sessão HTTP compartilhada (por processo e por instância)
+# ==============================================
+_SESSIONS: Dict[str, requests.Session] = {}
+_SESSION_PID: Optional[int] = None
+_SESSION_LOCK = threading.Lock()
+_HTTP_METRICAS = {"requests": 0, "errors": 0, "sessions_created": 0}
+
+
+def obter_sessao(instancia: Optional[str] = None) -> requests.Session:
+    """
+    Retorna a sessão HTTP da instância neste processo (criada sob demanda).
+    Recriada após fork: sockets do pool não podem ser herdados entre workers Gunicorn.
+    """
+    global _SESSION_PID
+    chave = _resolver_instancia(instancia) or "default"
+    pid = os.getpid()
+    sessao = _SESSIONS.get(chave)
+    if sessao is not None and _SESSION_PID == pid:
+        return sessao
+    with _SESSION_LOCK:
+        if _SESSION_PID != pid:
+            _SESSIONS.clear()
+            _SESSION_PID = pid
+        if chave not in _SESSIONS:
+            _SESSIONS[chave] = _create_session()
+            _HTTP_METRICAS["sessions_created"] += 1
+        return _SESSIONS[chave]
+
+
+def fechar_sessao() -> None:
+    """Fecha as sessões compartilhadas (shutdown/testes). A próxima chamada cria outras."""
+    global _SESSION_PID
+    with _SESSION_LOCK:
+        if _SESSION_PID == os.getpid():
+            for sessao in _SESSIONS.values():
+                sessao.close()
+        _SESSIONS.clear()
+        _SESSION_PID = None
+
+
+def _requisitar(metodo: str, url: str, instancia: Optional[str] = None, **kwargs) -> requests.Response:
+    """Executa a requisição na sessão da instância contabilizando métricas."""
+    with _SESSION_LOCK:
+        _HTTP_METRICAS["requests"] += 1
+    try:
+        return obter_sessao(instancia).request(metodo, url, **kwargs)
+    except Exception:
+        with _SESSION_LOCK:
+            _HTTP_METRICAS["errors"] += 1
+        raise
+
+
+def obter_metricas_http() -> dict:
+    """
+    Reuso de conexões da sessão Z-API deste processo (para /api/monitor-status).
+    connections_opened conta handshakes; o resto das requisições reaproveitou keep-alive.
+    """
+    conexoes = 0
+    requisicoes_pool = 0
+    sessoes = list(_SESSIONS.values()) if _SESSION_PID == os.getpid() else []
+    for sessao in sessoes:
+        for adapter in set(sessao.adapters.values()):
+            pools = getattr(getattr(adapter, "poolmanager", None), "pools", None)
+            if pools is None:
+                continue
+            for chave in list(pools.keys()):
+                pool = pools.get(chave)
+                if pool is None:
+                    continue
+                conexoes += getattr(pool, "num_connections", 0)
+                requisicoes_pool += getattr(pool, "num_requests", 0)
+
+    with _SESSION_LOCK:
+        metricas = dict(_HTTP_METRICAS)
+    metricas.update({
+        "connections_opened": conexoes,
+        "pool_requests": requisicoes_pool,
+        "reuse_ratio": round(1 - conexoes / requisicoes_pool, 3) if requisicoes_pool else 0.0,
+        "pool_maxsize": HTTP_POOL_MAXSIZE,
+        "sessions": len(sessoes),
+    })
+    return metricas
+
+
 def _parse_json_safe(response: requests.Response) -> dict:
     """Tenta parsear JSON da resposta, retornando dict vazio em caso de erro."""
     if not response.ok or not response.text.strip():
@@ -82,97 +261,530 @@ def _parse_json_safe(response: requests.Response) -> dict:
 
 
 # ==============================================
-# Funções públicas
+# Circuit breaker + bulkhead
 # ==============================================
-def verificar_status_instancia(force: bool = False) -> dict:
+CB_FECHADO = "closed"
+CB_ABERTO = "open"
+CB_MEIO_ABERTO = "half_open"
+
+
+class _CircuitBreaker:
+    """
+    Circuit breaker por processo (e por instância) para o envio à Z-API.
+
+    - closed: tudo passa; abre quando, nas últimas CB_JANELA chamadas, a taxa
+      de falhas (rede/timeout/5xx/429) ou de chamadas lentas passa do limiar.
+    - open: nada passa por CB_ABERTO_SEC (o worker nem faz claim da fila).
+    - half_open: passa UMA chamada de sonda; sucesso fecha, falha reabre.
+    """
+
+    def __init__(self, instancia: str = "default"):
+        self.instancia = instancia
+        self._lock = threading.Lock()
+        self.estado = CB_FECHADO
+        self._janela: deque = deque(maxlen=CB_JANELA)  # (falhou, lenta)
+        self._aberto_ate = 0.0
+        self._sonda_em_andamento = False
+        self.transicoes: deque = deque(maxlen=20)
+        self.rejeitadas = 0
+
+    def _mudar(self, novo: str, motivo: str) -> None:
+        if novo == self.estado:
+            return
+        self.transicoes.append({
+            "de": self.estado, "para": novo, "motivo": motivo,
+            "em": time.strftime("%Y-%m-%d %H:%M:%S"),
+        })
+        emoji = {CB_ABERTO: "🔴", CB_MEIO_ABERTO: "🟡", CB_FECHADO: "🟢"}[novo]
+        log.warning(f"{emoji} Circuit breaker Z-API [{self.instancia}]: {self.estado} → {novo} ({motivo})")
+        self.estado = novo
+
+    def segundos_ate_liberar(self) -> float:
+        """0 se uma chamada passaria agora (sem reservar a sonda)."""
+        with self._lock:
+            if self.estado == CB_FECHADO:
+                return 0.0
+            if self.estado == CB_ABERTO:
+                return max(0.0, self._aberto_ate - time.monotonic())
+            return CB_ABERTO_SEC if self._sonda_em_andamento else 0.0
+
+    def permitir(self) -> bool:
+        """Reserva a passagem de uma chamada (no half-open, só a sonda)."""
+        with self._lock:
+            if self.estado == CB_ABERTO and time.monotonic() >= self._aberto_ate:
+                self._mudar(CB_MEIO_ABERTO, "fim da espera, sondando")
+            if self.estado == CB_FECHADO:
+                return True
+            if self.estado == CB_MEIO_ABERTO and not self._sonda_em_andamento:
+                self._sonda_em_andamento = True
+                return True
+            self.rejeitadas += 1
+            return False
+
+    def liberar_sonda(self) -> None:
+        """A chamada autorizada não chegou a sair (ex.: bulkhead cheio)."""
+        with self._lock:
+            self._sonda_em_andamento = False
+
+    def registrar(self, falhou: bool, latencia_ms: float) -> None:
+        lenta = latencia_ms >= CB_LENTO_MS
+        with self._lock:
+            if self.estado == CB_MEIO_ABERTO:
+                self._sonda_em_andamento = False
+                if falhou or lenta:
+                    self._abrir("sonda falhou" if falhou else f"sonda lenta ({latencia_ms:.0f}ms)")
+                else:
+                    self._janela.clear()
+                    self._mudar(CB_FECHADO, "sonda OK")
+                return
+
+            self._janela.append((falhou, lenta))
+            total = len(self._janela)
+            if self.estado != CB_FECHADO or total < CB_MIN_CHAMADAS:
+                return
+            taxa_erro = sum(1 for f, _ in self._janela if f) / total
+            taxa_lentas = sum(1 for _, l in self._janela if l) / total
+            if taxa_erro >= CB_TAXA_ERRO:
+                self._abrir(f"taxa de erro {taxa_erro:.0%} em {total} chamadas")
+            elif taxa_lentas >= CB_TAXA_LENTAS:
+                self._abrir(f"{taxa_lentas:.0%} das chamadas acima de {CB_LENTO_MS:.0f}ms")
+
+    def _abrir(self, motivo: str) -> None:
+        self._aberto_ate = time.monotonic() + CB_ABERTO_SEC
+        self._janela.clear()
+        self._mudar(CB_ABERTO, motivo)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            total = len(self._janela)
+            return {
+                "state": self.estado,
+                "calls_in_window": total,
+                "error_rate": round(sum(1 for f, _ in self._janela if f) / total, 3) if total else 0.0,
+                "slow_rate": round(sum(1 for _, l in self._janela if l) / total, 3) if total else 0.0,
+                "open_remaining_sec": round(max(0.0, self._aberto_ate - time.monotonic()), 1)
+                    if self.estado == CB_ABERTO else 0.0,
+                "probe_in_flight": self._sonda_em_andamento,
+                "rejected": self.rejeitadas,
+                "transitions": list(self.transicoes),
+            }
+
+
+_breakers: Dict[str, _CircuitBreaker] = {}
+_BREAKERS_LOCK = threading.Lock()
+# Bulkhead é do processo (limita threads presas em I/O), não da instância
+_bulkhead = threading.BoundedSemaphore(max(1, BULKHEAD_MAX))
+_BULKHEAD_METRICAS = {"em_uso": 0, "rejeitadas": 0}
+
+
+def _breaker_de(instancia: Optional[str]) -> _CircuitBreaker:
+    chave = _resolver_instancia(instancia) or "default"
+    breaker = _breakers.get(chave)
+    if breaker is None:
+        with _BREAKERS_LOCK:
+            breaker = _breakers.setdefault(chave, _CircuitBreaker(chave))
+    return breaker
+
+
+def _instancias_ou_padrao() -> List[str]:
+    return listar_instancias() or ["default"]
+
+
+def circuito_segundos_ate_liberar(instancia: Optional[str] = None) -> float:
+    """
+    Quanto esperar antes de enviar pela instância (0 = pode enviar).
+    Sem instância: quanto o worker deve esperar antes de fazer claim, ou seja,
+    até a primeira instância liberar (0 se alguma já pode enviar).
+    """
+    if instancia is not None:
+        return _breaker_de(instancia).segundos_ate_liberar()
+    return min(_breaker_de(inst).segundos_ate_liberar() for inst in _instancias_ou_padrao())
+
+
+def circuito_meio_aberto(instancia: Optional[str] = None) -> bool:
     """
-    Consulta o status atual da instância Z-API (com cache thread-safe).
+    True quando o próximo envio é a sonda (half-open ou open com espera vencida).
+    Sem instância: True só se nenhuma instância está com o circuito fechado.
     """
-    global _STATUS_CACHE
+    if instancia is not None:
+        return _breaker_de(instancia).estado != CB_FECHADO
+    return all(_breaker_de(inst).estado != CB_FECHADO for inst in _instancias_ou_padrao())
+
+
+def obter_estado_circuito() -> dict:
+    """
+    Estado e transições dos breakers + ocupação do bulkhead (para /api/monitor-status).
+    No topo fica o estado da instância padrão (mesmo formato de antes); cada instância em "instances".
+    """
+    instancias = _instancias_ou_padrao()
+    return {
+        **_breaker_de(instancias[0]).snapshot(),
+        "instances": {inst: _breaker_de(inst).snapshot() for inst in instancias},
+        "bulkhead": {
+            "max": BULKHEAD_MAX,
+            "in_use": _BULKHEAD_METRICAS["em_uso"],
+            "rejected": _BULKHEAD_METRICAS["rejeitadas"],
+        },
+    }
+
 
-    if not _cfg_ok():
+def _falha_de_servico(status_code: int) -> bool:
+    """Só degradação da Z-API abre o circuito (número inválido etc. não)."""
+    return status_code == 429 or status_code >= 500
+
+
+# ==============================================
+# Funções públicas
+# ==============================================
+def verificar_status_instancia(force: bool = False, instancia: Optional[str] = None) -> dict:
+    """
+    Retorna o status da instância Z-API (padrão: a primeira) a partir do cache
+    (nunca bloqueia no envio). O cache é atualizado pelo prober em background;
+    force=True faz um refresh síncrono (single-flight) — uso administrativo,
+    não no caminho de envio.
+    """
+    instancia = _resolver_instancia(instancia)
+    if not _cfg_ok(instancia):
         return {"online": False, "mensagem": "⚠️ Variáveis de ambiente Z-API ausentes."}
 
-    now = time.time()
+    iniciar_prober_status()
+
+    if force:
+        with _STATUS_REFRESH_LOCK:
+            _ciclo_prober_instancia(instancia, forcar=True)
+
+    return _status_local(instancia)["data"]
+
+
+def invalidar_status_instancia(
+    mensagem: str = "⚠️ Instância offline ou desconectada",
+    instancia: Optional[str] = None,
+) -> None:
+    """
+    A Z-API indicou queda no meio de um envio: marca offline localmente e
+    acorda o prober para confirmar (sem bloquear quem chamou).
+    """
+    instancia = _resolver_instancia(instancia)
+    _publicar_status_local(instancia, {"online": False, "mensagem": mensagem})
+    with _STATUS_CACHE_LOCK:
+        _PROBER_FORCAR.add(instancia)
+    _PROBER_EVENTO.set()
+
+
+# ==============================================
+# Prober de status (cache compartilhado entre processos)
+# ==============================================
+_STATUS_REFRESH_LOCK = threading.Lock()
+_PROBER_EVENTO = threading.Event()
+_PROBER_FORCAR: set = set()  # instâncias com refresh forçado pendente
+_PROBER_THREAD: Optional[threading.Thread] = None
+_PROBER_PID: Optional[int] = None
+_PROBER_METRICAS = {"probes": 0, "shared_reads": 0, "lease_lost": 0, "db_fallbacks": 0}
+
 
+def _dono_status() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"[:64]
+
+
+# Antes do primeiro probe o status é desconhecido: não afirma "conectado" sem ter checado
+_STATUS_DESCONHECIDO = {"online": False, "desconhecido": True, "mensagem": "⏳ Status da instância ainda não verificado"}
+
+
+def _status_local(instancia: Optional[str]) -> dict:
     with _STATUS_CACHE_LOCK:
-        # Verifica cache (respeita TTL)
-        if (not force) and (now - _STATUS_CACHE["ts"] < STATUS_TTL_SEC):
-            return _STATUS_CACHE["data"]
+        return _STATUS_CACHE.get(instancia or "default") or {"ts": 0, "data": _STATUS_DESCONHECIDO}
+
 
+def _publicar_status_local(instancia: Optional[str], data: dict) -> None:
+    with _STATUS_CACHE_LOCK:
+        _STATUS_CACHE[instancia or "default"] = {"ts": time.time(), "data": data}
+
+
+def _consultar_status_api(instancia: str) -> dict:
+    """GET /status na Z-API (chamado só pelo dono do lease de refresh)."""
+    with _STATUS_CACHE_LOCK:
+        _PROBER_METRICAS["probes"] += 1
     try:
-        # ✅ URL corrigida: sem espaços extras
-        url = f"https://api.z-api.io/instances/{ZAPI_INSTANCE}/token/{ZAPI_TOKEN}/status"
-        headers = {"Client-Token": ZAPI_CLIENT_TOKEN}
-        
-        session = _create_session()
-        r = session.get(url, headers=headers, timeout=TIMEOUTS["status"])
+        cfg = _INSTANCIAS[instancia]
+        url = f"{ZAPI_BASE_URL}/{instancia}/token/{cfg['token']}/status"
+        headers = {"Client-Token": cfg["client_token"]}
+
+        r = _requisitar("GET", url, instancia, headers=headers, timeout=TIMEOUTS["status"])
 
         data = _parse_json_safe(r)
         online = bool(data.get("connected", False))
         msg = "✅ Instância online" if online else "⚠️ Instância offline ou desconectada"
-
-        with _STATUS_CACHE_LOCK:
-            _STATUS_CACHE = {
-                "ts": now,
-                "data": {"online": online, "mensagem": msg, "resposta": data}
-            }
-        
-        log.info(f"🔎 Status Z-API (cache refresh) → {msg}")
-        return _STATUS_CACHE["data"]
+        log.info(f"🔎 Status Z-API [{instancia}] (cache refresh) → {msg}")
+        return {"online": online, "mensagem": msg, "resposta": data}
 
     except requests.exceptions.Timeout:
         erro_msg = "Timeout ao verificar status da instância Z-API."
-        with _STATUS_CACHE_LOCK:
-            _STATUS_CACHE = {"ts": now, "data": {"online": False, "mensagem": erro_msg}}
         log.error(f"❌ {erro_msg}")
-        return _STATUS_CACHE["data"]
+        return {"online": False, "mensagem": erro_msg}
 
     except Exception as e:
         erro_msg = f"Erro ao verificar status da instância Z-API: {e}"
-        with _STATUS_CACHE_LOCK:
-            _STATUS_CACHE = {"ts": now, "data": {"online": False, "mensagem": erro_msg}}
         log.exception(f"❌ {erro_msg}")
-        return _STATUS_CACHE["data"]
+        return {"online": False, "mensagem": erro_msg}
+
+
+def _status_da_linha(row: dict) -> dict:
+    try:
+        resposta = json.loads(row.get("resposta_json") or "{}")
+    except (TypeError, ValueError):
+        resposta = {}
+    return {"online": bool(row.get("online")), "mensagem": row.get("mensagem") or "", "resposta": resposta}
+
+
+def _ciclo_prober(forcar: bool = False) -> None:
+    """Uma rodada do prober para cada instância configurada."""
+    with _STATUS_CACHE_LOCK:
+        forcadas = set(_PROBER_FORCAR)
+        _PROBER_FORCAR.clear()
+    for instancia in listar_instancias():
+        _ciclo_prober_instancia(instancia, forcar=forcar or instancia in forcadas)
+
+
+def _ciclo_prober_instancia(instance: str, forcar: bool = False) -> None:
+    """
+    Uma rodada do prober para a instância:
+    1. Linha compartilhada fresca → só copia para o cache local.
+    2. Vencida (ou forçada) → tenta o lease de refresh (UPDATE condicional);
+       quem ganha consulta a Z-API e grava; quem perde mantém o valor atual.
+    3. Sem banco → cai para o refresh local por processo (comportamento antigo).
+    """
+    try:
+        with closing(get_db_connection()) as conn:
+            if not conn:
+                raise RuntimeError("sem conexão com o banco")
+            cur = conn.cursor()
+            cur.execute("""
+                INSERT INTO zapi_status_cache (instance_id)
+                VALUES (%s)
+                ON DUPLICATE KEY UPDATE instance_id = instance_id
+            """, (instance,))
+            cur.execute("""
+                SELECT online, mensagem, resposta_json, checked_at,
+                       checked_at IS NOT NULL AND checked_at >= NOW() - INTERVAL %s SECOND AS fresco
+                FROM zapi_status_cache
+                WHERE instance_id=%s
+            """, (STATUS_TTL_SEC, instance))
+            row = cur.fetchone() or {}
+            conn.commit()
+
+            if row.get("fresco") and not forcar:
+                with _STATUS_CACHE_LOCK:
+                    _PROBER_METRICAS["shared_reads"] += 1
+                _publicar_status_local(instance, _status_da_linha(row))
+                return
+
+            # Single-flight entre processos: só um dono por janela de lease
+            cur.execute("""
+                UPDATE zapi_status_cache
+                SET refreshing_by=%s, refreshing_until=NOW() + INTERVAL %s SECOND
+                WHERE instance_id=%s
+                  AND (refreshing_until IS NULL OR refreshing_until < NOW())
+            """, (_dono_status(), TIMEOUTS["status"] + 5, instance))
+            conn.commit()
+            if not cur.rowcount:
+                with _STATUS_CACHE_LOCK:
+                    _PROBER_METRICAS["lease_lost"] += 1
+                if row.get("checked_at") is not None:
+                    _publicar_status_local(instance, _status_da_linha(row))
+                return
+
+            data = _consultar_status_api(instance)
+            cur.execute("""
+                UPDATE zapi_status_cache
+                SET online=%s, mensagem=%s, resposta_json=%s, checked_at=NOW(),
+                    refreshing_by=NULL, refreshing_until=NULL
+                WHERE instance_id=%s
+            """, (data["online"], data["mensagem"][:255], json.dumps(data.get("resposta") or {})[:4000], instance))
+            conn.commit()
+            _publicar_status_local(instance, data)
+    except Exception as e:
+        log.debug(f"Cache compartilhado de status indisponível ({e}); usando cache local.")
+        with _STATUS_CACHE_LOCK:
+            _PROBER_METRICAS["db_fallbacks"] += 1
+        vencido = forcar or (time.time() - _status_local(instance)["ts"] >= STATUS_TTL_SEC)
+        if vencido:
+            _publicar_status_local(instance, _consultar_status_api(instance))
+
+
+def _loop_prober() -> None:
+    while True:
+        forcar = _PROBER_EVENTO.wait(STATUS_PROBE_SEC)
+        _PROBER_EVENTO.clear()
+        try:
+            with _STATUS_REFRESH_LOCK:
+                _ciclo_prober(forcar=forcar)
+        except Exception as e:
+            log.error(f"❌ Erro no prober de status Z-API: {e}")
+
+
+def iniciar_prober_status() -> None:
+    """Sobe (uma vez por processo) a thread que mantém o cache de status quente."""
+    global _PROBER_THREAD, _PROBER_PID
+    pid = os.getpid()
+    if _PROBER_PID == pid and _PROBER_THREAD and _PROBER_THREAD.is_alive():
+        return
+    with _STATUS_REFRESH_LOCK:
+        if _PROBER_PID == pid and _PROBER_THREAD and _PROBER_THREAD.is_alive():
+            return
+        _PROBER_PID = pid
+        _PROBER_THREAD = threading.Thread(target=_loop_prober, name="zapi-status-prober", daemon=True)
+        _PROBER_THREAD.start()
+        # Primeira rodada imediata: processo frio não espera STATUS_PROBE_SEC
+        _PROBER_EVENTO.set()
+
+
+def obter_metricas_status() -> dict:
+    """
+    Idade do cache local e contadores do prober (para /api/monitor-status).
+    online/cache_age_sec são da instância padrão; cada instância em "instances".
+    """
+    agora = time.time()
+    instancias = {}
+    for inst in _instancias_ou_padrao():
+        st = _status_local(inst)
+        idade = agora - st["ts"] if st["ts"] else None
+        instancias[inst] = {
+            "online": bool(st["data"].get("online")),
+            "cache_age_sec": round(idade, 1) if idade is not None else None,
+        }
+    with _STATUS_CACHE_LOCK:
+        metricas = dict(_PROBER_METRICAS)
+    return {
+        **metricas,
+        **instancias[_instancias_ou_padrao()[0]],
+        "ttl_sec": STATUS_TTL_SEC,
+        "instances": instancias,
+    }
 
 
 def enviar_mensagem(
     numero_destino: str,
     corpo_mensagem: str,
-    imagem_url: Optional[str] = None
+    imagem_url: Optional[str] = None,
+    instancia: Optional[str] = None,
 ) -> ZapiResponse:
     """
     Envia mensagem via Z-API (texto ou imagem).
-    Retorna dict tipado com success bool e detalhes.
+    instancia=None usa a instância fixa do número (instancia_do_numero).
+    Retorna dict tipado com success bool e detalhes; circuit_open/bulkhead_full
+    indicam que nada saiu (quem chama adia e tenta de novo — ou usa a fila).
     """
-    if not _cfg_ok():
-        msg = "❌ Variáveis de ambiente Z-API ausentes."
-        log.error(msg)
-        return {"success": False, "erro": msg}
-
     # Normalização do número
     try:
         numero_normalizado = normalizar_para_envio(numero_destino)
     except Exception as e:
         return {"success": False, "erro": f"Telefone inválido: {e}", "numero": numero_destino}
 
+    instancia = _resolver_instancia(instancia or instancia_do_numero(numero_normalizado))
+    if not _cfg_ok(instancia):
+        msg = "❌ Variáveis de ambiente Z-API ausentes."
+        log.error(msg)
+        return {"success": False, "erro": msg}
+
     tipo_envio = "imagem" if imagem_url else "texto"
     endpoint = "send-image" if imagem_url else "send-text"
+    breaker = _breaker_de(instancia)
 
-    # Checa status da instância (com cache)
-    st = verificar_status_instancia(force=False)
-    if not st.get("online"):
-        msg = "⚠️ Instância Z-API offline — envio abortado."
-        log.warning(msg)
+    # 🔌 Circuit breaker: Z-API degradada → falha rápida sem gastar tentativa
+    if not breaker.permitir():
+        return {
+            "success": False,
+            "erro": "circuit_open: Z-API degradada, envio adiado.",
+            "circuit_open": True,
+            "numero": numero_normalizado,
+            "instance_id": instancia,
+        }
+
+    # 🚧 Bulkhead: limita envios simultâneos do processo (a Z-API não está degradada)
+    if not _bulkhead.acquire(timeout=BULKHEAD_ESPERA_SEC):
+        with _SESSION_LOCK:
+            _BULKHEAD_METRICAS["rejeitadas"] += 1
+        breaker.liberar_sonda()
         return {
             "success": False,
-            "erro": msg,
-            "status_instancia": st,
-            "numero": numero_normalizado
+            "erro": "bulkhead_full: limite de envios simultâneos atingido, envio adiado.",
+            "bulkhead_full": True,
+            "numero": numero_normalizado,
+            "instance_id": instancia,
         }
+    with _SESSION_LOCK:
+        _BULKHEAD_METRICAS["em_uso"] += 1
+    try:
+        return _enviar_com_breaker(instancia, numero_normalizado, corpo_mensagem, imagem_url, tipo_envio, endpoint)
+    finally:
+        with _SESSION_LOCK:
+            _BULKHEAD_METRICAS["em_uso"] -= 1
+        _bulkhead.release()
+
+
+def _falhou_para_breaker(resultado: dict) -> bool:
+    """Sem status_code = rede/timeout; instância offline não é falha de serviço da API."""
+    codigo = int(resultado.get("status_code") or 0)
+    return (codigo == 0 and "status_instancia" not in resultado) or _falha_de_servico(codigo)
+
+
+def _enviar_com_breaker(
+    instancia: str,
+    numero_normalizado: str,
+    corpo_mensagem: str,
+    imagem_url: Optional[str],
+    tipo_envio: str,
+    endpoint: str,
+) -> ZapiResponse:
+    """Status (cache) + POST, registrando resultado e latência no breaker da instância."""
+    inicio = time.monotonic()
+    falhou = True
+    try:
+        resultado = _enviar_http(instancia, numero_normalizado, corpo_mensagem, imagem_url, tipo_envio, endpoint)
+        falhou = _falhou_para_breaker(resultado)
+        return resultado
+    finally:
+        _breaker_de(instancia).registrar(falhou, (time.monotonic() - inicio) * 1000)
 
+
+def _checar_instancia_online(
+    instancia: str, numero_normalizado: str, sondar: bool = True
+) -> Optional[ZapiResponse]:
+    """
+    Retorna a resposta de abort se a instância está offline (status em cache).
+    Status ainda desconhecido (processo frio): com sondar=True espera o primeiro probe
+    (single-flight com o prober); sem sondar (engine async) aborta e o worker tenta depois.
+    """
+    st = verificar_status_instancia(force=False, instancia=instancia)
+    if st.get("desconhecido") and sondar:
+        with _STATUS_REFRESH_LOCK:
+            if _status_local(instancia)["data"].get("desconhecido"):
+                _ciclo_prober_instancia(instancia)
+        st = _status_local(instancia)["data"]
+    if st.get("online"):
+        return None
+    msg = f"⚠️ Instância Z-API {instancia} offline — envio abortado."
+    log.warning(msg)
+    return {
+        "success": False,
+        "erro": msg,
+        "status_instancia": st,
+        "numero": numero_normalizado,
+        "instance_id": instancia,
+    }
+
+
+def _montar_envio(
+    instancia: str,
+    numero_normalizado: str,
+    corpo_mensagem: str,
+    imagem_url: Optional[str],
+    endpoint: str,
+):
+    """URL, headers e payload do POST de envio (compartilhado pelo cliente síncrono e assíncrono)."""
+    cfg = _INSTANCIAS[instancia]
     headers = {
-        "Client-Token": ZAPI_CLIENT_TOKEN,
+        "Client-Token": cfg["client_token"],
         "Content-Type": "application/json"
     }
 
@@ -181,68 +793,181 @@ def enviar_mensagem(
         **({"caption": corpo_mensagem or "", "image": imagem_url} if imagem_url else {"message": corpo_mensagem or ""})
     }
 
-    # ✅ URL corrigida: sem espaços extras
-    url = f"https://api.z-api.io/instances/{ZAPI_INSTANCE}/token/{ZAPI_TOKEN}/{endpoint}"
+    url = f"{ZAPI_BASE_URL}/{instancia}/token/{cfg['token']}/{endpoint}"
+    return url, headers, payload
 
-    try:
-        log.info(
-            f"➡️ Z-API SEND | {numero_normalizado} | tipo={tipo_envio} | "
-            f"msg={(corpo_mensagem or '')[:60]}{'...' if len(corpo_mensagem or '') > 60 else ''}"
-        )
 
-        session = _create_session()
-        r = session.post(url, json=payload, headers=headers, timeout=TIMEOUTS[endpoint])
-        body = (r.text or "").strip()
-        data = _parse_json_safe(r)
+def _log_envio(instancia: str, numero_normalizado: str, tipo_envio: str, corpo_mensagem: str) -> None:
+    log.info(
+        f"➡️ Z-API SEND [{instancia}] | {numero_normalizado} | tipo={tipo_envio} | "
+        f"msg={(corpo_mensagem or '')[:60]}{'...' if len(corpo_mensagem or '') > 60 else ''}"
+    )
 
-        # Se a instância caiu no meio, invalida cache pra próxima checagem
-        low = body.lower()
-        if ("instance offline" in low) or ("disconnected" in low):
-            verificar_status_instancia(force=True)
 
-        # Falha dura: precisa reconectar/assinar novamente
-        if "must subscribe to this instance again" in low:
-            log.error("❌ Z-API exige re-subscrição da instância.")
-            return {
-                "success": False,
-                "status_code": r.status_code,
-                "erro": "Z-API exige re-subscrição (instância precisa reconectar no painel).",
-                "numero": numero_normalizado,
-                "resposta": body[:500],
-            }
+def _interpretar_resposta(
+    instancia: str,
+    status_code: int,
+    body: str,
+    numero_normalizado: str,
+    tipo_envio: str,
+    url: str,
+) -> ZapiResponse:
+    """Converte a resposta HTTP do envio no dict padrão {success, ...}."""
+    body = (body or "").strip()
+    http_ok = 200 <= status_code < 400
+    data = {}
+    if http_ok and body:
+        try:
+            data = json.loads(body)
+        except ValueError:
+            log.warning(f"Resposta não-JSON da Z-API: {body[:200]}")
+
+    # Se a instância caiu no meio, invalida cache (o prober confirma em background)
+    low = body.lower()
+    if ("instance offline" in low) or ("disconnected" in low):
+        invalidar_status_instancia(instancia=instancia)
+
+    # Falha dura: precisa reconectar/assinar novamente
+    if "must subscribe to this instance again" in low:
+        log.error("❌ Z-API exige re-subscrição da instância.")
+        return {
+            "success": False,
+            "status_code": status_code,
+            "erro": "Z-API exige re-subscrição (instância precisa reconectar no painel).",
+            "numero": numero_normalizado,
+            "resposta": body[:500],
+            "instance_id": instancia,
+        }
 
-        # ✅ Detecção de sucesso mais robusta: HTTP 2xx + campo 'success' ou 'id' na resposta
-        success = (
-            r.ok and
-            isinstance(data, dict) and
-            (data.get("success") is True or "id" in data or "messageId" in data)
+    # ✅ Detecção de sucesso mais robusta: HTTP 2xx + campo 'success' ou 'id' na resposta
+    success = (
+        http_ok and
+        isinstance(data, dict) and
+        (data.get("success") is True or "id" in data or "messageId" in data)
+    )
+
+    if not success:
+        log.error(
+            f"❌ Z-API FAIL ({status_code}) [{instancia}] | {numero_normalizado} | "
+            f"resposta: {body[:400]}"
         )
+    else:
+        log.info(f"✅ Z-API OK [{instancia}] → {numero_normalizado}")
+
+    return {
+        "success": success,
+        "status_code": status_code,
+        "numero": numero_normalizado,
+        "tipo": tipo_envio,
+        "resposta": body[:1000],
+        "url": url,
+        "instance_id": instancia,
+    }
 
-        if not success:
-            log.error(
-                f"❌ Z-API FAIL ({r.status_code}) | {numero_normalizado} | "
-                f"resposta: {body[:400]}"
-            )
-        else:
-            log.info(f"✅ Z-API OK → {numero_normalizado}")
 
-        return {
-            "success": success,
-            "status_code": r.status_code,
-            "numero": numero_normalizado,
-            "tipo": tipo_envio,
-            "resposta": body[:1000],
-            "url": url,
-        }
+def _enviar_http(
+    instancia: str,
+    numero_normalizado: str,
+    corpo_mensagem: str,
+    imagem_url: Optional[str],
+    tipo_envio: str,
+    endpoint: str,
+) -> ZapiResponse:
+    # Checa status da instância (com cache)
+    offline = _checar_instancia_online(instancia, numero_normalizado)
+    if offline:
+        return offline
+
+    url, headers, payload = _montar_envio(instancia, numero_normalizado, corpo_mensagem, imagem_url, endpoint)
+
+    try:
+        _log_envio(instancia, numero_normalizado, tipo_envio, corpo_mensagem)
+        r = _requisitar("POST", url, instancia, json=payload, headers=headers, timeout=TIMEOUTS[endpoint])
+        return _interpretar_resposta(instancia, r.status_code, r.text, numero_normalizado, tipo_envio, url)
 
     except requests.exceptions.Timeout:
-        log.warning(f"⏱️ Timeout ao enviar mensagem para {numero_normalizado}")
-        return {"success": False, "erro": "Timeout na requisição.", "numero": numero_normalizado}
+        log.warning(f"⏱️ Timeout ao enviar mensagem para {numero_normalizado} [{instancia}]")
+        return {"success": False, "erro": "Timeout na requisição.", "numero": numero_normalizado, "instance_id": instancia}
 
     except requests.exceptions.RequestException as e:
-        log.exception(f"💥 Erro de rede ao enviar via Z-API: {e}")
-        return {"success": False, "erro": f"Erro de conexão: {e}", "numero": numero_normalizado}
+        log.exception(f"💥 Erro de rede ao enviar via Z-API [{instancia}]: {e}")
+        return {"success": False, "erro": f"Erro de conexão: {e}", "numero": numero_normalizado, "instance_id": instancia}
 
     except Exception as e:
-        log.exception(f"💥 Erro inesperado ao enviar via Z-API: {e}")
-        return {"success": False, "erro": str(e), "numero": numero_normalizado}
+        log.exception(f"💥 Erro inesperado ao enviar via Z-API [{instancia}]: {e}")
+        return {"success": False, "erro": str(e), "numero": numero_normalizado, "instance_id": instancia}
+
+
+# ==============================================
+# Envio assíncrono (engine asyncio da fila)
+# ==============================================
+async def enviar_mensagem_async(
+    http,
+    numero_destino: str,
+    corpo_mensagem: str,
+    imagem_url: Optional[str] = None,
+    instancia: Optional[str] = None,
+) -> ZapiResponse:
+    """
+    Mesmo contrato de enviar_mensagem(), sobre uma aiohttp.ClientSession.
+    A concorrência é limitada por quem chama (semáforo da engine), não pelo bulkhead.
+    """
+    import aiohttp
+
+    try:
+        numero_normalizado = normalizar_para_envio(numero_destino)
+    except Exception as e:
+        return {"success": False, "erro": f"Telefone inválido: {e}", "numero": numero_destino}
+
+    instancia = _resolver_instancia(instancia or instancia_do_numero(numero_normalizado))
+    if not _cfg_ok(instancia):
+        msg = "❌ Variáveis de ambiente Z-API ausentes."
+        log.error(msg)
+        return {"success": False, "erro": msg}
+
+    tipo_envio = "imagem" if imagem_url else "texto"
+    endpoint = "send-image" if imagem_url else "send-text"
+    breaker = _breaker_de(instancia)
+
+    if not breaker.permitir():
+        return {
+            "success": False,
+            "erro": "circuit_open: Z-API degradada, envio adiado.",
+            "circuit_open": True,
+            "numero": numero_normalizado,
+            "instance_id": instancia,
+        }
+
+    inicio = time.monotonic()
+    resultado: ZapiResponse = {"success": False, "numero": numero_normalizado, "instance_id": instancia}
+    try:
+        offline = _checar_instancia_online(instancia, numero_normalizado, sondar=False)
+        if offline:
+            resultado = offline
+            return resultado
+
+        url, headers, payload = _montar_envio(instancia, numero_normalizado, corpo_mensagem, imagem_url, endpoint)
+        _log_envio(instancia, numero_normalizado, tipo_envio, corpo_mensagem)
+        timeout = aiohttp.ClientTimeout(total=TIMEOUTS[endpoint])
+        async with http.post(url, json=payload, headers=headers, timeout=timeout) as r:
+            body = await r.text()
+            resultado = _interpretar_resposta(instancia, r.status, body, numero_normalizado, tipo_envio, url)
+        return resultado
+
+    except asyncio.TimeoutError:
+        log.warning(f"⏱️ Timeout ao enviar mensagem para {numero_normalizado} [{instancia}]")
+        resultado = {"success": False, "erro": "Timeout na requisição.", "numero": numero_normalizado, "instance_id": instancia}
+        return resultado
+
+    except aiohttp.ClientError as e:
+        log.error(f"💥 Erro de rede ao enviar via Z-API (async) [{instancia}]: {e}")
+        resultado = {"success": False, "erro": f"Erro de conexão: {e}", "numero": numero_normalizado, "instance_id": instancia}
+        return resultado
+
+    except Exception as e:
+        log.exception(f"💥 Erro inesperado ao enviar via Z-API (async) [{instancia}]: {e}")
+        resultado = {"success": False, "erro": str(e), "numero": numero_normalizado, "instance_id": instancia}
+        return resultado
+
+    finally:
+        breaker.registrar(_falhou_para_breaker(resultado), (time.monotonic() - inicio) * 1000)
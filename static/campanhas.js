@@ -16,6 +16,7 @@
       window.location.href = '/app/login';
     } else {
       carregarStatus(); // carrega status de campanhas ao abrir
+      carregarJobAtivo(); // volta a acompanhar um job que ainda está rodando
     }
   });
 
@@ -106,7 +107,8 @@
       ...filtros
     };
 
-    if (!confirm(`Deseja enviar a campanha "${payload.nome_evento}"?`)) return;
+    const previsao = await planejarCampanha(payload);
+    if (!confirm(`Deseja enviar a campanha "${payload.nome_evento}"?${previsao}`)) return;
 
     try {
       const resp = await fetch(`${API_BASE_URL}/api/campanhas/enviar`, {
@@ -119,7 +121,8 @@
       });
 
       const data = await resp.json();
-      alert(data.message || '✅ Campanha enviada com sucesso!');
+      alert(data.message || data.error || '✅ Campanha enviada com sucesso!');
+      if (data.job_id) acompanharJob(data.job_id);
       carregarStatus();
     } catch (err) {
       console.error('Erro ao enviar campanha:', err);
@@ -127,6 +130,39 @@
     }
   }
 
+  // Prévia de capacidade: audiência, consentimento e quando a campanha terminaria
+  async function planejarCampanha(payload) {
+    try {
+      const resp = await fetch(`${API_BASE_URL}/api/campanhas/planejar`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          'Authorization': `Bearer ${localStorage.getItem('jwt_token')}`
+        },
+        body: JSON.stringify(payload)
+      });
+      const plano = await resp.json();
+      if (!resp.ok || !plano.audience) return '';
+
+      const a = plano.audience;
+      const nova = plano.new_campaign;
+      const termino = nova && nova.completion_at
+        ? new Date(nova.completion_at).toLocaleString('pt-BR', { dateStyle: 'short', timeStyle: 'short' })
+        : 'sem capacidade de envio configurada';
+      return `
+
+👥 Audiência: ${a.total} visitantes
+✅ Com consentimento: ${a.elegiveis}
+🚫 Fora (sem telefone / bloqueio / sem interação recente): ${a.sem_telefone} / ${a.bloqueio_recente} / ${a.sem_engajamento_recente}
+📬 Na fila à frente: ${plano.backlog} mensagens
+📈 Capacidade: ${plano.daily_ceiling} mensagens/dia (${plano.remaining_today} ainda hoje)
+📅 Término previsto: ${termino}${nova && nova.days ? ` (${nova.days} dia(s))` : ''}`;
+    } catch (err) {
+      console.error('Erro ao planejar campanha:', err);
+      return '';
+    }
+  }
+
   // -----------------------------------------------------------
   // 🔄 REPROCESSAR FALHAS
   // -----------------------------------------------------------
@@ -140,7 +176,8 @@
       });
 
       const data = await resp.json();
-      alert(data.message || '🔄 Reprocessamento concluído.');
+      alert(data.message || data.error || '🔄 Reprocessamento concluído.');
+      if (data.job_id) acompanharJob(data.job_id);
       carregarStatus();
     } catch (err) {
       console.error('Erro ao reprocessar falhas:', err);
@@ -148,6 +185,76 @@
     }
   }
 
+  // -----------------------------------------------------------
+  // 🗂️ PROGRESSO DO JOB (polling até concluir)
+  // -----------------------------------------------------------
+  let jobTimer = null;
+
+  async function acompanharJob(jobId) {
+    clearTimeout(jobTimer);
+    try {
+      const resp = await fetch(`${API_BASE_URL}/api/campanhas/jobs/${jobId}`, {
+        headers: { 'Authorization': `Bearer ${localStorage.getItem('jwt_token')}` }
+      });
+      const job = await resp.json();
+      renderJob(job);
+      if (job.status === 'pendente' || job.status === 'executando') {
+        jobTimer = setTimeout(() => acompanharJob(jobId), 3000);
+      } else {
+        carregarStatus();
+      }
+    } catch (err) {
+      console.error('Erro ao acompanhar job:', err);
+      jobTimer = setTimeout(() => acompanharJob(jobId), 10000);
+    }
+  }
+
+  async function carregarJobAtivo() {
+    try {
+      const resp = await fetch(`${API_BASE_URL}/api/campanhas/jobs?limit=1`, {
+        headers: { 'Authorization': `Bearer ${localStorage.getItem('jwt_token')}` }
+      });
+      const data = await resp.json();
+      const job = (data.jobs || [])[0];
+      if (job && (job.status === 'pendente' || job.status === 'executando')) acompanharJob(job.job_id);
+    } catch (err) {
+      console.error('Erro ao carregar jobs de campanha:', err);
+    }
+  }
+
+  function formatarEta(seg) {
+    if (seg === null || seg === undefined) return '-';
+    if (seg < 60) return `${seg}s`;
+    const h = Math.floor(seg / 3600);
+    const m = Math.round((seg % 3600) / 60);
+    return h ? `${h}h ${m}min` : `${m}min`;
+  }
+
+  function renderJob(job) {
+    let container = document.getElementById('jobCampanha');
+    if (!container) {
+      container = document.createElement('section');
+      container.id = 'jobCampanha';
+      document.querySelector('main').appendChild(container);
+    }
+    if (job.error) {
+      container.innerHTML = `<p>❌ ${job.error}</p>`;
+      return;
+    }
+
+    const rotulos = { pendente: '⏳ Na fila', executando: '⚙️ Em andamento', concluido: '✅ Concluído', erro: '❌ Erro' };
+    container.innerHTML = `
+      <h3>Job #${job.job_id} — ${job.evento || 'Reprocessamento'}</h3>
+      <progress max="100" value="${job.progress_pct}"></progress>
+      <p>
+        ${rotulos[job.status] || job.status} · ${job.processed}/${job.audience_size} processados ·
+        ${job.enqueued} enfileirados · ${job.skipped} pulados · ${job.failed} falhas ·
+        previsão de envio: ${formatarEta(job.eta_sec)}
+      </p>
+      ${job.last_error ? `<p>❌ ${job.last_error}</p>` : ''}
+    `;
+  }
+
   // -----------------------------------------------------------
   // 📊 STATUS DAS CAMPANHAS
   // -----------------------------------------------------------
@@ -0,0 +1,81 @@
+# ==============================================
+# tests/conftest.py
+# ==============================================
+# 🧪 Fixtures comuns: raiz do projeto no sys.path e um "banco" falso
+# (conexão/cursor que respondem por trecho de SQL), sem MySQL de verdade.
+# ==============================================
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+class CursorFalso:
+    """
+    Cursor DictCursor falso: cada chamada de execute procura o primeiro trecho de SQL
+    registrado em `respostas` e usa a função associada (sql, params) → linhas.
+    """
+
+    def __init__(self, respostas=None):
+        self.respostas = list(respostas or [])
+        self.executados = []
+        self._linhas = []
+        self.rowcount = 0
+        self.lastrowid = 0
+
+    def execute(self, sql, params=()):
+        self.executados.append((sql, tuple(params or ())))
+        self._linhas, self.rowcount = [], 0
+        for trecho, fn in self.respostas:
+            if trecho in sql:
+                linhas = fn(sql, tuple(params or ()))
+                if isinstance(linhas, int):
+                    self.rowcount = linhas
+                else:
+                    self._linhas = list(linhas or [])
+                    self.rowcount = len(self._linhas)
+                break
+
+    def executemany(self, sql, seq):
+        for params in seq:
+            self.execute(sql, params)
+
+    def fetchone(self):
+        return self._linhas[0] if self._linhas else None
+
+    def fetchall(self):
+        return list(self._linhas)
+
+    def close(self):
+        pass
+
+
+class ConexaoFalsa:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.commits = 0
+
+    def cursor(self):
+        return self._cursor
+
+    def begin(self):
+        pass
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def banco_falso():
+    """Devolve (cursor, fabrica) — `fabrica` substitui get_db_connection."""
+    cursor = CursorFalso()
+    return cursor, (lambda: ConexaoFalsa(cursor))
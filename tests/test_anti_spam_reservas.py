@@ -0,0 +1,76 @@
+import time
+
+from servicos import anti_spam_controller as asc
+from conftest import CursorFalso, ConexaoFalsa
+
+
+def test_reserva_orfa_recuperada_com_outro_processo_vivo(monkeypatch):
+    monkeypatch.setattr(asc, "_id_reserva", lambda: "web-1:100")
+    cur = CursorFalso([
+        ("SELECT tokens_reservados FROM fila_rate_limit", lambda sql, p: [{"tokens_reservados": 7}]),
+        ("FROM fila_rate_limit_reservas", lambda sql, p: [
+            {"holder": "web-1:100", "tokens": 1, "orfa": 1},   # este processo: nunca é órfão
+            {"holder": "web-1:101", "tokens": 2, "orfa": 0},   # vivo, heartbeat recente
+            {"holder": "web-1:102", "tokens": 4, "orfa": 1},   # morreu segurando tokens
+        ]),
+        ("DELETE FROM fila_rate_limit_reservas", lambda sql, p: 1),
+        ("UPDATE fila_rate_limit SET tokens_reservados", lambda sql, p: 1),
+    ])
+
+    recuperados = asc.AntiSpamController("inst")._recuperar_reservas_orfas(cur)
+
+    assert recuperados == 4
+    apagados = [p for sql, p in cur.executados if "DELETE FROM fila_rate_limit_reservas" in sql]
+    assert apagados == [("inst", apagados[0][1], "web-1:102")]
+    agregado = [p[0] for sql, p in cur.executados if "SET tokens_reservados = %s" in sql]
+    assert agregado == [3]
+
+
+def test_flush_so_de_heartbeat_respeita_intervalo(monkeypatch):
+    cur = CursorFalso([
+        ("SELECT tokens FROM fila_rate_limit_reservas", lambda sql, p: [{"tokens": 2}]),
+    ])
+    conexoes = []
+    monkeypatch.setattr(asc, "get_db_connection", lambda: conexoes.append(1) or ConexaoFalsa(cur))
+    controller = asc.AntiSpamController("inst")
+    controller._tokens, controller._tokens_date = 2, controller._get_today_key()
+    controller._ultimo_heartbeat = time.time()
+
+    assert controller.flush() is False
+    assert conexoes == []
+
+    controller._ultimo_heartbeat = time.time() - asc.HEARTBEAT_SEC - 1
+    controller.flush()
+    assert len(conexoes) == 1
+    assert any("heartbeat_at = NOW()" in sql for sql, _ in cur.executados)
+    assert controller._tokens == 2
+
+
+def test_flush_descarta_tokens_de_reserva_ja_recuperada(monkeypatch):
+    cur = CursorFalso([
+        ("SELECT tokens FROM fila_rate_limit_reservas", lambda sql, p: []),
+    ])
+    monkeypatch.setattr(asc, "get_db_connection", lambda: ConexaoFalsa(cur))
+    controller = asc.AntiSpamController("inst")
+    hoje = controller._get_today_key()
+    controller._tokens, controller._tokens_date = 1, hoje
+    controller._deltas, controller._deltas_date = {"total_sent": 1, "total_failed": 0}, hoje
+
+    assert controller.flush() is True
+    assert controller._tokens == 0
+    # Sem reserva, nada sai de tokens_reservados (outro processo já devolveu)
+    assert not any("tokens_reservados = GREATEST" in sql for sql, _ in cur.executados)
+
+
+def test_reconciliar_conta_pela_hora_do_envio(monkeypatch):
+    cur = CursorFalso([
+        ("SELECT tokens_reservados FROM fila_rate_limit", lambda sql, p: []),
+        ("FROM fila_envios", lambda sql, p: [{"enviados": 3}]),
+    ])
+    monkeypatch.setattr(asc, "get_db_connection", lambda: ConexaoFalsa(cur))
+
+    asc.AntiSpamController("inst")._reconciliar()
+
+    sql = next(sql for sql, _ in cur.executados if "FROM fila_envios" in sql)
+    assert "enviado_em >= %s" in sql and "created_at" not in sql
+    assert any(p[0] == 3 for s, p in cur.executados if "GREATEST(total_sent" in s)
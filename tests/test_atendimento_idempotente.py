@@ -0,0 +1,68 @@
+import pytest
+
+import database
+from database import VisitorContext
+from servicos import processamento_mensagens as pm
+from conftest import CursorFalso, ConexaoFalsa
+
+
+@pytest.fixture
+def atendimento(monkeypatch):
+    """processar_mensagem com um handler que responde e avisa a secretaria."""
+    def handler(contexto, texto, texto_normalizado, sid, origem, is_reply):
+        contexto.registrar_conversa("resposta", tipo="enviada", sid=sid, origem=origem)
+        contexto.enfileirar(contexto.telefone, "resposta", meta={"is_reply": True})
+        contexto.enfileirar("48911112222", "aviso")
+        return {"resposta": "resposta"}
+
+    notificados = []
+    monkeypatch.setattr(pm, "carregar_contexto_visitante", lambda tel: VisitorContext(tel, visitante_id=7))
+    monkeypatch.setattr(pm, "_processar_com_contexto", handler)
+    monkeypatch.setattr(pm, "notificar_fila", lambda: notificados.append(1))
+    return notificados
+
+
+def test_envios_commitam_junto_com_a_conversa(monkeypatch, atendimento):
+    cur = CursorFalso()
+    conn = ConexaoFalsa(cur)
+    monkeypatch.setattr(database, "get_db_connection", lambda: conn)
+
+    pm.processar_mensagem("48999998888", "oi", "SID1")
+
+    sqls = [sql for sql, _ in cur.executados]
+    assert any("INSERT INTO conversas" in s for s in sqls)
+    assert sum("INSERT INTO fila_envios" in s for s in sqls) == 1
+    assert conn.commits == 1
+    assert atendimento == [1]
+
+
+def test_sem_gravar_nada_e_enfileirado_e_o_erro_sobe(monkeypatch, atendimento):
+    monkeypatch.setattr(database, "get_db_connection", lambda: None)
+
+    with pytest.raises(RuntimeError):
+        pm.processar_mensagem("48999998888", "oi", "SID1")
+    assert atendimento == []
+
+
+def test_retry_de_mensagem_ja_gravada_nao_reprocessa(monkeypatch):
+    import botmsg
+
+    chamadas = []
+    monkeypatch.setattr(botmsg, "verificar_sid_existente", lambda sid: sid == "SID1")
+    monkeypatch.setattr(botmsg, "processar_mensagem", lambda *a, **k: chamadas.append(a))
+
+    resultado = botmsg.tratar_mensagem_webhook({"phone": "5548999998888", "text": {"message": "oi"}, "messageId": "SID1"})
+
+    assert resultado["status"] == "duplicada"
+    assert chamadas == []
+
+
+def test_pedido_de_oracao_avisa_intercessores_pela_fila():
+    from servicos import atendimento_oracao
+    from servicos.fila_mensagens import TIPO_INTERNO
+
+    contexto = VisitorContext("48999998888", visitante_id=7, nome="Ana")
+    atendimento_oracao.processar_pedido_oracao(contexto, "pela família", "SID1")
+
+    avisos = [(n, meta) for n, _, meta in contexto.envios_pendentes if (meta or {}).get("tipo") == TIPO_INTERNO]
+    assert [n for n, _ in avisos] == atendimento_oracao.LISTA_INTERCESSORES
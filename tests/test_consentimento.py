@@ -0,0 +1,127 @@
+from datetime import datetime
+
+import pytest
+
+import database
+import database_setup
+from servicos import fila_mensagens as fm
+from conftest import CursorFalso, ConexaoFalsa
+
+
+@pytest.mark.parametrize("telefone", [
+    "48999998888",
+    "5548999998888",
+    "+55 (48) 99999-8888",
+    "(48) 99999-8888",
+    "4899998888",        # sem o 9
+    "554899998888",      # com 55, sem o 9
+    "whatsapp:5548999998888",
+])
+def test_chave_consentimento_formatos(telefone):
+    assert database.chave_consentimento(telefone) == "48999998888"
+
+
+def test_chave_consentimento_ddd_55():
+    assert database.chave_consentimento("55999998888") == "55999998888"
+    assert database.chave_consentimento("5555999998888") == "55999998888"
+
+
+def test_chave_consentimento_numero_da_fila():
+    # fila_envios.numero é gravado com _normalizar_para_envio
+    for telefone in ("48999998888", "4899998888", "(48) 99999-8888", "55999998888"):
+        numero_fila = fm._normalizar_para_envio(telefone)
+        assert database.chave_consentimento(numero_fila) == database.chave_consentimento(telefone)
+
+
+def test_backfill_consolida_formatos_e_bloqueio_prevalece():
+    antigo, recente = datetime(2024, 1, 1), datetime(2024, 6, 1)
+    cur = CursorFalso([
+        ("FROM conversas c", lambda sql, p: [
+            {"telefone": "(48) 99999-8888", "last_inbound_at": recente, "last_block_signal_at": None},
+            {"telefone": "+5548999998888", "last_inbound_at": antigo, "last_block_signal_at": antigo},
+            {"telefone": "4833334444", "last_inbound_at": antigo, "last_block_signal_at": None},
+        ]),
+        ("FROM consent_state", lambda sql, p: [
+            {"telefone": "48999998888", "last_inbound_at": antigo, "last_block_signal_at": None},
+            {"telefone": "48 99999-8888", "last_inbound_at": None, "last_block_signal_at": recente},
+        ]),
+    ])
+
+    database_setup._backfill_consent_state(cur)
+
+    inseridos = {p[0]: (p[1], p[2]) for sql, p in cur.executados if "INSERT INTO consent_state" in sql}
+    removidos = [p[0] for sql, p in cur.executados if "DELETE FROM consent_state" in sql]
+    assert inseridos == {
+        "48999998888": (recente, recente),
+        "48933334444": (antigo, None),
+    }
+    assert removidos == ["48 99999-8888"]
+
+
+def test_pode_enviar_proativo_consulta_pela_chave(monkeypatch):
+    cur = CursorFalso([
+        ("FROM consent_state", lambda sql, p: [{"bloqueado": 0, "engajado": 1}] if p[-1] == "48999998888" else []),
+    ])
+    monkeypatch.setattr(fm, "get_db_connection", lambda: ConexaoFalsa(cur))
+    monkeypatch.setattr(fm, "_esta_dentro_horario_comercial", lambda: True)
+
+    assert fm._pode_enviar_proativo("5548999998888") is True
+    assert fm._pode_enviar_proativo("5548911112222") is False
+
+
+def _consent_state_falso(estados):
+    """Responde SELECT em consent_state a partir de {chave: (bloqueado, engajado)}."""
+    def responder(sql, p):
+        if "IN (" in sql:
+            return [{"telefone": t, "bloqueado": estados[t][0], "engajado": estados[t][1]} for t in p[2:] if t in estados]
+        chave = p[-1]
+        return [{"bloqueado": estados[chave][0], "engajado": estados[chave][1]}] if chave in estados else []
+    return responder
+
+
+def test_previa_do_planejador_usa_a_chave_normalizada(monkeypatch):
+    from servicos import planejador_envios
+
+    estados = {"48999998888": (0, 1), "48911112222": (1, 1)}
+    cur = CursorFalso([
+        ("SELECT telefone FROM visitantes", lambda sql, p: [
+            {"telefone": "(48) 99999-8888"}, {"telefone": "+55 48 91111-2222"},
+            {"telefone": "48933334444"}, {"telefone": None},
+        ]),
+        ("FROM consent_state", _consent_state_falso(estados)),
+    ])
+    monkeypatch.setattr(planejador_envios, "get_db_connection", lambda: ConexaoFalsa(cur))
+    monkeypatch.setattr(planejador_envios, "planejar", lambda **kw: {})
+
+    plano = planejador_envios.planejar_campanha("Culto", {})
+
+    assert plano["audience"] == {
+        "total": 4, "sem_telefone": 1, "bloqueio_recente": 1,
+        "sem_engajamento_recente": 1, "elegiveis": 1,
+    }
+
+
+def test_pre_filtro_da_campanha_concorda_com_o_worker(monkeypatch):
+    estados = {
+        "48999998888": (0, 1),   # engajado
+        "48911112222": (1, 1),   # bloqueou
+        "48933334444": (0, 0),   # sem engajamento recente
+        "55999990000": (0, 1),   # DDD 55
+    }
+    cur = CursorFalso([("FROM consent_state", _consent_state_falso(estados))])
+    monkeypatch.setattr(fm, "get_db_connection", lambda: ConexaoFalsa(cur))
+    monkeypatch.setattr(fm, "_esta_dentro_horario_comercial", lambda: True)
+    audiencia = [
+        "(48) 99999-8888", "+55 48 99999-8888", "4899998888", "5548911112222",
+        "48 91111-2222", "48933334444", "4833334444", "55999990000", "(55) 99999-0000",
+        "48977776666",   # sem histórico
+    ]
+
+    inelegiveis = fm.avaliar_consentimento_em_lote(audiencia)
+
+    for telefone in audiencia:
+        aprovado_no_lote = telefone not in inelegiveis
+        aprovado_no_worker = fm._pode_enviar_proativo(fm._normalizar_para_envio(telefone))
+        assert aprovado_no_lote == aprovado_no_worker, telefone
+    assert inelegiveis["48 91111-2222"] == "bloqueio_recente"
+    assert inelegiveis["48977776666"] == "sem_engajamento_recente"
@@ -0,0 +1,86 @@
+import random
+import re
+
+import pytest
+
+from constantes import palavras_chave_ministerios
+from servicos import detector_intencoes as di
+from utilitarios.texto import normalizar_texto
+
+
+def _referencia(texto):
+    """Cadeia de detectores antiga (regex/substring), na mesma ordem do processar_mensagem."""
+    t = normalizar_texto(texto)
+    if not t:
+        return {}
+    esperado = {}
+    tm = t.replace("ç", "c")
+    for palavra in palavras_chave_ministerios:
+        if palavra in tm or palavra.rstrip("s") in tm:
+            esperado[di.MINISTERIO] = palavra
+            break
+    if any(p in t for p in di.PALAVRAS_AGRADECIMENTO):
+        esperado[di.AGRADECIMENTO] = None
+    if any(s in t for s in di.SAUDACOES):
+        esperado[di.SAUDACAO] = None
+    if t in di.PEDIDO_ORACAO_EXATO:
+        esperado[di.PEDIDO_ORACAO] = None
+    for nome, padroes in di.PADROES.items():
+        if any(re.search(p, t) for p in padroes):
+            esperado[nome] = None
+    menu = t.strip()
+    if menu in di.OPCOES_MENU_EXATAS:
+        esperado[di.OPCAO_MENU] = di.OPCOES_MENU_EXATAS[menu]
+    else:
+        for opcao, padroes in di.PADROES_OPCOES_MENU.items():
+            if any(re.search(p, menu) for p in padroes):
+                esperado[di.OPCAO_MENU] = opcao
+                break
+    return esperado
+
+
+def _vocabulario():
+    pecas = set()
+    todos = [p for ps in di.PADROES.values() for p in ps]
+    todos += [p for ps in di.PADROES_OPCOES_MENU.values() for p in ps]
+    for padrao in todos:
+        for sequencia in di._expandir(padrao):
+            pecas.update(sequencia)
+            pecas.update(w for peca in sequencia for w in peca.split())
+    pecas.update(palavras_chave_ministerios)
+    pecas.update(di.SAUDACOES + di.PALAVRAS_AGRADECIMENTO + di.PEDIDO_ORACAO_EXATO)
+    pecas.update(["igreja", "amanha", "voces", "sobre", "queria", "saber", "Olá!", "  ", "ç", "é", "?"])
+    return sorted(p for p in pecas if p.strip())
+
+
+def _mensagens(n, semente=2024):
+    rnd = random.Random(semente)
+    vocab = _vocabulario()
+    mensagens = list(vocab) + list(di.OPCOES_MENU_EXATAS)
+    for _ in range(n):
+        mensagens.append(" ".join(rnd.choice(vocab) for _ in range(rnd.randint(1, 6))))
+    return mensagens
+
+
+@pytest.mark.parametrize("texto", [
+    "Quem são os pastores?", "qual o horário do culto de domingo", "quero entrar no grupo do whatsapp",
+    "Bom dia! Obrigado", "3️⃣", "pedido de oração", "ministério de jovens", "onde fica a igreja",
+    "já fiz batismo e quero ser membro", "", "   ",
+])
+def test_exemplos_iguais_aos_detectores_antigos(texto):
+    assert {i.nome: i.valor for i in di.detectar_intencoes(texto)} == _referencia(texto)
+
+
+def test_mensagens_geradas_iguais_aos_detectores_antigos():
+    divergentes = [
+        (m, {i.nome: i.valor for i in di.detectar_intencoes(m)}, _referencia(m))
+        for m in _mensagens(5000)
+        if {i.nome: i.valor for i in di.detectar_intencoes(m)} != _referencia(m)
+    ]
+    assert divergentes == []
+
+
+def test_intencoes_ordenadas_pela_prioridade_do_atendimento():
+    intencoes = di.detectar_intencoes("oi, obrigado! quem sao os pastores dos jovens?")
+    assert [i.prioridade for i in intencoes] == sorted(i.prioridade for i in intencoes)
+    assert intencoes[0].nome == di.MINISTERIO
@@ -0,0 +1,26 @@
+from servicos import fila_mensagens as fm
+from conftest import CursorFalso
+
+
+def test_stats_raias_conta_raia_de_resposta():
+    cur = CursorFalso([
+        ("GROUP BY prioridade", lambda sql, p: [
+            {"prioridade": fm.RAIA_RESPOSTA, "pendentes": 4},
+            {"prioridade": fm.RAIA_MANUAL, "pendentes": 2},
+            {"prioridade": None, "pendentes": 1},
+        ]),
+        ("espera_sec", lambda sql, p: [
+            {"prioridade": fm.RAIA_RESPOSTA, "espera_sec": 3},
+            {"prioridade": fm.RAIA_RESPOSTA, "espera_sec": 5},
+            {"prioridade": fm.RAIA_CAMPANHA, "espera_sec": 60},
+        ]),
+    ])
+
+    raias = fm._stats_raias(cur)
+
+    assert raias["reply"]["pending"] == 4
+    assert raias["manual"]["pending"] == 2
+    assert raias["campaign"]["pending"] == 1
+    assert raias["reply"]["claimed_24h"] == 2
+    assert raias["reply"]["wait_p95_sec"] <= 5
+    assert raias["campaign"]["claimed_24h"] == 1
@@ -0,0 +1,55 @@
+from servicos import fila_mensagens as fm
+from conftest import CursorFalso, ConexaoFalsa
+
+
+def _resultado(envio_id, status, dono="w1"):
+    return {
+        "id": envio_id, "status": status, "status_code": 200, "erro": None, "tentativas": None,
+        "dono": dono, "efeitos": {}, "enviado_em": None,
+    }
+
+
+def test_write_back_grava_hora_do_envio(monkeypatch):
+    cur = CursorFalso([
+        ("FOR UPDATE", lambda sql, p: [{"id": i, "status": "processando", "claimed_by": "w1"} for i in p]),
+    ])
+    monkeypatch.setattr(fm, "get_db_connection", lambda: ConexaoFalsa(cur))
+    monkeypatch.setattr(fm, "_worker_id", lambda: "w1")
+    monkeypatch.setattr(fm, "WRITEBACK_SEC", 60)
+    monkeypatch.setattr(fm, "_resultados", [])
+
+    fm._registrar_resultado(1, "enviado", 200)
+    fm._registrar_resultado(2, "falha", 500, "erro")
+    enviado_em = fm._resultados[0]["enviado_em"]
+    assert enviado_em is not None and fm._resultados[1]["enviado_em"] is None
+
+    assert fm._db_gravar_resultados(list(fm._resultados)) is True
+    sql, params = next((s, p) for s, p in cur.executados if s.lstrip().startswith("UPDATE fila_envios"))
+    assert "enviado_em = CASE id WHEN %s THEN %s ELSE enviado_em END" in sql
+    assert enviado_em in params
+
+
+
+def test_flush_com_falha_renova_lease_e_devolve_o_lote(monkeypatch):
+    renovados = []
+    monkeypatch.setattr(fm, "_resultados", [_resultado(1, "enviado"), _resultado(2, "enviado", dono="w2")])
+    monkeypatch.setattr(fm, "_db_gravar_resultados", lambda lote: False)
+    cur = CursorFalso([("SET lease_expires_at", lambda sql, p: renovados.append(p) or len(p) - 2)])
+    monkeypatch.setattr(fm, "get_db_connection", lambda: ConexaoFalsa(cur))
+
+    assert fm._flush_resultados() == 0
+
+    assert [r["id"] for r in fm._resultados] == [1, 2]   # volta para a próxima rodada
+    assert sorted((p[1], p[2:]) for p in renovados) == [("w1", (1,)), ("w2", (2,))]
+
+
+def test_write_back_descarta_item_recuperado_por_outro_worker(monkeypatch, caplog):
+    cur = CursorFalso([
+        ("FOR UPDATE", lambda sql, p: [{"id": 1, "status": "processando", "claimed_by": "w2"}]),
+    ])
+    monkeypatch.setattr(fm, "get_db_connection", lambda: ConexaoFalsa(cur))
+
+    assert fm._db_gravar_resultados([_resultado(1, "enviado")]) is True
+
+    assert not any(s.lstrip().startswith("UPDATE fila_envios") for s, _ in cur.executados)
+    assert "possível duplicado" in caplog.text
@@ -0,0 +1,59 @@
+import ia_integracao
+from conftest import CursorFalso, ConexaoFalsa
+
+
+class IndiceFalso:
+    tamanho = 1000
+    n_delta = 0
+
+    def __init__(self, chaves=()):
+        self.chaves = set(chaves)
+
+    def com_delta(self, chaves, linhas):
+        novo = IndiceFalso(self.chaves | set(chaves))
+        novo.n_delta = len(novo.chaves)
+        return novo
+
+
+def _motor(monkeypatch, changelog):
+    cur = CursorFalso([
+        ("MAX(id)", lambda sql, p: [{"versao": max(changelog, default=0)}]),
+        ("DELETE FROM ia_changelog", lambda sql, p: 0),
+        ("SELECT id, fonte, question FROM ia_changelog", lambda sql, p: [
+            {"id": i, "fonte": "train", "question": q}
+            for i, q in changelog.items() if p[0] < i <= p[1] or i in p[2:]
+        ]),
+        ("FROM training_pairs", lambda sql, p: [
+            {"question": q, "answer": "r", "category": "geral", "created_at": None} for q in p
+        ]),
+    ])
+    monkeypatch.setattr(ia_integracao, "get_db_connection", lambda: ConexaoFalsa(cur))
+    monkeypatch.setattr(ia_integracao, "CHANGEFEED_SEC", 0)
+    motor = ia_integracao.MotorBuscaLocal()
+    motor._indice = IndiceFalso()
+    motor._versao = 1
+    return motor
+
+
+def test_id_commitado_fora_de_ordem_nao_se_perde(monkeypatch):
+    changelog = {1: "q1", 3: "q3"}   # id 2 ainda em transação aberta
+    motor = _motor(monkeypatch, changelog)
+
+    motor.sincronizar()
+    assert motor._indice.chaves == {ia_integracao._chave_doc("train", "q3")}
+    assert motor.versao is None   # lacuna pendente: fora do cache compartilhado
+
+    changelog[2] = "q2"            # commit atrasado do id menor
+    motor.sincronizar()
+    assert ia_integracao._chave_doc("train", "q2") in motor._indice.chaves
+    assert motor.versao == 3
+
+
+def test_lacuna_de_transacao_desfeita_expira(monkeypatch):
+    changelog = {1: "q1", 3: "q3"}
+    motor = _motor(monkeypatch, changelog)
+    monkeypatch.setattr(ia_integracao, "CHANGEFEED_LACUNA_SEC", -1)
+
+    motor.sincronizar()
+    motor.sincronizar()
+    assert motor.versao == 3
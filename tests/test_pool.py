@@ -0,0 +1,74 @@
+import os
+
+import database
+from conftest import CursorFalso
+
+
+class RawFalsa:
+    """Conexão PyMySQL falsa para o pool (cursor() também é context manager)."""
+
+    open = True
+    server_status = 0
+
+    def __init__(self):
+        self.cur = CursorFalso([("GET_LOCK", lambda sql, p: [{"ok": 1}])])
+        self.rollbacks = 0
+
+    def cursor(self):
+        return _CursorCtx(self.cur)
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def ping(self, reconnect=False):
+        pass
+
+    def close(self):
+        self.open = False
+
+
+class _CursorCtx:
+    def __init__(self, cur):
+        self._cur = cur
+
+    def __getattr__(self, nome):
+        return getattr(self._cur, nome)
+
+    def __enter__(self):
+        return self._cur
+
+    def __exit__(self, *exc):
+        return False
+
+
+def _pool(monkeypatch, raw):
+    monkeypatch.setattr(database, "_abrir_conexao_mysql", lambda: raw)
+    return database._MySQLPool(size=1, timeout=0.1, max_lifetime=0, ping_after=60)
+
+
+def test_lock_nomeado_e_solto_na_devolucao(monkeypatch):
+    raw = RawFalsa()
+    pool = _pool(monkeypatch, raw)
+
+    conn = pool.acquire()
+    assert database.obter_lock_nomeado(conn, "campaign_job:x", 1) is True
+    conn.close()   # sem RELEASE_LOCK: caminho que "esqueceu"
+
+    assert "DO RELEASE_ALL_LOCKS()" in [sql for sql, _ in raw.cur.executados]
+    assert pool.stats()["idle"] == 1
+
+
+def test_conexao_sem_lock_nao_paga_reset(monkeypatch):
+    raw = RawFalsa()
+    pool = _pool(monkeypatch, raw)
+
+    pool.acquire().close()
+    pool.acquire().close()
+
+    assert raw.cur.executados == []
+
+
+def test_pool_padrao_comporta_as_threads_do_processo():
+    if "DB_POOL_SIZE" not in os.environ:
+        assert database.DB_POOL_SIZE == database._THREADS_DB
+    assert database._THREADS_DB > database._THREADS_BACKGROUND_DB
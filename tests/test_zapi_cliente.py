@@ -0,0 +1,66 @@
+import threading
+
+from servicos import zapi_cliente as zc
+from servicos import fila_mensagens as fm
+
+
+def test_bulkhead_cheio_nao_se_passa_por_circuito_aberto(monkeypatch):
+    monkeypatch.setattr(zc, "_cfg_ok", lambda instancia=None: True)
+    monkeypatch.setattr(zc, "_bulkhead", threading.BoundedSemaphore(1))
+    monkeypatch.setattr(zc, "BULKHEAD_ESPERA_SEC", 0.01)
+    zc._bulkhead.acquire()
+
+    res = zc.enviar_mensagem("48999998888", "oi")
+
+    assert res["success"] is False
+    assert res.get("bulkhead_full") is True
+    assert not res.get("circuit_open")
+
+
+def test_worker_adia_item_com_bulkhead_cheio(monkeypatch):
+    adiados, marcados = [], []
+    monkeypatch.setattr(fm, "_db_adiar_itens", lambda ids, seg: adiados.append((ids, seg)) or len(ids))
+    monkeypatch.setattr(fm, "_agendar_despertar", lambda seg: None)
+    monkeypatch.setattr(fm, "_anti_spam_de", lambda inst: None)
+    monkeypatch.setattr(fm, "_registrar_resultado", lambda *a, **k: marcados.append(a))
+    envio = {
+        "item": {"id": 7}, "envio_id": 7, "numero": "5548999998888", "numero_envio": "5548999998888",
+        "mensagem_envio": "oi", "meta": {}, "is_reply": False, "is_manual": True,
+        "instancia": None, "imagem_url": None,
+    }
+
+    espera = fm._concluir_envio(envio, {"success": False, "bulkhead_full": True})
+
+    assert espera is None
+    assert adiados == [([7], fm.POLL_SECONDS)]
+    assert marcados == []
+
+
+def test_status_inicial_nao_afirma_conectado(monkeypatch):
+    monkeypatch.setattr(zc, "_STATUS_CACHE", {})
+    assert zc._status_local("inst")["data"]["online"] is False
+
+
+def test_envio_com_status_desconhecido_espera_o_primeiro_probe(monkeypatch):
+    probes = []
+    monkeypatch.setattr(zc, "_STATUS_CACHE", {})
+    monkeypatch.setattr(zc, "_cfg_ok", lambda instancia=None: True)
+    monkeypatch.setattr(zc, "_resolver_instancia", lambda instancia: instancia)
+    monkeypatch.setattr(zc, "iniciar_prober_status", lambda: None)
+    monkeypatch.setattr(zc, "_ciclo_prober_instancia", lambda inst, forcar=False: (
+        probes.append(inst), zc._publicar_status_local(inst, {"online": True, "mensagem": "ok"})
+    ))
+
+    assert zc._checar_instancia_online("inst", "5548999998888") is None
+    assert zc._checar_instancia_online("inst", "5548999998888") is None
+    assert probes == ["inst"]
+
+
+def test_engine_async_nao_sonda_e_aborta_com_status_desconhecido(monkeypatch):
+    monkeypatch.setattr(zc, "_STATUS_CACHE", {})
+    monkeypatch.setattr(zc, "_cfg_ok", lambda instancia=None: True)
+    monkeypatch.setattr(zc, "_resolver_instancia", lambda instancia: instancia)
+    monkeypatch.setattr(zc, "iniciar_prober_status", lambda: None)
+
+    res = zc._checar_instancia_online("inst", "5548999998888", sondar=False)
+    assert res["success"] is False and res["status_instancia"]["desconhecido"] is True
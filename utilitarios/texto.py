@@ -45,6 +45,20 @@ def detectar_agradecimento(texto: str) -> bool:
     return any(p in texto for p in palavras)
 
 
+# Sinais de bloqueio/denúncia numa mensagem recebida (mesmos termos da antiga checagem LIKE)
+PALAVRAS_BLOQUEIO = ("pare", "bloque", "spam", "denuncia")
+
+
+def detectar_sinal_bloqueio(texto: str) -> bool:
+    """
+    Retorna True se o texto contiver pedido de parar, bloqueio ou denúncia.
+    """
+    if not texto:
+        return False
+    texto = normalizar_texto(texto)
+    return any(p in texto for p in PALAVRAS_BLOQUEIO)
+
+
 def validar_data_nascimento(data: str) -> bool:
     """
     Valida se a data está no formato DD/MM/AAAA.